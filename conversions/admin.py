@@ -1,6 +1,13 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import ConversionRequest, ConversionHistory
+from .models import ConversionRequest, ConversionOutput, ConversionHistory
+
+
+class ConversionOutputInline(admin.TabularInline):
+    model = ConversionOutput
+    extra = 0
+    readonly_fields = ('position', 'label', 'output_format', 'output_quality', 'audio_bitrate', 'output_file', 'output_size')
+    can_delete = False
 
 
 @admin.register(ConversionRequest)
@@ -34,6 +41,7 @@ class ConversionRequestAdmin(admin.ModelAdmin):
         }),
     )
     
+    inlines = [ConversionOutputInline]
     actions = ['cancel_conversions', 'retry_failed_conversions', 'cleanup_expired']
     
     def user_email(self, obj):
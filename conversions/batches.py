@@ -0,0 +1,155 @@
+"""
+Batch conversions: many inputs with shared settings, converted on a capped pool and returned as one streamed ZIP
+"""
+import os
+import uuid
+import shutil
+import zipfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple, Iterator, BinaryIO
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from .models import ConversionBatch, ConversionRequest
+from .progress import progress_key
+from .progressive import FINISHED
+from .services import ConversionService
+from core.zipstream import ZipSink, write_file
+
+logger = logging.getLogger(__name__)
+
+# Media in these formats is already compressed - deflating it again costs CPU for nothing
+_DEFLATE_FORMATS = {'wav'}
+
+
+def archive_members(archive: BinaryIO, allowed_extensions: List[str]) -> Tuple[List[zipfile.ZipInfo], List[str]]:
+    """The entries of a ZIP worth converting, and the names of those skipped (folders, hidden files, other types)"""
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            infos = zf.infolist()
+    except zipfile.BadZipFile:
+        raise Exception("Archive is not a valid ZIP file")
+    finally:
+        archive.seek(0)
+
+    members, skipped = [], []
+    for info in infos:
+        name = os.path.basename(info.filename)
+        if info.is_dir() or not name:
+            continue
+        if name.startswith('.') or info.filename.startswith('__MACOSX/'):
+            skipped.append(info.filename)  # Finder metadata and dotfiles
+            continue
+        if name.split('.')[-1].lower() not in allowed_extensions:
+            skipped.append(info.filename)
+            continue
+        members.append(info)
+    return members, skipped
+
+
+def extract_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> str:
+    """Unpack one entry into temp_uploads/, as if it had been uploaded on its own; returns the storage name"""
+    name = f"temp_uploads/{uuid.uuid4()}_{os.path.basename(info.filename)}"
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with archive.open(info) as source, open(path, 'wb') as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    return name
+
+
+def run_batch(batch: ConversionBatch):
+    """Convert every pending file of the batch, at most batch.concurrency at a time"""
+    batch.status = 'processing'
+    batch.save(update_fields=['status'])
+    jobs = list(batch.conversions.filter(status='pending').order_by('created_at'))
+    logger.info(f"Batch {batch.id}: converting {len(jobs)} files, {batch.concurrency} at a time")
+
+    def run(conversion_request: ConversionRequest):
+        try:
+            conversion_request.refresh_from_db(fields=['status'])
+            if conversion_request.status != 'pending':
+                return  # Cancelled while it waited for a slot
+            ConversionService().convert_media(conversion_request)
+        except Exception as e:
+            # convert_media has already marked the job failed; the rest of the batch carries on
+            logger.warning(f"Batch {batch.id}: {conversion_request.input_filename} failed: {str(e)}")
+        finally:
+            connection.close()  # Each pool thread opened its own DB connection
+
+    with ThreadPoolExecutor(max_workers=max(1, batch.concurrency)) as pool:
+        list(pool.map(run, jobs))
+
+    batch.refresh_from_db(fields=['status'])
+    if batch.status != 'cancelled':
+        completed = batch.conversions.filter(status='completed').exists()
+        batch.status = 'completed' if completed else 'failed'
+        if not completed:
+            batch.error_message = "No file in the batch could be converted"
+    batch.completed_at = timezone.now()
+    batch.save(update_fields=['status', 'error_message', 'completed_at'])
+
+
+def batch_progress(batch: ConversionBatch) -> Dict[str, Any]:
+    """Per-status counts and overall progress, weighting each file by its input size"""
+    counts = {status: 0 for status, _ in ConversionRequest.STATUS_CHOICES}
+    done = total = 0.0
+    jobs = list(batch.conversions.values('id', 'status', 'progress', 'input_size'))
+    for job in jobs:
+        status = job['status']
+        progress = job['progress']
+        live = cache.get(progress_key(job['id']))
+        if live and live.get('status'):
+            status = live['status']
+            progress = live.get('progress') or progress
+        counts[status] = counts.get(status, 0) + 1
+        weight = max(job['input_size'], 1)
+        total += weight
+        done += weight * (100 if status in FINISHED else min(float(progress or 0), 100))
+    return {
+        'status': batch.status,
+        'total': len(jobs),
+        'counts': counts,
+        'progress': round(done / total, 1) if total else 0,
+    }
+
+
+def _entry_name(conversion_request: ConversionRequest, used: set) -> str:
+    base = os.path.splitext(os.path.basename(conversion_request.input_filename))[0] or 'file'
+    name = f"{base}.{conversion_request.output_format}"
+    copy = 2
+    while name in used:
+        name = f"{base} ({copy}).{conversion_request.output_format}"
+        copy += 1
+    used.add(name)
+    return name
+
+
+def stream_zip(batch: ConversionBatch, chunk_size: int = 256 * 1024) -> Iterator[bytes]:
+    """Yield a ZIP of the batch's finished outputs
+
+    Nothing is assembled on disk: zipfile writes local headers and data descriptors into a sink
+    that is drained after every block, so memory holds one chunk at a time. Files that failed, or
+    were still converting when the download started, are listed in errors.txt at the end.
+    """
+    sink = ZipSink()
+    used_names: set = set()
+    failures: List[str] = []
+
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for job in batch.conversions.order_by('created_at'):
+            if job.status not in FINISHED:
+                failures.append(f"{job.input_filename}: still {job.status}, not included")
+                continue
+            path = job.output_file.path if job.status == 'completed' and job.output_file else None
+            if not path or not os.path.exists(path):
+                failures.append(f"{job.input_filename}: {job.error_message or job.status}")
+                continue
+
+            yield from write_file(archive, sink, _entry_name(job, used_names), path,
+                                  deflate=job.output_format in _DEFLATE_FORMATS, chunk_size=chunk_size)
+
+        if failures:
+            archive.writestr('errors.txt', '\n'.join(failures) + '\n')
+    yield sink.drain()
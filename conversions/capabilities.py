@@ -0,0 +1,166 @@
+"""
+Probe what the local ffmpeg build and host can actually do, once per host and ffmpeg binary
+"""
+import os
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+import logging
+from typing import Dict, Any, List, Optional
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Hardware encoders worth checking for, per codec family (software fallbacks live in profiles.py)
+HARDWARE_ENCODERS = ['h264_nvenc', 'hevc_nvenc', 'av1_nvenc', 'h264_qsv', 'hevc_qsv',
+                     'h264_videotoolbox', 'hevc_videotoolbox']
+
+CPU_FLAGS = ('sse4_2', 'avx', 'avx2', 'avx512f', 'avx512bw', 'neon', 'asimd')
+
+_capabilities: Optional[Dict[str, Any]] = None
+_lock = threading.Lock()
+
+
+def _run(args: List[str], timeout: int = 20) -> subprocess.CompletedProcess:
+    return subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+
+
+def _parse_codec_list(output: str) -> List[str]:
+    """Names from `ffmpeg -encoders` / `-decoders`, which list ' V....D name  description' after a ------ line"""
+    names = []
+    in_list = False
+    for line in output.splitlines():
+        if line.strip().startswith('------'):
+            in_list = True
+            continue
+        parts = line.split()
+        if in_list and len(parts) >= 2:
+            names.append(parts[1])
+    return names
+
+
+def _cpu_features() -> Dict[str, Any]:
+    flags = set()
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith(('flags', 'Features')):
+                    flags.update(line.split(':', 1)[1].split())
+    except OSError:
+        pass  # Not Linux - report the core count only
+    return {'cores': os.cpu_count() or 1, 'flags': sorted(flag for flag in CPU_FLAGS if flag in flags)}
+
+
+def _works(args: List[str]) -> bool:
+    try:
+        return _run(args, timeout=30).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def _verify_hardware(ffmpeg_bin: str, encoders: List[str], hwaccels: List[str]) -> Dict[str, List[str]]:
+    """Listed is not the same as usable: try each one on a tiny clip so jobs never hit init failures"""
+    usable_encoders = [
+        name for name in HARDWARE_ENCODERS if name in encoders and _works([
+            ffmpeg_bin, '-hide_banner', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=256x144:rate=25:duration=0.2',
+            '-c:v', name, '-f', 'null', '-',
+        ])
+    ]
+
+    usable_hwaccels = []
+    if hwaccels and 'libx264' in encoders:
+        with tempfile.TemporaryDirectory() as tmp:
+            sample = os.path.join(tmp, 'sample.mp4')
+            if _works([ffmpeg_bin, '-hide_banner', '-v', 'error', '-f', 'lavfi', '-i',
+                       'testsrc2=size=256x144:rate=25:duration=0.2', '-c:v', 'libx264', '-y', sample]):
+                usable_hwaccels = [
+                    accel for accel in hwaccels if _works([
+                        ffmpeg_bin, '-hide_banner', '-v', 'error', '-hwaccel', accel, '-i', sample, '-f', 'null', '-',
+                    ])
+                ]
+    return {'encoders': usable_encoders, 'hwaccels': usable_hwaccels}
+
+
+def probe_capabilities(ffmpeg_bin: str = 'ffmpeg') -> Dict[str, Any]:
+    """Run the full probe (a few seconds); use get_capabilities() for the cached result"""
+    version = _run([ffmpeg_bin, '-hide_banner', '-version']).stdout.splitlines()
+    encoders = _parse_codec_list(_run([ffmpeg_bin, '-hide_banner', '-encoders']).stdout)
+    decoders = _parse_codec_list(_run([ffmpeg_bin, '-hide_banner', '-decoders']).stdout)
+    hwaccels = [line.strip() for line in _run([ffmpeg_bin, '-hide_banner', '-hwaccels']).stdout.splitlines()[1:]
+                if line.strip()]
+    hardware = _verify_hardware(ffmpeg_bin, encoders, hwaccels)
+
+    return {
+        'ffmpeg_version': version[0] if version else '',
+        'encoders': encoders,
+        'decoders': decoders,
+        'hwaccels_listed': hwaccels,
+        'hwaccels': hardware['hwaccels'],
+        'hardware_encoders': hardware['encoders'],
+        'cpu': _cpu_features(),
+    }
+
+
+def _fingerprint(ffmpeg_bin: str) -> Dict[str, Any]:
+    """What the cached probe depends on - a different host or an upgraded ffmpeg invalidates it"""
+    path = shutil.which(ffmpeg_bin) or ffmpeg_bin
+    try:
+        st = os.stat(os.path.realpath(path))
+        binary = f"{os.path.realpath(path)}:{st.st_size}:{int(st.st_mtime)}"
+    except OSError:
+        binary = path
+    return {'host': socket.gethostname(), 'binary': binary}
+
+
+def get_capabilities(refresh: bool = False) -> Dict[str, Any]:
+    """Capabilities for this process: memoized in memory, persisted on disk per host and ffmpeg binary"""
+    global _capabilities
+    with _lock:
+        if _capabilities is not None and not refresh:
+            return _capabilities
+
+        ffmpeg_bin = 'ffmpeg'  # Same binary ffmpeg-python invokes
+        cache_file = settings.FFMPEG_CAPABILITIES_FILE
+        fingerprint = _fingerprint(ffmpeg_bin)
+
+        if not refresh:
+            try:
+                with open(cache_file) as f:
+                    cached = json.load(f)
+                if cached.get('fingerprint') == fingerprint:
+                    _capabilities = cached['capabilities']
+                    return _capabilities
+            except (OSError, ValueError, KeyError):
+                pass
+
+        try:
+            capabilities = probe_capabilities(ffmpeg_bin)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            # No usable ffmpeg - report nothing rather than guessing; don't persist so the next start retries
+            logger.error(f"ffmpeg capability probe failed: {str(e)}")
+            _capabilities = {'ffmpeg_version': '', 'encoders': [], 'decoders': [], 'hwaccels_listed': [],
+                             'hwaccels': [], 'hardware_encoders': [], 'cpu': _cpu_features()}
+            return _capabilities
+
+        try:
+            os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+            tmp_path = f"{cache_file}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'fingerprint': fingerprint, 'capabilities': capabilities}, f)
+            os.replace(tmp_path, cache_file)
+        except OSError as e:
+            logger.warning(f"Could not persist ffmpeg capabilities: {str(e)}")
+
+        logger.info(f"ffmpeg capabilities: hwaccels={capabilities['hwaccels']} "
+                    f"hardware_encoders={capabilities['hardware_encoders']}")
+        _capabilities = capabilities
+        return _capabilities
+
+
+def hwaccel_input_options() -> Dict[str, Any]:
+    """ffmpeg.input() kwargs for hardware decoding - empty when no hwaccel actually works here"""
+    hwaccels = get_capabilities()['hwaccels']
+    return {'hwaccel': hwaccels[0]} if hwaccels else {}
@@ -0,0 +1,79 @@
+"""
+Chapter splitting: one input, one output per chapter, all chapters cut concurrently
+"""
+import os
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List
+import ffmpeg
+from django.conf import settings
+from .progress import ProgressPublisher
+
+logger = logging.getLogger(__name__)
+
+# Chapters shorter than this are usually markers, not content
+MIN_CHAPTER_SECONDS = 0.5
+
+_UNSAFE = re.compile(r'[^\w\- ]+')
+
+
+def normalize_chapters(chapters: Optional[List[Dict[str, Any]]], duration: Optional[float] = None) -> List[Dict[str, Any]]:
+    """[{'title', 'start', 'end'}] from yt-dlp info-dict chapters or ffprobe chapters, sorted and clamped"""
+    normalized = []
+    for index, chapter in enumerate(sorted(chapters or [], key=lambda c: float(c.get('start_time') or 0))):
+        start = float(chapter.get('start_time') or 0)
+        end = chapter.get('end_time')
+        end = float(end) if end not in (None, '') else duration
+        if duration:
+            end = min(end, duration) if end is not None else duration
+        if end is None or end - start < MIN_CHAPTER_SECONDS:
+            continue
+        title = chapter.get('title') or (chapter.get('tags') or {}).get('title') or f"Chapter {index + 1}"
+        normalized.append({'title': str(title).strip(), 'start': start, 'end': end})
+    return normalized
+
+
+def chapter_filename(position: int, title: str, ext: str) -> str:
+    """'03 - Title.ext' - numbered so the files sort in playback order"""
+    safe = _UNSAFE.sub('', title).strip()[:80] or 'Chapter'
+    return f"{position + 1:02d} - {safe}.{ext}"
+
+
+def cut_chapter(input_path: str, output_path: str, chapter: Dict[str, Any], output_options: Dict[str, Any]):
+    """Cut one chapter; stream copy snaps the start to the keyframe at or before it"""
+    duration = round(chapter['end'] - chapter['start'], 6)
+    stream = ffmpeg.input(input_path, ss=chapter['start'], t=duration).output(output_path, **output_options)
+    try:
+        stream.run(overwrite_output=True, quiet=True)
+    except ffmpeg.Error as e:
+        stderr = (e.stderr or b'').decode('utf-8', 'replace')
+        raise Exception(f"Cutting chapter '{chapter['title']}' failed: {stderr[-1000:]}")
+
+
+def split_chapters(input_path: str, output_paths: List[str], chapters: List[Dict[str, Any]],
+                   output_options: Dict[str, Any], publisher: Optional[ProgressPublisher] = None,
+                   max_workers: Optional[int] = None) -> List[str]:
+    """Cut every chapter into its output path, several ffmpeg processes at once
+
+    Each cut is an independent seek-and-copy (or encode) of its own slice, so there is nothing to
+    share between them; the pool only bounds how many ffmpeg processes run side by side.
+    """
+    max_workers = max_workers or settings.CHAPTER_SPLIT_WORKERS or os.cpu_count() or 1
+    done = [0]
+    lock = threading.Lock()
+
+    def run(index: int) -> str:
+        cut_chapter(input_path, output_paths[index], chapters[index], output_options)
+        if publisher:
+            with lock:
+                done[0] += 1
+                publisher.publish({'progress': min(done[0] / len(chapters) * 100, 99.9)},
+                                  f"Cut {done[0]} of {len(chapters)} chapters")
+        return output_paths[index]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chapters)))) as pool:
+        paths = list(pool.map(run, range(len(chapters))))
+    logger.info(f"Split {input_path} into {len(chapters)} chapters, {max_workers} at a time")
+    return paths
@@ -0,0 +1,233 @@
+"""
+Clips: convert only custom_settings start..end of an input - whole GOPs are copied, only the partial ones at the edges re-encoded
+"""
+import os
+import re
+import subprocess
+import logging
+from typing import Dict, Any, Optional, List, Tuple
+import ffmpeg
+from .progress import ProgressPublisher, run_ffmpeg
+from core.scratch import ScratchSpace
+
+logger = logging.getLogger(__name__)
+
+# Encoders for the re-encoded edges, per source codec (ffprobe codec_name). Quality is set high because
+# these frames sit next to untouched source frames and any drop would be visible at the joins.
+EDGE_ENCODERS = {
+    'h264': ('libx264', {'crf': 16, 'preset': 'fast'}),
+    'hevc': ('libx265', {'crf': 18, 'preset': 'fast'}),
+    'vp9': ('libvpx-vp9', {'crf': 20, 'b:v': 0, 'deadline': 'good', 'cpu-used': 4}),
+    'vp8': ('libvpx', {'crf': 6, 'b:v': '8M'}),
+    'mpeg4': ('mpeg4', {'q:v': 2}),
+}
+
+# A cut this close to a keyframe counts as aligned (about a frame at 50fps)
+KEYFRAME_TOLERANCE = 0.02
+
+_TIMESTAMP = re.compile(r'^(?:(\d+):)?(?:(\d+):)?(\d+(?:\.\d+)?)$')
+_KEYFRAME = re.compile(r'pts_time:(-?[\d.]+).*?iskey:1')
+
+
+def parse_time(value) -> float:
+    """Seconds from a number or an 'HH:MM:SS.mmm' / 'MM:SS' / 'SS' string"""
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid time: {value}")
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        match = _TIMESTAMP.match(str(value).strip())
+        if not match:
+            raise ValueError(f"Invalid time: {value}")
+        first, second, rest = match.groups()
+        hours, minutes = (first, second) if second is not None else (None, first)
+        seconds = int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(rest)
+    if seconds < 0:
+        raise ValueError(f"Time cannot be negative: {value}")
+    return seconds
+
+
+def clip_window(custom_settings: Optional[Dict[str, Any]]) -> Optional[Tuple[float, Optional[float]]]:
+    """(start, end) from custom_settings, end None meaning the end of the input; None when nothing is cut"""
+    custom = custom_settings or {}
+    if custom.get('start') in (None, '') and custom.get('end') in (None, ''):
+        return None
+    start = parse_time(custom['start']) if custom.get('start') not in (None, '') else 0.0
+    end = parse_time(custom['end']) if custom.get('end') not in (None, '') else None
+    if end is not None and end <= start:
+        raise ValueError("Clip end must be after its start")
+    if not start and end is None:
+        return None
+    return start, end
+
+
+def clip_input_options(window: Tuple[float, Optional[float]]) -> Dict[str, Any]:
+    """Input seeking: ffmpeg jumps to the keyframe before start and stops reading at end"""
+    start, end = window
+    options = {'ss': start} if start else {}
+    if end is not None:
+        options['t'] = round(end - start, 3)
+    return options
+
+
+def scan_keyframes(input_path: str, start: float, duration: Optional[float]) -> Tuple[Optional[float], List[float]]:
+    """(last keyframe before the window, keyframes inside it), as times relative to start
+
+    Only keyframes are decoded (-skip_frame nokey) and only the window is read, so this costs
+    about one frame per GOP of the clip however long the source is. Decoders that ignore skip_frame
+    still pass every frame, so frames are filtered on showinfo's iskey flag too. The seek isn't made
+    accurate, so the keyframe it lands on before start is reported (as a negative time) as well.
+    """
+    args = ['ffmpeg', '-hide_banner', '-nostdin', '-skip_frame', 'nokey', '-noaccurate_seek', '-ss', str(start),
+            '-i', input_path, '-map', '0:v:0', '-vf', 'showinfo']
+    if duration is not None:
+        args += ['-t', str(duration)]  # On the output, where it still counts from start
+    args += ['-f', 'null', '-']
+    result = subprocess.run(args, capture_output=True, text=True, errors='replace')
+    if result.returncode != 0:
+        raise Exception(f"Keyframe scan failed: {result.stderr[-1000:]}")
+    times = sorted({round(float(match), 6) for match in _KEYFRAME.findall(result.stderr)})
+    before = [t for t in times if t < 0]
+    inside = [t for t in times if t >= 0 and (duration is None or t < duration - KEYFRAME_TOLERANCE)]
+    return (before[-1] if before else None), inside
+
+
+def _copy_from(previous: Optional[float]) -> Dict[str, Any]:
+    """Output -ss for a -copyts stream copy that should begin at the first keyframe after previous
+
+    An input seek only gets near: Matroska seeks by cluster, so it can land GOPs early. Dropping
+    every packet that decodes before just after the previous keyframe does not depend on where it
+    landed, and copying then starts at the next keyframe. (The limit is compared with decode times,
+    which B-frames put ahead of the keyframe's presentation time, so it can't be the keyframe itself.)
+    """
+    return {'ss': round(previous + 0.0005, 6)} if previous is not None else {}
+
+
+def exact_audio(input_path: str, output_path: str, window: Tuple[float, Optional[float]],
+                audio_options: Dict[str, Any], **output_options):
+    """ffmpeg stream that writes exactly window of the first audio track
+
+    Seeking lands on the demuxer's index point before start (in Matroska, the video keyframe), so the
+    cut is made on the source timestamps: copied audio drops the packets before start at the output,
+    re-encoded audio is trimmed to the sample with atrim. -start_at_zero keeps the same timeline the
+    video parts use for start.
+    """
+    start, end = window
+    source = ffmpeg.input(input_path, ss=start)['a:0'] if start else ffmpeg.input(input_path)['a:0']
+    if audio_options.get('acodec') == 'copy':
+        trim = {'ss': start} if start else {}
+        if end is not None:
+            trim['to'] = end
+        stream = ffmpeg.output(source, output_path, **{'vn': None, **audio_options, **trim, **output_options})
+    else:
+        trim = {'start': start} if start else {}
+        if end is not None:
+            trim['end'] = end
+        audio = source.filter('atrim', **trim).filter('asetpts', 'PTS-STARTPTS')
+        stream = ffmpeg.output(audio, output_path, **{'vn': None, **audio_options, **output_options})
+    return stream.global_args('-copyts', '-start_at_zero')
+
+
+def plan_cut(keyframes: List[float], duration: Optional[float]) -> List[Tuple[str, float, Optional[float]]]:
+    """Split the window into ('encode' | 'copy', from, to) parts; to None means the end of the input"""
+    if not keyframes:
+        return [('encode', 0.0, duration)]  # The whole clip sits inside one GOP
+
+    parts = []
+    first = keyframes[0]
+    last = keyframes[-1] if duration is not None else None
+    if first > KEYFRAME_TOLERANCE:
+        parts.append(('encode', 0.0, first))
+    if last is None or last - first > KEYFRAME_TOLERANCE:
+        parts.append(('copy', first, last if last is not None and duration - last > KEYFRAME_TOLERANCE else duration))
+    if last is not None and duration - last > KEYFRAME_TOLERANCE:
+        parts.append(('encode', last, duration))
+    return parts
+
+
+def smart_cut(input_path: str, output_path: str, window: Tuple[float, Optional[float]], video_codec: str,
+              audio_options: Optional[Dict[str, Any]], output_options: Dict[str, Any],
+              publisher: Optional[ProgressPublisher] = None) -> Dict[str, Any]:
+    """Cut window out of input_path into output_path, keeping the source video wherever a whole GOP fits
+
+    audio_options are the output options for the audio track ({'acodec': 'copy'} or an encoder), None
+    for no audio; output_options are container flags for the final file.
+    """
+    start, end = window
+    duration = end - start if end is not None else None
+    encoder, encoder_options = EDGE_ENCODERS[video_codec]
+    previous, keyframes = scan_keyframes(input_path, start, duration)
+    parts = plan_cut(keyframes, duration)
+    kinds = [kind for kind, _, _ in parts]
+
+    # Parts are Matroska for every codec: the concat demuxer hands each part's parameter sets on when
+    # they change, so the encoded edges and the copied middle decode with their own headers
+    ext, fmt = 'mkv', 'matroska'
+    scratch = ScratchSpace().allocate(f"clip-{os.path.basename(output_path)}")
+    try:
+        paths = []
+        copy = next((part for part in parts if part[0] == 'copy'), None)
+        if copy:
+            # One stream-copy pass from the first keyframe in the window; when there is a tail to re-encode,
+            # the segment muxer splits it off exactly at the last keyframe
+            keyframe = start + copy[1]  # The first keyframe in the window, so previous is the one before it
+            trim = _copy_from(start + previous if previous is not None else None)
+            has_tail = kinds[-1] == 'encode'
+            options = {'map': '0:v:0', 'c': 'copy', 'f': fmt, **trim}
+            if has_tail:
+                # Segment times count from the first packet, which is now the keyframe
+                options.update({'f': 'segment', 'segment_format': fmt, 'reset_timestamps': 1,
+                                'segment_times': f"{copy[2] - copy[1] - 0.0005:.6f}"})
+            elif end is not None:
+                options['to'] = end
+            ffmpeg.input(input_path, ss=keyframe).output(
+                os.path.join(scratch.path, f"copy_%03d.{ext}" if has_tail else f"copy_000.{ext}"), **options
+            ).global_args('-copyts', '-start_at_zero').run(overwrite_output=True, quiet=True)
+            copied = os.path.join(scratch.path, f"copy_000.{ext}")
+            if not os.path.exists(copied):
+                raise Exception("Keyframe split produced no middle segment")
+
+        encoded_seconds = 0.0
+        for index, (kind, part_start, part_end) in enumerate(parts):
+            if kind == 'copy':
+                paths.append(copied)
+                continue
+            # Accurate seek: decoding starts at the keyframe before part_start, frames before it are dropped
+            target = os.path.join(scratch.path, f"edge_{index}.{ext}")
+            length = part_end - part_start if part_end is not None else None
+            options = {'map': '0:v:0', 'an': None, 'vcodec': encoder, 'f': fmt, **encoder_options}
+            if length is not None:
+                options['t'] = round(length - 0.001, 6)  # Stop short of the keyframe the next part starts with
+            stream = ffmpeg.input(input_path, ss=round(start + part_start, 6)).output(target, **options)
+            if not run_ffmpeg(stream, message='Re-encoding clip edge...').frame:
+                continue  # Less than a frame before the keyframe - nothing to show there
+            encoded_seconds += length or 0.0
+            paths.append(target)
+            if publisher:
+                publisher.publish({'progress': min((index + 1) / (len(parts) + 1) * 100, 99.9)}, 'Cutting clip...')
+
+        list_path = os.path.join(scratch.path, 'parts.txt')
+        with open(list_path, 'w') as f:
+            for path in paths:
+                f.write(f"file '{path}'\n")
+        inputs = [ffmpeg.input(list_path, f='concat', safe=0)['v']]
+        if audio_options:
+            # Cut on its own so the join is a plain copy of two inputs that both start at the window
+            audio_path = os.path.join(scratch.path, f"audio.{ext}")
+            run_ffmpeg(exact_audio(input_path, audio_path, window, audio_options, f=fmt), message='Cutting audio...')
+            inputs.append(ffmpeg.input(audio_path)['a'])
+        final_options = {'vcodec': 'copy', **({'acodec': 'copy'} if audio_options else {'an': None}), **output_options}
+        run_ffmpeg(ffmpeg.output(*inputs, output_path, **final_options), message='Joining clip...')
+        scratch.check_quota(interval=0)
+
+        if encoded_seconds:
+            logger.info(f"Clip {start}-{end}: re-encoded {encoded_seconds:.2f}s of edges with {encoder}, "
+                        f"copied the rest")
+        else:
+            logger.info(f"Clip {start}-{end}: keyframe-aligned, stream copy only")
+        return {'parts': parts, 'encoded_seconds': encoded_seconds}
+    except ffmpeg.Error as e:
+        stderr = (e.stderr or b'').decode('utf-8', 'replace')
+        raise Exception(f"Clip cut failed: {stderr[-2000:]}")
+    finally:
+        scratch.cleanup()
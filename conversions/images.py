@@ -0,0 +1,118 @@
+"""
+In-process image conversion with Pillow (optional), falling back to ffmpeg for formats it can't handle
+"""
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple
+import ffmpeg
+from django.conf import settings
+from .progress import ProgressPublisher, run_ffmpeg
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow not installed - every image goes through ffmpeg
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Extension -> Pillow format name. Whether the installed build can actually read/write each one
+# (WebP and AVIF depend on the native libraries it was compiled with) is checked at runtime.
+PILLOW_FORMATS = {
+    'jpg': 'JPEG',
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+    'webp': 'WEBP',
+    'avif': 'AVIF',
+    'ico': 'ICO',
+}
+
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 90},
+    'PNG': {'compress_level': 6},
+    'WEBP': {'quality': 90, 'method': 4},
+    'AVIF': {'quality': 75},
+    'ICO': {'sizes': [(16, 16), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256)]},
+}
+
+# Formats without an alpha channel or palette support
+_RGB_ONLY = {'JPEG'}
+
+
+def _pillow_supports(fmt: str, write: bool) -> bool:
+    if Image is None or fmt not in PILLOW_FORMATS:
+        return False
+    Image.init()
+    name = PILLOW_FORMATS[fmt]
+    return name in (Image.SAVE if write else Image.OPEN)
+
+
+def engine_for(input_format: str, output_format: str) -> str:
+    """'pillow' when the installed Pillow can both read the input and write the output, else 'ffmpeg'"""
+    input_format = input_format.lower()
+    output_format = output_format.lower()
+    if _pillow_supports(input_format, write=False) and _pillow_supports(output_format, write=True):
+        return 'pillow'
+    return 'ffmpeg'
+
+
+def _convert_with_pillow(input_path: str, output_path: str, output_format: str):
+    """Decode and encode in this process - Pillow releases the GIL inside its codecs, so threads scale"""
+    name = PILLOW_FORMATS[output_format]
+    with Image.open(input_path) as image:
+        image = ImageOps.exif_transpose(image)  # Camera photos are often stored sideways
+        if name in _RGB_ONLY and image.mode not in ('RGB', 'L'):
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # Flatten transparency onto white rather than letting it turn black
+                rgba = image.convert('RGBA')
+                background = Image.new('RGB', rgba.size, (255, 255, 255))
+                background.paste(rgba, mask=rgba.getchannel('A'))
+                image = background
+            else:
+                image = image.convert('RGB')
+        image.save(output_path, format=name, **SAVE_OPTIONS.get(name, {}))
+
+
+def _convert_with_ffmpeg(input_path: str, output_path: str, publisher: Optional[ProgressPublisher] = None):
+    try:
+        stream = ffmpeg.output(ffmpeg.input(input_path), output_path, vframes=1)
+        run_ffmpeg(stream, publisher, message='Converting image...')
+    except ffmpeg.Error as e:
+        logger.error(f"FFmpeg error in image conversion: {e.stderr}")
+        raise Exception(f"Image conversion failed: {e.stderr}")
+
+
+def convert_image(input_path: str, output_path: str, publisher: Optional[ProgressPublisher] = None) -> str:
+    """Convert one image; returns the engine that did it"""
+    input_format = os.path.splitext(input_path)[1].lstrip('.').lower()
+    output_format = os.path.splitext(output_path)[1].lstrip('.').lower()
+    engine = engine_for(input_format, output_format)
+    if engine == 'pillow':
+        try:
+            _convert_with_pillow(input_path, output_path, output_format)
+            return engine
+        except (OSError, ValueError) as e:
+            # Unusual variants (CMYK PNG, animated inputs, exotic bit depths) - let ffmpeg try
+            logger.warning(f"Pillow could not convert {input_path}, using ffmpeg: {str(e)}")
+    _convert_with_ffmpeg(input_path, output_path, publisher)
+    return 'ffmpeg'
+
+
+def convert_images(jobs: List[Tuple[str, str]], max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Convert many (input_path, output_path) pairs on a thread pool; one failure doesn't stop the rest"""
+    max_workers = max_workers or settings.IMAGE_CONVERSION_WORKERS or os.cpu_count() or 1
+
+    def run(job: Tuple[str, str]) -> Dict[str, Any]:
+        input_path, output_path = job
+        started = time.monotonic()
+        result = {'input': input_path, 'output': output_path, 'engine': None, 'error': None}
+        try:
+            result['engine'] = convert_image(input_path, output_path)
+        except Exception as e:
+            result['error'] = str(e)
+        result['seconds'] = round(time.monotonic() - started, 4)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(run, jobs))
@@ -0,0 +1,74 @@
+import os
+import time
+import ffmpeg
+from django.core.management.base import BaseCommand
+from conversions.images import convert_images, engine_for, _convert_with_ffmpeg
+from core.scratch import ScratchSpace
+
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'webp', 'avif', 'ico')
+
+
+class Command(BaseCommand):
+    help = 'Images/second for the in-process batch pipeline versus one ffmpeg process per image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', nargs='?', help='Directory of test images (default: generate a mixed-size set)')
+        parser.add_argument('--to', default='webp', help='Output format (default webp)')
+        parser.add_argument('--count', type=int, default=40, help='Images to generate when no directory is given')
+        parser.add_argument('--workers', type=int, default=None, help='Thread pool size (default: one per core)')
+
+    def handle(self, *args, **options):
+        scratch = ScratchSpace().allocate('benchmark-images')
+        try:
+            directory = options['directory']
+            if not directory:
+                directory = os.path.join(scratch.path, 'source')
+                os.makedirs(directory)
+                self.stdout.write(f"Generating {options['count']} mixed-size test images...")
+                sizes = [(320, 240), (800, 600), (1280, 720), (1920, 1080), (3840, 2160)]
+                for i in range(options['count']):
+                    width, height = sizes[i % len(sizes)]
+                    ext = ('jpg', 'png')[i % 2]
+                    ffmpeg.input(f"testsrc2=size={width}x{height}:rate=1", f='lavfi').output(
+                        os.path.join(directory, f"img_{i:03d}.{ext}"), vframes=1
+                    ).run(overwrite_output=True, quiet=True)
+
+            sources = sorted(
+                os.path.join(directory, name) for name in os.listdir(directory)
+                if name.lower().rsplit('.', 1)[-1] in IMAGE_EXTENSIONS
+            )
+            if not sources:
+                self.stderr.write("No images found")
+                return
+            target = options['to']
+
+            def outputs(tag):
+                out_dir = os.path.join(scratch.path, tag)
+                os.makedirs(out_dir, exist_ok=True)
+                return [(src, os.path.join(out_dir, f"{os.path.splitext(os.path.basename(src))[0]}.{target}"))
+                        for src in sources]
+
+            started = time.monotonic()
+            ffmpeg_failures = 0
+            for src, dst in outputs('ffmpeg'):
+                try:
+                    _convert_with_ffmpeg(src, dst)
+                except Exception:
+                    ffmpeg_failures += 1  # e.g. ffmpeg's ICO muxer rejects anything over 256px
+            per_process = time.monotonic() - started
+
+            started = time.monotonic()
+            results = convert_images(outputs('batch'), max_workers=options['workers'])
+            batch = time.monotonic() - started
+
+            engines = {}
+            for result in results:
+                engines[result['engine'] or 'failed'] = engines.get(result['engine'] or 'failed', 0) + 1
+            sample = os.path.splitext(sources[0])[1].lstrip('.')
+            self.stdout.write(f"images:        {len(sources)} -> {target} (e.g. {sample}: {engine_for(sample, target)})")
+            self.stdout.write(f"ffmpeg/image:  {per_process:.2f}s ({len(sources) / per_process:.1f} images/s)"
+                              + (f", {ffmpeg_failures} failed" if ffmpeg_failures else ''))
+            self.stdout.write(f"batch:         {batch:.2f}s ({len(sources) / batch:.1f} images/s), engines {engines}")
+            self.stdout.write(f"speedup:       {per_process / batch:.2f}x")
+        finally:
+            scratch.cleanup()
@@ -0,0 +1,57 @@
+import os
+import time
+import ffmpeg
+from django.core.management.base import BaseCommand
+from conversions.profiles import resolve_profile
+from conversions.capabilities import get_capabilities
+from conversions.parallel import encode_parallel, segment_workers
+from conversions.progress import run_ffmpeg
+from core.scratch import ScratchSpace
+
+
+class Command(BaseCommand):
+    help = 'Compare single-process and segment-parallel encoding wall-clock time on a generated test pattern'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=int, default=600, help='Seconds of test pattern (default 10 minutes)')
+        parser.add_argument('--height', type=int, default=720)
+        parser.add_argument('--format', default='mp4')
+        parser.add_argument('--quality', default='original')
+        parser.add_argument('--speed', default=None)
+        parser.add_argument('--workers', type=int, default=None, help='Parallel segments (default: sized to cores)')
+
+    def handle(self, *args, **options):
+        duration = options['duration']
+        scratch = ScratchSpace().allocate('benchmark-parallel')
+        try:
+            source = os.path.join(scratch.path, 'source.mp4')
+            width = options['height'] * 16 // 9
+            width -= width % 2
+            self.stdout.write(f"Generating {duration}s {width}x{options['height']} test pattern...")
+            video = ffmpeg.input(f"testsrc2=size={width}x{options['height']}:rate=30:duration={duration}", f='lavfi')
+            audio = ffmpeg.input(f"sine=frequency=440:duration={duration}", f='lavfi')
+            ffmpeg.output(video, audio, source, vcodec='libx264', preset='ultrafast', crf=18, g=60,
+                          acodec='aac').run(overwrite_output=True, quiet=True)
+
+            profile = resolve_profile(options['format'], options['quality'], options['speed'],
+                                      source_height=options['height'], capabilities=get_capabilities())
+            plan = {'video': 'encode', 'audio': 'encode'}
+
+            single_path = os.path.join(scratch.path, f"single.{options['format']}")
+            started = time.monotonic()
+            run_ffmpeg(ffmpeg.output(ffmpeg.input(source), single_path, **profile.output_options()), duration=duration)
+            single = time.monotonic() - started
+
+            parallel_path = os.path.join(scratch.path, f"parallel.{options['format']}")
+            result = encode_parallel(source, parallel_path, profile, duration, plan,
+                                     workers=options['workers'] or segment_workers())
+
+            self.stdout.write(f"profile:   {profile.name} ({profile.video_encoder})")
+            self.stdout.write(f"single:    {single:.1f}s ({duration / single:.2f}x realtime)")
+            self.stdout.write(f"parallel:  {result['seconds']:.1f}s ({duration / result['seconds']:.2f}x realtime), "
+                              f"{result['segments']} segments on {result['workers']} workers")
+            self.stdout.write(f"speedup:   {single / result['seconds']:.2f}x")
+            self.stdout.write(f"sizes:     single {os.path.getsize(single_path)} bytes, "
+                              f"parallel {os.path.getsize(parallel_path)} bytes")
+        finally:
+            scratch.cleanup()
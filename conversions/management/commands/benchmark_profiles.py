@@ -0,0 +1,55 @@
+import os
+import time
+import ffmpeg
+from django.core.management.base import BaseCommand
+from conversions.profiles import profile_matrix, QUALITY_TIERS
+from conversions.capabilities import get_capabilities
+from conversions.progress import run_ffmpeg
+from core.scratch import ScratchSpace
+
+
+class Command(BaseCommand):
+    help = 'Encode a synthetic clip with every conversion profile and report encode fps'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=int, default=5, help='Seconds of synthetic input')
+        parser.add_argument('--height', type=int, default=1080, help='Height of the synthetic input')
+        parser.add_argument('--formats', nargs='*', help='Output formats (default: all)')
+        parser.add_argument('--qualities', nargs='*', help='Quality tiers (default: all)')
+        parser.add_argument('--speeds', nargs='*', help='Speed tiers (default: all)')
+
+    def handle(self, *args, **options):
+        scratch = ScratchSpace().allocate('benchmark-profiles')
+        try:
+            source = os.path.join(scratch.path, 'source.mkv')
+            width = options['height'] * 16 // 9
+            width -= width % 2
+            fps = 30
+            frames = options['duration'] * fps
+
+            # Lossless synthetic source so decoding cost stays negligible next to the encode
+            video = ffmpeg.input(f"testsrc2=size={width}x{options['height']}:rate={fps}:duration={options['duration']}", f='lavfi')
+            audio = ffmpeg.input(f"sine=frequency=440:duration={options['duration']}", f='lavfi')
+            ffmpeg.output(video, audio, source, vcodec='ffv1', acodec='pcm_s16le').run(overwrite_output=True, quiet=True)
+
+            qualities = options['qualities'] or [q for q in QUALITY_TIERS if q == 'original' or int(q[:-1]) <= options['height']]
+            self.stdout.write(f"{'profile':<28} {'encoder':<14} {'seconds':>8} {'fps':>8} {'x realtime':>11}")
+            for profile in profile_matrix(options['formats'], qualities, options['speeds'], get_capabilities()):
+                profile.source_height = options['height']
+                output = os.path.join(scratch.path, f"out.{profile.output_format}")
+                stream = ffmpeg.output(ffmpeg.input(source), output, **profile.output_options())
+                started = time.monotonic()
+                try:
+                    run_ffmpeg(stream, duration=options['duration'])
+                except Exception as e:
+                    self.stdout.write(f"{profile.name:<28} {'-':<14} failed: {str(e).splitlines()[-1][:60]}")
+                    continue
+                elapsed = time.monotonic() - started
+                encoder = profile.video_encoder or profile.audio_options().get('acodec', '-')
+                encoded_frames = frames if profile.video_codec else 0
+                self.stdout.write(
+                    f"{profile.name:<28} {encoder:<14} {elapsed:>8.2f} "
+                    f"{(encoded_frames / elapsed if encoded_frames else 0):>8.1f} {options['duration'] / elapsed:>11.1f}"
+                )
+        finally:
+            scratch.cleanup()
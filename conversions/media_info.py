@@ -0,0 +1,52 @@
+"""
+ffprobe summary of a media file: duration, size, bitrate, per-stream codecs and chapters
+"""
+import logging
+from typing import Dict, Any
+import ffmpeg
+from .chapters import normalize_chapters
+
+logger = logging.getLogger(__name__)
+
+
+def probe_media(file_path: str) -> Dict[str, Any]:
+    """Get media file information using ffprobe; {} when it can't be read"""
+    try:
+        probe = ffmpeg.probe(file_path, show_chapters=None)
+
+        info = {
+            'duration': float(probe.get('format', {}).get('duration', 0)),
+            'size': int(probe.get('format', {}).get('size', 0)),
+            'bitrate': int(probe.get('format', {}).get('bit_rate', 0)),
+            'format_name': probe.get('format', {}).get('format_name', ''),
+            'streams': []
+        }
+
+        for stream in probe.get('streams', []):
+            stream_info = {
+                'codec_type': stream.get('codec_type'),
+                'codec_name': stream.get('codec_name'),
+            }
+
+            if stream.get('codec_type') == 'video':
+                stream_info.update({
+                    'width': stream.get('width'),
+                    'height': stream.get('height'),
+                    'fps': eval(stream.get('r_frame_rate', '0/1'))
+                })
+            elif stream.get('codec_type') == 'audio':
+                stream_info.update({
+                    'sample_rate': stream.get('sample_rate'),
+                    'channels': stream.get('channels'),
+                    'channel_layout': stream.get('channel_layout')
+                })
+
+            info['streams'].append(stream_info)
+
+        info['chapters'] = normalize_chapters(probe.get('chapters'), info['duration'] or None)
+
+        return info
+
+    except Exception as e:
+        logger.error(f"Error getting media info: {str(e)}")
+        return {}
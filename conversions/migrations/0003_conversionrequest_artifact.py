@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversions', '0002_initial'),
+        ('core', '0002_artifact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversionrequest',
+            name='artifact',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='conversions', to='core.artifact'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversions', '0003_conversionrequest_artifact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversionrequest',
+            name='encode_speed',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversionrequest',
+            name='eta_seconds',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:13
+
+import conversions.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversions', '0004_conversionrequest_encode_speed_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversionOutput',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('output_format', models.CharField(choices=[('mp4', 'MP4 Video'), ('avi', 'AVI Video'), ('mkv', 'MKV Video'), ('mov', 'MOV Video'), ('webm', 'WebM Video'), ('mp3', 'MP3 Audio'), ('wav', 'WAV Audio'), ('flac', 'FLAC Audio'), ('aac', 'AAC Audio'), ('ogg', 'OGG Audio'), ('m4a', 'M4A Audio')], max_length=10)),
+                ('output_quality', models.CharField(choices=[('144p', '144p'), ('240p', '240p'), ('360p', '360p'), ('480p', '480p'), ('720p', '720p'), ('1080p', '1080p'), ('1440p', '1440p'), ('2160p', '2160p (4K)'), ('original', 'Original Quality')], default='original', max_length=10)),
+                ('audio_bitrate', models.CharField(blank=True, max_length=10)),
+                ('output_file', models.FileField(blank=True, null=True, upload_to=conversions.models.upload_to_conversions)),
+                ('output_size', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('conversion_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outputs', to='conversions.conversionrequest')),
+            ],
+            options={
+                'ordering': ['conversion_request', 'position'],
+            },
+        ),
+    ]
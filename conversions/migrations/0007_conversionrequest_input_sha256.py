@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversions', '0006_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversionrequest',
+            name='input_sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:27
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversions', '0007_conversionrequest_input_sha256'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversionoutput',
+            name='output_format',
+            field=models.CharField(choices=[('mp4', 'MP4 Video'), ('avi', 'AVI Video'), ('mkv', 'MKV Video'), ('mov', 'MOV Video'), ('webm', 'WebM Video'), ('mp3', 'MP3 Audio'), ('wav', 'WAV Audio'), ('flac', 'FLAC Audio'), ('aac', 'AAC Audio'), ('ogg', 'OGG Audio'), ('m4a', 'M4A Audio'), ('jpg', 'JPEG Image'), ('png', 'PNG Image'), ('webp', 'WebP Image'), ('avif', 'AVIF Image'), ('ico', 'ICO Icon')], max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='conversionrequest',
+            name='output_format',
+            field=models.CharField(choices=[('mp4', 'MP4 Video'), ('avi', 'AVI Video'), ('mkv', 'MKV Video'), ('mov', 'MOV Video'), ('webm', 'WebM Video'), ('mp3', 'MP3 Audio'), ('wav', 'WAV Audio'), ('flac', 'FLAC Audio'), ('aac', 'AAC Audio'), ('ogg', 'OGG Audio'), ('m4a', 'M4A Audio'), ('jpg', 'JPEG Image'), ('png', 'PNG Image'), ('webp', 'WebP Image'), ('avif', 'AVIF Image'), ('ico', 'ICO Icon')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='ConversionBatch',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('output_format', models.CharField(choices=[('mp4', 'MP4 Video'), ('avi', 'AVI Video'), ('mkv', 'MKV Video'), ('mov', 'MOV Video'), ('webm', 'WebM Video'), ('mp3', 'MP3 Audio'), ('wav', 'WAV Audio'), ('flac', 'FLAC Audio'), ('aac', 'AAC Audio'), ('ogg', 'OGG Audio'), ('m4a', 'M4A Audio'), ('jpg', 'JPEG Image'), ('png', 'PNG Image'), ('webp', 'WebP Image'), ('avif', 'AVIF Image'), ('ico', 'ICO Icon')], max_length=10)),
+                ('output_quality', models.CharField(choices=[('144p', '144p'), ('240p', '240p'), ('360p', '360p'), ('480p', '480p'), ('720p', '720p'), ('1080p', '1080p'), ('1440p', '1440p'), ('2160p', '2160p (4K)'), ('original', 'Original Quality')], default='original', max_length=10)),
+                ('custom_settings', models.JSONField(blank=True, default=dict)),
+                ('concurrency', models.PositiveSmallIntegerField(default=1)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=20)),
+                ('error_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='conversionrequest',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conversions', to='conversions.conversionbatch'),
+        ),
+    ]
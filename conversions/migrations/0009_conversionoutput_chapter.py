@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversions', '0008_conversionbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversionoutput',
+            name='end_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversionoutput',
+            name='label',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='conversionoutput',
+            name='start_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -33,6 +33,11 @@ class ConversionRequest(models.Model):
         ('aac', 'AAC Audio'),
         ('ogg', 'OGG Audio'),
         ('m4a', 'M4A Audio'),
+        ('jpg', 'JPEG Image'),
+        ('png', 'PNG Image'),
+        ('webp', 'WebP Image'),
+        ('avif', 'AVIF Image'),
+        ('ico', 'ICO Icon'),
     ]
 
     QUALITY_CHOICES = [
@@ -49,12 +54,14 @@ class ConversionRequest(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    batch = models.ForeignKey('ConversionBatch', on_delete=models.CASCADE, null=True, blank=True, related_name='conversions')
     
     # Input file
     input_file = models.FileField(upload_to='temp_uploads/')
     input_filename = models.CharField(max_length=255)
     input_format = models.CharField(max_length=10)
     input_size = models.BigIntegerField()  # in bytes
+    input_sha256 = models.CharField(max_length=64, blank=True)  # Result cache key; set on the first lookup
     
     # Output settings
     output_format = models.CharField(max_length=10, choices=OUTPUT_FORMAT_CHOICES)
@@ -65,10 +72,13 @@ class ConversionRequest(models.Model):
     output_file = models.FileField(upload_to=upload_to_conversions, blank=True, null=True)
     output_filename = models.CharField(max_length=255, blank=True)
     output_size = models.BigIntegerField(null=True, blank=True)  # in bytes
+    artifact = models.ForeignKey('core.Artifact', on_delete=models.SET_NULL, null=True, blank=True, related_name='conversions')
     
     # Status and tracking
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     progress = models.IntegerField(default=0)  # 0-100
+    encode_speed = models.FloatField(null=True, blank=True)  # x realtime, as reported by ffmpeg
+    eta_seconds = models.IntegerField(null=True, blank=True)
     error_message = models.TextField(blank=True)
     
     # Timestamps
@@ -118,10 +128,14 @@ class ConversionRequest(models.Model):
         else:
             return f"{minutes:02d}:{seconds:02d}"
 
-    def delete_files(self):
-        """Delete both input and output files from storage"""
+    def discard_input(self):
+        """Remove the uploaded input once the conversion no longer needs it"""
         if self.input_file and os.path.exists(self.input_file.path):
             os.remove(self.input_file.path)
+
+    def delete_files(self):
+        """Delete both input and output files from storage"""
+        self.discard_input()
         
         if self.output_file and os.path.exists(self.output_file.path):
             os.remove(self.output_file.path)
@@ -130,6 +144,16 @@ class ConversionRequest(models.Model):
                 self.user.storage_used -= self.output_size
                 self.user.save()
 
+        # Extra renditions of a multi-output job (the primary one is output_file, removed above)
+        for output in self.outputs.all():
+            if output.output_file and os.path.exists(output.output_file.path):
+                os.remove(output.output_file.path)
+
+        # The shared artifact blob stays until no job references it
+        if self.artifact_id:
+            from core.artifacts import ArtifactStore
+            ArtifactStore().release(self)
+
     def save(self, *args, **kwargs):
         # Set expiration date (7 days from creation)
         if not self.expires_at:
@@ -146,6 +170,103 @@ class ConversionRequest(models.Model):
         super().save(*args, **kwargs)
 
 
+class ConversionBatch(models.Model):
+    """Many inputs converted with the same settings and returned together as one ZIP"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    output_format = models.CharField(max_length=10, choices=ConversionRequest.OUTPUT_FORMAT_CHOICES)
+    output_quality = models.CharField(max_length=10, choices=ConversionRequest.QUALITY_CHOICES, default='original')
+    custom_settings = models.JSONField(default=dict, blank=True)
+    concurrency = models.PositiveSmallIntegerField(default=1)  # Files of this batch converting at once
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error_message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Batch {self.id} -> {self.output_format} - {self.status}"
+
+    def delete_files(self):
+        """Delete the files of every conversion in the batch"""
+        for conversion_request in self.conversions.all():
+            conversion_request.delete_files()
+
+
+class ConversionOutput(models.Model):
+    """One rendition written by a conversion; multi-output jobs have several from a single decode pass"""
+    conversion_request = models.ForeignKey(ConversionRequest, on_delete=models.CASCADE, related_name='outputs')
+    position = models.PositiveSmallIntegerField(default=0)  # 0 is the job's own output_format/output_quality
+    label = models.CharField(max_length=255, blank=True)  # Chapter title when the job was split by chapters
+    start_time = models.FloatField(null=True, blank=True)  # Where a chapter sits in the input, in seconds
+    end_time = models.FloatField(null=True, blank=True)
+    output_format = models.CharField(max_length=10, choices=ConversionRequest.OUTPUT_FORMAT_CHOICES)
+    output_quality = models.CharField(max_length=10, choices=ConversionRequest.QUALITY_CHOICES, default='original')
+    audio_bitrate = models.CharField(max_length=10, blank=True)
+    output_file = models.FileField(upload_to=upload_to_conversions, blank=True, null=True)
+    output_size = models.BigIntegerField(null=True, blank=True)  # in bytes
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['conversion_request', 'position']
+
+    def __str__(self):
+        return f"{self.conversion_request_id} #{self.position} -> {self.output_format}/{self.output_quality}"
+
+    def get_output_size_mb(self):
+        """Return output file size in MB"""
+        if self.output_size:
+            return round(self.output_size / (1024 * 1024), 2)
+        return 0
+
+
+class ChunkedUpload(models.Model):
+    """A conversion input sent in resumable chunks; finished uploads are kept in the artifact store"""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+        ('failed', 'Failed'),
+        ('expired', 'Expired'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()  # in bytes
+    received = models.BigIntegerField(default=0)  # Next offset the server expects
+    expected_sha256 = models.CharField(max_length=64, blank=True)  # Declared by the client, verified at the end
+    sha256 = models.CharField(max_length=64, blank=True)  # Computed while the chunks arrived
+    scratch_path = models.CharField(max_length=500, blank=True)
+    artifact = models.ForeignKey('core.Artifact', on_delete=models.SET_NULL, null=True, blank=True, related_name='uploads')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    error_message = models.TextField(blank=True)
+    deduplicated = models.BooleanField(default=False)  # Content was already stored - nothing was uploaded
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.total_size}) - {self.status}"
+
+    def get_progress(self):
+        """Return upload progress as a percentage"""
+        if not self.total_size:
+            return 100
+        return round(self.received / self.total_size * 100, 1)
+
+
 class ConversionHistory(models.Model):
     """Track conversion history for analytics"""
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
@@ -0,0 +1,146 @@
+"""
+Segment-parallel encoding: split long inputs at keyframes, encode the pieces concurrently, stitch with stream copy
+"""
+import os
+import glob
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+import ffmpeg
+from django.conf import settings
+from django.db import connection
+from .profiles import EncodingProfile, VIDEO_ENCODERS
+from .progress import FFmpegProgress, ProgressPublisher, run_ffmpeg
+from core.scratch import ScratchSpace
+
+logger = logging.getLogger(__name__)
+
+
+def core_share(concurrent_jobs: int = 1, cores: Optional[int] = None) -> int:
+    """Cores one of concurrent_jobs encodes running side by side may use"""
+    return max(1, (cores or os.cpu_count() or 1) // max(1, concurrent_jobs))
+
+
+def segment_workers(cores: Optional[int] = None) -> int:
+    """How many segments to encode at once; each encoder still gets a few threads of its own"""
+    cores = cores or os.cpu_count() or 1
+    return max(1, min(cores // settings.PARALLEL_ENCODE_THREADS_PER_SEGMENT, settings.PARALLEL_ENCODE_MAX_WORKERS))
+
+
+def should_parallelize(profile: EncodingProfile, duration: Optional[float], plan: Dict[str, Optional[str]],
+                       cores: Optional[int] = None) -> bool:
+    """Only long, video-encoding jobs with a software encoder and spare cores are worth splitting"""
+    if not settings.PARALLEL_ENCODE_ENABLED or not duration or duration < settings.PARALLEL_ENCODE_MIN_DURATION:
+        return False
+    if plan.get('video') != 'encode' or not profile.video_encoder:
+        return False
+    if VIDEO_ENCODERS[profile.video_encoder].get('hardware'):
+        return False  # A GPU has one encode engine - more processes just queue on it
+    return segment_workers(cores) >= 2
+
+
+class _CombinedProgress:
+    """Sums encoded media time across concurrently running segments into one job-level figure"""
+
+    def __init__(self, publisher: Optional[ProgressPublisher], duration: float):
+        self.publisher = publisher
+        self.duration = duration
+        self.encoded: Dict[int, float] = {}
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def update(self, index: int, tracker: FFmpegProgress):
+        with self._lock:
+            self.encoded[index] = tracker.out_time
+            done = sum(self.encoded.values())
+            elapsed = time.monotonic() - self.started
+            speed = done / elapsed if elapsed > 0 else None
+            snapshot = {
+                'progress': min(done / self.duration * 100, 99.9),
+                'speed': round(speed, 2) if speed else None,
+                'eta_seconds': int((self.duration - done) / speed) if speed else None,
+            }
+            if self.publisher:
+                self.publisher.publish(snapshot, f'Encoding {len(self.encoded)} segments in parallel...')
+
+
+def encode_parallel(input_path: str, output_path: str, profile: EncodingProfile, duration: float,
+                    plan: Dict[str, Optional[str]], publisher: Optional[ProgressPublisher] = None,
+                    workers: Optional[int] = None, segment_seconds: Optional[int] = None,
+                    cores: Optional[int] = None) -> Dict[str, Any]:
+    """Encode input_path to output_path using a pool of ffmpeg processes over keyframe-aligned segments
+
+    cores bounds the whole encode (segment workers times their threads); it defaults to the machine.
+    """
+    cores = cores or os.cpu_count() or 1
+    workers = workers or segment_workers(cores)
+    segment_seconds = segment_seconds or max(
+        settings.PARALLEL_ENCODE_MIN_SEGMENT, int(duration / (workers * 2)) + 1
+    )
+    threads = max(1, cores // workers)
+    started = time.monotonic()
+
+    scratch = ScratchSpace().allocate(f"parallel-{os.path.basename(output_path)}")
+    try:
+        # 1. Split the video stream without decoding - stream copy can only cut at keyframes, which is what we want
+        pattern = os.path.join(scratch.path, 'src_%05d.mkv')
+        ffmpeg.input(input_path).output(
+            pattern, map='0:v:0', c='copy', f='segment', segment_time=segment_seconds, reset_timestamps=1,
+        ).run(overwrite_output=True, quiet=True)
+        sources = sorted(glob.glob(os.path.join(scratch.path, 'src_*.mkv')))
+        if not sources:
+            raise Exception("Keyframe split produced no segments")
+
+        # 2. Audio is cheap - encode (or copy) it once, whole, so segment joins can't cause gaps or clicks
+        audio_path = None
+        if plan.get('audio'):
+            audio_path = os.path.join(scratch.path, 'audio.mka')
+            audio_options = {'acodec': 'copy'} if plan['audio'] == 'copy' else profile.audio_options()
+            ffmpeg.input(input_path).output(audio_path, map='0:a:0', vn=None, **audio_options).run(
+                overwrite_output=True, quiet=True
+            )
+
+        # 3. Encode the segments concurrently
+        video_options = {**profile.video_options(), 'threads': threads}
+        if 'x265-params' in video_options:
+            video_options['x265-params'] = f"pools={threads}"
+        combined = _CombinedProgress(publisher, duration)
+
+        def encode(index: int, source: str) -> str:
+            target = os.path.join(scratch.path, f"enc_{index:05d}.mkv")
+            try:
+                stream = ffmpeg.input(source).output(target, an=None, **video_options)
+                run_ffmpeg(stream, callback=lambda tracker: combined.update(index, tracker))
+                scratch.check_quota(interval=0)
+            finally:
+                connection.close()  # Progress publishing opened a DB connection on this pool thread
+            return target
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            encoded = list(pool.map(encode, range(len(sources)), sources))
+
+        # 4. Concatenate with the concat demuxer (stream copy) and mux the audio back in
+        list_path = os.path.join(scratch.path, 'segments.txt')
+        with open(list_path, 'w') as f:
+            for path in encoded:
+                f.write(f"file '{path}'\n")
+
+        inputs = [ffmpeg.input(list_path, f='concat', safe=0)['v']]
+        if audio_path:
+            inputs.append(ffmpeg.input(audio_path)['a'])
+        mux_options = {'c': 'copy'}
+        if profile.output_format in ('mp4', 'mov'):
+            mux_options['movflags'] = '+faststart'
+        ffmpeg.output(*inputs, output_path, **mux_options).run(overwrite_output=True, quiet=True)
+
+        elapsed = time.monotonic() - started
+        logger.info(f"Parallel encode of {len(sources)} segments on {workers} workers took {elapsed:.1f}s "
+                    f"({duration / elapsed:.2f}x realtime)")
+        return {'segments': len(sources), 'workers': workers, 'seconds': elapsed}
+    except ffmpeg.Error as e:
+        stderr = (e.stderr or b'').decode('utf-8', 'replace')
+        raise Exception(f"Parallel encode failed: {stderr[-2000:]}")
+    finally:
+        scratch.cleanup()
@@ -0,0 +1,307 @@
+"""
+Declarative encoding profiles: (output format, quality tier, speed) -> ffmpeg output options
+"""
+from typing import Dict, Any, Optional, List
+from django.conf import settings
+
+SPEEDS = ('fast', 'balanced', 'quality')
+
+# Target height and audio bitrate for each ConversionRequest.QUALITY_CHOICES value
+QUALITY_TIERS = {
+    '144p': {'height': 144, 'audio_bitrate': '64k'},
+    '240p': {'height': 240, 'audio_bitrate': '96k'},
+    '360p': {'height': 360, 'audio_bitrate': '96k'},
+    '480p': {'height': 480, 'audio_bitrate': '128k'},
+    '720p': {'height': 720, 'audio_bitrate': '160k'},
+    '1080p': {'height': 1080, 'audio_bitrate': '192k'},
+    '1440p': {'height': 1440, 'audio_bitrate': '192k'},
+    '2160p': {'height': 2160, 'audio_bitrate': '256k'},
+    'original': {'height': None, 'audio_bitrate': '256k'},
+}
+
+# Default (video codec, audio codec) per output container; None = the container has no such stream
+FORMAT_CODECS = {
+    'mp4': ('h264', 'aac'),
+    'mov': ('h264', 'aac'),
+    'mkv': ('h264', 'aac'),
+    'avi': ('mpeg4', 'mp3'),
+    'webm': ('vp9', 'opus'),
+    'mp3': (None, 'mp3'),
+    'aac': (None, 'aac'),
+    'm4a': (None, 'aac'),
+    'ogg': (None, 'vorbis'),
+    'flac': (None, 'flac'),
+    'wav': (None, 'pcm'),
+}
+
+# Codecs (ffprobe names) each container can hold, so a stream that already fits is copied, not re-encoded
+CONTAINER_CODECS = {
+    'mp4': {'video': {'h264', 'hevc', 'av1', 'mpeg4', 'vp9'},
+            'audio': {'aac', 'mp3', 'alac', 'opus', 'ac3', 'eac3'}},
+    'mov': {'video': {'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'},
+            'audio': {'aac', 'mp3', 'alac', 'ac3', 'pcm_s16le', 'pcm_s24le'}},
+    'mkv': {'video': {'h264', 'hevc', 'av1', 'vp8', 'vp9', 'mpeg4', 'mpeg2video', 'prores', 'mjpeg'},
+            'audio': {'aac', 'mp3', 'opus', 'vorbis', 'flac', 'alac', 'ac3', 'eac3', 'dts', 'pcm_s16le', 'pcm_s24le'}},
+    'webm': {'video': {'vp8', 'vp9', 'av1'}, 'audio': {'opus', 'vorbis'}},
+    'avi': {'video': {'h264', 'mpeg4', 'mjpeg', 'mpeg2video'}, 'audio': {'mp3', 'ac3', 'pcm_s16le'}},
+    'mp3': {'audio': {'mp3'}},
+    'aac': {'audio': {'aac'}},
+    'm4a': {'audio': {'aac', 'alac'}},
+    'ogg': {'audio': {'vorbis', 'opus', 'flac'}},
+    'flac': {'audio': {'flac'}},
+    'wav': {'audio': {'pcm_s16le', 'pcm_s24le', 'pcm_s32le', 'pcm_f32le', 'pcm_u8'}},
+}
+
+# Video encoders, keyed by ffmpeg encoder name. 'quality' is (option, value at 1080p, step per smaller
+# size class): frames under 1080p/720p get a step or two looser, since artifacts show less when scaled up.
+VIDEO_ENCODERS = {
+    'libx264': {
+        'quality': ('crf', 21, 1),
+        'speeds': {
+            'fast': {'preset': 'veryfast'},
+            'balanced': {'preset': 'medium'},
+            'quality': {'preset': 'slow'},
+        },
+        'extra': {'pix_fmt': 'yuv420p'},
+    },
+    'libx265': {
+        'quality': ('crf', 24, 1),
+        'speeds': {
+            'fast': {'preset': 'veryfast'},
+            'balanced': {'preset': 'medium'},
+            'quality': {'preset': 'slow'},
+        },
+        'extra': {'pix_fmt': 'yuv420p', 'tag:v': 'hvc1'},  # hvc1 tag so Apple players accept it
+        'x265_pools': True,
+    },
+    'libvpx-vp9': {
+        'quality': ('crf', 32, 1),
+        'speeds': {
+            # cpu-used 5+ with deadline=good is ~4x faster than the libvpx default of 1
+            'fast': {'deadline': 'good', 'cpu-used': 5},
+            'balanced': {'deadline': 'good', 'cpu-used': 3},
+            'quality': {'deadline': 'good', 'cpu-used': 1},
+        },
+        # row-mt + tile columns are what let libvpx use more than ~2 cores
+        'extra': {'b:v': 0, 'row-mt': 1, 'frame-parallel': 0, 'pix_fmt': 'yuv420p'},
+        'tiles': 'tile-columns',
+    },
+    'libaom-av1': {
+        'quality': ('crf', 32, 1),
+        'speeds': {
+            'fast': {'cpu-used': 8, 'usage': 'realtime'},
+            'balanced': {'cpu-used': 6},
+            'quality': {'cpu-used': 4},
+        },
+        'extra': {'b:v': 0, 'row-mt': 1, 'pix_fmt': 'yuv420p'},
+        'tiles': 'tiles',
+    },
+    'libsvtav1': {
+        'quality': ('crf', 35, 1),
+        'speeds': {
+            'fast': {'preset': 10},
+            'balanced': {'preset': 8},
+            'quality': {'preset': 6},
+        },
+        'extra': {'pix_fmt': 'yuv420p'},
+    },
+    'mpeg4': {
+        'quality': ('q:v', 4, 0),  # mpeg4 has no CRF; q:v 2 (best) - 31
+        'speeds': {'fast': {}, 'balanced': {}, 'quality': {}},
+        'extra': {'vtag': 'xvid'},
+    },
+    # Hardware encoders - only picked when the capability probe verified them on this host
+    'h264_nvenc': {
+        'quality': ('cq', 23, 1),
+        'speeds': {'fast': {'preset': 'p1'}, 'balanced': {'preset': 'p4'}, 'quality': {'preset': 'p6'}},
+        'extra': {'rc': 'vbr', 'b:v': 0, 'pix_fmt': 'yuv420p'},
+        'hardware': True,
+    },
+    'hevc_nvenc': {
+        'quality': ('cq', 26, 1),
+        'speeds': {'fast': {'preset': 'p1'}, 'balanced': {'preset': 'p4'}, 'quality': {'preset': 'p6'}},
+        'extra': {'rc': 'vbr', 'b:v': 0, 'pix_fmt': 'yuv420p', 'tag:v': 'hvc1'},
+        'hardware': True,
+    },
+    'av1_nvenc': {
+        'quality': ('cq', 32, 1),
+        'speeds': {'fast': {'preset': 'p1'}, 'balanced': {'preset': 'p4'}, 'quality': {'preset': 'p6'}},
+        'extra': {'rc': 'vbr', 'b:v': 0},
+        'hardware': True,
+    },
+    'h264_qsv': {
+        'quality': ('global_quality', 23, 1),
+        'speeds': {'fast': {'preset': 'veryfast'}, 'balanced': {'preset': 'medium'}, 'quality': {'preset': 'slow'}},
+        'extra': {},
+        'hardware': True,
+    },
+    'hevc_qsv': {
+        'quality': ('global_quality', 26, 1),
+        'speeds': {'fast': {'preset': 'veryfast'}, 'balanced': {'preset': 'medium'}, 'quality': {'preset': 'slow'}},
+        'extra': {'tag:v': 'hvc1'},
+        'hardware': True,
+    },
+    'h264_videotoolbox': {
+        'quality': ('q:v', 65, -5),  # 1-100, higher is better
+        'speeds': {'fast': {}, 'balanced': {}, 'quality': {}},
+        'extra': {'pix_fmt': 'yuv420p'},
+        'hardware': True,
+    },
+    'hevc_videotoolbox': {
+        'quality': ('q:v', 60, -5),
+        'speeds': {'fast': {}, 'balanced': {}, 'quality': {}},
+        'extra': {'pix_fmt': 'yuv420p', 'tag:v': 'hvc1'},
+        'hardware': True,
+    },
+}
+
+# Implementations per codec family, fastest first. The last entry is the default when nothing is probed.
+CODEC_IMPLEMENTATIONS = {
+    'h264': ['h264_nvenc', 'h264_qsv', 'h264_videotoolbox', 'libx264'],
+    'hevc': ['hevc_nvenc', 'hevc_qsv', 'hevc_videotoolbox', 'libx265'],
+    'av1': ['av1_nvenc', 'libsvtav1', 'libaom-av1'],
+    'vp9': ['libvpx-vp9'],
+    'mpeg4': ['mpeg4'],
+}
+
+AUDIO_ENCODERS = {
+    'aac': {'acodec': 'aac'},
+    'mp3': {'acodec': 'libmp3lame'},
+    'opus': {'acodec': 'libopus'},
+    'vorbis': {'acodec': 'libvorbis'},
+    'flac': {'acodec': 'flac', 'compression_level': 5},
+    'pcm': {'acodec': 'pcm_s16le'},
+}
+
+LOSSLESS_AUDIO = {'flac', 'pcm'}
+
+# libvorbis refuses many fixed bitrates (e.g. 256k mono) - use its VBR quality scale instead
+VORBIS_QUALITY = {'64k': 1, '96k': 2, '128k': 4, '160k': 5, '192k': 6, '256k': 8}
+
+
+def _tile_columns(height: Optional[int]) -> int:
+    """log2 of tile columns - one tile per 256px of width is the encoder guidance (assumes 16:9)"""
+    width = (height or 1080) * 16 // 9
+    columns = 0
+    while (256 << (columns + 1)) <= width and columns < 4:
+        columns += 1
+    return columns
+
+
+class EncodingProfile:
+    """Resolved encoding settings for one job"""
+
+    def __init__(self, output_format: str, quality: str, speed: str,
+                 video_codec: Optional[str], audio_codec: Optional[str],
+                 source_height: Optional[int] = None, video_encoder: Optional[str] = None):
+        self.output_format = output_format
+        self.quality = quality if quality in QUALITY_TIERS else 'original'
+        self.speed = speed if speed in SPEEDS else 'balanced'
+        self.video_codec = video_codec
+        self.video_encoder = video_encoder or (CODEC_IMPLEMENTATIONS[video_codec][-1] if video_codec else None)
+        self.audio_codec = audio_codec
+        self.source_height = source_height
+        tier = QUALITY_TIERS[self.quality]
+        # Never upscale
+        self.height = tier['height'] if tier['height'] and (not source_height or source_height > tier['height']) else None
+        self.audio_bitrate = tier['audio_bitrate']
+
+    @property
+    def name(self) -> str:
+        return f"{self.output_format}/{self.quality}/{self.speed}"
+
+    def video_options(self) -> Dict[str, Any]:
+        if not self.video_codec:
+            return {}
+        spec = VIDEO_ENCODERS[self.video_encoder]
+        effective_height = self.height or self.source_height
+        options: Dict[str, Any] = {'vcodec': self.video_encoder}
+
+        option, value, step = spec['quality']
+        if effective_height and effective_height < 720:
+            value += 2 * step
+        elif effective_height and effective_height < 1080:
+            value += step
+        options[option] = value
+
+        options.update(spec['speeds'][self.speed])
+        options.update(spec.get('extra', {}))
+
+        tiles = spec.get('tiles')
+        if tiles == 'tile-columns':
+            options['tile-columns'] = _tile_columns(effective_height)
+        elif tiles == 'tiles':
+            columns = 1 << min(_tile_columns(effective_height), 2)
+            options['tiles'] = f"{columns}x{max(columns // 2, 1)}"
+
+        threads = settings.CONVERSION_THREADS
+        if threads:
+            options['threads'] = threads
+            if spec.get('x265_pools'):
+                options['x265-params'] = f"pools={threads}"
+
+        if self.height:
+            options['vf'] = f"scale=-2:{self.height}"
+        return options
+
+    def audio_options(self) -> Dict[str, Any]:
+        if not self.audio_codec:
+            return {}
+        options = dict(AUDIO_ENCODERS[self.audio_codec])
+        if self.audio_codec == 'vorbis':
+            options['q:a'] = VORBIS_QUALITY.get(self.audio_bitrate, 5)
+        elif self.audio_codec not in LOSSLESS_AUDIO:
+            options['audio_bitrate'] = self.audio_bitrate
+        return options
+
+    def output_options(self, copy_video: bool = False, copy_audio: bool = False) -> Dict[str, Any]:
+        """ffmpeg-python output kwargs; copied streams skip their encoder settings entirely"""
+        video = {'vcodec': 'copy'} if copy_video and self.video_codec else self.video_options()
+        audio = {'acodec': 'copy'} if copy_audio and self.audio_codec else self.audio_options()
+        options = {**video, **audio}
+        if not self.video_codec:
+            options['vn'] = None  # Audio containers - drop video and cover-art streams
+        if self.output_format in ('mp4', 'mov', 'm4a'):
+            options['movflags'] = '+faststart'
+        return options
+
+
+def pick_encoder(video_codec: str, speed: str, capabilities: Optional[Dict[str, Any]] = None) -> str:
+    """Fastest implementation of a codec family that this host can run"""
+    candidates = CODEC_IMPLEMENTATIONS[video_codec]
+    if capabilities is None:
+        return candidates[-1]
+    for name in candidates:
+        if VIDEO_ENCODERS[name].get('hardware'):
+            # GPU encoders trade some quality per bit for speed - skip them when quality was asked for
+            if (speed != 'quality' and settings.CONVERSION_HARDWARE_ENCODING
+                    and name in capabilities.get('hardware_encoders', [])):
+                return name
+        elif name in capabilities.get('encoders', []):
+            return name
+    return candidates[-1]
+
+
+def resolve_profile(output_format: str, quality: str = 'original', speed: Optional[str] = None,
+                    source_height: Optional[int] = None, video_codec: Optional[str] = None,
+                    capabilities: Optional[Dict[str, Any]] = None) -> EncodingProfile:
+    """Look up the profile for a job; video_codec overrides the container default (e.g. 'hevc' in mp4)"""
+    if output_format not in FORMAT_CODECS:
+        raise Exception(f"No encoding profile for format: {output_format}")
+    default_video, audio = FORMAT_CODECS[output_format]
+    video = video_codec if (video_codec in CODEC_IMPLEMENTATIONS and default_video) else default_video
+    speed = speed if speed in SPEEDS else settings.CONVERSION_SPEED
+    encoder = pick_encoder(video, speed, capabilities) if video else None
+    return EncodingProfile(output_format, quality, speed, video, audio, source_height, encoder)
+
+
+def profile_matrix(formats: Optional[List[str]] = None, qualities: Optional[List[str]] = None,
+                   speeds: Optional[List[str]] = None,
+                   capabilities: Optional[Dict[str, Any]] = None) -> List[EncodingProfile]:
+    """Every (format, quality, speed) combination - used by the benchmark"""
+    return [
+        resolve_profile(fmt, quality, speed, capabilities=capabilities)
+        for fmt in (formats or list(FORMAT_CODECS))
+        for quality in (qualities or list(QUALITY_TIERS))
+        for speed in (speeds or list(SPEEDS))
+    ]
@@ -0,0 +1,201 @@
+"""
+Real conversion progress from ffmpeg's machine-readable -progress output
+"""
+import time
+import threading
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, Callable, Iterable
+from django.core.cache import cache
+from .models import ConversionRequest
+
+logger = logging.getLogger(__name__)
+
+
+def progress_key(conversion_id) -> str:
+    return f"conversion_progress_{conversion_id}"
+
+
+class FFmpegProgress:
+    """Turns `-progress pipe:1` key=value blocks into percent, speed (x realtime) and ETA"""
+
+    def __init__(self, duration: Optional[float] = None):
+        self.duration = duration or None
+        self.out_time = 0.0
+        self.speed: Optional[float] = None
+        self.frame = 0
+        self.finished = False
+        self._block: Dict[str, str] = {}
+        self._started = time.monotonic()
+
+    def feed(self, line: str) -> bool:
+        """Consume one output line; returns True when a complete progress block has been parsed"""
+        line = line.strip()
+        if '=' not in line:
+            return False
+        key, value = line.split('=', 1)
+        self._block[key] = value.strip()
+        if key != 'progress':
+            return False
+
+        block, self._block = self._block, {}
+        # out_time_us is correct; out_time_ms is also microseconds in every ffmpeg release (long-standing misnomer)
+        for time_key in ('out_time_us', 'out_time_ms'):
+            raw = block.get(time_key, '')
+            if raw.lstrip('-').isdigit() and int(raw) >= 0:
+                self.out_time = int(raw) / 1_000_000
+                break
+        speed = block.get('speed', '').rstrip('x')
+        try:
+            self.speed = float(speed) if speed not in ('', 'N/A') else self.speed
+        except ValueError:
+            pass
+        if block.get('frame', '').isdigit():
+            self.frame = int(block['frame'])
+        self.finished = value == 'end'
+        return True
+
+    @property
+    def percent(self) -> Optional[float]:
+        if self.finished:
+            return 100.0
+        if not self.duration:
+            return None
+        return min(self.out_time / self.duration * 100, 99.9)
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds until done, from media time left divided by encode speed"""
+        if self.finished:
+            return 0.0
+        if not self.duration:
+            return None
+        remaining = max(self.duration - self.out_time, 0.0)
+        if self.speed:
+            return remaining / self.speed
+        # No speed reported yet - extrapolate from wall clock
+        elapsed = time.monotonic() - self._started
+        if self.out_time > 0 and elapsed > 0:
+            return remaining / (self.out_time / elapsed)
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'progress': round(self.percent, 1) if self.percent is not None else None,
+            'speed': round(self.speed, 2) if self.speed is not None else None,
+            'eta_seconds': int(self.eta) if self.eta is not None else None,
+            'out_time': round(self.out_time, 2),
+            'frame': self.frame,
+        }
+
+
+class ProgressPublisher:
+    """Publishes progress to the cache every update and to the job row at most every db_interval seconds"""
+
+    def __init__(self, conversion_request: ConversionRequest, start: int = 0, end: int = 99,
+                 db_interval: float = 2.0):
+        self.conversion_request = conversion_request
+        self.start = start
+        self.end = end
+        self.db_interval = db_interval
+        self._last_db = 0.0
+
+    def scaled(self, percent: Optional[float]) -> Optional[int]:
+        """Map an ffmpeg run's 0-100 onto this job's [start, end] band (for multi-step jobs)"""
+        if percent is None:
+            return None
+        return int(self.start + (self.end - self.start) * percent / 100)
+
+    def publish(self, snapshot: Dict[str, Any], message: str = 'Converting...', force: bool = False):
+        progress = self.scaled(snapshot.get('progress'))
+        data = {
+            'progress': progress if progress is not None else self.conversion_request.progress,
+            'speed': snapshot.get('speed'),
+            'eta_seconds': snapshot.get('eta_seconds'),
+            'message': message,
+            'status': 'processing',
+        }
+        cache.set(progress_key(self.conversion_request.id), data, 300)
+
+        now = time.monotonic()
+        if not force and now - self._last_db < self.db_interval:
+            return
+        self._last_db = now
+        fields = {'encode_speed': data['speed'], 'eta_seconds': data['eta_seconds']}
+        if progress is not None:
+            fields['progress'] = progress
+            self.conversion_request.progress = progress
+        ConversionRequest.objects.filter(id=self.conversion_request.id).update(**fields)
+        self.conversion_request.encode_speed = data['speed']
+        self.conversion_request.eta_seconds = data['eta_seconds']
+
+
+def run_ffmpeg(stream, publisher: Optional[ProgressPublisher] = None,
+               duration: Optional[float] = None, message: str = 'Converting...',
+               callback: Optional[Callable[[FFmpegProgress], None]] = None,
+               stdin: Optional[Iterable[bytes]] = None) -> FFmpegProgress:
+    """Run an ffmpeg-python stream, reporting real progress; raises with ffmpeg's stderr tail on failure
+
+    With stdin, the chunks are fed to an input of 'pipe:0' as they are produced, so encoding
+    overlaps with however the chunks arrive (e.g. an upload still in flight).
+    """
+    stream = stream.global_args('-progress', 'pipe:1', '-nostats')
+    process = stream.run_async(pipe_stdin=stdin is not None, pipe_stdout=True, pipe_stderr=True,
+                               overwrite_output=True)
+
+    # stderr must be drained concurrently or ffmpeg blocks once the pipe buffer fills
+    stderr_tail = deque(maxlen=50)
+    drain = threading.Thread(
+        target=lambda: [stderr_tail.append(line) for line in iter(process.stderr.readline, b'')],
+        daemon=True,
+    )
+    drain.start()
+
+    feed_error = []
+    feeder = None
+    if stdin is not None:
+        def feed():
+            try:
+                for chunk in stdin:
+                    process.stdin.write(chunk)
+            except BrokenPipeError:
+                pass  # ffmpeg exited early - its return code says why
+            except Exception as e:
+                feed_error.append(e)  # The source failed (e.g. client went away) - don't let ffmpeg finish on a truncated input
+                process.kill()
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+    tracker = FFmpegProgress(duration)
+    try:
+        for raw in iter(process.stdout.readline, b''):
+            if tracker.feed(raw.decode('utf-8', 'replace')):
+                if publisher:
+                    publisher.publish(tracker.snapshot(), message)
+                if callback:
+                    callback(tracker)
+        process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        if feeder:
+            feeder.join()  # Never leave it reading the source behind the caller's back
+        drain.join(timeout=5)
+
+    if feed_error:
+        raise feed_error[0]
+    if process.returncode != 0:
+        stderr = b''.join(stderr_tail).decode('utf-8', 'replace').strip()
+        raise Exception(f"FFmpeg exited with code {process.returncode}: {stderr[-2000:]}")
+
+    if publisher:
+        tracker.finished = True
+        publisher.publish(tracker.snapshot(), message, force=True)
+    return tracker
@@ -0,0 +1,98 @@
+"""
+Conversion result cache: the same input bytes converted with equivalent settings on the same ffmpeg build
+share one stored output
+"""
+import hashlib
+from typing import Dict, Any
+from django.conf import settings
+from django.core.cache import cache
+from .models import ConversionRequest
+from .profiles import SPEEDS, FORMAT_CODECS, CODEC_IMPLEMENTATIONS, resolve_profile
+from .progressive import PROGRESSIVE_FORMATS
+from .capabilities import get_capabilities
+from .clips import clip_window
+from core.artifacts import settings_key
+
+HITS_KEY = 'conversion_cache_hits'
+MISSES_KEY = 'conversion_cache_misses'
+
+
+def _normalize_rendition(rendition: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = {
+        'output_format': rendition['output_format'],
+        'output_quality': rendition.get('output_quality') or 'original',
+    }
+    if rendition.get('audio_bitrate'):
+        normalized['audio_bitrate'] = rendition['audio_bitrate'].lower()
+    return normalized
+
+
+def normalized_settings(conversion_request: ConversionRequest) -> Dict[str, Any]:
+    """Only the custom_settings that change the output bytes, with defaults spelled out
+
+    Unknown keys are dropped, so client-side extras (labels, nonces) don't split the cache.
+    """
+    custom = conversion_request.custom_settings or {}
+    output_format = conversion_request.output_format
+    default_video = FORMAT_CODECS.get(output_format, (None, None))[0]
+
+    normalized = {'speed': custom.get('speed') if custom.get('speed') in SPEEDS else settings.CONVERSION_SPEED}
+    if custom.get('audio_bitrate'):
+        normalized['audio_bitrate'] = custom['audio_bitrate'].lower()
+    video_codec = custom.get('video_codec')
+    if default_video and video_codec in CODEC_IMPLEMENTATIONS:
+        # Kept even when it is the container default: it stops a source in another codec being stream-copied
+        normalized['video_codec'] = video_codec
+    if custom.get('progressive') and output_format in PROGRESSIVE_FORMATS:
+        normalized['progressive'] = True
+    window = clip_window(custom)
+    if window:
+        normalized['start'] = round(window[0], 3)
+        normalized['end'] = round(window[1], 3) if window[1] is not None else None
+    if custom.get('renditions'):
+        normalized['renditions'] = [_normalize_rendition(rendition) for rendition in custom['renditions']]
+    return normalized
+
+
+def result_key(conversion_request: ConversionRequest) -> str:
+    """Variant key for the artifact store: output settings plus the ffmpeg build and encoder that produce them"""
+    normalized = normalized_settings(conversion_request)
+    capabilities = get_capabilities()
+    encoder = None
+    if conversion_request.output_format in FORMAT_CODECS:
+        encoder = resolve_profile(conversion_request.output_format, conversion_request.output_quality,
+                                  speed=normalized['speed'], video_codec=normalized.get('video_codec'),
+                                  capabilities=capabilities).video_encoder
+    # "ffmpeg version 7.0.2-static https://..." -> "7.0.2-static"
+    version = capabilities['ffmpeg_version'].split()
+    key = settings_key(
+        kind='conversion',
+        output_format=conversion_request.output_format,
+        output_quality=conversion_request.output_quality or 'original',
+        settings=normalized,
+        encoder=encoder,
+        ffmpeg=version[2] if len(version) > 2 else capabilities['ffmpeg_version'],
+    )
+    if len(key) > 500:  # Artifact.variant_key column width - long rendition lists get a digest instead
+        key = f"sha256:{hashlib.sha256(key.encode()).hexdigest()}"
+    return key
+
+
+def record(hit: bool):
+    key = HITS_KEY if hit else MISSES_KEY
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)  # Evicted between add and incr
+
+
+def counters() -> Dict[str, Any]:
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / lookups, 3) if lookups else None,
+    }
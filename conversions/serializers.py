@@ -1,5 +1,20 @@
+import re
+from django.conf import settings
 from rest_framework import serializers
-from .models import ConversionRequest, ConversionHistory
+from .models import ConversionRequest, ConversionBatch, ConversionOutput, ChunkedUpload, ConversionHistory
+
+
+class ConversionOutputSerializer(serializers.ModelSerializer):
+    output_size_mb = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ConversionOutput
+        fields = ('id', 'position', 'label', 'start_time', 'end_time', 'output_format', 'output_quality',
+                  'audio_bitrate', 'output_size', 'output_size_mb')
+        read_only_fields = fields
+
+    def get_output_size_mb(self, obj):
+        return obj.get_output_size_mb()
 
 
 class ConversionRequestSerializer(serializers.ModelSerializer):
@@ -8,6 +23,7 @@ class ConversionRequestSerializer(serializers.ModelSerializer):
     compression_percentage = serializers.SerializerMethodField()
     duration_formatted = serializers.SerializerMethodField()
     user_email = serializers.SerializerMethodField()
+    outputs = ConversionOutputSerializer(many=True, read_only=True)
 
     class Meta:
         model = ConversionRequest
@@ -15,13 +31,13 @@ class ConversionRequestSerializer(serializers.ModelSerializer):
             'id', 'user_email', 'input_filename', 'input_format', 'input_size',
             'input_size_mb', 'output_format', 'output_quality', 'custom_settings',
             'output_filename', 'output_size', 'output_size_mb', 'status', 'progress',
-            'error_message', 'created_at', 'started_at', 'completed_at', 'expires_at',
+            'encode_speed', 'eta_seconds', 'error_message', 'created_at', 'started_at', 'completed_at', 'expires_at',
             'duration', 'duration_formatted', 'conversion_time', 'compression_ratio',
-            'compression_percentage'
+            'compression_percentage', 'outputs'
         )
         read_only_fields = (
             'id', 'input_filename', 'input_format', 'input_size', 'output_filename',
-            'output_size', 'status', 'progress', 'error_message', 'created_at',
+            'output_size', 'status', 'progress', 'encode_speed', 'eta_seconds', 'error_message', 'created_at',
             'started_at', 'completed_at', 'expires_at', 'duration', 'conversion_time',
             'compression_ratio'
         )
@@ -42,49 +58,328 @@ class ConversionRequestSerializer(serializers.ModelSerializer):
         return obj.user.email if obj.user else 'Anonymous'
 
 
+MAX_INPUT_SIZE = 500 * 1024 * 1024  # 500MB
+MAX_INPUT_SIZE_MESSAGE = "File size cannot exceed 500MB"
+
+ALLOWED_INPUT_EXTENSIONS = [
+    'mp4', 'avi', 'mkv', 'mov', 'wmv', 'flv', 'webm', 'm4v',
+    'mp3', 'wav', 'flac', 'aac', 'ogg', 'm4a', 'wma',
+    'jpg', 'jpeg', 'png', 'webp', 'avif', 'ico'
+]
+
+
+def validate_input(filename: str, size: int):
+    """Size and type checks shared by every way a conversion input can arrive"""
+    if size > MAX_INPUT_SIZE:
+        raise serializers.ValidationError(MAX_INPUT_SIZE_MESSAGE)
+
+    file_extension = filename.split('.')[-1].lower()
+    if file_extension not in ALLOWED_INPUT_EXTENSIONS:
+        raise serializers.ValidationError(
+            f"File type '{file_extension}' not supported. "
+            f"Allowed types: {', '.join(ALLOWED_INPUT_EXTENSIONS)}"
+        )
+
+
+def validate_categories(input_extension: str, output_format: str):
+    """Audio can't become video, and images only convert to other images"""
+    from .services import ConversionService
+    service = ConversionService()
+    input_category = service.get_file_category(input_extension)
+    output_category = service.get_file_category(output_format)
+    if input_category == 'audio' and output_category == 'video':
+        raise serializers.ValidationError("Cannot produce video from an audio input")
+    if (input_category == 'image') != (output_category == 'image'):
+        raise serializers.ValidationError(f"Cannot convert {input_extension} to {output_format}")
+
+
+def validate_clip(custom_settings):
+    """custom_settings start/end must be times (seconds or HH:MM:SS.mmm) with end after start"""
+    from .clips import clip_window
+    try:
+        clip_window(custom_settings)
+    except ValueError as e:
+        raise serializers.ValidationError({'custom_settings': str(e)})
+
+
+def validate_video_codec(custom_settings, output_formats):
+    """custom_settings video_codec must be a codec we encode and one every video output's container can hold"""
+    video_codec = (custom_settings or {}).get('video_codec')
+    if not video_codec:
+        return
+    from .profiles import CODEC_IMPLEMENTATIONS, CONTAINER_CODECS, FORMAT_CODECS
+    if video_codec not in CODEC_IMPLEMENTATIONS:
+        raise serializers.ValidationError(
+            {'custom_settings': f"Unknown video_codec '{video_codec}'. Choose from: {', '.join(CODEC_IMPLEMENTATIONS)}"}
+        )
+    for output_format in output_formats:
+        if not FORMAT_CODECS.get(output_format, (None, None))[0]:
+            continue  # Audio-only and image outputs have no video stream to apply it to
+        allowed = CONTAINER_CODECS.get(output_format, {}).get('video', set())
+        if video_codec not in allowed:
+            raise serializers.ValidationError(
+                {'custom_settings': f"{output_format} can't hold {video_codec} video. "
+                                    f"Allowed: {', '.join(sorted(allowed & set(CODEC_IMPLEMENTATIONS)))}"}
+            )
+
+
+def validate_split(custom_settings, input_extension: str):
+    """split_chapters needs a video/audio input and produces the chapters instead of a clip or renditions"""
+    custom = custom_settings or {}
+    if not custom.get('split_chapters'):
+        return
+    from .services import ConversionService
+    if ConversionService().get_file_category(input_extension) not in ('video', 'audio'):
+        raise serializers.ValidationError({'custom_settings': "Only video and audio inputs have chapters"})
+    if custom.get('renditions') or custom.get('start') or custom.get('end'):
+        raise serializers.ValidationError(
+            {'custom_settings': "Chapter splitting can't be combined with renditions or a clip"}
+        )
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ChunkedUpload
+        fields = (
+            'id', 'filename', 'total_size', 'received', 'progress', 'expected_sha256', 'sha256',
+            'status', 'error_message', 'deduplicated', 'created_at', 'updated_at'
+        )
+        read_only_fields = (
+            'id', 'received', 'progress', 'sha256', 'status', 'error_message', 'deduplicated',
+            'created_at', 'updated_at'
+        )
+
+    def get_progress(self, obj):
+        return obj.get_progress()
+
+    def validate_expected_sha256(self, value):
+        if value and not re.fullmatch(r'[0-9a-fA-F]{64}', value):
+            raise serializers.ValidationError("Expected a hex SHA-256 digest")
+        return value.lower()
+
+    def validate(self, attrs):
+        validate_input(attrs['filename'], attrs['total_size'])
+        return attrs
+
+
+class RenditionSerializer(serializers.Serializer):
+    """An extra output encoded from the same decode pass as the job's own output"""
+    output_format = serializers.ChoiceField(choices=ConversionRequest.OUTPUT_FORMAT_CHOICES)
+    output_quality = serializers.ChoiceField(choices=ConversionRequest.QUALITY_CHOICES, default='original')
+    audio_bitrate = serializers.CharField(max_length=10, required=False, allow_blank=True)
+
+    def validate_audio_bitrate(self, value):
+        if value and not re.fullmatch(r'\d{2,3}k', value):
+            raise serializers.ValidationError("Audio bitrate must look like '320k'")
+        return value
+
+
 class ConversionCreateSerializer(serializers.ModelSerializer):
-    input_file = serializers.FileField()
+    input_file = serializers.FileField(required=False)
+    upload_id = serializers.UUIDField(required=False, write_only=True)  # A finished ChunkedUpload instead of a file
+    # JSON list of renditions - a plain JSON field so it also works in multipart uploads
+    renditions = serializers.JSONField(required=False, write_only=True)
 
     class Meta:
         model = ConversionRequest
-        fields = ('input_file', 'output_format', 'output_quality', 'custom_settings')
+        fields = ('input_file', 'upload_id', 'output_format', 'output_quality', 'custom_settings', 'renditions')
 
     def validate_input_file(self, value):
         """Validate the input file"""
-        # Check file size (max 500MB)
-        max_size = 500 * 1024 * 1024  # 500MB
-        if value.size > max_size:
-            raise serializers.ValidationError("File size cannot exceed 500MB")
-
-        # Check file extension
-        allowed_extensions = [
-            'mp4', 'avi', 'mkv', 'mov', 'wmv', 'flv', 'webm', 'm4v',
-            'mp3', 'wav', 'flac', 'aac', 'ogg', 'm4a', 'wma'
-        ]
-        
-        file_extension = value.name.split('.')[-1].lower()
-        if file_extension not in allowed_extensions:
-            raise serializers.ValidationError(
-                f"File type '{file_extension}' not supported. "
-                f"Allowed types: {', '.join(allowed_extensions)}"
-            )
-
+        validate_input(value.name, value.size)
         return value
 
+    def validate_upload_id(self, value):
+        """A finished chunked upload owned by the requesting user"""
+        upload = ChunkedUpload.objects.filter(id=value).first()
+        request = self.context.get('request')
+        user = request.user if request and request.user.is_authenticated else None
+        if not upload or (upload.user_id and upload.user != user):
+            raise serializers.ValidationError("Upload not found")
+        if upload.status != 'complete':
+            raise serializers.ValidationError(f"Upload is {upload.status}, not complete")
+        return upload
+
     def validate(self, attrs):
         """Validate conversion settings"""
         input_file = attrs.get('input_file')
+        upload = attrs.pop('upload_id', None)
         output_format = attrs.get('output_format')
+
+        if bool(input_file) == bool(upload):
+            raise serializers.ValidationError("Provide either input_file or upload_id")
+        validate_clip(attrs.get('custom_settings'))
+        if upload:
+            attrs['upload'] = upload
+        input_name = input_file.name if input_file else upload.filename
         
-        if input_file and output_format:
-            input_extension = input_file.name.split('.')[-1].lower()
+        if input_name and output_format:
+            input_extension = input_name.split('.')[-1].lower()
             
             # Don't allow converting to the same format
             if input_extension == output_format:
                 raise serializers.ValidationError(
                     "Output format cannot be the same as input format"
                 )
+            validate_categories(input_extension, output_format)
+            validate_split({**(attrs.get('custom_settings') or {}), 'renditions': attrs.get('renditions')},
+                           input_extension)
+
+        # Extra renditions ride along in custom_settings, where the conversion service reads them
+        renditions = attrs.pop('renditions', None)
+        if renditions:
+            rendition_serializer = RenditionSerializer(data=renditions, many=True)
+            if not rendition_serializer.is_valid():
+                raise serializers.ValidationError({'renditions': rendition_serializer.errors})
+            renditions = rendition_serializer.validated_data
+            if len(renditions) + 1 > settings.CONVERSION_MAX_RENDITIONS:
+                raise serializers.ValidationError(
+                    f"At most {settings.CONVERSION_MAX_RENDITIONS} outputs per conversion"
+                )
+            from .services import ConversionService
+            service = ConversionService()
+            input_category = service.get_file_category(input_name.split('.')[-1])
+            for rendition in renditions:
+                output_category = service.get_file_category(rendition['output_format'])
+                if input_category not in ('video', 'audio') or (input_category == 'audio' and output_category == 'video'):
+                    raise serializers.ValidationError(
+                        f"Cannot produce {rendition['output_format']} from a {input_category} input"
+                    )
+            attrs['custom_settings'] = {
+                **(attrs.get('custom_settings') or {}),
+                'renditions': [dict(rendition) for rendition in renditions],
+            }
+        validate_video_codec(attrs.get('custom_settings'),
+                             [output_format] + [rendition['output_format'] for rendition in renditions or []])
+
+        return attrs
+
+
+class ConversionStreamSerializer(serializers.ModelSerializer):
+    """A conversion whose input arrives later as a raw streamed upload"""
+    input_size = serializers.IntegerField(required=False, min_value=0, max_value=MAX_INPUT_SIZE)
+
+    class Meta:
+        model = ConversionRequest
+        fields = ('input_filename', 'input_size', 'output_format', 'output_quality', 'custom_settings')
+
+    def validate_input_filename(self, value):
+        from .streaming import STREAMABLE_INPUTS
+        extension = value.split('.')[-1].lower()
+        if extension not in STREAMABLE_INPUTS:
+            raise serializers.ValidationError(
+                f"File type '{extension}' cannot be converted while uploading. "
+                f"Streamable types: {', '.join(STREAMABLE_INPUTS)}"
+            )
+        return value
+
+    def validate(self, attrs):
+        input_extension = attrs['input_filename'].split('.')[-1].lower()
+        if input_extension == attrs.get('output_format'):
+            raise serializers.ValidationError("Output format cannot be the same as input format")
+        validate_categories(input_extension, attrs['output_format'])
+        custom = attrs.get('custom_settings') or {}
+        if custom.get('renditions'):
+            raise serializers.ValidationError("Streaming conversions produce a single output")
+        if custom.get('start') or custom.get('end'):
+            raise serializers.ValidationError("Clips need a seekable input - upload the file instead of streaming it")
+        if custom.get('split_chapters'):
+            raise serializers.ValidationError("Chapter splitting needs a seekable input - upload the file instead")
+        validate_video_codec(custom, [attrs['output_format']])
+        return attrs
+
+
+class ConversionBatchSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    conversions = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ConversionBatch
+        fields = (
+            'id', 'output_format', 'output_quality', 'custom_settings', 'concurrency', 'status',
+            'error_message', 'progress', 'conversions', 'created_at', 'completed_at'
+        )
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        from .batches import batch_progress
+        return batch_progress(obj)
+
+    def get_conversions(self, obj):
+        return [
+            {'id': str(job.id), 'input_filename': job.input_filename, 'status': job.status,
+             'progress': job.progress, 'output_size': job.output_size, 'error_message': job.error_message}
+            for job in obj.conversions.order_by('created_at')
+        ]
+
+
+class ConversionBatchCreateSerializer(serializers.Serializer):
+    """Many uploaded files, or one ZIP of them, all converted with the same settings"""
+    files = serializers.ListField(child=serializers.FileField(), required=False)
+    archive = serializers.FileField(required=False)
+    output_format = serializers.ChoiceField(choices=ConversionRequest.OUTPUT_FORMAT_CHOICES)
+    output_quality = serializers.ChoiceField(choices=ConversionRequest.QUALITY_CHOICES, default='original')
+    custom_settings = serializers.JSONField(required=False, default=dict)
+    concurrency = serializers.IntegerField(required=False, min_value=1)
+
+    def validate_files(self, value):
+        for input_file in value:
+            validate_input(input_file.name, input_file.size)
+        return value
+
+    def validate_archive(self, value):
+        if not value.name.lower().endswith('.zip'):
+            raise serializers.ValidationError("Archive must be a .zip file")
+        return value
+
+    def validate_custom_settings(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Expected a JSON object")
+        if value.get('renditions') or value.get('split_chapters'):
+            raise serializers.ValidationError("Batch conversions produce one output per file")
+        validate_clip(value)
+        return value
+
+    def validate(self, attrs):
+        from .batches import archive_members
+        files = attrs.get('files') or []
+        archive = attrs.get('archive')
+        if bool(files) == bool(archive):
+            raise serializers.ValidationError("Provide either files or archive")
+        validate_video_codec(attrs.get('custom_settings'), [attrs['output_format']])
+
+        if archive:
+            try:
+                members, skipped = archive_members(archive, ALLOWED_INPUT_EXTENSIONS)
+            except Exception as e:
+                raise serializers.ValidationError({'archive': str(e)})
+            convertible = []
+            for member in members:
+                # Archives carry extras (cover art in an album, say) - leave out what can't become the target
+                try:
+                    validate_categories(member.filename.split('.')[-1].lower(), attrs['output_format'])
+                except serializers.ValidationError:
+                    skipped.append(member.filename)
+                    continue
+                validate_input(member.filename, member.file_size)
+                convertible.append(member)
+            if not convertible:
+                raise serializers.ValidationError({'archive': "Archive contains no files that can be converted"})
+            attrs['members'] = convertible
+            attrs['skipped'] = skipped
+            count = len(convertible)
+        else:
+            for input_file in files:
+                validate_categories(input_file.name.split('.')[-1].lower(), attrs['output_format'])
+            count = len(files)
+
+        if count > settings.CONVERSION_BATCH_MAX_FILES:
+            raise serializers.ValidationError(f"At most {settings.CONVERSION_BATCH_MAX_FILES} files per batch")
 
+        attrs['concurrency'] = min(attrs.get('concurrency') or settings.CONVERSION_BATCH_CONCURRENCY,
+                                   settings.CONVERSION_BATCH_CONCURRENCY)
         return attrs
 
 
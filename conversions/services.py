@@ -1,10 +1,26 @@
 import os
+import time
 import uuid
 import ffmpeg
 from typing import Dict, Any, Optional, List
 from django.conf import settings
 from django.core.files.storage import default_storage
-from .models import ConversionRequest
+from .models import ConversionRequest, ConversionOutput
+from .progress import ProgressPublisher, run_ffmpeg, progress_key
+from .profiles import (
+    EncodingProfile, resolve_profile, CODEC_IMPLEMENTATIONS, VIDEO_ENCODERS, FORMAT_CODECS, CONTAINER_CODECS
+)
+from .capabilities import get_capabilities, hwaccel_input_options
+from .parallel import core_share, should_parallelize, encode_parallel
+from .streaming import STREAMABLE_INPUTS, UploadSpool
+from .progressive import wants_progressive, live_path, muxer_options
+from .result_cache import result_key, record as record_lookup
+from .images import convert_image
+from .clips import EDGE_ENCODERS, clip_window, clip_input_options, exact_audio, smart_cut
+from .chapters import split_chapters
+from .media_info import probe_media
+from core.artifacts import ArtifactStore, file_sha256
+from django.core.cache import cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -50,6 +66,7 @@ class ConversionService:
     
     def convert_media(self, conversion_request: ConversionRequest) -> str:
         """Convert media file based on conversion request"""
+        extra_paths: List[str] = []
         try:
             input_path = os.path.join(settings.MEDIA_ROOT, conversion_request.input_file.name)
             
@@ -58,218 +75,552 @@ class ConversionService:
             safe_name = "".join(c for c in base_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
             output_filename = f"{uuid.uuid4()}_{safe_name}.{conversion_request.output_format}"
             output_path = os.path.join(self.conversion_dir, output_filename)
+
+            renditions = self.get_renditions(conversion_request)
+            extra_paths = [
+                os.path.join(self.conversion_dir,
+                             f"{uuid.uuid4()}_{safe_name}_{rendition['output_quality']}.{rendition['output_format']}")
+                for rendition in renditions[1:]
+            ]
+
+            # Hashes a plain upload here, off the request; a chunked upload's hash was checked at creation
+            cached_path = self.serve_cached(conversion_request, output_path)
+            if cached_path:
+                return cached_path
+            artifact_store = ArtifactStore()
+            source_key = f"sha256:{conversion_request.input_sha256}"
+            variant_key = result_key(conversion_request)
             
             # Update status to processing
+            started = time.monotonic()
             conversion_request.status = 'processing'
             conversion_request.progress = 0
             conversion_request.save()
+
+            # Real progress needs the input duration to measure ffmpeg's position against
+            media_info = self.get_media_info(input_path)
+            chapters = None
+            window = clip_window(conversion_request.custom_settings)
+            if window:
+                # Progress and ETA are measured against the clip, not the whole input
+                end = window[1] if window[1] is not None else media_info.get('duration')
+                media_info['duration'] = max(end - window[0], 0) if end else None
+            if media_info.get('duration'):
+                conversion_request.duration = media_info['duration']
+                conversion_request.save(update_fields=['duration'])
             
             # Determine conversion type
             input_category = self.get_file_category(conversion_request.input_format)
             output_category = self.get_file_category(conversion_request.output_format)
             
+            # Progressive jobs write front-to-back into a live file that clients can tail while ffmpeg works
+            split = (conversion_request.custom_settings or {}).get('split_chapters')
+            progressive = (not extra_paths and not split and input_category in ["video", "audio"]
+                           and wants_progressive(conversion_request))
+            target_path = live_path(conversion_request) if progressive else output_path
+            muxer = muxer_options(conversion_request) if progressive else None
+            if progressive:
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            
             if input_category == "image" and output_category == "image":
                 self._convert_image(input_path, output_path, conversion_request)
+            elif split and input_category in ["video", "audio"]:
+                chapters = self.get_chapters(media_info)
+                extra_paths = [
+                    os.path.join(self.conversion_dir,
+                                 f"{uuid.uuid4()}_{safe_name}_ch{position + 1:02d}.{conversion_request.output_format}")
+                    for position in range(1, len(chapters))
+                ]
+                self._split_chapters(input_path, [output_path] + extra_paths, chapters, conversion_request, media_info)
+            elif extra_paths and input_category in ["video", "audio"]:
+                self._convert_renditions(input_path, [output_path] + extra_paths, renditions,
+                                         conversion_request, media_info)
             elif input_category == "video" and output_category == "audio":
-                self._extract_audio(input_path, output_path, conversion_request)
+                self._extract_audio(input_path, target_path, conversion_request, media_info, muxer)
             elif input_category in ["video", "audio"]:
-                self._convert_media_ffmpeg(input_path, output_path, conversion_request)
+                self._convert_media_ffmpeg(input_path, target_path, conversion_request, media_info, muxer)
             else:
                 raise Exception(f"Unsupported conversion: {input_category} to {output_category}")
+
+            if progressive:
+                # Followers keep their open descriptor across the rename and drain the tail
+                os.replace(target_path, output_path)
             
             # Update completion status
             conversion_request.output_file = os.path.relpath(output_path, settings.MEDIA_ROOT)
             conversion_request.output_size = os.path.getsize(output_path)
             conversion_request.status = 'completed'
             conversion_request.progress = 100
+            conversion_request.eta_seconds = 0
+            conversion_request.conversion_time = time.monotonic() - started
             conversion_request.save()
+            cache.set(progress_key(conversion_request.id), {
+                'progress': 100, 'speed': conversion_request.encode_speed, 'eta_seconds': 0,
+                'message': 'Conversion complete', 'status': 'completed',
+            }, 300)
+
+            if chapters:
+                ConversionOutput.objects.bulk_create([
+                    ConversionOutput(
+                        conversion_request=conversion_request,
+                        position=position,
+                        label=chapter['title'][:255],
+                        start_time=chapter['start'],
+                        end_time=chapter['end'],
+                        output_format=conversion_request.output_format,
+                        output_quality=conversion_request.output_quality,
+                        output_file=os.path.relpath(path, settings.MEDIA_ROOT),
+                        output_size=os.path.getsize(path),
+                    )
+                    for position, (chapter, path) in enumerate(zip(chapters, [output_path] + extra_paths))
+                ])
+            elif extra_paths:
+                ConversionOutput.objects.bulk_create([
+                    ConversionOutput(
+                        conversion_request=conversion_request,
+                        position=position,
+                        output_format=rendition['output_format'],
+                        output_quality=rendition['output_quality'],
+                        audio_bitrate=rendition.get('audio_bitrate') or '',
+                        output_file=os.path.relpath(path, settings.MEDIA_ROOT),
+                        output_size=os.path.getsize(path),
+                    )
+                    for position, (rendition, path) in enumerate(zip(renditions, [output_path] + extra_paths))
+                ])
+            else:
+                try:
+                    artifact = artifact_store.ingest(output_path, source_key, variant_key)
+                    artifact_store.acquire(conversion_request, artifact)
+                except Exception as e:
+                    logger.warning(f"Could not store artifact for {conversion_request.id}: {str(e)}")
+
+            # The upload has served its purpose - don't let temp_uploads/ grow forever
+            conversion_request.discard_input()
             
             return output_path
             
         except Exception as e:
             logger.error(f"Conversion failed: {str(e)}")
+            for path in extra_paths + [live_path(conversion_request)]:
+                if os.path.exists(path):
+                    os.remove(path)
             conversion_request.status = 'failed'
             conversion_request.error_message = str(e)
             conversion_request.save()
+            conversion_request.discard_input()
+            cache.set(progress_key(conversion_request.id), {
+                'progress': conversion_request.progress, 'message': str(e), 'status': 'failed',
+            }, 300)
             raise e
     
-    def _convert_image(self, input_path: str, output_path: str, conversion_request: ConversionRequest):
-        """Convert image files, inspired by stillconvert"""
+    def serve_cached(self, conversion_request: ConversionRequest, output_path: Optional[str] = None) -> Optional[str]:
+        """Complete a job from the result cache if this input was already converted the same way
+
+        Returns the output path on a hit. Multi-output jobs are never cached (the store keeps one
+        blob per job). Only a job's first lookup counts towards the hit/miss metrics.
+        """
+        custom = conversion_request.custom_settings or {}
+        if custom.get('renditions') or custom.get('split_chapters'):
+            return None
+
+        first_lookup = not conversion_request.input_sha256
+        if first_lookup:
+            input_path = os.path.join(settings.MEDIA_ROOT, conversion_request.input_file.name)
+            conversion_request.input_sha256 = file_sha256(input_path)
+            conversion_request.save(update_fields=['input_sha256'])
+
+        artifact_store = ArtifactStore()
+        artifact = artifact_store.lookup(f"sha256:{conversion_request.input_sha256}", result_key(conversion_request))
+        if first_lookup:
+            record_lookup(artifact is not None)
+        if not artifact:
+            return None
+
+        if output_path is None:
+            base_name = os.path.splitext(conversion_request.input_filename)[0]
+            safe_name = "".join(c for c in base_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+            output_path = os.path.join(self.conversion_dir, f"{uuid.uuid4()}_{safe_name}.{conversion_request.output_format}")
+        artifact_store.materialize(artifact, output_path)
+        artifact_store.acquire(conversion_request, artifact)
+        conversion_request.output_file = os.path.relpath(output_path, settings.MEDIA_ROOT)
+        conversion_request.output_size = artifact.file_size
+        conversion_request.status = 'completed'
+        conversion_request.progress = 100
+        conversion_request.eta_seconds = 0
+        conversion_request.save()
+        cache.set(progress_key(conversion_request.id), {
+            'progress': 100, 'eta_seconds': 0, 'message': 'Served from cache', 'status': 'completed',
+        }, 300)
+        conversion_request.discard_input()
+        logger.info(f"Conversion {conversion_request.id} served from result cache")
+        return output_path
+
+    def open_stream(self, conversion_request: ConversionRequest, total: Optional[int] = None) -> UploadSpool:
+        """Spool a streaming job's upload is received into and its encoder reads from"""
+        if conversion_request.input_format not in STREAMABLE_INPUTS:
+            raise Exception(f"{conversion_request.input_format} cannot be converted while uploading")
+        base_name = os.path.splitext(conversion_request.input_filename)[0]
+        safe_name = "".join(c for c in base_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'temp_uploads'), exist_ok=True)
+        path = os.path.join(settings.MEDIA_ROOT, 'temp_uploads',
+                            f"{uuid.uuid4()}_{safe_name}.{conversion_request.input_format}")
+        return UploadSpool(path, total, ProgressPublisher(conversion_request))
+
+    def convert_stream(self, conversion_request: ConversionRequest, upload: UploadSpool) -> Optional[str]:
+        """Convert an upload while it is still arriving, feeding the growing spool into ffmpeg's stdin
+
+        Returns the output path, or None when the encode failed after the whole input arrived and
+        the job went back to 'pending' for a regular retry from the spool.
+        """
+        demuxer = STREAMABLE_INPUTS[conversion_request.input_format]
+        base_name = os.path.splitext(conversion_request.input_filename)[0]
+        safe_name = "".join(c for c in base_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        output_path = os.path.join(self.conversion_dir, f"{uuid.uuid4()}_{safe_name}.{conversion_request.output_format}")
+
+        started = time.monotonic()
         try:
-            # Update progress
-            conversion_request.progress = 25
-            conversion_request.save()
-            
-            stream = ffmpeg.input(input_path)
-            stream = ffmpeg.output(stream, output_path, vframes=1)
-            
-            conversion_request.progress = 75
+            stream = ffmpeg.input('pipe:0', f=demuxer)
+            stream = ffmpeg.output(stream, output_path, **self.get_profile(conversion_request).output_options())
+            logger.info(f"Conversion {conversion_request.id}: streaming {conversion_request.input_format} "
+                        f"upload into ffmpeg")
+            run_ffmpeg(stream, stdin=upload)
+        except Exception as e:
+            logger.error(f"Streaming conversion failed: {str(e)}")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            complete = upload.wait()  # The client may still be sending - the spool is only usable once it's all in
+            conversion_request.input_size = upload.received
+            conversion_request.error_message = str(e)
+            if complete and settings.CONVERSION_STREAM_RETRY:
+                # The encoder failed, not the upload - the whole input is on disk, so retry the normal way
+                conversion_request.input_file = os.path.relpath(upload.path, settings.MEDIA_ROOT)
+                conversion_request.status = 'pending'
+                conversion_request.progress = 0
+                conversion_request.save()
+                return None
+            upload.discard()
+            conversion_request.status = 'failed'
             conversion_request.save()
-            
-            ffmpeg.run(stream, overwrite_output=True, quiet=True)
-            
-        except ffmpeg.Error as e:
-            logger.error(f"FFmpeg error in image conversion: {e.stderr}")
-            raise Exception(f"Image conversion failed: {e.stderr}")
+            cache.set(progress_key(conversion_request.id), {
+                'progress': conversion_request.progress, 'message': str(e), 'status': 'failed',
+            }, 300)
+            raise e
+
+        upload.discard()
+        conversion_request.input_size = upload.received
+        conversion_request.input_sha256 = upload.sha256
+        conversion_request.output_file = os.path.relpath(output_path, settings.MEDIA_ROOT)
+        conversion_request.output_size = os.path.getsize(output_path)
+        conversion_request.status = 'completed'
+        conversion_request.progress = 100
+        conversion_request.eta_seconds = 0
+        conversion_request.conversion_time = time.monotonic() - started
+        conversion_request.save()
+        cache.set(progress_key(conversion_request.id), {
+            'progress': 100, 'eta_seconds': 0, 'message': 'Conversion complete', 'status': 'completed',
+        }, 300)
+
+        # Hashed on the way through, so identical uploads can still share the stored output
+        try:
+            artifact_store = ArtifactStore()
+            artifact = artifact_store.ingest(output_path, f"sha256:{upload.sha256}", result_key(conversion_request))
+            artifact_store.acquire(conversion_request, artifact)
+        except Exception as e:
+            logger.warning(f"Could not store artifact for {conversion_request.id}: {str(e)}")
+        return output_path
+
+    def _convert_image(self, input_path: str, output_path: str, conversion_request: ConversionRequest):
+        """Convert image files, inspired by stillconvert - in-process where Pillow handles both formats"""
+        engine = convert_image(input_path, output_path, ProgressPublisher(conversion_request))
+        logger.info(f"Conversion {conversion_request.id}: image converted with {engine}")
     
-    def _extract_audio(self, input_path: str, output_path: str, conversion_request: ConversionRequest):
-        """Extract audio from video, inspired by ExtractAudio"""
+    def _extract_audio(self, input_path: str, output_path: str, conversion_request: ConversionRequest,
+                       media_info: Optional[Dict[str, Any]] = None, muxer: Optional[Dict[str, Any]] = None):
+        """Extract audio from video, inspired by ExtractAudio; muxer overrides container options"""
         try:
-            conversion_request.progress = 10
-            conversion_request.save()
-            
-            stream = ffmpeg.input(input_path)
+            plan = self.plan_stream_copy(media_info or {}, conversion_request.output_format, conversion_request.output_quality)
             
-            # Audio extraction options
-            audio_options = {}
-            if conversion_request.output_format == "mp3":
-                audio_options['acodec'] = 'mp3'
-                audio_options['audio_bitrate'] = '320k'
-            elif conversion_request.output_format == "flac":
-                audio_options['acodec'] = 'flac'
-            elif conversion_request.output_format == "aac":
-                audio_options['acodec'] = 'aac'
-                audio_options['audio_bitrate'] = '256k'
+            # A track that already fits the target container is just pulled out; otherwise the profile's encoder
+            audio_options = self.get_profile(conversion_request).output_options(copy_audio=plan.get('audio') == 'copy')
+            audio_options.update(muxer or {})
+            window = clip_window(conversion_request.custom_settings)
+            if window:
+                # Input seeking lands on the video keyframe before start - cut on the source timestamps instead
+                stream = exact_audio(input_path, output_path, window, audio_options)
             else:
-                audio_options['acodec'] = 'copy'
-            
-            conversion_request.progress = 50
-            conversion_request.save()
-            
-            stream = ffmpeg.output(stream, output_path, vn=None, **audio_options)
-            ffmpeg.run(stream, overwrite_output=True, quiet=True)
+                stream = ffmpeg.output(ffmpeg.input(input_path), output_path, **{'vn': None, **audio_options})
+            run_ffmpeg(stream, ProgressPublisher(conversion_request), conversion_request.duration,
+                       message='Extracting audio...')
             
         except ffmpeg.Error as e:
             logger.error(f"FFmpeg error in audio extraction: {e.stderr}")
             raise Exception(f"Audio extraction failed: {e.stderr}")
     
-    def _convert_media_ffmpeg(self, input_path: str, output_path: str, conversion_request: ConversionRequest):
-        """Convert video/audio files, inspired by convert and manualConvert"""
+    def get_profile(self, conversion_request: ConversionRequest,
+                    media_info: Optional[Dict[str, Any]] = None) -> EncodingProfile:
+        """Resolve the encoding profile for a job; custom_settings may pick 'speed', 'video_codec' and 'audio_bitrate'"""
+        custom = conversion_request.custom_settings or {}
+        video_stream = next((st for st in (media_info or {}).get('streams', []) if st.get('codec_type') == 'video'), {})
+        profile = resolve_profile(
+            conversion_request.output_format,
+            conversion_request.output_quality,
+            speed=custom.get('speed'),
+            source_height=video_stream.get('height'),
+            video_codec=custom.get('video_codec'),
+            capabilities=get_capabilities(),
+        )
+        if custom.get('audio_bitrate'):
+            profile.audio_bitrate = custom['audio_bitrate']
+        return profile
+
+    def get_capabilities_summary(self) -> Dict[str, Any]:
+        """What this host's ffmpeg can encode, and which implementation each output format would use"""
+        capabilities = get_capabilities()
+        available = set(capabilities['encoders'])
+        codecs = {}
+        for family, implementations in CODEC_IMPLEMENTATIONS.items():
+            usable = [name for name in implementations
+                      if name in capabilities['hardware_encoders'] or (name in available and not VIDEO_ENCODERS[name].get('hardware'))]
+            codecs[family] = {'available': usable, 'preferred': usable[0] if usable else None}
+
+        output_encoders = {}
+        for fmt in FORMAT_CODECS:
+            profile = resolve_profile(fmt, capabilities=capabilities)
+            output_encoders[fmt] = profile.video_encoder or profile.audio_options().get('acodec')
+
+        return {
+            'ffmpeg_version': capabilities['ffmpeg_version'],
+            'video_codecs': codecs,
+            'output_encoders': output_encoders,
+            'hwaccels': capabilities['hwaccels'],
+            'hardware_encoders': capabilities['hardware_encoders'],
+            'cpu': capabilities['cpu'],
+        }
+
+    def plan_stream_copy(self, media_info: Dict[str, Any], output_format: str, output_quality: str = 'original',
+                         video_codec: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """Decide per stream type whether to 'copy' or 'encode'; None where the input has no such stream.
+        A requested video_codec (custom_settings['video_codec']) is only copied from a source already in it."""
+        allowed = CONTAINER_CODECS.get(output_format)
+        streams = media_info.get('streams') or []
+        if not allowed or not streams:
+            return {}
+
+        target_height = None
+        if output_quality and output_quality.endswith('p') and output_quality[:-1].isdigit():
+            target_height = int(output_quality[:-1])
+
+        # Same rule as resolve_profile: unknown codecs and audio-only containers ignore the override
+        requested = video_codec if (video_codec in CODEC_IMPLEMENTATIONS and FORMAT_CODECS.get(output_format, (None,))[0]) else None
+
+        plan = {'video': None, 'audio': None}
+        for kind in ('video', 'audio'):
+            stream = next((st for st in streams if st.get('codec_type') == kind), None)
+            if stream is None or kind not in allowed:
+                continue
+            fits = stream.get('codec_name') in allowed[kind]
+            if kind == 'video' and requested and stream.get('codec_name') != requested:
+                fits = False  # Asked for another codec than the source carries
+            if kind == 'video' and target_height and (stream.get('height') or 0) > target_height:
+                fits = False  # Needs downscaling, which means decoding
+            plan[kind] = 'copy' if fits else 'encode'
+        return plan
+
+    def _convert_media_ffmpeg(self, input_path: str, output_path: str, conversion_request: ConversionRequest,
+                              media_info: Optional[Dict[str, Any]] = None, muxer: Optional[Dict[str, Any]] = None):
+        """Convert video/audio files, inspired by convert and manualConvert; muxer overrides container options"""
         try:
-            conversion_request.progress = 10
-            conversion_request.save()
-            
-            # Use hardware acceleration if available
-            stream = ffmpeg.input(input_path, hwaccel='auto')
-            
-            output_options = {}
-            
-            # Quality-based encoding
-            if conversion_request.output_quality == 'high':
-                if conversion_request.output_format in ['mp4', 'mkv', 'avi']:
-                    output_options.update({
-                        'vcodec': 'libx264',
-                        'crf': '18',
-                        'preset': 'slow',
-                        'acodec': 'aac',
-                        'audio_bitrate': '320k'
-                    })
-                elif conversion_request.output_format in ['mp3', 'aac', 'm4a']:
-                    output_options.update({
-                        'acodec': 'aac' if conversion_request.output_format in ['aac', 'm4a'] else 'mp3',
-                        'audio_bitrate': '320k'
-                    })
-            elif conversion_request.output_quality == 'medium':
-                if conversion_request.output_format in ['mp4', 'mkv', 'avi']:
-                    output_options.update({
-                        'vcodec': 'libx264',
-                        'crf': '23',
-                        'preset': 'medium',
-                        'acodec': 'aac',
-                        'audio_bitrate': '192k'
-                    })
-                elif conversion_request.output_format in ['mp3', 'aac', 'm4a']:
-                    output_options.update({
-                        'acodec': 'aac' if conversion_request.output_format in ['aac', 'm4a'] else 'mp3',
-                        'audio_bitrate': '192k'
-                    })
-            else:  # low quality
-                if conversion_request.output_format in ['mp4', 'mkv', 'avi']:
-                    output_options.update({
-                        'vcodec': 'libx264',
-                        'crf': '28',
-                        'preset': 'fast',
-                        'acodec': 'aac',
-                        'audio_bitrate': '128k'
-                    })
-                elif conversion_request.output_format in ['mp3', 'aac', 'm4a']:
-                    output_options.update({
-                        'acodec': 'aac' if conversion_request.output_format in ['aac', 'm4a'] else 'mp3',
-                        'audio_bitrate': '128k'
-                    })
+            plan = self.plan_stream_copy(media_info or {}, conversion_request.output_format, conversion_request.output_quality,
+                                         (conversion_request.custom_settings or {}).get('video_codec'))
+            if plan.get('video') == 'copy' and self._smart_cut(input_path, output_path, conversion_request,
+                                                               media_info, plan, muxer):
+                return
+            if plan and 'encode' not in plan.values():
+                # Codecs already fit the target container - remuxing is orders of magnitude faster
+                self._remux(input_path, output_path, conversion_request, plan, muxer)
+                return
+
+            # Hardware decoding only where the capability probe saw it work - no per-job init failures.
+            # Clips seek on the input, so only the requested part is ever decoded.
+            clip = self.clip_options(conversion_request)
+            stream = ffmpeg.input(input_path, **hwaccel_input_options(), **clip)
             
-            conversion_request.progress = 30
-            conversion_request.save()
+            # Only one stream is incompatible - copy the other instead of re-encoding it too
+            profile = self.get_profile(conversion_request, media_info)
+            output_options = profile.output_options(
+                copy_video=plan.get('video') == 'copy',
+                copy_audio=plan.get('audio') == 'copy',
+            )
+            output_options.update(muxer or {})
+            logger.info(f"Conversion {conversion_request.id}: profile {profile.name}"
+                        + (f", partial stream copy {plan}" if 'copy' in plan.values() else ''))
+
+            # Files of a batch encode side by side - each gets its share of the cores, not all of them
+            cores = core_share(conversion_request.batch.concurrency if conversion_request.batch_id else 1)
+            if not muxer and not clip and should_parallelize(profile, conversion_request.duration, plan, cores):
+                # Long input - encode keyframe-aligned segments on several cores and stitch them
+                encode_parallel(input_path, output_path, profile, conversion_request.duration, plan,
+                                ProgressPublisher(conversion_request), cores=cores)
+                return
             
             # Create output stream
             stream = ffmpeg.output(stream, output_path, **output_options)
-            
-            conversion_request.progress = 50
-            conversion_request.save()
-            
-            # Run conversion with progress callback
-            process = ffmpeg.run_async(stream, overwrite_output=True, quiet=True)
-            
-            # Simulate progress updates (in real implementation, you'd parse ffmpeg output)
-            import time
-            progress_steps = [60, 70, 80, 90, 95]
-            for step in progress_steps:
-                if process.poll() is None:  # Process still running
-                    time.sleep(1)
-                    conversion_request.progress = step
-                    conversion_request.save()
-                else:
-                    break
-            
-            # Wait for completion
-            process.wait()
-            
-            if process.returncode != 0:
-                raise Exception("FFmpeg conversion failed")
+            run_ffmpeg(stream, ProgressPublisher(conversion_request), conversion_request.duration)
                 
         except ffmpeg.Error as e:
             logger.error(f"FFmpeg error in media conversion: {e.stderr}")
             raise Exception(f"Media conversion failed: {e.stderr}")
     
+    def clip_options(self, conversion_request: ConversionRequest) -> Dict[str, Any]:
+        """Input seek/duration options for custom_settings start/end; empty when the whole input is converted"""
+        window = clip_window(conversion_request.custom_settings)
+        return clip_input_options(window) if window else {}
+
+    def _smart_cut(self, input_path: str, output_path: str, conversion_request: ConversionRequest,
+                   media_info: Dict[str, Any], plan: Dict[str, Optional[str]],
+                   muxer: Optional[Dict[str, Any]] = None) -> bool:
+        """Cut a clip whose video can be kept as-is: copy whole GOPs, re-encode only the partial ones at the edges
+
+        Returns False when the job isn't a clip or the source codec has no edge encoder here.
+        """
+        window = clip_window(conversion_request.custom_settings)
+        video_stream = next((st for st in media_info.get('streams', []) if st.get('codec_type') == 'video'), {})
+        edge = EDGE_ENCODERS.get(video_stream.get('codec_name'))
+        if not window or not edge or edge[0] not in get_capabilities()['encoders']:
+            return False
+
+        audio_options = None
+        if plan.get('audio') == 'copy':
+            audio_options = {'acodec': 'copy'}
+        elif plan.get('audio') == 'encode':
+            audio_options = self.get_profile(conversion_request, media_info).audio_options()
+        output_options = {'sn': None}
+        if conversion_request.output_format in ('mp4', 'mov', 'm4a'):
+            output_options['movflags'] = '+faststart'
+        output_options.update(muxer or {})
+
+        result = smart_cut(input_path, output_path, window, video_stream['codec_name'], audio_options,
+                           output_options, ProgressPublisher(conversion_request))
+        logger.info(f"Conversion {conversion_request.id}: clip {window[0]}-{window[1]} with "
+                    f"{result['encoded_seconds']:.2f}s re-encoded")
+        return True
+
+    def get_chapters(self, media_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The input's chapters, checked against the per-job limit"""
+        chapters = media_info.get('chapters') or []
+        if not chapters:
+            raise Exception("The input has no chapter markers to split by")
+        if len(chapters) > settings.CHAPTER_SPLIT_MAX:
+            raise Exception(f"The input has {len(chapters)} chapters; at most {settings.CHAPTER_SPLIT_MAX} can be split")
+        return chapters
+
+    def _split_chapters(self, input_path: str, output_paths: List[str], chapters: List[Dict[str, Any]],
+                        conversion_request: ConversionRequest, media_info: Dict[str, Any]):
+        """One output per chapter: streams that fit the target are copied, the rest use the job's profile"""
+        plan = self.plan_stream_copy(media_info, conversion_request.output_format, conversion_request.output_quality,
+                                     (conversion_request.custom_settings or {}).get('video_codec'))
+        options = self.get_profile(conversion_request, media_info).output_options(
+            copy_video=plan.get('video') == 'copy', copy_audio=plan.get('audio') == 'copy'
+        )
+        split_chapters(input_path, output_paths, chapters, {**options, 'sn': None},
+                       ProgressPublisher(conversion_request))
+
+    def get_renditions(self, conversion_request: ConversionRequest) -> List[Dict[str, Any]]:
+        """The job's own output first, then any extra outputs listed in custom_settings['renditions']"""
+        custom = conversion_request.custom_settings or {}
+        renditions = [{
+            'output_format': conversion_request.output_format,
+            'output_quality': conversion_request.output_quality,
+            'audio_bitrate': custom.get('audio_bitrate'),
+        }]
+        for rendition in custom.get('renditions') or []:
+            renditions.append({
+                'output_format': rendition['output_format'],
+                'output_quality': rendition.get('output_quality') or 'original',
+                'audio_bitrate': rendition.get('audio_bitrate'),
+            })
+        return renditions
+
+    def _convert_renditions(self, input_path: str, output_paths: List[str], renditions: List[Dict[str, Any]],
+                            conversion_request: ConversionRequest, media_info: Optional[Dict[str, Any]] = None):
+        """Decode the input once and feed every rendition's encoder through a split/scale filter graph"""
+        media_info = media_info or {}
+        custom = conversion_request.custom_settings or {}
+        streams = media_info.get('streams') or []
+        video_stream = next((st for st in streams if st.get('codec_type') == 'video'), None)
+        # Without a probe, trust the extension: video files are assumed to carry audio too
+        has_video = video_stream is not None if streams else self.get_file_category(conversion_request.input_format) == 'video'
+        has_audio = any(st.get('codec_type') == 'audio' for st in streams) if streams else True
+
+        capabilities = get_capabilities()
+        jobs = []
+        for rendition, path in zip(renditions, output_paths):
+            profile = resolve_profile(
+                rendition['output_format'], rendition['output_quality'], speed=custom.get('speed'),
+                source_height=(video_stream or {}).get('height'), video_codec=custom.get('video_codec'),
+                capabilities=capabilities,
+            )
+            if rendition.get('audio_bitrate'):
+                profile.audio_bitrate = rendition['audio_bitrate']
+            if profile.video_codec and not has_video:
+                raise Exception(f"Cannot produce {rendition['output_format']} video from an input without video")
+            plan = self.plan_stream_copy(media_info, rendition['output_format'], rendition['output_quality'],
+                                         custom.get('video_codec'))
+            jobs.append((profile, plan, path))
+
+        source = ffmpeg.input(input_path, **hwaccel_input_options(), **self.clip_options(conversion_request))
+        # One split output per rendition that actually re-encodes; copied streams map the input directly
+        video_encodes = [profile for profile, plan, _ in jobs if profile.video_codec and plan.get('video') != 'copy']
+        audio_encodes = [profile for profile, plan, _ in jobs if has_audio and plan.get('audio') != 'copy']
+        video_split = source.video.filter_multi_output('split', len(video_encodes)) if len(video_encodes) > 1 else None
+        audio_split = source.audio.filter_multi_output('asplit', len(audio_encodes)) if len(audio_encodes) > 1 else None
+
+        outputs = []
+        video_index = audio_index = 0
+        for profile, plan, path in jobs:
+            copy_video = plan.get('video') == 'copy'
+            copy_audio = plan.get('audio') == 'copy'
+            options = profile.output_options(copy_video=copy_video, copy_audio=copy_audio)
+            options.pop('vn', None)  # Streams are mapped explicitly below
+            options.pop('vf', None)  # Scaling happens in the shared graph
+            branches = []
+            if profile.video_codec:
+                if copy_video:
+                    branches.append(source.video)
+                else:
+                    branch = video_split[video_index] if video_split else source.video
+                    video_index += 1
+                    branches.append(branch.filter('scale', -2, profile.height) if profile.height else branch)
+            if has_audio:
+                if copy_audio:
+                    branches.append(source.audio)
+                else:
+                    branches.append(audio_split[audio_index] if audio_split else source.audio)
+                    audio_index += 1
+            outputs.append(ffmpeg.output(*branches, path, **options))
+
+        logger.info(f"Conversion {conversion_request.id}: {len(jobs)} renditions from one decode "
+                    f"({', '.join(profile.name for profile, _, _ in jobs)})")
+        run_ffmpeg(ffmpeg.merge_outputs(*outputs), ProgressPublisher(conversion_request), conversion_request.duration,
+                   message=f'Encoding {len(jobs)} renditions...')
+
+    def _remux(self, input_path: str, output_path: str, conversion_request: ConversionRequest,
+               plan: Dict[str, Optional[str]], muxer: Optional[Dict[str, Any]] = None):
+        """Rewrap the existing streams into the new container without decoding them"""
+        output_options = {'c': 'copy', 'sn': None}  # Subtitle formats rarely survive a container change
+        if plan.get('video') is None:
+            output_options['vn'] = None
+        if conversion_request.output_format in ('mp4', 'mov', 'm4a'):
+            output_options['movflags'] = '+faststart'
+        output_options.update(muxer or {})
+        stream = ffmpeg.output(ffmpeg.input(input_path, **self.clip_options(conversion_request)), output_path,
+                               **output_options)
+        logger.info(f"Conversion {conversion_request.id}: stream-copy remux to {conversion_request.output_format}")
+        run_ffmpeg(stream, ProgressPublisher(conversion_request), conversion_request.duration, message='Remuxing...')
+
     def get_media_info(self, file_path: str) -> Dict[str, Any]:
         """Get media file information using ffprobe"""
-        try:
-            probe = ffmpeg.probe(file_path)
-            
-            info = {
-                'duration': float(probe.get('format', {}).get('duration', 0)),
-                'size': int(probe.get('format', {}).get('size', 0)),
-                'bitrate': int(probe.get('format', {}).get('bit_rate', 0)),
-                'format_name': probe.get('format', {}).get('format_name', ''),
-                'streams': []
-            }
-            
-            for stream in probe.get('streams', []):
-                stream_info = {
-                    'codec_type': stream.get('codec_type'),
-                    'codec_name': stream.get('codec_name'),
-                }
-                
-                if stream.get('codec_type') == 'video':
-                    stream_info.update({
-                        'width': stream.get('width'),
-                        'height': stream.get('height'),
-                        'fps': eval(stream.get('r_frame_rate', '0/1'))
-                    })
-                elif stream.get('codec_type') == 'audio':
-                    stream_info.update({
-                        'sample_rate': stream.get('sample_rate'),
-                        'channels': stream.get('channels'),
-                        'channel_layout': stream.get('channel_layout')
-                    })
-                
-                info['streams'].append(stream_info)
-            
-            return info
-            
-        except Exception as e:
-            logger.error(f"Error getting media info: {str(e)}")
-            return {}
+        return probe_media(file_path)
     
     def estimate_conversion_time(self, file_size: int, input_format: str, output_format: str, quality: str) -> int:
         """Estimate conversion time in seconds based on file size and formats"""
@@ -291,3 +642,31 @@ class ConversionService:
             format_multiplier = 0.5  # Lossless audio is faster
         
         return int(base_time * format_multiplier)
+
+    def estimate_queue_wait(self, conversion_request: Optional[ConversionRequest] = None) -> int:
+        """Estimate seconds until a pending job starts, from live ETAs and recently observed encode speeds"""
+        running = ConversionRequest.objects.filter(status='processing')
+        queued = ConversionRequest.objects.filter(status='pending')
+        if conversion_request is not None:
+            queued = queued.filter(created_at__lt=conversion_request.created_at)
+
+        # Media seconds encoded per wall-clock second on this deployment, lately
+        recent_speeds = list(
+            ConversionRequest.objects.filter(status='completed', encode_speed__isnull=False)
+            .order_by('-completed_at').values_list('encode_speed', flat=True)[:20]
+        )
+        typical_speed = sum(recent_speeds) / len(recent_speeds) if recent_speeds else None
+
+        work = 0.0
+        for job in running:
+            if job.eta_seconds is not None:
+                work += job.eta_seconds
+            else:
+                work += self.estimate_conversion_time(job.input_size, job.input_format, job.output_format, job.output_quality)
+        for job in queued:
+            if job.duration and typical_speed:
+                work += job.duration / typical_speed
+            else:
+                work += self.estimate_conversion_time(job.input_size, job.input_format, job.output_format, job.output_quality)
+
+        return int(work / max(settings.CONVERSION_WORKER_CONCURRENCY, 1))
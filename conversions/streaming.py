@@ -0,0 +1,109 @@
+"""
+Streaming-upload conversions: feed the request body into ffmpeg's stdin while it is still arriving
+"""
+import os
+import hashlib
+import logging
+import threading
+from typing import Optional, Iterator, BinaryIO
+from .progress import ProgressPublisher
+
+logger = logging.getLogger(__name__)
+
+# Containers ffmpeg can demux front-to-back from a pipe. MP4/MOV/M4A are missing on purpose:
+# their index (moov) is usually at the end of the file, so they need a seekable input.
+STREAMABLE_INPUTS = {
+    'mkv': 'matroska',
+    'webm': 'matroska',
+    'flv': 'flv',
+    'ts': 'mpegts',
+    'mp3': 'mp3',
+    'flac': 'flac',
+    'wav': 'wav',
+    'ogg': 'ogg',
+    'aac': 'aac',
+}
+
+
+class UploadSpool:
+    """A request body received into a file that the encoder follows from another thread while it grows
+
+    receive() runs on the request thread at the client's pace and iterating runs on the encoder's
+    thread at ffmpeg's pace, so the request is done once the body is on disk however far behind
+    the encode is.
+    """
+
+    def __init__(self, path: str, total: Optional[int] = None, publisher: Optional[ProgressPublisher] = None,
+                 chunk_size: int = 256 * 1024):
+        self.path = path
+        self.total = total
+        self.publisher = publisher
+        self.chunk_size = chunk_size
+        self.received = 0
+        self.complete = False
+        self.error: Optional[str] = None
+        self._sha256 = hashlib.sha256()
+        self._grown = threading.Condition()
+        self._done = False
+        open(self.path, 'wb').close()  # The encoder may start following before the first chunk lands
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def receive(self, source: BinaryIO):
+        """Write the whole body to the spool; raises when it ends short of total"""
+        try:
+            with open(self.path, 'ab') as spool:
+                while self.total is None or self.received < self.total:
+                    chunk = source.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    spool.write(chunk)
+                    spool.flush()
+                    self._sha256.update(chunk)
+                    with self._grown:
+                        self.received += len(chunk)
+                        self._grown.notify_all()
+            if self.total is not None and self.received < self.total:
+                raise Exception(f"Upload ended after {self.received} of {self.total} bytes")
+            self.complete = True
+        except Exception as e:
+            self.error = str(e)
+            raise
+        finally:
+            with self._grown:
+                self._done = True
+                self._grown.notify_all()
+
+    def wait(self) -> bool:
+        """Block until receive() is over; True when the whole body arrived"""
+        with self._grown:
+            while not self._done:
+                self._grown.wait()
+        return self.complete
+
+    def __iter__(self) -> Iterator[bytes]:
+        with open(self.path, 'rb') as spool:
+            while True:
+                with self._grown:
+                    done = self._done
+                chunk = spool.read(self.chunk_size)
+                if chunk:
+                    if self.publisher and self.total:
+                        # Without a probed duration, how much of the upload ffmpeg has consumed is the best measure
+                        self.publisher.publish({'progress': spool.tell() / self.total * 100},
+                                               'Converting while uploading...')
+                    yield chunk
+                    continue
+                if done:
+                    if not self.complete:
+                        raise Exception(self.error or "Upload ended early")
+                    return
+                with self._grown:
+                    if not self._done and spool.tell() >= self.received:
+                        self._grown.wait(timeout=1)
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -36,3 +36,23 @@ def process_conversion_task(self, conversion_id: str):
             pass
         
         return error_msg
+
+
+@shared_task(bind=True)
+def process_batch_task(self, batch_id: str):
+    """Background task to convert every file of a batch on a capped pool"""
+    from .models import ConversionBatch
+    from .batches import run_batch
+    try:
+        batch = ConversionBatch.objects.get(id=batch_id)
+        run_batch(batch)
+        return f"Batch completed: {batch_id}"
+    except ConversionBatch.DoesNotExist:
+        error_msg = f"Conversion batch {batch_id} not found"
+        logger.error(error_msg)
+        return error_msg
+    except Exception as e:
+        error_msg = f"Batch failed: {str(e)}"
+        logger.error(error_msg)
+        ConversionBatch.objects.filter(id=batch_id).update(status='failed', error_message=str(e))
+        return error_msg
@@ -1,3 +1,774 @@
-from django.test import TestCase
+import io
+import os
+import re
+import hashlib
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import capabilities
+from .batches import archive_members, batch_progress, _entry_name
+from .chapters import chapter_filename, normalize_chapters, split_chapters
+from .clips import smart_cut
+from .models import ConversionBatch, ConversionOutput, ConversionRequest
+from .parallel import core_share, segment_workers, should_parallelize
+from .profiles import resolve_profile
+from .progress import FFmpegProgress, progress_key, run_ffmpeg
+from .progressive import live_path
+
+from .serializers import ConversionStreamSerializer, ConversionBatchCreateSerializer
+from .services import ConversionService
+from .streaming import UploadSpool
+from . import uploads
+
+
+def _media(video_codec='h264', audio_codec='aac', height=720):
+    return {'streams': [
+        {'codec_type': 'video', 'codec_name': video_codec, 'height': height},
+        {'codec_type': 'audio', 'codec_name': audio_codec},
+    ]}
+
+
+class PlanStreamCopyTests(SimpleTestCase):
+    """Which streams a conversion copies and which it re-encodes"""
+
+    def setUp(self):
+        self.service = ConversionService()
+
+    def test_fitting_codecs_are_copied(self):
+        plan = self.service.plan_stream_copy(_media(), 'mkv')
+        self.assertEqual(plan, {'video': 'copy', 'audio': 'copy'})
+
+    def test_requested_codec_other_than_source_is_encoded(self):
+        plan = self.service.plan_stream_copy(_media('h264'), 'mkv', video_codec='hevc')
+        self.assertEqual(plan, {'video': 'encode', 'audio': 'copy'})
+
+    def test_requested_codec_matching_source_is_copied(self):
+        plan = self.service.plan_stream_copy(_media('hevc'), 'mp4', video_codec='hevc')
+        self.assertEqual(plan, {'video': 'copy', 'audio': 'copy'})
+
+    def test_unknown_requested_codec_is_ignored(self):
+        plan = self.service.plan_stream_copy(_media('h264'), 'mkv', video_codec='theora')
+        self.assertEqual(plan['video'], 'copy')
+
+    def test_downscale_forces_encode(self):
+        plan = self.service.plan_stream_copy(_media(height=1080), 'mp4', '480p')
+        self.assertEqual(plan['video'], 'encode')
+
+
+
+def _feed(tracker, text):
+    """Feed -progress lines; returns how many blocks completed"""
+    return sum(tracker.feed(line) for line in text.strip().splitlines())
+
+
+class FFmpegProgressTests(SimpleTestCase):
+    """Parsing of ffmpeg's -progress key=value blocks"""
+
+    BLOCK = "frame={frame}\nfps=50.0\nout_time_us={us}\nout_time_ms={us}\nspeed={speed}\nprogress={state}\n"
+
+    def block(self, us, speed='2.00x', frame=0, state='continue'):
+        return self.BLOCK.format(us=us, speed=speed, frame=frame, state=state)
+
+    def test_percent_speed_and_eta(self):
+        tracker = FFmpegProgress(duration=60)
+        self.assertEqual(_feed(tracker, self.block(15_000_000, frame=375)), 1)
+        self.assertEqual(tracker.out_time, 15.0)
+        self.assertEqual(tracker.speed, 2.0)
+        self.assertEqual(tracker.percent, 25.0)
+        self.assertEqual(tracker.eta, 22.5)  # 45s of media left at 2x
+        self.assertEqual(tracker.snapshot(), {
+            'progress': 25.0, 'speed': 2.0, 'eta_seconds': 22, 'out_time': 15.0, 'frame': 375,
+        })
+
+    def test_only_the_progress_line_completes_a_block(self):
+        tracker = FFmpegProgress(duration=60)
+        self.assertEqual(_feed(tracker, "frame=10\nout_time_us=1000000\n"), 0)
+        self.assertEqual(tracker.out_time, 0.0)
+        self.assertTrue(tracker.feed("progress=continue"))
+        self.assertEqual(tracker.out_time, 1.0)
+
+    def test_unknown_values_keep_the_last_reading(self):
+        tracker = FFmpegProgress(duration=60)
+        _feed(tracker, self.block(30_000_000, speed='1.5x'))
+        # Early blocks of some ffmpeg builds report N/A and a negative time
+        _feed(tracker, self.block(-9223372036854775807, speed='N/A'))
+        self.assertEqual(tracker.speed, 1.5)
+        self.assertEqual(tracker.out_time, 30.0)
+        self.assertEqual(tracker.eta, 20.0)
+
+    def test_out_time_ms_is_microseconds(self):
+        tracker = FFmpegProgress(duration=10)
+        _feed(tracker, "out_time_ms=5000000\nspeed=1x\nprogress=continue")
+        self.assertEqual(tracker.out_time, 5.0)
+        self.assertEqual(tracker.percent, 50.0)
+
+    def test_end_block_finishes(self):
+        tracker = FFmpegProgress(duration=60)
+        _feed(tracker, self.block(59_990_000))
+        self.assertEqual(tracker.percent, 99.9)  # Never 100 until ffmpeg says so
+        _feed(tracker, self.block(60_000_000, state='end'))
+        self.assertTrue(tracker.finished)
+        self.assertEqual(tracker.percent, 100.0)
+        self.assertEqual(tracker.eta, 0.0)
+
+    def test_unknown_duration_has_no_percent_or_eta(self):
+        tracker = FFmpegProgress()
+        _feed(tracker, self.block(15_000_000))
+        self.assertIsNone(tracker.percent)
+        self.assertIsNone(tracker.eta)
+
+    def test_eta_falls_back_to_wall_clock(self):
+        tracker = FFmpegProgress(duration=60)
+        with mock.patch('conversions.progress.time.monotonic', return_value=tracker._started + 10):
+            _feed(tracker, self.block(20_000_000, speed='N/A'))
+            # 20s of media in 10s of wall clock is 2x, so 40s left takes 20s
+            self.assertEqual(tracker.eta, 20.0)
+
+
+class VideoCodecValidationTests(SimpleTestCase):
+    """A video_codec override has to fit the container it is encoded into"""
+
+    def _errors(self, output_format, video_codec):
+        serializer = ConversionStreamSerializer(data={
+            'input_filename': 'clip.flv', 'output_format': output_format,
+            'custom_settings': {'video_codec': video_codec},
+        })
+        self.assertFalse(serializer.is_valid())
+        return serializer.errors
+
+    def test_codec_the_container_cannot_hold_is_rejected(self):
+        self.assertIn('webm', str(self._errors('webm', 'h264')))
+
+    def test_unknown_codec_is_rejected(self):
+        self.assertIn('Unknown video_codec', str(self._errors('mkv', 'theora')))
+
+    def test_fitting_codec_is_accepted(self):
+        serializer = ConversionStreamSerializer(data={
+            'input_filename': 'clip.flv', 'output_format': 'mkv', 'custom_settings': {'video_codec': 'hevc'},
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_audio_outputs_ignore_the_override(self):
+        serializer = ConversionStreamSerializer(data={
+            'input_filename': 'clip.flv', 'output_format': 'mp3', 'custom_settings': {'video_codec': 'hevc'},
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_batch_settings_are_checked(self):
+        serializer = ConversionBatchCreateSerializer(data={
+            'files': [SimpleUploadedFile('clip.mkv', b'data')], 'output_format': 'webm',
+            'custom_settings': {'video_codec': 'hevc'},
+        })
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("can't hold hevc", str(serializer.errors))
+
+
+class LiveOutputTests(TestCase):
+    """The live endpoint picks its response only once it knows whether it attached to the encode"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root, CONVERSION_LIVE_START_TIMEOUT=1)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.job = ConversionRequest.objects.create(
+            input_filename='clip.mkv', input_format='mkv', input_size=1, output_format='webm',
+            custom_settings={'progressive': True}, status='processing',
+        )
+        self.addCleanup(cache.delete, progress_key(self.job.id))
+        self.url = f'/api/conversions/requests/{self.job.id}/live/'
+
+    def _finish(self, conversion_request, *args, **kwargs):
+        # The job completes and renames its live file before the follower could open it
+        os.makedirs(os.path.join(self.media_root, 'conversions'), exist_ok=True)
+        with open(os.path.join(self.media_root, 'conversions', 'final.webm'), 'wb') as f:
+            f.write(b'final output')
+        ConversionRequest.objects.filter(id=self.job.id).update(status='completed', output_file='conversions/final.webm')
+        return None
+
+    def test_streams_the_live_file(self):
+        path = live_path(self.job)
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'live bytes')
+        cache.set(progress_key(self.job.id), {'status': 'completed'})
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'live bytes')
+
+    def test_finished_before_attach_serves_the_final_file(self):
+        with mock.patch('conversions.views.attach_output', side_effect=self._finish):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'final output')
+
+    def test_failed_before_attach_is_an_error(self):
+        def fail(conversion_request, *args, **kwargs):
+            ConversionRequest.objects.filter(id=self.job.id).update(status='failed', error_message='encoder exploded')
+            return None
+
+        with mock.patch('conversions.views.attach_output', side_effect=fail):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['error'], 'encoder exploded')
+
+
+class CreateCacheLookupTests(TestCase):
+    """Creating a job never hashes a plain upload in the request - the task does that"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_plain_upload_is_queued_unhashed(self):
+        with mock.patch('conversions.views.ConversionService.serve_cached') as serve_cached, \
+                mock.patch('conversions.views.queue_conversion') as queue:
+            response = self.client.post('/api/conversions/requests/', {
+                'input_file': SimpleUploadedFile('clip.mkv', b'data'), 'output_format': 'mp3',
+            })
+        self.assertEqual(response.status_code, 201, response.content)
+        serve_cached.assert_not_called()
+        queue.assert_called_once()
+        self.assertEqual(ConversionRequest.objects.get(id=response.json()['id']).input_sha256, '')
+
+
+class UploadSpoolTests(SimpleTestCase):
+    """The encoder follows the spool while the request thread is still writing it"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def _follow(self, spool):
+        read, errors = [], []
+
+        def follow():
+            try:
+                read.extend(spool)
+            except Exception as e:
+                errors.append(e)
+        follower = threading.Thread(target=follow)
+        follower.start()
+        return follower, read, errors
+
+    def test_reader_gets_the_whole_body(self):
+        body = os.urandom(300_000)
+        spool = UploadSpool(os.path.join(self.tmp, 'in.mkv'), len(body), chunk_size=4096)
+        follower, read, errors = self._follow(spool)
+        spool.receive(io.BytesIO(body))
+        follower.join(timeout=10)
+        self.assertEqual(b''.join(read), body)
+        self.assertEqual(errors, [])
+        self.assertEqual(spool.sha256, hashlib.sha256(body).hexdigest())
+
+    def test_short_body_fails_the_reader(self):
+        spool = UploadSpool(os.path.join(self.tmp, 'in.mkv'), 10_000, chunk_size=4096)
+        follower, read, errors = self._follow(spool)
+        with self.assertRaises(Exception):
+            spool.receive(io.BytesIO(b'x' * 5_000))
+        follower.join(timeout=10)
+        self.assertFalse(spool.wait())
+        self.assertEqual(len(errors), 1)
+
+
+class StreamUploadTests(TestCase):
+    """PUT of a streaming job's body claims the job once and returns before the encode is done"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.job = ConversionRequest.objects.create(
+            input_filename='clip.flv', input_format='flv', input_size=0, output_format='mp3',
+        )
+        self.url = f'/api/conversions/requests/{self.job.id}/upload/'
+
+    def test_second_upload_is_rejected(self):
+        with mock.patch('conversions.views.encode_stream') as encode:
+            first = self.client.put(self.url, data=b'flv body', content_type='application/octet-stream')
+            second = self.client.put(self.url, data=b'flv body', content_type='application/octet-stream')
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.json()['status'], 'processing')
+        self.assertEqual(second.status_code, 409)
+        self.assertEqual(encode.call_count, 1)
+        self.assertEqual(open(encode.call_args[0][1].path, 'rb').read(), b'flv body')
+
+    def test_oversized_upload_is_rejected_before_claiming(self):
+        with mock.patch('conversions.views.MAX_INPUT_SIZE', 4):
+            response = self.client.put(self.url, data=b'flv body', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 400)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'pending')
+
+
+
+class ChunkedUploadTests(TestCase):
+    """Chunks land at the expected offset, are hashed once, and verified or deduplicated at the end"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(
+            MEDIA_ROOT=self.media_root, ARTIFACT_STORE_DIR=os.path.join(self.media_root, 'artifacts'),
+            SCRATCH_DIR=os.path.join(self.media_root, 'scratch'), SCRATCH_TMPFS_DIR='', SCRATCH_MIN_FREE_BYTES=0,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.body = os.urandom(100_000)
+        self.sha256 = hashlib.sha256(self.body).hexdigest()
+
+    def _data(self, upload):
+        return os.path.join(upload.scratch_path, 'data')
+
+    def test_offset_mismatch_reports_the_expected_offset(self):
+        upload = uploads.start_upload('clip.mkv', len(self.body))
+        uploads.write_chunk(upload, 0, io.BytesIO(self.body[:40_000]), 40_000)
+        with self.assertRaises(uploads.UploadConflict) as raised:
+            uploads.write_chunk(upload, 50_000, io.BytesIO(self.body[50_000:]), 50_000)
+        self.assertEqual(raised.exception.offset, 40_000)
+
+    def test_resumed_chunk_drops_the_partial_tail(self):
+        upload = uploads.start_upload('clip.mkv', len(self.body), expected_sha256=self.sha256)
+        uploads.write_chunk(upload, 0, io.BytesIO(self.body[:40_000]), 40_000)
+        # A chunk that broke off after the offset was saved left junk behind it
+        with open(self._data(upload), 'ab') as f:
+            f.write(b'junk' * 1000)
+        uploads.write_chunk(upload, 40_000, io.BytesIO(self.body[40_000:]), 60_000)
+        self.assertEqual(upload.status, 'complete')
+        self.assertEqual(upload.sha256, self.sha256)
+
+    def test_hash_catches_up_from_disk_on_another_worker(self):
+        upload = uploads.start_upload('clip.mkv', len(self.body))
+        uploads.write_chunk(upload, 0, io.BytesIO(self.body[:40_000]), 40_000)
+        uploads._hashers.clear()  # The next chunk lands on a worker that never saw the first
+        uploads.write_chunk(upload, 40_000, io.BytesIO(self.body[40_000:]), 60_000)
+        self.assertEqual(upload.status, 'complete')
+        self.assertEqual(upload.sha256, self.sha256)
+        copy = uploads.ArtifactStore().materialize(upload.artifact, os.path.join(self.media_root, 'copy.mkv'))
+        with open(copy, 'rb') as f:
+            self.assertEqual(f.read(), self.body)
+
+    def test_hash_mismatch_fails_the_upload(self):
+        upload = uploads.start_upload('clip.mkv', len(self.body), expected_sha256='0' * 64)
+        uploads.write_chunk(upload, 0, io.BytesIO(self.body), len(self.body))
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, 'failed')
+        self.assertIn('Content hash mismatch', upload.error_message)
+        self.assertIsNone(upload.artifact)
+        self.assertFalse(os.path.exists(upload.scratch_path))
+
+    def test_stored_content_completes_on_start(self):
+        first = uploads.start_upload('clip.mkv', len(self.body), expected_sha256=self.sha256)
+        uploads.write_chunk(first, 0, io.BytesIO(self.body), len(self.body))
+        second = uploads.start_upload('again.mkv', len(self.body), expected_sha256=self.sha256.upper())
+        self.assertEqual(second.status, 'complete')
+        self.assertTrue(second.deduplicated)
+        self.assertEqual(second.received, len(self.body))
+        self.assertEqual(second.artifact_id, first.artifact_id)
+
+
+
+
+ENCODERS_OUTPUT = """Encoders:
+ V..... = Video
+ A..... = Audio
+ ------
+ V....D libx264              libx264 H.264 / AVC / MPEG-4 AVC / MPEG-4 part 10 (codec h264)
+ V....D h264_nvenc           NVIDIA NVENC H.264 encoder (codec h264)
+ A....D aac                  AAC (Advanced Audio Coding)
+
+ A....D libmp3lame           libmp3lame MP3 (MPEG audio layer 3) (codec mp3)
+"""
+
+
+class CapabilitiesTests(SimpleTestCase):
+    """The probe is cached on disk per host and ffmpeg binary"""
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        override = override_settings(FFMPEG_CAPABILITIES_FILE=os.path.join(tmp, 'capabilities.json'))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(setattr, capabilities, '_capabilities', capabilities._capabilities)
+        capabilities._capabilities = None
+        self.fingerprint = {'host': 'worker-1', 'binary': '/usr/bin/ffmpeg:1000:1'}
+        self.probes = 0
+
+        def run(args, timeout=20):
+            flag = args[-1]
+            if flag == '-encoders':
+                self.probes += 1
+            output = {'-version': 'ffmpeg version 7.0', '-encoders': ENCODERS_OUTPUT,
+                      '-decoders': 'Decoders:\n ------\n V....D h264  H.264\n',
+                      '-hwaccels': 'Hardware acceleration methods:\n\n'}.get(flag, '')
+            return subprocess.CompletedProcess(args, 1 if flag == '-' else 0, output, '')
+        for target, kwargs in (('_run', {'side_effect': run}),
+                               ('_fingerprint', {'side_effect': lambda ffmpeg_bin: dict(self.fingerprint)})):
+            patcher = mock.patch(f'conversions.capabilities.{target}', **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fresh_process(self):
+        capabilities._capabilities = None
+        return capabilities.get_capabilities()
+
+    def test_parse_codec_list(self):
+        self.assertEqual(capabilities._parse_codec_list(ENCODERS_OUTPUT), ['libx264', 'h264_nvenc', 'aac', 'libmp3lame'])
+        self.assertEqual(capabilities._parse_codec_list('no list here\n V..... = Video\n'), [])
+
+    def test_listed_hardware_encoder_is_verified(self):
+        result = self.fresh_process()
+        self.assertEqual(result['encoders'], ['libx264', 'h264_nvenc', 'aac', 'libmp3lame'])
+        self.assertEqual(result['decoders'], ['h264'])
+        self.assertEqual(result['hardware_encoders'], [])  # The trial encode failed
+        self.assertEqual(result['ffmpeg_version'], 'ffmpeg version 7.0')
+
+    def test_cached_probe_is_reused_until_the_fingerprint_changes(self):
+        self.fresh_process()
+        self.assertIs(capabilities.get_capabilities(), capabilities._capabilities)  # Memoized in the process
+        self.fresh_process()
+        self.assertEqual(self.probes, 1)  # Read back from disk
+
+        self.fingerprint['binary'] = '/usr/bin/ffmpeg:2000:2'  # ffmpeg upgraded
+        self.fresh_process()
+        self.assertEqual(self.probes, 2)
+        self.fresh_process()
+        self.assertEqual(self.probes, 2)
+
+        self.fingerprint['host'] = 'worker-2'  # Shared volume, other machine
+        self.fresh_process()
+        self.assertEqual(self.probes, 3)
+
+        capabilities.get_capabilities(refresh=True)
+        self.assertEqual(self.probes, 4)
+
+    def test_unreadable_cache_is_probed_again(self):
+        self.fresh_process()
+        with open(capabilities.settings.FFMPEG_CAPABILITIES_FILE, 'w') as f:
+            f.write('{not json')
+        self.fresh_process()
+        self.assertEqual(self.probes, 2)
+
+
+class BatchHelperTests(SimpleTestCase):
+    def test_archive_members_skips_folders_metadata_and_other_types(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            for name in ('clips/', 'clips/a.mp4', 'clips/B.MKV', '__MACOSX/clips/._a.mp4', '.hidden.mp4', 'notes.txt'):
+                zf.writestr(name, b'' if name.endswith('/') else b'data')
+        archive.seek(7)
+        members, skipped = archive_members(archive, ['mp4', 'mkv'])
+        self.assertEqual([info.filename for info in members], ['clips/a.mp4', 'clips/B.MKV'])
+        self.assertEqual(skipped, ['__MACOSX/clips/._a.mp4', '.hidden.mp4', 'notes.txt'])
+        self.assertEqual(archive.tell(), 0)  # Ready to be read again for extraction
+
+    def test_archive_members_rejects_a_non_zip(self):
+        with self.assertRaisesMessage(Exception, 'not a valid ZIP'):
+            archive_members(io.BytesIO(b'not a zip'), ['mp4'])
+
+    def test_entry_names_are_unique(self):
+        used = set()
+        names = [_entry_name(ConversionRequest(input_filename=filename, output_format='mp3'), used)
+                 for filename in ('talk.mp4', 'other/talk.wav', 'talk.mkv', '.mp4', 'talk (2).flac')]
+        self.assertEqual(names, ['talk.mp3', 'talk (2).mp3', 'talk (3).mp3', '.mp4.mp3', 'talk (2) (2).mp3'])
+
+    def test_batch_files_share_the_cores(self):
+        self.assertEqual(core_share(4, cores=16), 4)
+        self.assertEqual(core_share(8, cores=4), 1)
+        with override_settings(PARALLEL_ENCODE_THREADS_PER_SEGMENT=4, PARALLEL_ENCODE_MAX_WORKERS=8):
+            self.assertEqual(segment_workers(core_share(1, cores=16)), 4)
+            self.assertEqual(segment_workers(core_share(4, cores=16)), 1)  # No parallel encode inside the batch
+
+
+
+@override_settings(PARALLEL_ENCODE_ENABLED=True, PARALLEL_ENCODE_MIN_DURATION=600,
+                   PARALLEL_ENCODE_THREADS_PER_SEGMENT=4, PARALLEL_ENCODE_MAX_WORKERS=8)
+class ParallelEncodeDecisionTests(SimpleTestCase):
+    """Which jobs are split into segments, and over how many workers"""
+
+    SOFTWARE = {'encoders': ['libx264'], 'hardware_encoders': []}
+    ENCODE = {'video': 'encode', 'audio': 'copy'}
+
+    def profile(self, output_format='mp4', capabilities=SOFTWARE):
+        return resolve_profile(output_format, speed='balanced', capabilities=capabilities)
+
+    def test_segment_workers(self):
+        self.assertEqual(segment_workers(16), 4)
+        self.assertEqual(segment_workers(3), 1)
+        self.assertEqual(segment_workers(64), 8)  # PARALLEL_ENCODE_MAX_WORKERS
+        with mock.patch('conversions.parallel.os.cpu_count', return_value=12):
+            self.assertEqual(segment_workers(), 3)
+        with mock.patch('conversions.parallel.os.cpu_count', return_value=None):
+            self.assertEqual(segment_workers(), 1)
+
+    def test_long_software_encode_is_split(self):
+        self.assertTrue(should_parallelize(self.profile(), 1800, self.ENCODE, cores=16))
+
+    def test_short_or_unknown_duration_is_not_split(self):
+        self.assertFalse(should_parallelize(self.profile(), 599, self.ENCODE, cores=16))
+        self.assertFalse(should_parallelize(self.profile(), None, self.ENCODE, cores=16))
+
+    def test_only_video_encodes_are_split(self):
+        self.assertFalse(should_parallelize(self.profile(), 1800, {'video': 'copy', 'audio': 'encode'}, cores=16))
+        self.assertFalse(should_parallelize(self.profile('mp3'), 1800, {'video': None, 'audio': 'encode'}, cores=16))
+
+    def test_hardware_encoder_is_not_split(self):
+        gpu = {'encoders': ['libx264', 'h264_nvenc'], 'hardware_encoders': ['h264_nvenc']}
+        with override_settings(CONVERSION_HARDWARE_ENCODING=True):
+            profile = self.profile(capabilities=gpu)
+        self.assertEqual(profile.video_encoder, 'h264_nvenc')
+        self.assertFalse(should_parallelize(profile, 1800, self.ENCODE, cores=16))
+
+    def test_too_few_cores_or_disabled(self):
+        self.assertFalse(should_parallelize(self.profile(), 1800, self.ENCODE, cores=7))
+        with override_settings(PARALLEL_ENCODE_ENABLED=False):
+            self.assertFalse(should_parallelize(self.profile(), 1800, self.ENCODE, cores=16))
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.batch = ConversionBatch.objects.create(output_format='mp3', concurrency=2, status='processing')
+
+    def job(self, filename, status, input_size=100, progress=0):
+        return ConversionRequest.objects.create(
+            batch=self.batch, input_filename=filename, input_format='mp4', input_size=input_size,
+            output_format='mp3', status=status, progress=progress,
+        )
+
+    def test_progress_is_weighted_by_input_size(self):
+        self.job('a.mp4', 'completed', input_size=300)
+        running = self.job('b.mp4', 'processing', input_size=100, progress=20)
+        self.job('c.mp4', 'failed', input_size=100)
+        self.job('d.mp4', 'pending', input_size=0)  # Unknown size still counts, with a token weight
+        result = batch_progress(self.batch)
+        self.assertEqual(result['total'], 4)
+        self.assertEqual(result['counts']['completed'], 1)
+        self.assertEqual(result['counts']['pending'], 1)
+        self.assertEqual(result['progress'], round((300 * 100 + 100 * 20 + 100 * 100) / 501, 1))
+
+        # The worker's live figure is fresher than the row
+        cache.set(progress_key(running.id), {'status': 'processing', 'progress': 80}, 60)
+        self.addCleanup(cache.delete, progress_key(running.id))
+        self.assertEqual(batch_progress(self.batch)['progress'], round((300 * 100 + 100 * 80 + 100 * 100) / 501, 1))
+
+    def test_download_waits_for_every_file(self):
+        self.job('a.mp4', 'completed')
+        self.job('b.mp4', 'processing', progress=50)
+        url = f'/api/conversions/batches/{self.batch.id}/download/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(response.json()['progress'], 75.0)
+
+        os.makedirs(os.path.join(self.media_root, 'conversions'))
+        with open(os.path.join(self.media_root, 'conversions', 'a.mp3'), 'wb') as f:
+            f.write(b'mp3 bytes')
+        self.batch.conversions.filter(input_filename='a.mp4').update(output_file='conversions/a.mp3')
+        self.batch.conversions.filter(input_filename='b.mp4').update(status='failed', error_message='bad input')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as zf:
+            self.assertEqual(zf.namelist(), ['a.mp3', 'errors.txt'])
+            self.assertEqual(zf.read('a.mp3'), b'mp3 bytes')
+            self.assertEqual(zf.read('errors.txt'), b'b.mp4: bad input\n')
+
+
+def _frames(path):
+    """(presentation time, md5) of every decoded video frame"""
+    result = subprocess.run(['ffmpeg', '-v', 'error', '-i', path, '-map', '0:v:0', '-f', 'framemd5', '-'],
+                            capture_output=True, text=True, check=True)
+    timebase, frames = 1 / 1000, []
+    for line in result.stdout.splitlines():
+        if line.startswith('#tb'):
+            num, den = line.split(':')[1].strip().split('/')
+            timebase = int(num) / int(den)
+        elif not line.startswith('#'):
+            fields = [field.strip() for field in line.split(',')]
+            frames.append((int(fields[2]) * timebase, fields[5]))
+    return frames
+
+
+def _audio_seconds(path):
+    """Length of the first audio track: AAC packets hold 1024 samples of the 44.1kHz test tone"""
+    result = subprocess.run(['ffmpeg', '-v', 'error', '-i', path, '-map', '0:a:0', '-c', 'copy', '-f', 'framemd5', '-'],
+                            capture_output=True, text=True, check=True)
+    return sum(1 for line in result.stdout.splitlines() if not line.startswith('#')) * 1024 / 44100
+
+
+@unittest.skipUnless(shutil.which('ffmpeg'), "ffmpeg is not installed")
+class SmartCutTests(SimpleTestCase):
+    """Cuts starting between keyframes of a 2s-GOP source with audio"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.workdir = tempfile.mkdtemp()
+        cls.source = os.path.join(cls.workdir, 'source.mkv')
+        subprocess.run([
+            'ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=160x120:rate=25',
+            '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100', '-t', '14',
+            '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-g', '50', '-keyint_min', '50', '-sc_threshold', '0',
+            '-c:a', 'aac', cls.source,
+        ], check=True)
+        subprocess.run(['ffmpeg', '-v', 'error', '-i', cls.source, '-c', 'copy',
+                        os.path.join(cls.workdir, 'source.mp4')], check=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.workdir, ignore_errors=True)
+        super().tearDownClass()
+
+    def _cut(self, ext, window, output_options=None):
+        source = os.path.join(self.workdir, f'source.{ext}')
+        output = os.path.join(self.workdir, f'cut_{window[0]}_{window[1]}.{ext}')
+        with override_settings(SCRATCH_DIR=os.path.join(self.workdir, 'scratch'), SCRATCH_TMPFS_DIR=''):
+            result = smart_cut(source, output, window, 'h264', {'acodec': 'copy'}, output_options or {})
+
+        source_frames = _frames(source)
+        start, end = window
+        end = end if end is not None else source_frames[-1][0] + 0.04
+        expected = sum(1 for t, _ in source_frames if start <= t < end)
+        frames = _frames(output)
+        self.assertLessEqual(abs(len(frames) - expected), 1)
+        # Copied GOPs are bit-exact, so they show where the output sits on the source timeline
+        source_times = {digest: t for t, digest in source_frames}
+        offsets = {round(source_times[digest] - t, 2) for t, digest in frames if digest in source_times}
+        self.assertTrue(offsets)
+        self.assertLessEqual(max(abs(offset - start) for offset in offsets), 0.04)
+        self.assertAlmostEqual(_audio_seconds(output), min(end, _audio_seconds(source)) - start, delta=0.03)
+        return result
+
+    def test_mkv_cut_between_keyframes(self):
+        result = self._cut('mkv', (3.3, 10.5))
+        self.assertEqual([kind for kind, _, _ in result['parts']], ['encode', 'copy', 'encode'])
+
+    def test_mkv_cut_to_the_end(self):
+        result = self._cut('mkv', (2.1, None))
+        self.assertEqual([kind for kind, _, _ in result['parts']], ['encode', 'copy'])
+
+    def test_mp4_cut_between_keyframes(self):
+        self._cut('mp4', (3.3, 10.5), {'movflags': '+faststart'})
+
+
+def _video_size(path):
+    """(width, height) of the first video stream, read from ffmpeg's input banner"""
+    banner = subprocess.run(['ffmpeg', '-hide_banner', '-i', path], capture_output=True, text=True).stderr
+    line = next(line for line in banner.splitlines() if 'Video:' in line)
+    width, height = re.search(r', (\d+)x(\d+)', line).groups()
+    return int(width), int(height)
+
+
+@unittest.skipUnless(shutil.which('ffmpeg'), "ffmpeg is not installed")
+class RenditionsTests(TestCase):
+    """Several renditions from one decode of a 320x240 test pattern with audio"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root,
+                                     ARTIFACT_STORE_DIR=os.path.join(self.media_root, 'artifacts'))
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root, 'temp_uploads'))
+        subprocess.run([
+            'ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=320x240:rate=25:duration=2',
+            '-f', 'lavfi', '-i', 'sine=frequency=440:duration=2', '-c:v', 'libx264', '-c:a', 'aac',
+            os.path.join(self.media_root, 'temp_uploads', 'source.mp4'),
+        ], check=True)
+
+    def test_one_pass_writes_every_rendition(self):
+        job = ConversionRequest.objects.create(
+            input_file='temp_uploads/source.mp4', input_filename='source.mp4', input_format='mp4',
+            input_size=0, output_format='mp4', output_quality='240p',
+            custom_settings={'renditions': [
+                {'output_format': 'mp4', 'output_quality': '144p'},
+                {'output_format': 'mp3', 'audio_bitrate': '96k'},
+            ]},
+        )
+        with mock.patch('conversions.services.run_ffmpeg', wraps=run_ffmpeg) as run:
+            ConversionService().convert_media(job)
+
+        self.assertEqual(run.call_count, 1)
+        graph = run.call_args[0][0].get_args()
+        graph = graph[graph.index('-filter_complex') + 1]
+        self.assertIn('split=2', graph)  # Both mp4s re-encode video
+        self.assertIn('asplit=3', graph)  # Every rendition encodes audio
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        outputs = list(ConversionOutput.objects.filter(conversion_request=job))
+        self.assertEqual([(o.position, o.output_format, o.output_quality) for o in outputs],
+                         [(0, 'mp4', '240p'), (1, 'mp4', '144p'), (2, 'mp3', 'original')])
+        self.assertEqual(outputs[2].audio_bitrate, '96k')
+        paths = [os.path.join(self.media_root, o.output_file.name) for o in outputs]
+        self.assertEqual([o.output_size for o in outputs], [os.path.getsize(path) for path in paths])
+        self.assertEqual(_video_size(paths[0])[1], 240)
+        self.assertEqual(_video_size(paths[1])[1], 144)
+        self.assertAlmostEqual(_audio_seconds(paths[0]), 2, delta=0.1)
+        banner = subprocess.run(['ffmpeg', '-hide_banner', '-i', paths[2]], capture_output=True, text=True).stderr
+        self.assertIn('Audio: mp3', banner)
+        self.assertNotIn('Video:', banner)
+
+
+class ChapterTests(SimpleTestCase):
+    def test_normalize_ffprobe_and_yt_dlp_chapters(self):
+        chapters = normalize_chapters([
+            {'start_time': '120.0', 'end_time': '200.5', 'tags': {'title': 'Outro'}},  # ffprobe: strings, tags
+            {'start_time': 0, 'end_time': 60, 'title': '  Intro '},  # yt-dlp
+            {'start_time': 60, 'end_time': 60.2, 'title': 'Marker'},  # Too short to be content
+            {'start_time': 60.2, 'end_time': 120.0},
+        ], duration=180)
+        self.assertEqual(chapters, [
+            {'title': 'Intro', 'start': 0.0, 'end': 60.0},
+            {'title': 'Chapter 3', 'start': 60.2, 'end': 120.0},
+            {'title': 'Outro', 'start': 120.0, 'end': 180},  # Clamped to the duration
+        ])
+
+    def test_open_ended_chapter_runs_to_the_end(self):
+        self.assertEqual(normalize_chapters([{'start_time': 30, 'end_time': None, 'title': 'Last'}], 90),
+                         [{'title': 'Last', 'start': 30.0, 'end': 90}])
+        self.assertEqual(normalize_chapters([{'start_time': 30, 'title': 'Last'}]), [])
+        self.assertEqual(normalize_chapters(None), [])
+
+    def test_chapter_filename(self):
+        self.assertEqual(chapter_filename(2, 'Q&A: part 1/2', 'mp3'), '03 - QA part 12.mp3')
+        self.assertEqual(chapter_filename(0, '???', 'mkv'), '01 - Chapter.mkv')
+        self.assertEqual(len(chapter_filename(9, 'x' * 300, 'mp4')), len('10 - .mp4') + 80)
+
+    @unittest.skipUnless(shutil.which('ffmpeg'), "ffmpeg is not installed")
+    def test_split_cuts_every_chapter(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        source = os.path.join(workdir, 'source.mkv')
+        subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=160x120:rate=25:duration=6',
+                        '-c:v', 'libx264', '-g', '25', source], check=True)
+        chapters = normalize_chapters([{'start_time': start, 'end_time': start + 2} for start in (0, 2, 4)])
+        paths = [os.path.join(workdir, chapter_filename(position, chapter['title'], 'mkv'))
+                 for position, chapter in enumerate(chapters)]
+        publisher = mock.Mock()
+
+        self.assertEqual(split_chapters(source, paths, chapters, {'vcodec': 'libx264'}, publisher, max_workers=2), paths)
+        self.assertEqual([len(_frames(path)) for path in paths], [50, 50, 50])
+        self.assertEqual([call[0][0]['progress'] for call in publisher.publish.call_args_list][-1], 99.9)
+        self.assertEqual(publisher.publish.call_count, 3)
@@ -0,0 +1,167 @@
+"""
+Resumable chunked uploads: chunks go straight to scratch space and are hashed as they arrive
+"""
+import os
+import uuid
+import hashlib
+import threading
+import logging
+from typing import Dict, Any, Optional, Tuple, BinaryIO
+from django.conf import settings
+from django.core.cache import cache
+from .models import ChunkedUpload
+from core.artifacts import ArtifactStore, settings_key
+from core.models import Artifact
+from core.scratch import ScratchSpace, ScratchDir
+
+logger = logging.getLogger(__name__)
+
+# Stored inputs live in the artifact store next to outputs, keyed by their own content hash
+UPLOAD_VARIANT = settings_key(kind='upload')
+
+_DATA_FILE = 'data'
+
+# Running hashes for uploads this process is receiving, so each chunk is hashed exactly once.
+# Chunks landing on another worker rebuild the state from the bytes on disk.
+_hashers: Dict[str, Tuple[int, Any]] = {}
+_hashers_lock = threading.Lock()
+
+
+class UploadConflict(Exception):
+    """The chunk doesn't start at the offset the server expects, or another chunk is being written"""
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+def find_input(sha256: str) -> Optional[Artifact]:
+    """A stored input with this content hash, if we still have its bytes"""
+    return ArtifactStore().lookup(f"sha256:{sha256.lower()}", UPLOAD_VARIANT)
+
+
+def start_upload(filename: str, total_size: int, user=None, expected_sha256: str = '') -> ChunkedUpload:
+    """Open an upload session - or complete it on the spot when the declared hash is already stored"""
+    expected_sha256 = (expected_sha256 or '').lower()
+    if expected_sha256:
+        artifact = find_input(expected_sha256)
+        if artifact and artifact.file_size == total_size:
+            ArtifactStore().touch(artifact)
+            logger.info(f"Upload of {filename} skipped: content {expected_sha256[:12]} already stored")
+            return ChunkedUpload.objects.create(
+                user=user, filename=filename, total_size=total_size, received=total_size,
+                expected_sha256=expected_sha256, sha256=expected_sha256, artifact=artifact,
+                status='complete', deduplicated=True,
+            )
+
+    upload = ChunkedUpload(user=user, filename=filename, total_size=total_size, expected_sha256=expected_sha256)
+    scratch = ScratchSpace().allocate(f"upload-{upload.id}", expected_size=total_size,
+                                      quota=total_size + 1024 * 1024, detached=True)
+    open(os.path.join(scratch.path, _DATA_FILE), 'wb').close()
+    upload.scratch_path = scratch.path
+    upload.save()
+    return upload
+
+
+def _hasher_at(upload: ChunkedUpload, data_path: str):
+    """The running hash of the first upload.received bytes"""
+    with _hashers_lock:
+        cached = _hashers.pop(str(upload.id), None)
+    if cached and cached[0] == upload.received:
+        return cached[1]
+
+    # First chunk on this worker, or the state moved on elsewhere - catch up from disk
+    digest = hashlib.sha256()
+    remaining = upload.received
+    with open(data_path, 'rb') as f:
+        while remaining > 0:
+            block = f.read(min(remaining, 1024 * 1024))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest
+
+
+def write_chunk(upload: ChunkedUpload, offset: int, source: BinaryIO, length: int,
+                chunk_size: int = 1024 * 1024) -> ChunkedUpload:
+    """Append length bytes read from source at offset; the upload finalizes itself once all bytes are in"""
+    data_path = os.path.join(upload.scratch_path, _DATA_FILE)
+    if upload.status != 'uploading':
+        raise Exception(f"Upload is {upload.status}")
+    if not os.path.exists(data_path):
+        upload.status = 'expired'
+        upload.save(update_fields=['status', 'updated_at'])
+        raise Exception("Upload expired - start a new one")
+    if offset != upload.received:
+        raise UploadConflict(f"Expected offset {upload.received}, got {offset}", upload.received)
+    if offset + length > upload.total_size:
+        raise Exception(f"Chunk ends at {offset + length}, past the declared size of {upload.total_size}")
+
+    lock_key = f"upload_lock_{upload.id}"
+    if not cache.add(lock_key, 1, 300):
+        raise UploadConflict("Another chunk is being written", upload.received)
+    try:
+        scratch = ScratchDir(upload.scratch_path, f"upload-{upload.id}", upload.total_size + 1024 * 1024)
+        digest = _hasher_at(upload, data_path)
+        written = 0
+        try:
+            with open(data_path, 'r+b') as f:
+                f.seek(offset)
+                f.truncate()  # Drop the tail of an earlier chunk that broke off mid-way
+                while written < length:
+                    block = source.read(min(chunk_size, length - written))
+                    if not block:
+                        break
+                    f.write(block)
+                    digest.update(block)
+                    written += len(block)
+                    scratch.check_quota()
+        finally:
+            # Whatever made it to disk counts - a dropped connection resumes from here
+            upload.received = offset + written
+            upload.save(update_fields=['received', 'updated_at'])
+            with _hashers_lock:
+                _hashers[str(upload.id)] = (upload.received, digest)
+            scratch.heartbeat()
+    finally:
+        cache.delete(lock_key)
+
+    if upload.received == upload.total_size:
+        finalize(upload, digest.hexdigest())
+    return upload
+
+
+def finalize(upload: ChunkedUpload, sha256: str) -> ChunkedUpload:
+    """Verify the hash and move the bytes into the artifact store as a reusable input"""
+    with _hashers_lock:
+        _hashers.pop(str(upload.id), None)
+    scratch = ScratchDir(upload.scratch_path, f"upload-{upload.id}", upload.total_size)
+    upload.sha256 = sha256
+    try:
+        if upload.expected_sha256 and upload.expected_sha256 != sha256:
+            upload.status = 'failed'
+            upload.error_message = f"Content hash mismatch: expected {upload.expected_sha256}, got {sha256}"
+            return upload
+
+        ext = upload.filename.split('.')[-1].lower()
+        stored = os.path.join(upload.scratch_path, f"input.{ext}")
+        os.replace(os.path.join(upload.scratch_path, _DATA_FILE), stored)
+        upload.artifact = ArtifactStore().ingest(stored, f"sha256:{sha256}", UPLOAD_VARIANT, content_hash=sha256)
+        upload.status = 'complete'
+        logger.info(f"Upload {upload.id} complete: {upload.total_size} bytes, sha256 {sha256[:12]}")
+        return upload
+    finally:
+        upload.save()
+        scratch.cleanup()
+
+
+def materialize_input(upload: ChunkedUpload) -> str:
+    """Give a new conversion its own temp_uploads/ path to a finished upload's stored bytes"""
+    if upload.status != 'complete' or not upload.artifact:
+        raise Exception("Upload is not complete")
+    name = f"temp_uploads/{uuid.uuid4()}_{os.path.basename(upload.filename)}"
+    store = ArtifactStore()
+    store.materialize(upload.artifact, os.path.join(settings.MEDIA_ROOT, name))
+    store.touch(upload.artifact)
+    return name
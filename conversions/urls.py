@@ -4,6 +4,8 @@ from . import views
 
 router = DefaultRouter()
 router.register(r'requests', views.ConversionRequestViewSet, basename='conversionrequest')
+router.register(r'batches', views.ConversionBatchViewSet, basename='conversionbatch')
+router.register(r'uploads', views.ChunkedUploadViewSet, basename='chunkedupload')
 router.register(r'history', views.ConversionHistoryViewSet, basename='conversionhistory')
 
 urlpatterns = [
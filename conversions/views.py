@@ -4,18 +4,98 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from rest_framework.decorators import action
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse, Http404
+from django.urls import reverse
+from django.http import HttpResponse, Http404, StreamingHttpResponse, FileResponse
 from django.utils import timezone
-from .models import ConversionRequest, ConversionHistory
-from .serializers import ConversionRequestSerializer, ConversionCreateSerializer, ConversionHistorySerializer
+from django.conf import settings
+from django.db import connection
+from .models import ConversionRequest, ConversionBatch, ChunkedUpload, ConversionHistory
+from .serializers import (
+    ConversionRequestSerializer, ConversionCreateSerializer, ConversionStreamSerializer, ChunkedUploadSerializer,
+    ConversionBatchSerializer, ConversionBatchCreateSerializer, ConversionHistorySerializer,
+    MAX_INPUT_SIZE, MAX_INPUT_SIZE_MESSAGE
+)
 from .tasks import process_conversion_task  # Import the actual task
 from .services import ConversionService  # Import the conversion service
+from .streaming import STREAMABLE_INPUTS, UploadSpool
+from .progressive import FINISHED, PROGRESSIVE_FORMATS, CONTENT_TYPES, wants_progressive, attach_output, follow_output
+from .uploads import UploadConflict, find_input, start_upload, write_chunk, materialize_input
+from .result_cache import counters as result_cache_counters
+from .batches import extract_member, batch_progress, stream_zip
+from .chapters import chapter_filename
+from core.scratch import ScratchDir, ScratchSpaceError
+from core.artifacts import ArtifactStore
+from core.zipstream import stream_files
 from core.views import log_activity
+import os
+import zipfile
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
 
+def queue_conversion(conversion_request: ConversionRequest):
+    """Hand a job to Celery, or to a background thread when no broker is reachable"""
+    try:
+        from conversions.tasks import process_conversion_task
+        process_conversion_task.delay(str(conversion_request.id))
+        logger.info(f"Started conversion task for {conversion_request.id}")
+    except Exception as e:
+        logger.warning(f"Celery unavailable, using synchronous processing: {str(e)}")
+        # Fallback to synchronous processing
+        try:
+            from core.sync_tasks import SyncTaskProcessor
+            import threading
+            # Run in background thread to avoid blocking the API response
+            thread = threading.Thread(
+                target=SyncTaskProcessor.process_conversion,
+                args=(str(conversion_request.id),)
+            )
+            thread.daemon = True
+            thread.start()
+            logger.info(f"Started synchronous conversion for {conversion_request.id}")
+        except Exception as sync_error:
+            logger.error(f"Both async and sync processing failed: {str(sync_error)}")
+            conversion_request.status = 'failed'
+            conversion_request.error_message = f"Processing unavailable: {str(sync_error)}"
+            conversion_request.save()
+
+
+def queue_batch(batch: ConversionBatch):
+    """Hand a batch to Celery as one task, or to a background thread when no broker is reachable"""
+    try:
+        from conversions.tasks import process_batch_task
+        process_batch_task.delay(str(batch.id))
+        logger.info(f"Started batch task for {batch.id}")
+    except Exception as e:
+        logger.warning(f"Celery unavailable, using synchronous processing: {str(e)}")
+        try:
+            from core.sync_tasks import SyncTaskProcessor
+            import threading
+            thread = threading.Thread(target=SyncTaskProcessor.process_batch, args=(str(batch.id),))
+            thread.daemon = True
+            thread.start()
+            logger.info(f"Started synchronous batch for {batch.id}")
+        except Exception as sync_error:
+            logger.error(f"Both async and sync processing failed: {str(sync_error)}")
+            batch.status = 'failed'
+            batch.error_message = f"Processing unavailable: {str(sync_error)}"
+            batch.save()
+
+
+def encode_stream(conversion_request: ConversionRequest, upload: UploadSpool):
+    """Encoder side of a streamed upload, on its own thread so the request ends once the body is in"""
+    try:
+        if ConversionService().convert_stream(conversion_request, upload) is None:
+            # The encoder failed but the spooled input is complete - retry it through the normal queue
+            queue_conversion(conversion_request)
+    except Exception as e:
+        logger.error(f"Streaming conversion {conversion_request.id} failed: {str(e)}")
+    finally:
+        connection.close()  # This thread opened its own DB connection
+
+
 class ConversionRequestViewSet(ModelViewSet):
     """ViewSet for conversion requests"""
     serializer_class = ConversionRequestSerializer
@@ -47,19 +127,29 @@ class ConversionRequestViewSet(ModelViewSet):
 
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            input_file = serializer.validated_data['input_file']
-            
+            upload = serializer.validated_data.pop('upload', None)
+            extra = {}
+            if upload:
+                # Chunked (or deduplicated) upload - link the stored bytes instead of copying them
+                input_filename = upload.filename
+                input_size = upload.total_size
+                extra['input_file'] = materialize_input(upload)
+            else:
+                input_file = serializer.validated_data['input_file']
+                input_filename = input_file.name
+                input_size = input_file.size
+
             # Extract file information
-            input_filename = input_file.name
             input_format = input_filename.split('.')[-1].lower()
-            input_size = input_file.size
 
             # Create conversion request
             conversion_request = serializer.save(
                 user=request.user if request.user.is_authenticated else None,
                 input_filename=input_filename,
                 input_format=input_format,
-                input_size=input_size
+                input_size=input_size,
+                input_sha256=upload.sha256 if upload else '',
+                **extra
             )
 
             # Increment user request count
@@ -74,30 +164,18 @@ class ConversionRequestViewSet(ModelViewSet):
                 request
             )
 
-            # Start conversion task (with fallback to synchronous)
-            try:
-                from conversions.tasks import process_conversion_task
-                process_conversion_task.delay(str(conversion_request.id))
-                logger.info(f"Started conversion task for {conversion_request.id}")
-            except Exception as e:
-                logger.warning(f"Celery unavailable, using synchronous processing: {str(e)}")
-                # Fallback to synchronous processing
+            # Someone already converted these exact bytes this way - done without touching the queue.
+            # Only when a chunked upload already hashed them; otherwise the task hashes the input, not this request.
+            cached = None
+            if conversion_request.input_sha256:
                 try:
-                    from core.sync_tasks import SyncTaskProcessor
-                    import threading
-                    # Run in background thread to avoid blocking the API response
-                    thread = threading.Thread(
-                        target=SyncTaskProcessor.process_conversion,
-                        args=(str(conversion_request.id),)
-                    )
-                    thread.daemon = True
-                    thread.start()
-                    logger.info(f"Started synchronous conversion for {conversion_request.id}")
-                except Exception as sync_error:
-                    logger.error(f"Both async and sync processing failed: {str(sync_error)}")
-                    conversion_request.status = 'failed'
-                    conversion_request.error_message = f"Processing unavailable: {str(sync_error)}"
-                    conversion_request.save()
+                    cached = ConversionService().serve_cached(conversion_request)
+                except Exception as e:
+                    logger.warning(f"Result cache lookup failed for {conversion_request.id}: {str(e)}")
+
+            # Start conversion task (with fallback to synchronous)
+            if not cached:
+                queue_conversion(conversion_request)
 
             return Response(
                 ConversionRequestSerializer(conversion_request).data,
@@ -106,6 +184,78 @@ class ConversionRequestViewSet(ModelViewSet):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'])
+    def stream(self, request):
+        """Create a job whose input will be streamed to the upload action and converted as it arrives"""
+        if request.user.is_authenticated and not request.user.can_make_request():
+            return Response(
+                {'error': 'Daily request limit exceeded'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+
+        serializer = ConversionStreamSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        conversion_request = serializer.save(
+            user=request.user if request.user.is_authenticated else None,
+            input_format=serializer.validated_data['input_filename'].split('.')[-1].lower(),
+            input_size=serializer.validated_data.get('input_size') or 0,
+        )
+        if request.user.is_authenticated:
+            request.user.increment_request_count()
+        log_activity(
+            request.user if request.user.is_authenticated else None,
+            'convert',
+            f'Streaming conversion requested: {conversion_request.input_filename} to {conversion_request.output_format}',
+            request
+        )
+
+        data = ConversionRequestSerializer(conversion_request).data
+        data['upload_url'] = request.build_absolute_uri(reverse('conversionrequest-upload', args=[conversion_request.id]))
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['put'], parser_classes=[])
+    def upload(self, request, pk=None):
+        """Raw request body of a streaming job - encoded from its spool on a side thread while it is still arriving"""
+        conversion_request = self.get_object()
+        content_length = request.META.get('CONTENT_LENGTH')
+        total = int(content_length) if content_length and content_length.isdigit() else 0
+        if not total:
+            return Response({'error': 'Content-Length is required'}, status=status.HTTP_411_LENGTH_REQUIRED)
+        if total > MAX_INPUT_SIZE:
+            return Response({'error': MAX_INPUT_SIZE_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Claimed in one UPDATE, so of two concurrent PUTs only one gets to encode
+        claimed = ConversionRequest.objects.filter(pk=conversion_request.pk, status='pending', input_file='').update(
+            status='processing', progress=0
+        )
+        if not claimed:
+            return Response(
+                {'error': 'Upload already received for this conversion'},
+                status=status.HTTP_409_CONFLICT
+            )
+        conversion_request.refresh_from_db()
+
+        try:
+            upload = ConversionService().open_stream(conversion_request, total)
+        except Exception as e:
+            ConversionRequest.objects.filter(pk=conversion_request.pk).update(status='failed', error_message=str(e))
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        encoder = threading.Thread(target=encode_stream, args=(conversion_request, upload), daemon=True)
+        encoder.start()
+
+        try:
+            # request.stream is the unbuffered WSGI input - request.data is never touched here
+            upload.receive(request.stream)
+        except Exception as e:
+            encoder.join()  # It fails on the truncated input and records why
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The body is on disk; the rest of the encode doesn't need this request
+        conversion_request.refresh_from_db()
+        return Response(ConversionRequestSerializer(conversion_request).data, status=status.HTTP_202_ACCEPTED)
+
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         """Cancel a conversion request"""
@@ -122,22 +272,112 @@ class ConversionRequestViewSet(ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        """Get real-time conversion progress (percent, encode speed, ETA)"""
+        from django.core.cache import cache
+        from .progress import progress_key
+
+        conversion_request = self.get_object()
+        progress_data = cache.get(progress_key(conversion_request.id)) or {
+            'progress': conversion_request.progress,
+            'speed': conversion_request.encode_speed,
+            'eta_seconds': conversion_request.eta_seconds,
+            'status': conversion_request.status,
+        }
+        if conversion_request.status == 'pending':
+            progress_data['queue_wait_seconds'] = ConversionService().estimate_queue_wait(conversion_request)
+        return Response(progress_data)
+
     @action(detail=True, methods=['get'])
     def download_file(self, request, pk=None):
-        """Download the converted file"""
+        """Download the converted file; ?output=<position> picks one rendition of a multi-output job"""
         conversion_request = self.get_object()
         
         if conversion_request.status != 'completed' or not conversion_request.output_file:
             raise Http404("File not available")
 
+        output_file = conversion_request.output_file
+        filename = conversion_request.output_filename
+        position = request.query_params.get('output')
+        if position not in (None, '', '0'):
+            output = conversion_request.outputs.filter(position=position).first() if position.isdigit() else None
+            if not output or not output.output_file:
+                raise Http404("Output not found")
+            output_file = output.output_file
+            filename = os.path.basename(output.output_file.name)
+
         try:
-            with open(conversion_request.output_file.path, 'rb') as f:
+            with open(output_file.path, 'rb') as f:
                 response = HttpResponse(f.read(), content_type='application/octet-stream')
-                response['Content-Disposition'] = f'attachment; filename="{conversion_request.output_filename}"'
+                response['Content-Disposition'] = f'attachment; filename="{filename}"'
                 return response
         except FileNotFoundError:
             raise Http404("File not found")
 
+    @action(detail=True, methods=['get'])
+    def download_zip(self, request, pk=None):
+        """Every output of a multi-output job (renditions or chapters) as one streamed ZIP"""
+        conversion_request = self.get_object()
+        outputs = [output for output in conversion_request.outputs.all()
+                   if output.output_file and os.path.exists(output.output_file.path)]
+        if conversion_request.status != 'completed' or not outputs:
+            raise Http404("Outputs not available")
+
+        files = []
+        for output in outputs:
+            if output.label:
+                name = chapter_filename(output.position, output.label, output.output_format)
+            else:
+                name = f"{output.position + 1:02d}_{output.output_quality}.{output.output_format}"
+            files.append((name, output.output_file.path))
+        base_name = os.path.splitext(conversion_request.input_filename)[0] or 'outputs'
+        response = StreamingHttpResponse(stream_files(files), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{base_name}.zip"'
+        return response
+
+    def _final_output(self, conversion_request, content_type):
+        try:
+            return FileResponse(open(conversion_request.output_file.path, 'rb'), content_type=content_type)
+        except FileNotFoundError:
+            raise Http404("File not found")
+
+    @action(detail=True, methods=['get'])
+    def live(self, request, pk=None):
+        """Stream a progressive job's output while it is being encoded; finished jobs get the final file"""
+        conversion_request = self.get_object()
+        content_type = CONTENT_TYPES.get(conversion_request.output_format, 'application/octet-stream')
+
+        if conversion_request.status == 'completed' and conversion_request.output_file:
+            return self._final_output(conversion_request, content_type)
+        if conversion_request.status not in ('pending', 'processing') or not wants_progressive(conversion_request):
+            return Response(
+                {'error': 'Live output is only available for progressive jobs that are still running'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Attach before answering: a job that finishes first is served its final file, not an empty stream
+        live_file = attach_output(conversion_request)
+        if live_file is None:
+            conversion_request.refresh_from_db()
+            if conversion_request.status == 'completed' and conversion_request.output_file:
+                return self._final_output(conversion_request, content_type)
+            if conversion_request.status in ('pending', 'processing'):
+                response = Response({'error': 'The conversion has not started writing output yet'},
+                                    status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                response['Retry-After'] = '5'
+                return response
+            return Response(
+                {'error': conversion_request.error_message or f'Conversion {conversion_request.status}'},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        # Length unknown until ffmpeg finishes, so this is a chunked response that ends with the encode
+        response = StreamingHttpResponse(follow_output(conversion_request, live_file), content_type=content_type)
+        response['Cache-Control'] = 'no-store'
+        response['X-Accel-Buffering'] = 'no'  # Don't let nginx hold the stream back
+        return response
+
     @action(detail=True, methods=['delete'])
     def delete_files(self, request, pk=None):
         """Delete the conversion files"""
@@ -163,6 +403,189 @@ class ConversionRequestViewSet(ModelViewSet):
         return Response({'message': 'Files deleted successfully'})
 
 
+class ChunkedUploadViewSet(ModelViewSet):
+    """Resumable uploads: POST to open (with an optional SHA-256 pre-check), PUT chunks at ?offset=, GET to resume"""
+    serializer_class = ChunkedUploadSerializer
+    permission_classes = [permissions.AllowAny]
+    http_method_names = ['get', 'post', 'put', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        if self.request.user.is_authenticated:
+            return ChunkedUpload.objects.filter(user=self.request.user)
+        # Anonymous uploads are only reachable by their unguessable id
+        if self.action == 'list':
+            return ChunkedUpload.objects.none()
+        return ChunkedUpload.objects.filter(user__isnull=True)
+
+    def create(self, request, *args, **kwargs):
+        """Open an upload; a known expected_sha256 completes it immediately without any bytes sent"""
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload = start_upload(
+                serializer.validated_data['filename'],
+                serializer.validated_data['total_size'],
+                user=request.user if request.user.is_authenticated else None,
+                expected_sha256=serializer.validated_data.get('expected_sha256', ''),
+            )
+        except ScratchSpaceError as e:
+            return Response({'error': str(e)}, status=status.HTTP_507_INSUFFICIENT_STORAGE)
+        return Response(ChunkedUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+    def update(self, request, *args, **kwargs):
+        """Write the raw request body at ?offset= (must equal the upload's received count)"""
+        upload = self.get_object()
+        offset = request.query_params.get('offset', '')
+        content_length = request.META.get('CONTENT_LENGTH')
+        if not offset.isdigit():
+            return Response({'error': 'offset query parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not content_length or not content_length.isdigit():
+            return Response({'error': 'Content-Length is required'}, status=status.HTTP_411_LENGTH_REQUIRED)
+
+        try:
+            write_chunk(upload, int(offset), request.stream, int(content_length))
+        except UploadConflict as e:
+            return Response({'error': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT)
+        except ScratchSpaceError as e:
+            return Response({'error': str(e)}, status=status.HTTP_507_INSUFFICIENT_STORAGE)
+        except Exception as e:
+            upload.refresh_from_db()
+            return Response({'error': str(e), 'offset': upload.received}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ChunkedUploadSerializer(upload).data)
+
+    def destroy(self, request, *args, **kwargs):
+        """Abandon an upload and free its scratch space"""
+        upload = self.get_object()
+        if upload.scratch_path:
+            ScratchDir(upload.scratch_path, f"upload-{upload.id}", upload.total_size).cleanup()
+        upload.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['get'])
+    def check(self, request):
+        """Do we already have this content? ?sha256=<hex>"""
+        sha256 = request.query_params.get('sha256', '').lower()
+        if len(sha256) != 64:
+            return Response({'error': 'sha256 query parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        artifact = find_input(sha256)
+        return Response({'sha256': sha256, 'exists': artifact is not None,
+                         'size': artifact.file_size if artifact else None})
+
+
+class ConversionBatchViewSet(ModelViewSet):
+    """Batches: POST many files (or one ZIP) with shared settings, GET for aggregate progress, download as a ZIP"""
+    serializer_class = ConversionBatchSerializer
+    permission_classes = [permissions.AllowAny]
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        if self.request.user.is_authenticated:
+            return ConversionBatch.objects.filter(user=self.request.user)
+        if self.action == 'list':
+            return ConversionBatch.objects.none()
+        return ConversionBatch.objects.filter(user__isnull=True)
+
+    def create(self, request, *args, **kwargs):
+        """Create one conversion per input and queue them as a single batch"""
+        if request.user.is_authenticated and not request.user.can_make_request():
+            return Response(
+                {'error': 'Daily request limit exceeded'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+
+        serializer = ConversionBatchCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        user = request.user if request.user.is_authenticated else None
+
+        batch = ConversionBatch.objects.create(
+            user=user,
+            output_format=data['output_format'],
+            output_quality=data['output_quality'],
+            custom_settings=data['custom_settings'],
+            concurrency=data['concurrency'],
+        )
+        shared = {
+            'user': user, 'batch': batch, 'output_format': batch.output_format,
+            'output_quality': batch.output_quality, 'custom_settings': batch.custom_settings,
+        }
+        if data.get('archive'):
+            # Unpacked one entry at a time - the archive itself is never extracted in full up front
+            with zipfile.ZipFile(data['archive']) as archive:
+                for member in data['members']:
+                    filename = os.path.basename(member.filename)
+                    ConversionRequest.objects.create(
+                        input_file=extract_member(archive, member), input_filename=filename,
+                        input_format=filename.split('.')[-1].lower(), input_size=member.file_size, **shared
+                    )
+        else:
+            for input_file in data['files']:
+                ConversionRequest.objects.create(
+                    input_file=input_file, input_filename=input_file.name,
+                    input_format=input_file.name.split('.')[-1].lower(), input_size=input_file.size, **shared
+                )
+
+        # One batch counts as one request against the daily limit - that's the point of batching
+        if request.user.is_authenticated:
+            request.user.increment_request_count()
+        log_activity(
+            user,
+            'convert',
+            f'Batch conversion requested: {batch.conversions.count()} files to {batch.output_format}',
+            request
+        )
+
+        queue_batch(batch)
+        response = ConversionBatchSerializer(batch).data
+        if data.get('skipped'):
+            response['skipped'] = data['skipped']
+        return Response(response, status=status.HTTP_201_CREATED)
+
+    def destroy(self, request, *args, **kwargs):
+        """Delete the batch and every file it produced"""
+        batch = self.get_object()
+        batch.delete_files()
+        batch.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        """Aggregate progress across the batch's files"""
+        return Response(batch_progress(self.get_object()))
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Cancel files still waiting for a slot; ones already converting run to completion"""
+        batch = self.get_object()
+        if batch.status not in ['pending', 'processing']:
+            return Response(
+                {'error': 'Cannot cancel batch in current status'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        count = batch.conversions.filter(status='pending').update(status='cancelled')
+        batch.status = 'cancelled'
+        batch.save(update_fields=['status'])
+        return Response({'message': f'Batch cancelled ({count} files not started)'})
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """ZIP of the outputs, streamed once every file of the batch has finished"""
+        batch = self.get_object()
+        if batch.conversions.exclude(status__in=FINISHED).exists():
+            # Don't hold a worker waiting on the encodes - the client polls progress and comes back
+            response = Response({'error': 'The batch is still converting', **batch_progress(batch)},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '10'
+            return response
+        response = StreamingHttpResponse(stream_zip(batch), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="batch-{batch.id}.zip"'
+        response['Cache-Control'] = 'no-store'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
 class ConversionHistoryViewSet(ReadOnlyModelViewSet):
     """ViewSet for conversion history (admin only)"""
     serializer_class = ConversionHistorySerializer
@@ -191,7 +614,13 @@ def conversion_stats(request):
     
     return Response({
         'status_counts': stats,
-        'popular_conversions': list(popular_conversions)
+        'popular_conversions': list(popular_conversions),
+        'estimated_queue_wait_seconds': ConversionService().estimate_queue_wait(),
+        'result_cache': {
+            **result_cache_counters(),
+            'stored_bytes': ArtifactStore().total_size(),
+            'max_bytes': settings.ARTIFACT_STORE_MAX_BYTES,
+        },
     })
 
 
@@ -212,5 +641,8 @@ def supported_formats(request):
     else:
         # Return all supported formats
         return Response({
-            'supported_formats': conversion_service.SUPPORTED_FORMATS
+            'supported_formats': conversion_service.SUPPORTED_FORMATS,
+            'capabilities': conversion_service.get_capabilities_summary(),
+            'streaming_inputs': list(STREAMABLE_INPUTS),
+            'progressive_outputs': list(PROGRESSIVE_FORMATS),
         })
@@ -3,7 +3,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import User, SystemSettings, ActivityLog
+from .models import User, SystemSettings, ActivityLog, Artifact
 
 
 @admin.register(User)
@@ -88,3 +88,23 @@ class ActivityLogAdmin(admin.ModelAdmin):
     
     def has_change_permission(self, request, obj=None):
         return False  # Prevent editing of activity logs
+
+
+@admin.register(Artifact)
+class ArtifactAdmin(admin.ModelAdmin):
+    list_display = ('source_key', 'variant_preview', 'content_hash_short', 'file_size_mb', 'ref_count', 'last_used_at')
+    search_fields = ('source_key', 'variant_key', 'content_hash')
+    list_filter = ('ext', 'created_at', 'last_used_at')
+    readonly_fields = ('source_key', 'variant_key', 'content_hash', 'blob_path', 'file_size', 'ext', 'ref_count', 'created_at', 'last_used_at')
+    
+    def variant_preview(self, obj):
+        return obj.variant_key[:60] + "..." if len(obj.variant_key) > 60 else obj.variant_key
+    variant_preview.short_description = 'Variant'
+    
+    def content_hash_short(self, obj):
+        return obj.content_hash[:12]
+    content_hash_short.short_description = 'Hash'
+    
+    def file_size_mb(self, obj):
+        return f"{obj.get_file_size_mb()} MB"
+    file_size_mb.short_description = 'Size'
@@ -0,0 +1,238 @@
+"""
+Content-addressed artifact store for finished downloads and conversions
+"""
+import os
+import json
+import errno
+import shutil
+import hashlib
+import logging
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse, parse_qs, urlencode
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Artifact
+
+try:
+    import fcntl
+except ImportError:  # Windows - no reflink support, hardlink or copy only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FICLONE = 0x40049409  # Linux ioctl for copy-on-write clones (btrfs, xfs, overlayfs on top of them)
+
+# Query parameters that never change what a URL points at
+_TRACKING_PARAMS = {'feature', 'si', 'pp', 'utm_source', 'utm_medium', 'utm_campaign', 'ab_channel', 't', 'list', 'index'}
+
+
+def canonical_source(url: str) -> str:
+    """Reduce a media URL to a stable identity, so every link form of one video shares artifacts"""
+    parsed = urlparse(url.strip() if url.startswith(('http://', 'https://')) else f'https://{url.strip()}')
+    host = parsed.netloc.lower()
+    if host.startswith('www.') or host.startswith('m.'):
+        host = host.split('.', 1)[1]
+
+    # YouTube has many URL shapes for the same video
+    if host == 'youtu.be':
+        video_id = parsed.path.strip('/').split('/')[0]
+        if video_id:
+            return f"youtube:{video_id}"
+    if host.endswith('youtube.com'):
+        query = parse_qs(parsed.query)
+        if query.get('v'):
+            return f"youtube:{query['v'][0]}"
+        parts = parsed.path.strip('/').split('/')
+        if len(parts) >= 2 and parts[0] in ('shorts', 'embed', 'live', 'v'):
+            return f"youtube:{parts[1]}"
+
+    query = {k: v for k, v in parse_qs(parsed.query).items() if k not in _TRACKING_PARAMS}
+    normalized_query = urlencode(sorted(query.items()), doseq=True)
+    path = parsed.path.rstrip('/')
+    return f"url:{host}{path}" + (f"?{normalized_query}" if normalized_query else '')
+
+
+def settings_key(**settings_values) -> str:
+    """Stable key for a dict of job settings (key order and empty values don't matter)"""
+    cleaned = {k: v for k, v in settings_values.items() if v not in (None, '', {}, [])}
+    return json.dumps(cleaned, sort_keys=True, separators=(',', ':'))
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file without loading it into memory"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def materialize_file(src: str, dst: str) -> str:
+    """Make dst a view of src: hardlink, then copy-on-write clone, then a plain copy as a last resort"""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.exists(dst):
+        os.remove(dst)
+
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+            raise
+
+    if fcntl:
+        try:
+            with open(src, 'rb') as s, open(dst, 'wb') as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return 'reflink'
+        except OSError:
+            if os.path.exists(dst):
+                os.remove(dst)
+
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+
+class ArtifactStore:
+    """Deduplicates finished files by (canonical source, variant) and by content hash"""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = str(root or settings.ARTIFACT_STORE_DIR)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _blob_path(self, content_hash: str, ext: str) -> str:
+        return os.path.join(self.root, content_hash[:2], f"{content_hash}.{ext}")
+
+    def lookup(self, source_key: str, variant_key: str) -> Optional[Artifact]:
+        """Find a finished artifact whose blob is still on disk"""
+        artifact = Artifact.objects.filter(source_key=source_key, variant_key=variant_key).first()
+        if not artifact:
+            return None
+        if not os.path.exists(os.path.join(settings.MEDIA_ROOT, artifact.blob_path)):
+            logger.warning(f"Artifact blob missing, dropping record: {artifact}")
+            artifact.delete()
+            return None
+        return artifact
+
+    def ingest(self, path: str, source_key: str, variant_key: str,
+               content_hash: Optional[str] = None) -> Artifact:
+        """Register a freshly produced file; identical content is stored once
+
+        Pass content_hash when the caller already hashed the bytes on the way in.
+        """
+        content_hash = content_hash or file_sha256(path)
+        ext = os.path.splitext(path)[1].lstrip('.') or 'bin'
+        blob_path = self._blob_path(content_hash, ext)
+
+        if os.path.exists(blob_path):
+            # Same bytes already stored under another key - point the job file at the shared blob
+            materialize_file(blob_path, path)
+        else:
+            materialize_file(path, blob_path)
+
+        artifact, created = Artifact.objects.get_or_create(
+            source_key=source_key,
+            variant_key=variant_key,
+            defaults={
+                'content_hash': content_hash,
+                'blob_path': os.path.relpath(blob_path, settings.MEDIA_ROOT),
+                'file_size': os.path.getsize(blob_path),
+                'ext': ext,
+            }
+        )
+        if not created and artifact.content_hash != content_hash:
+            # Upstream changed (re-encode, new upload) - the newest bytes win
+            artifact.content_hash = content_hash
+            artifact.blob_path = os.path.relpath(blob_path, settings.MEDIA_ROOT)
+            artifact.file_size = os.path.getsize(blob_path)
+            artifact.ext = ext
+            artifact.save()
+        logger.info(f"Ingested artifact {artifact} ({'new' if created else 'updated'})")
+        self.enforce_limit(keep=artifact)
+        return artifact
+
+    def touch(self, artifact: Artifact):
+        """Record a reuse that doesn't hold a reference, so garbage collection sees the blob as live"""
+        Artifact.objects.filter(id=artifact.id).update(last_used_at=timezone.now())
+
+    def materialize(self, artifact: Artifact, dest_path: str) -> str:
+        """Give a job its own path to the shared blob"""
+        blob = os.path.join(settings.MEDIA_ROOT, artifact.blob_path)
+        method = materialize_file(blob, dest_path)
+        logger.info(f"Materialized artifact {artifact.content_hash[:12]} via {method}: {dest_path}")
+        return dest_path
+
+    def acquire(self, job, artifact: Artifact):
+        """Link a DownloadRequest/ConversionRequest row to an artifact and count the reference"""
+        with transaction.atomic():
+            if job.artifact_id == artifact.id:
+                return
+            if job.artifact_id:
+                Artifact.objects.filter(id=job.artifact_id).update(ref_count=F('ref_count') - 1)
+            Artifact.objects.filter(id=artifact.id).update(
+                ref_count=F('ref_count') + 1, last_used_at=timezone.now()
+            )
+            job.artifact = artifact
+            job.save(update_fields=['artifact'])
+
+    def release(self, job):
+        """Drop a job's reference; unreferenced artifacts are left for collect_garbage"""
+        if not job.artifact_id:
+            return
+        with transaction.atomic():
+            Artifact.objects.filter(id=job.artifact_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+            job.artifact = None
+            if job.pk:
+                type(job).objects.filter(pk=job.pk).update(artifact=None)
+
+    def delete(self, artifact: Artifact) -> int:
+        """Remove an artifact record and its blob once nothing else shares the bytes; returns bytes freed"""
+        blob = os.path.join(settings.MEDIA_ROOT, artifact.blob_path)
+        shared = Artifact.objects.filter(content_hash=artifact.content_hash).exclude(id=artifact.id).exists()
+        artifact.delete()
+        if not shared and os.path.exists(blob):
+            os.remove(blob)
+            return artifact.file_size
+        return 0
+
+    def total_size(self) -> int:
+        """Bytes held by distinct blobs (records sharing content count once)"""
+        sizes = Artifact.objects.values_list('content_hash', 'file_size').distinct()
+        return sum(dict(sizes).values())
+
+    def enforce_limit(self, max_bytes: Optional[int] = None, keep: Optional[Artifact] = None) -> Dict[str, Any]:
+        """Evict least-recently-used artifacts until the store fits in max_bytes
+
+        Unreferenced artifacts go first. Jobs hold hardlinks or copies of their own, so evicting a
+        referenced blob only stops future reuse - it never breaks an existing job's file.
+        """
+        max_bytes = settings.ARTIFACT_STORE_MAX_BYTES if max_bytes is None else max_bytes
+        used = self.total_size()
+        removed = 0
+        freed = 0
+        if used <= max_bytes:
+            return {'removed': 0, 'freed_bytes': 0, 'used_bytes': used}
+
+        candidates = Artifact.objects.exclude(id=keep.id) if keep else Artifact.objects.all()
+        for queryset in (candidates.filter(ref_count__lte=0), candidates.filter(ref_count__gt=0)):
+            for artifact in queryset.order_by('last_used_at').iterator():
+                if used <= max_bytes:
+                    break
+                size = self.delete(artifact)
+                used -= size
+                freed += size
+                removed += 1
+        logger.info(f"Artifact store over budget: evicted {removed} artifacts, {freed} bytes")
+        return {'removed': removed, 'freed_bytes': freed, 'used_bytes': used}
+
+    def collect_garbage(self, max_idle_days: int = 7) -> Dict[str, Any]:
+        """Delete unreferenced artifacts that haven't been reused for a while"""
+        cutoff = timezone.now() - timezone.timedelta(days=max_idle_days)
+        removed = 0
+        freed = 0
+        for artifact in Artifact.objects.filter(ref_count__lte=0, last_used_at__lt=cutoff):
+            freed += self.delete(artifact)  # A blob another record still shares frees nothing
+            removed += 1
+        return {'removed': removed, 'freed_bytes': freed}
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Artifact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_key', models.CharField(max_length=255)),
+                ('variant_key', models.CharField(max_length=500)),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('blob_path', models.CharField(max_length=500)),
+                ('file_size', models.BigIntegerField()),
+                ('ext', models.CharField(max_length=10)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-last_used_at'],
+                'constraints': [models.UniqueConstraint(fields=('source_key', 'variant_key'), name='unique_artifact_source_variant')],
+            },
+        ),
+    ]
@@ -78,3 +78,29 @@ class ActivityLog(models.Model):
     def __str__(self):
         user_info = self.user.email if self.user else 'Anonymous'
         return f"{user_info} - {self.action} - {self.timestamp}"
+
+
+class Artifact(models.Model):
+    """Content-addressed finished file shared by identical download and conversion jobs"""
+    source_key = models.CharField(max_length=255)  # Canonical source: video identity or input content hash
+    variant_key = models.CharField(max_length=500)  # Format selector or normalized conversion settings
+    content_hash = models.CharField(max_length=64, db_index=True)  # SHA-256 of the stored blob
+    blob_path = models.CharField(max_length=500)  # Relative to MEDIA_ROOT
+    file_size = models.BigIntegerField()  # in bytes
+    ext = models.CharField(max_length=10)
+    ref_count = models.IntegerField(default=0)  # Number of job rows currently using this artifact
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-last_used_at']
+        constraints = [
+            models.UniqueConstraint(fields=['source_key', 'variant_key'], name='unique_artifact_source_variant'),
+        ]
+
+    def __str__(self):
+        return f"{self.source_key} [{self.variant_key}] - {self.content_hash[:12]}"
+
+    def get_file_size_mb(self):
+        """Return file size in MB"""
+        return round(self.file_size / (1024 * 1024), 2)
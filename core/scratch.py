@@ -0,0 +1,250 @@
+"""
+Managed scratch space: per-job temp directories with byte quotas and orphan sweeping
+"""
+import os
+import glob
+import json
+import time
+import shutil
+import socket
+import logging
+from typing import Dict, Any, Optional, Iterator, Iterable, List
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_MARKER = '.scratch.json'
+
+
+class ScratchSpaceError(Exception):
+    """Raised when a job would exceed its own quota or the node's scratch budget"""
+
+
+def directory_size(path: str) -> int:
+    """Bytes actually allocated under path (sparse files count for what they use)"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                st = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue  # Removed while we were walking
+            total += min(st.st_size, st.st_blocks * 512) if hasattr(st, 'st_blocks') else st.st_size
+    return total
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class ScratchDir:
+    """One job's temporary directory; removed on cleanup(), context exit, or by the sweeper"""
+
+    def __init__(self, path: str, job_id: str, quota: int):
+        self.path = path
+        self.job_id = job_id
+        self.quota = quota
+        self._last_check = 0.0
+
+    def __enter__(self) -> 'ScratchDir':
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+    def heartbeat(self):
+        """Refresh the marker so the sweeper knows the owner is still working"""
+        try:
+            os.utime(os.path.join(self.path, _MARKER))
+        except OSError:
+            pass
+
+    def usage(self) -> int:
+        return directory_size(self.path)
+
+    def check_quota(self, interval: float = 1.0):
+        """Raise ScratchSpaceError once the job has written more than its quota (checked at most every interval)"""
+        now = time.monotonic()
+        if now - self._last_check < interval:
+            return
+        self._last_check = now
+        self.heartbeat()
+        used = self.usage()
+        if used > self.quota:
+            raise ScratchSpaceError(
+                f"Job {self.job_id} exceeded its scratch quota ({used} > {self.quota} bytes)"
+            )
+
+    def cleanup(self):
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path, ignore_errors=True)
+            logger.debug(f"Removed scratch dir {self.path}")
+
+
+class CleanupIterator:
+    """Iterate chunks of a file and always release its scratch dir on close() - even if iteration never started
+
+    Django's StreamingHttpResponse calls close() when the response ends or the client disconnects.
+    A generator's finally block only runs if the generator was started, which is why the plain
+    generator used before leaked its temp directory.
+    """
+
+    def __init__(self, file_path: str, scratch: ScratchDir, chunk_size: int = 64 * 1024):
+        self.file_path = file_path
+        self.scratch = scratch
+        self.chunk_size = chunk_size
+        self._file = None
+        self._closed = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self
+
+    def __next__(self) -> bytes:
+        if self._closed:
+            raise StopIteration
+        if self._file is None:
+            self._file = open(self.file_path, 'rb')
+        chunk = self._file.read(self.chunk_size)
+        if not chunk:
+            self.close()
+            raise StopIteration
+        return chunk
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._file is not None:
+            self._file.close()
+        self.scratch.cleanup()
+
+
+class ScratchSpace:
+    """Allocates per-job directories under SCRATCH_DIR (or tmpfs for small jobs) within a global budget"""
+
+    def __init__(self, root: Optional[str] = None, tmpfs_root: Optional[str] = None,
+                 max_bytes: Optional[int] = None, job_quota: Optional[int] = None):
+        self.root = str(root or settings.SCRATCH_DIR)
+        self.tmpfs_root = tmpfs_root if tmpfs_root is not None else settings.SCRATCH_TMPFS_DIR
+        self.max_bytes = settings.SCRATCH_MAX_BYTES if max_bytes is None else max_bytes
+        self.job_quota = settings.SCRATCH_JOB_QUOTA_BYTES if job_quota is None else job_quota
+        os.makedirs(self.root, exist_ok=True)
+
+    def _roots(self) -> Iterable[str]:
+        yield self.root
+        if self.tmpfs_root and os.path.isdir(self.tmpfs_root):
+            yield self.tmpfs_root
+
+    def _contained(self, path: str) -> bool:
+        """Whether path resolves to a directory directly under one of the scratch roots"""
+        parent = os.path.dirname(os.path.realpath(path))
+        return any(parent == os.path.realpath(root) for root in (self.root, self.tmpfs_root) if root)
+
+    def _remove(self, path: str) -> bool:
+        if not self._contained(path):
+            logger.warning(f"Refusing to remove {path}: outside the scratch roots")
+            return False
+        shutil.rmtree(path, ignore_errors=True)
+        return True
+
+    def _pick_root(self, expected_size: Optional[int]) -> str:
+        """Small jobs go to tmpfs (RAM) when configured and it has room; everything else to disk"""
+        if (self.tmpfs_root and expected_size is not None
+                and expected_size <= settings.SCRATCH_TMPFS_MAX_JOB_BYTES):
+            try:
+                os.makedirs(self.tmpfs_root, exist_ok=True)
+                if shutil.disk_usage(self.tmpfs_root).free > expected_size * 2:
+                    return self.tmpfs_root
+            except OSError as e:
+                logger.warning(f"tmpfs scratch root unusable, using disk: {e}")
+        return self.root
+
+    def usage(self) -> Dict[str, Any]:
+        used = sum(directory_size(os.path.join(root, name))
+                   for root in self._roots() for name in os.listdir(root))
+        return {
+            'bytes': used,
+            'max_bytes': self.max_bytes,
+            'free_disk_bytes': shutil.disk_usage(self.root).free,
+        }
+
+    def allocate(self, job_id: str, expected_size: Optional[int] = None,
+                 quota: Optional[int] = None, detached: bool = False) -> ScratchDir:
+        """Create a directory for job_id, refusing up front if the node can't afford it
+
+        Detached directories outlive the allocating process (e.g. an upload spread over many
+        requests), so the sweeper judges them by heartbeat age only.
+        """
+        quota = quota or self.job_quota
+        needed = expected_size or 0
+        if needed > quota:
+            raise ScratchSpaceError(f"Job {job_id} needs {needed} bytes, over the per-job quota of {quota}")
+
+        used = self.usage()['bytes']
+        if used + needed > self.max_bytes:
+            # Try reclaiming abandoned directories before turning the job away
+            self.sweep()
+            used = self.usage()['bytes']
+            if used + needed > self.max_bytes:
+                raise ScratchSpaceError(f"Scratch space full ({used} of {self.max_bytes} bytes in use)")
+
+        root = self._pick_root(expected_size)
+        if root == self.root and shutil.disk_usage(root).free - needed < settings.SCRATCH_MIN_FREE_BYTES:
+            raise ScratchSpaceError("Not enough free disk space for a new job")
+
+        path = os.path.join(root, f"{job_id}-{os.getpid()}-{int(time.time() * 1000)}")
+        if not self._contained(path):
+            raise ScratchSpaceError(f"Invalid scratch job id: {job_id!r}")
+        os.makedirs(path)
+        with open(os.path.join(path, _MARKER), 'w') as f:
+            json.dump({'job_id': str(job_id), 'host': socket.gethostname(),
+                       'pid': None if detached else os.getpid(), 'created': time.time()}, f)
+        return ScratchDir(path, str(job_id), quota)
+
+    def release(self, job_id: str) -> List[str]:
+        """Remove every directory allocated for job_id, in all roots; returns the paths removed"""
+        removed = []
+        for root in self._roots():
+            for path in glob.glob(os.path.join(glob.escape(root), f"{glob.escape(str(job_id))}-*")):
+                if os.path.isdir(path) and not os.path.islink(path) and self._remove(path):
+                    removed.append(path)
+        return removed
+
+    def sweep(self, max_age: Optional[int] = None) -> Dict[str, Any]:
+        """Remove directories whose owning process died or that stopped heartbeating max_age seconds ago"""
+        max_age = settings.SCRATCH_ORPHAN_AGE if max_age is None else max_age
+        now = time.time()
+        removed = 0
+        freed = 0
+        for root in self._roots():
+            for name in os.listdir(root):
+                path = os.path.join(root, name)
+                if not os.path.isdir(path):
+                    continue
+                marker = os.path.join(path, _MARKER)
+                try:
+                    with open(marker) as f:
+                        owner = json.load(f)
+                    last_seen = os.path.getmtime(marker)
+                except (OSError, ValueError):
+                    owner = {}
+                    last_seen = os.path.getmtime(path)
+
+                # Only trust pid liveness for our own host's directories; age covers everything else
+                dead_owner = (owner.get('host') == socket.gethostname() and owner.get('pid')
+                              and not _pid_alive(owner['pid']))
+                if not dead_owner and now - last_seen < max_age:
+                    continue
+                size = directory_size(path)
+                if not self._remove(path):
+                    continue
+                removed += 1
+                freed += size
+                logger.info(f"Swept orphaned scratch dir {path} ({size} bytes)")
+        return {'removed': removed, 'freed_bytes': freed}
@@ -93,3 +93,15 @@ class SyncTaskProcessor:
                 conversion_request.save()
             except:
                 pass
+
+    @staticmethod
+    def process_batch(batch_id: str):
+        """Process a conversion batch synchronously"""
+        from conversions.models import ConversionBatch
+        from conversions.batches import run_batch
+        try:
+            run_batch(ConversionBatch.objects.get(id=batch_id))
+            logger.info(f"Batch {batch_id} completed synchronously")
+        except Exception as e:
+            logger.error(f"Sync batch failed for {batch_id}: {str(e)}")
+            ConversionBatch.objects.filter(id=batch_id).update(status='failed', error_message=str(e))
@@ -0,0 +1,51 @@
+from celery import shared_task
+from django.conf import settings
+from .artifacts import ArtifactStore
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def collect_artifact_garbage():
+    """Periodic task: delete artifacts no job has referenced for ARTIFACT_IDLE_DAYS, then trim to the size budget"""
+    store = ArtifactStore()
+    result = store.collect_garbage(max_idle_days=settings.ARTIFACT_IDLE_DAYS)
+    result['eviction'] = store.enforce_limit()
+    logger.info(f"Artifact garbage collection: {result}")
+    return result
+
+
+@shared_task
+def sweep_scratch_space():
+    """Periodic task: remove orphaned scratch dirs and conversion uploads no job is waiting on"""
+    import os
+    import time
+    from conversions.models import ConversionRequest, ChunkedUpload
+    from .scratch import ScratchSpace
+
+    result = ScratchSpace().sweep()
+
+    uploads_dir = os.path.join(settings.MEDIA_ROOT, 'temp_uploads')
+    removed_uploads = 0
+    if os.path.isdir(uploads_dir):
+        active = set(
+            ConversionRequest.objects.filter(status__in=['pending', 'processing'])
+            .values_list('input_file', flat=True)
+        )
+        cutoff = time.time() - settings.CONVERSION_INPUT_RETENTION
+        for name in os.listdir(uploads_dir):
+            path = os.path.join(uploads_dir, name)
+            if f"temp_uploads/{name}" in active or not os.path.isfile(path):
+                continue
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed_uploads += 1
+    result['removed_uploads'] = removed_uploads
+
+    # Chunked uploads whose scratch dir the sweep just reclaimed can't be resumed any more
+    expired = [upload.id for upload in ChunkedUpload.objects.filter(status='uploading')
+               if not os.path.isdir(upload.scratch_path)]
+    result['expired_chunked_uploads'] = ChunkedUpload.objects.filter(id__in=expired).update(status='expired')
+
+    logger.info(f"Scratch sweep: {result}")
+    return result
@@ -1,3 +1,73 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from .artifacts import ArtifactStore
+from .models import Artifact
+from .scratch import ScratchSpace, ScratchSpaceError
 
-# Create your tests here.
+
+@override_settings(SCRATCH_MIN_FREE_BYTES=0, SCRATCH_TMPFS_MAX_JOB_BYTES=1024 * 1024)
+class ScratchSpaceTests(SimpleTestCase):
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base, ignore_errors=True)
+        self.root = os.path.join(self.base, 'scratch')
+        self.tmpfs = os.path.join(self.base, 'tmpfs')
+        self.victim = os.path.join(self.base, 'media', 'downloads', 'abc_chapters-1')
+        os.makedirs(self.victim)
+        self.space = ScratchSpace(root=self.root, tmpfs_root=self.tmpfs, max_bytes=10 ** 9, job_quota=10 ** 8)
+
+    def test_allocate_refuses_ids_that_leave_the_root(self):
+        for job_id in ('../media/downloads/x', '../../etc', 'a/b'):
+            with self.assertRaises(ScratchSpaceError):
+                self.space.allocate(job_id)
+        self.assertEqual(os.listdir(os.path.join(self.base, 'media', 'downloads')), ['abc_chapters-1'])
+
+    def test_release_never_reaches_outside_the_roots(self):
+        self.assertEqual(self.space.release('../media/downloads/*'), [])
+        self.assertEqual(self.space.release('*'), [])
+        self.assertTrue(os.path.isdir(self.victim))
+
+    def test_release_removes_the_jobs_directories(self):
+        first = self.space.allocate('0f8fad5b-d9cb-469f-a165-70867728950e')
+        other = self.space.allocate('7c9e6679-7425-40de-944b-e07fc1f90ae7')
+        self.assertEqual(self.space.release('0f8fad5b-d9cb-469f-a165-70867728950e'), [first.path])
+        self.assertFalse(os.path.exists(first.path))
+        self.assertTrue(os.path.isdir(other.path))
+
+    def test_sweep_skips_symlinks_out_of_the_root(self):
+        os.makedirs(self.root, exist_ok=True)
+        os.symlink(os.path.dirname(self.victim), os.path.join(self.root, 'link-1-1'))
+        self.space.sweep(max_age=0)
+        self.assertTrue(os.path.isdir(self.victim))
+
+    def test_small_jobs_go_to_tmpfs(self):
+        self.assertEqual(os.path.dirname(self.space.allocate('small', expected_size=1000).path), self.tmpfs)
+        self.assertEqual(os.path.dirname(self.space.allocate('big', expected_size=10 ** 7).path), self.root)
+        self.assertEqual(os.path.dirname(self.space.allocate('unknown').path), self.root)
+
+
+class ArtifactGarbageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root, ARTIFACT_STORE_MAX_BYTES=10 ** 9)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.store = ArtifactStore(root=os.path.join(self.media_root, 'artifacts'))
+
+    def ingest(self, variant_key):
+        path = os.path.join(self.media_root, f'{variant_key}.mp4')
+        with open(path, 'wb') as f:
+            f.write(b'x' * 1000)
+        return self.store.ingest(path, 'youtube:abc', variant_key)
+
+    def test_shared_blob_is_counted_once(self):
+        self.ingest('720p')
+        self.ingest('best')  # Same bytes under another key
+        Artifact.objects.update(last_used_at=timezone.now() - timezone.timedelta(days=30))
+        result = self.store.collect_garbage()
+        self.assertEqual(result, {'removed': 2, 'freed_bytes': 1000})
+        self.assertFalse(Artifact.objects.exists())
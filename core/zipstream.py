@@ -0,0 +1,61 @@
+"""
+ZIP archives streamed to the client as they are written - nothing is assembled on disk
+"""
+import io
+import os
+import time
+import zipfile
+from typing import List, Iterable, Iterator, Tuple
+
+
+class ZipSink(io.RawIOBase):
+    """Write-only, unseekable target for zipfile that hands the bytes back out as soon as they are written"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def write_file(archive: zipfile.ZipFile, sink: ZipSink, name: str, path: str, deflate: bool = False,
+               chunk_size: int = 256 * 1024) -> Iterator[bytes]:
+    """Add one file to archive, yielding the archive bytes block by block"""
+    entry = zipfile.ZipInfo(name, time.localtime(time.time())[:6])
+    entry.file_size = os.path.getsize(path)  # Lets zipfile decide on ZIP64 before writing
+    if deflate:
+        entry.compress_type = zipfile.ZIP_DEFLATED
+    with open(path, 'rb') as source, archive.open(entry, 'w') as target:
+        while True:
+            block = source.read(chunk_size)
+            if not block:
+                break
+            target.write(block)
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+
+def stream_files(files: Iterable[Tuple[str, str]], chunk_size: int = 256 * 1024) -> Iterator[bytes]:
+    """Yield a ZIP of (name, path) pairs that already exist; media is stored, not deflated"""
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for name, path in files:
+            yield from write_file(archive, sink, name, path, chunk_size=chunk_size)
+    yield sink.drain()
@@ -2,7 +2,14 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import DownloadRequest, DownloadHistory
+from .models import DownloadRequest, DownloadChapter, DownloadHistory
+
+
+class DownloadChapterInline(admin.TabularInline):
+    model = DownloadChapter
+    extra = 0
+    readonly_fields = ('position', 'title', 'start_time', 'end_time', 'file_path', 'file_size', 'file_format')
+    can_delete = False
 
 
 @admin.register(DownloadRequest)
@@ -18,7 +25,7 @@ class DownloadRequestAdmin(admin.ModelAdmin):
             'fields': ('id', 'user', 'url', 'title', 'description')
         }),
         ('Download Options', {
-            'fields': ('format_requested', 'quality_requested', 'audio_only')
+            'fields': ('format_requested', 'quality_requested', 'audio_only', 'start_time', 'end_time', 'split_chapters')
         }),
         ('Status & Progress', {
             'fields': ('status', 'progress', 'error_message')
@@ -36,6 +43,7 @@ class DownloadRequestAdmin(admin.ModelAdmin):
         }),
     )
     
+    inlines = [DownloadChapterInline]
     actions = ['cancel_downloads', 'retry_failed_downloads', 'cleanup_expired']
     
     def title_preview(self, obj):
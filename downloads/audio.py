@@ -0,0 +1,87 @@
+"""
+Direct-to-target audio: ffmpeg reads the chosen audio stream from its URL and writes the requested format in one pass
+"""
+import logging
+from typing import Dict, Any, Optional, Tuple, Callable
+import ffmpeg
+from conversions.clips import clip_input_options
+from conversions.profiles import CONTAINER_CODECS, resolve_profile
+from conversions.capabilities import get_capabilities
+from conversions.progress import FFmpegProgress, run_ffmpeg
+from .format_index import audio_codec_name
+
+logger = logging.getLogger(__name__)
+
+AUDIO_TARGETS = ('mp3', 'm4a', 'wav', 'flac')
+
+# Prefer a source already in the target codec - a copy beats any transcode
+SOURCE_SELECTORS = {
+    'mp3': 'bestaudio[acodec=mp3]/bestaudio/best',
+    'm4a': 'bestaudio[acodec^=mp4a]/bestaudio[ext=m4a]/bestaudio/best',
+    'flac': 'bestaudio[acodec=flac]/bestaudio/best',
+    'wav': 'bestaudio/best',
+}
+
+# Protocols ffmpeg can read by itself; fragment lists (DASH segments, ISM) need yt-dlp's downloader
+_FFMPEG_PROTOCOLS = {'http', 'https', 'm3u8', 'm3u8_native'}
+
+
+def source_codec(fmt: Dict[str, Any]) -> Optional[str]:
+    """ffprobe-style codec name of a resolved format's audio, None when yt-dlp doesn't say"""
+    return audio_codec_name(fmt.get('acodec'))
+
+
+def can_copy(fmt: Dict[str, Any], target: str) -> bool:
+    """Whether the source audio fits the target container as-is"""
+    codec = source_codec(fmt)
+    if codec:
+        return codec in CONTAINER_CODECS[target]['audio']
+    # Codec not reported (direct links): a file already in the target container needs no encoder
+    return fmt.get('ext') == target and fmt.get('vcodec') in (None, 'none')
+
+
+def ffmpeg_readable(fmt: Dict[str, Any]) -> bool:
+    """A single stream ffmpeg can open from its URL, without yt-dlp in between"""
+    return (bool(fmt.get('url')) and not fmt.get('requested_formats')
+            and fmt.get('protocol') in _FFMPEG_PROTOCOLS)
+
+
+def output_options(fmt: Dict[str, Any], target: str) -> Dict[str, Any]:
+    """Copy when the source fits, else the target's audio profile; video and cover art are dropped"""
+    if can_copy(fmt, target):
+        options = {'acodec': 'copy'}
+    else:
+        options = resolve_profile(target, capabilities=get_capabilities()).audio_options()
+    options['vn'] = None
+    if target == 'm4a':
+        options['movflags'] = '+faststart'
+    return options
+
+
+def transcode_to(fmt: Dict[str, Any], output_path: str, target: str,
+                 window: Optional[Tuple[float, Optional[float]]] = None,
+                 callback: Optional[Callable[[FFmpegProgress], None]] = None) -> FFmpegProgress:
+    """Fetch and encode in one ffmpeg process: bytes go from the network straight into the encoder
+
+    A window seeks on the input, so only that part of the stream is requested.
+    """
+    input_options: Dict[str, Any] = {}
+    headers = fmt.get('http_headers') or {}
+    if headers:
+        input_options['headers'] = ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+    if fmt.get('protocol') in ('http', 'https'):
+        # A dropped connection resumes at the byte it stopped at instead of failing the job
+        input_options.update({'reconnect': 1, 'reconnect_streamed': 1, 'reconnect_delay_max': 5})
+    if window:
+        input_options.update(clip_input_options(window))
+
+    duration = fmt.get('duration')
+    if window:
+        end = window[1] if window[1] is not None else duration
+        duration = end - window[0] if end else None
+
+    options = output_options(fmt, target)
+    logger.info(f"Audio {fmt.get('format_id')} ({source_codec(fmt) or fmt.get('ext')}) -> {target}: "
+                f"{'copy' if options.get('acodec') == 'copy' else 'encode'}")
+    stream = ffmpeg.input(fmt['url'], **input_options).output(output_path, **options)
+    return run_ffmpeg(stream, duration=duration, message='Downloading audio...', callback=callback)
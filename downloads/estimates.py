@@ -0,0 +1,103 @@
+"""
+Time estimates from what this deployment actually measured: fetch throughput of past downloads, encode speed of past conversions
+"""
+import logging
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlparse
+from django.conf import settings
+from conversions.models import ConversionRequest
+from .models import DownloadRequest, DownloadHistory
+
+logger = logging.getLogger(__name__)
+
+# Recent jobs an estimate is averaged over; a domain with fewer samples than MIN_DOMAIN_SAMPLES uses all domains
+HISTORY_SAMPLES = 50
+MIN_DOMAIN_SAMPLES = 5
+
+
+def url_domain(url: str) -> str:
+    domain = urlparse(url).netloc.lower()
+    return domain[4:] if domain.startswith('www.') else domain
+
+
+def record_fetch(download_request: DownloadRequest, size: int, seconds: float):
+    """Log one finished fetch (bytes over the wire, wall time) to download history"""
+    try:
+        DownloadHistory.objects.create(
+            user=download_request.user,
+            url=download_request.url,
+            domain=url_domain(download_request.url)[:100],
+            success=True,
+            file_size=size,
+            download_time=round(seconds, 3),
+        )
+    except Exception as e:
+        # Only estimates depend on it
+        logger.warning(f"Could not record download history for {download_request.id}: {str(e)}")
+
+
+def download_throughput(url: Optional[str] = None) -> Tuple[float, str, int]:
+    """(bytes/second, 'history' | 'default', samples) - from recent fetches of this domain when there are
+    enough of them, else of any domain, else DOWNLOAD_PLAN_BANDWIDTH"""
+    recent = DownloadHistory.objects.filter(success=True, file_size__gt=0, download_time__gt=0)
+    rows = []
+    if url:
+        rows = list(recent.filter(domain=url_domain(url)).values_list('file_size', 'download_time')[:HISTORY_SAMPLES])
+    if len(rows) < MIN_DOMAIN_SAMPLES:
+        rows = list(recent.values_list('file_size', 'download_time')[:HISTORY_SAMPLES])
+    if not rows:
+        return float(settings.DOWNLOAD_PLAN_BANDWIDTH), 'default', 0
+    # Total bytes over total time, so one tiny fast file doesn't skew it the way a mean of rates would
+    return sum(size for size, _ in rows) / sum(seconds for _, seconds in rows), 'history', len(rows)
+
+
+def processing_speed() -> Tuple[Optional[float], int]:
+    """(media seconds encoded per wall second, samples) over recent finished conversions; None without history"""
+    rows = ConversionRequest.objects.filter(
+        status='completed', duration__gt=0, started_at__isnull=False, completed_at__isnull=False
+    ).order_by('-completed_at').values_list('duration', 'started_at', 'completed_at')[:HISTORY_SAMPLES]
+    media = wall = 0.0
+    for duration, started_at, completed_at in rows:
+        elapsed = (completed_at - started_at).total_seconds()
+        if elapsed > 0:
+            media += duration
+            wall += elapsed
+    return (media / wall if wall else None), len(rows)
+
+
+def estimate_plan(plan: Dict[str, Any], url: str, duration: Optional[float],
+                  window: Optional[Tuple[float, Optional[float]]] = None,
+                  throughput: Optional[Tuple[float, str, int]] = None) -> Dict[str, Any]:
+    """Bytes and seconds a plan should take here; a window scales both to its share of the video"""
+    bandwidth, source, samples = throughput or download_throughput(url)
+    media_seconds = duration
+    share = 1.0
+    if window and duration:
+        end = window[1] if window[1] is not None else duration
+        media_seconds = max(min(end, duration) - window[0], 0.0)
+        share = media_seconds / duration
+
+    expected = plan['expected_bytes']
+    fetch_bytes = int((expected if expected is not None else plan['bytes']) * share)
+    download_seconds = fetch_bytes / bandwidth
+
+    processing = plan['breakdown']['mux'] * share
+    speed, speed_samples = processing_speed() if 'encode' in plan['steps'].values() else (None, 0)
+    if speed and media_seconds:
+        processing += media_seconds / speed
+    else:
+        processing += plan['breakdown']['encode'] * share
+
+    return {
+        'expected_bytes': int(expected * share) if expected is not None else None,
+        'estimated_bytes': fetch_bytes,  # Falls back to typical bitrates when yt-dlp reports no size
+        'size_exact': plan['size_exact'] and share == 1.0,
+        'download_seconds': round(download_seconds, 1),
+        'processing_seconds': round(processing, 1),
+        'total_seconds': round(download_seconds + processing, 1),
+        'throughput': int(bandwidth),
+        'throughput_source': source,
+        'throughput_samples': samples,
+        'processing_speed': round(speed, 2) if speed else None,
+        'processing_samples': speed_samples,
+    }
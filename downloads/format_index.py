@@ -0,0 +1,145 @@
+"""
+Format index: one pass over an extraction's formats list, then every selector answers from buckets
+"""
+import bisect
+from typing import Dict, Any, Optional, List, Tuple, Iterable, Union
+
+# yt-dlp codec strings -> ffprobe codec names
+_VIDEO_CODEC_NAMES = {
+    'avc1': 'h264', 'avc3': 'h264', 'h264': 'h264', 'hev1': 'hevc', 'hvc1': 'hevc', 'hevc': 'hevc',
+    'vp09': 'vp9', 'vp9': 'vp9', 'vp8': 'vp8', 'av01': 'av1', 'av1': 'av1', 'mp4v': 'mpeg4',
+}
+_AUDIO_CODEC_NAMES = {'mp4a': 'aac', 'alac': 'alac', 'mp3': 'mp3', 'opus': 'opus', 'vorbis': 'vorbis', 'flac': 'flac'}
+
+
+def _codec_name(value: Optional[str], names: Dict[str, str]) -> Optional[str]:
+    value = (value or '').lower()
+    if value in ('', 'none'):
+        return None
+    prefix = value.split('.')[0]
+    return names.get(prefix, prefix)
+
+
+def video_codec_name(vcodec: Optional[str]) -> Optional[str]:
+    """ffprobe-style name for a yt-dlp vcodec string, None when there is no video or yt-dlp doesn't say"""
+    return _codec_name(vcodec, _VIDEO_CODEC_NAMES)
+
+
+def audio_codec_name(acodec: Optional[str]) -> Optional[str]:
+    """ffprobe-style name for a yt-dlp acodec string, None when there is no audio or yt-dlp doesn't say"""
+    return _codec_name(acodec, _AUDIO_CODEC_NAMES)
+
+
+class FormatRecord:
+    """Read-only view of one yt-dlp format with the fields selectors compare already normalized"""
+
+    __slots__ = ('info', 'format_id', 'ext', 'protocol', 'has_url', 'kind', 'video_codec', 'audio_codec',
+                 'height', 'width', 'fps', 'tbr', 'abr', 'audio_rank')
+
+    def __init__(self, info: Dict[str, Any]):
+        has_video = info.get('vcodec', 'none') not in (None, 'none')
+        has_audio = info.get('acodec', 'none') not in (None, 'none')
+        values = {
+            'info': info,
+            'format_id': str(info.get('format_id')),
+            'ext': info.get('ext'),
+            'protocol': info.get('protocol'),
+            'has_url': bool(info.get('url')),
+            'kind': 'combined' if has_video and has_audio else 'video' if has_video else 'audio' if has_audio else None,
+            'video_codec': video_codec_name(info.get('vcodec')),
+            'audio_codec': audio_codec_name(info.get('acodec')),
+            'height': info.get('height') or 0,
+            'width': info.get('width') or 0,
+            'fps': info.get('fps'),
+            'tbr': info.get('tbr') or 0,
+            'abr': info.get('abr') or (info.get('tbr') if not has_video else 0) or 0,
+            # The original-language track first, then full dynamic range over YouTube's -drc copies, then bitrate
+            'audio_rank': ('original' in str(info.get('format_note') or ''),
+                           not str(info.get('format_id')).endswith('-drc'),
+                           info.get('abr') or info.get('tbr') or 0),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    @property
+    def has_video(self) -> bool:
+        return self.kind in ('video', 'combined')
+
+    @property
+    def has_audio(self) -> bool:
+        return self.kind in ('audio', 'combined')
+
+    def __repr__(self) -> str:
+        return f"<FormatRecord {self.format_id} {self.kind} {self.height or ''}>"
+
+
+class FormatIndex:
+    """Immutable index over one extraction's formats: by format_id, by height, by stream type, best audio"""
+
+    __slots__ = ('records', '_by_id', '_by_height', 'heights', 'video', 'audio', 'combined',
+                 'best_audio', '_best_audio_by_ext')
+
+    def __init__(self, formats: Iterable[Dict[str, Any]]):
+        records = tuple(FormatRecord(info) for info in formats or () if info.get('format_id') is not None)
+        by_height: Dict[int, List[FormatRecord]] = {}
+        buckets: Dict[str, List[FormatRecord]] = {'video': [], 'audio': [], 'combined': []}
+        for record in records:
+            if record.kind:
+                buckets[record.kind].append(record)
+            if record.has_video and record.height > 0:
+                by_height.setdefault(record.height, []).append(record)
+
+        audio = sorted(buckets['audio'], key=lambda record: record.audio_rank, reverse=True)
+        best_by_ext: Dict[str, FormatRecord] = {}
+        for record in audio:
+            best_by_ext.setdefault(record.ext, record)
+
+        values = {
+            'records': records,
+            '_by_id': {record.format_id: record for record in records},
+            '_by_height': {height: tuple(group) for height, group in by_height.items()},
+            'heights': tuple(sorted(by_height)),
+            'video': tuple(buckets['video']),
+            'audio': tuple(audio),  # Best first
+            'combined': tuple(buckets['combined']),
+            'best_audio': audio[0] if audio else None,
+            '_best_audio_by_ext': best_by_ext,
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @classmethod
+    def of(cls, formats: Union['FormatIndex', List[Dict[str, Any]]]) -> 'FormatIndex':
+        """An index passes through as it is; a formats list is indexed now. Callers asking one extraction
+        several questions build the index once and pass it on, so nothing is cached by list identity."""
+        if isinstance(formats, FormatIndex):
+            return formats
+        return cls(formats if formats is not None else [])
+
+    def get(self, format_id: str) -> Optional[FormatRecord]:
+        return self._by_id.get(str(format_id))
+
+    def __contains__(self, format_id: str) -> bool:
+        return str(format_id) in self._by_id
+
+    def at_height(self, height: int) -> Tuple[FormatRecord, ...]:
+        """Formats with video at exactly this height, single files and video-only alike"""
+        return self._by_height.get(height, ())
+
+    def heights_between(self, min_height: Optional[int] = None, max_height: Optional[int] = None) -> Tuple[int, ...]:
+        """Available video heights in [min_height, max_height)"""
+        low = bisect.bisect_left(self.heights, min_height) if min_height else 0
+        high = bisect.bisect_left(self.heights, max_height) if max_height else len(self.heights)
+        return self.heights[low:high]
+
+    def best_audio_with_ext(self, ext: str) -> Optional[FormatRecord]:
+        return self._best_audio_by_ext.get(ext)
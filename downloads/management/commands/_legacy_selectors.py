@@ -0,0 +1,140 @@
+"""
+The list-scanning format selectors FormatIndex replaced, kept only as benchmark_format_index's baseline
+
+Each call walks the raw formats list again: the planner filters it into video/audio lists and
+normalizes codecs per candidate, the service helpers scan it for their own picks, and format_id
+checks are a linear search. Cost constants and scoring come from the current planner, so the
+two sides differ only in how they look formats up; alternatives aren't described here, which if
+anything flatters the baseline.
+"""
+from typing import Dict, Any, Optional, List
+from downloads.audio import source_codec
+from downloads.format_index import video_codec_name
+from downloads.planner import (
+    AUDIO_QUALITY_FLOOR, MERGE_SECONDS, PORTABILITY_SHARE, QUALITY_HEIGHTS, REMUX_BYTES_PER_SECOND,
+    VIDEO_ENCODE_PIXELS_PER_SECOND, AUDIO_ENCODE_SPEED, _DEFAULT_KBPS, _DEFAULT_AUDIO_KBPS, _stream_step,
+    expected_bytes,
+)
+
+
+def has_video(fmt: Dict[str, Any]) -> bool:
+    return fmt.get('vcodec', 'none') not in (None, 'none')
+
+
+def has_audio(fmt: Dict[str, Any]) -> bool:
+    return fmt.get('acodec', 'none') not in (None, 'none')
+
+
+def _assumed_bytes(fmt: Dict[str, Any], duration: Optional[float]) -> int:
+    size = expected_bytes(fmt, duration)
+    if size is not None:
+        return size
+    if has_video(fmt):
+        kbps = next(rate for height, rate in _DEFAULT_KBPS if (fmt.get('height') or 0) >= height)
+    else:
+        kbps = _DEFAULT_AUDIO_KBPS
+    return int(kbps * 125 * (duration or 0))
+
+
+def _encode_seconds(kind: str, fmt: Dict[str, Any], duration: Optional[float]) -> float:
+    if kind == 'video':
+        pixels = (fmt.get('width') or 0) * (fmt.get('height') or 0) * (fmt.get('fps') or 30)
+        return (duration or 0) * pixels / VIDEO_ENCODE_PIXELS_PER_SECOND
+    return (duration or 0) / AUDIO_ENCODE_SPEED
+
+
+def _score(video: Optional[Dict[str, Any]], audio: Optional[Dict[str, Any]], container: str,
+           duration: Optional[float], bandwidth: float) -> Dict[str, Any]:
+    parts = [fmt for fmt in (video, audio) if fmt is not None]
+    merge = len(parts) == 2 and parts[0] is not parts[1]
+    if not merge:
+        parts = parts[:1]
+    size = sum(_assumed_bytes(fmt, duration) for fmt in parts)
+
+    steps = {}
+    cost = size / bandwidth
+    for kind, fmt in (('video', video), ('audio', audio)):
+        if fmt is None:
+            continue
+        codec = video_codec_name(fmt.get('vcodec')) if kind == 'video' else source_codec(fmt)
+        steps[kind], portable = _stream_step(kind, codec, container)
+        if steps[kind] == 'encode':
+            cost += _encode_seconds(kind, fmt, duration)
+        elif not portable:
+            cost += PORTABILITY_SHARE * _encode_seconds(kind, fmt, duration)
+    if merge or parts[0].get('ext') != container or 'encode' in steps.values():
+        cost += (MERGE_SECONDS if merge else 0.0) + size / REMUX_BYTES_PER_SECOND
+
+    return {
+        'format_id': '+'.join(str(fmt.get('format_id')) for fmt in parts),
+        'steps': steps,
+        'video': video,
+        'audio': audio if audio is not None and (merge or video is None) else None,
+        'cost': cost,
+    }
+
+
+def plan_formats(formats: List[Dict[str, Any]], quality: str, container: Optional[str] = None,
+                 duration: Optional[float] = None, allow_merge: bool = True,
+                 bandwidth: float = 10 * 1024 * 1024) -> Optional[Dict[str, Any]]:
+    formats = [fmt for fmt in formats if fmt.get('format_id') and (has_video(fmt) or has_audio(fmt))]
+    audio_only = [fmt for fmt in formats if has_audio(fmt) and not has_video(fmt)]
+    best_abr = max((fmt.get('abr') or fmt.get('tbr') or 0 for fmt in audio_only), default=0)
+    good_audio = [fmt for fmt in audio_only if (fmt.get('abr') or fmt.get('tbr') or 0) >= best_abr * AUDIO_QUALITY_FLOOR]
+
+    candidates = []
+    if quality == 'audio':
+        container = container or 'm4a'
+        candidates = [_score(None, fmt, container, duration, bandwidth) for fmt in good_audio]
+    else:
+        container = container or 'mp4'
+        videos = [fmt for fmt in formats if has_video(fmt) and (fmt.get('height') or 0) > 0]
+        heights = sorted({fmt['height'] for fmt in videos})
+        target = None
+        if heights:
+            wanted = QUALITY_HEIGHTS.get(quality, 720)
+            below = [height for height in heights if height <= wanted]
+            target = max(below) if below else min(heights)
+        for fmt in (fmt for fmt in videos if fmt['height'] == target):
+            if has_audio(fmt):
+                candidates.append(_score(fmt, fmt, container, duration, bandwidth))
+            elif allow_merge and good_audio:
+                candidates.extend(_score(fmt, audio, container, duration, bandwidth) for audio in good_audio)
+        if not candidates and not allow_merge:
+            candidates = [_score(fmt, None, container, duration, bandwidth) for fmt in videos if fmt['height'] == target]
+
+    return min(candidates, key=lambda plan: plan['cost']) if candidates else None
+
+
+def find_best_format_for_quality(formats: List[Dict[str, Any]], quality: str,
+                                 duration: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    if quality not in QUALITY_HEIGHTS:
+        return None
+    plan = plan_formats(formats, quality, None, duration)
+    return plan['video'] if plan else None
+
+
+def select_format_for_direct_download(formats: List[Dict[str, Any]], quality: str,
+                                      duration: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    with_url = [f for f in formats if f.get('url')]
+    plan = plan_formats(with_url, quality, None, duration, allow_merge=False)
+    if plan:
+        return plan['video'] or plan['audio']
+    return next(iter(with_url), None)
+
+
+def get_best_audio_format(formats: List[Dict[str, Any]]) -> Optional[str]:
+    multipletracks = ""
+    for f in formats:
+        if len(str(f.get('format_id', ''))) == 5:
+            multipletracks = "original"
+            break
+    for f in formats:
+        if (f.get('resolution') == 'audio only' and f.get('ext') == "m4a"
+                and multipletracks in str(f.get('format_note', '')) and len(str(f.get('format_id', ''))) <= 5):
+            return f.get('format_id')
+    return None
+
+
+def has_format(formats: List[Dict[str, Any]], format_id: str) -> bool:
+    return any(f.get('format_id') == format_id for f in formats)
@@ -0,0 +1,118 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from downloads.format_index import FormatIndex
+from downloads.planner import QUALITY_HEIGHTS, plan_formats
+from downloads.services import DownloadService
+from . import _legacy_selectors as legacy
+
+# Resolutions and codecs of a typical YouTube extraction; DASH/HLS copies and dubbed audio tracks make up the rest
+_HEIGHTS = (144, 240, 360, 480, 720, 1080, 1440, 2160)
+_VIDEO_CODECS = (('avc1.64001F', 'mp4', 1.0), ('vp09.00.40.08', 'webm', 0.8), ('av01.0.08M.08', 'mp4', 0.65))
+_AUDIO_CODECS = (('mp4a.40.2', 'm4a', 129), ('mp4a.40.5', 'm4a', 48), ('opus', 'webm', 135), ('opus', 'webm', 60))
+_LANGUAGES = ('en', 'es', 'de', 'fr', 'ja', 'pt', 'hi', 'it')
+
+
+def synthetic_info(count: int, duration: int = 600) -> dict:
+    """An info dict shaped like a multi-language YouTube extraction with at least count formats"""
+    formats = []
+    variant = 0
+    while len(formats) < count:
+        protocol = ('https', 'm3u8_native')[variant % 2]
+        for height in _HEIGHTS:
+            for vcodec, ext, factor in _VIDEO_CODECS:
+                kbps = round(height * 3.2 * factor)
+                formats.append({
+                    'format_id': f"{height}{ext}{vcodec[:2]}-{variant}", 'ext': ext, 'protocol': protocol,
+                    'vcodec': vcodec, 'acodec': 'none', 'height': height, 'width': height * 16 // 9, 'fps': 30,
+                    'tbr': kbps, 'vbr': kbps, 'url': f"https://example.invalid/v/{height}/{variant}",
+                })
+        language = _LANGUAGES[variant % len(_LANGUAGES)]
+        for index, (acodec, ext, abr) in enumerate(_AUDIO_CODECS):
+            formats.append({
+                'format_id': f"a{index}{ext}-{variant}", 'ext': ext, 'protocol': protocol, 'vcodec': 'none',
+                'acodec': acodec, 'abr': abr, 'tbr': abr, 'filesize': abr * 125 * duration,
+                'format_note': f"{language}{' original' if variant == 0 else ''}, medium",
+                'url': f"https://example.invalid/a/{index}/{variant}",
+            })
+        formats.append({
+            'format_id': f"18-{variant}", 'ext': 'mp4', 'protocol': protocol, 'vcodec': 'avc1.42001E',
+            'acodec': 'mp4a.40.2', 'height': 360, 'width': 640, 'fps': 30, 'tbr': 600,
+            'url': f"https://example.invalid/c/{variant}",
+        })
+        variant += 1
+    return {'title': 'synthetic', 'duration': duration, 'formats': formats}
+
+
+class Command(BaseCommand):
+    help = 'Format selection on an extraction: one shared index versus the list-scanning selectors it replaced'
+
+    def add_arguments(self, parser):
+        parser.add_argument('info_files', nargs='*',
+                            help='Recorded info dicts (yt-dlp -J URL > info.json); default: a synthetic one')
+        parser.add_argument('--formats', type=int, default=150, help='Formats in the synthetic info dict')
+        parser.add_argument('--repeat', type=int, default=50, help='Times each workload is run')
+
+    def handle(self, *args, **options):
+        infos = []
+        for path in options['info_files']:
+            with open(path) as f:
+                infos.append((path, json.load(f)))
+        if not infos:
+            infos.append(('synthetic', synthetic_info(options['formats'])))
+
+        service = DownloadService.__new__(DownloadService)  # Selectors only - no download dir or helper needed
+        self.stdout.write(f"{'info dict':<28} {'formats':>8} {'build':>10} {'indexed':>10} {'scanning':>10} "
+                          f"{'speedup':>8} {'id lookup':>10} {'id scan':>10}")
+        for name, info in infos:
+            formats = info.get('formats') or []
+            duration = info.get('duration')
+            ids = [f.get('format_id') for f in formats[::max(1, len(formats) // 10)]] + ['missing']
+
+            # Everything one extraction is asked: per-quality picks, the direct link, audio, and
+            # stream_download's format_id checks
+            def indexed():
+                index = FormatIndex.of(formats)
+                for quality in QUALITY_HEIGHTS:
+                    plan_formats(index, quality, 'mp4', duration)
+                    service._find_best_format_for_quality(index, quality, duration=duration)
+                service._select_format_for_direct_download(index, '720p', duration=duration)
+                plan_formats(index, 'audio', 'm4a', duration)
+                service._get_best_audio_format(index)
+                for format_id in ids:
+                    format_id in index
+
+            def scanning():
+                for quality in QUALITY_HEIGHTS:
+                    legacy.plan_formats(formats, quality, 'mp4', duration)
+                    legacy.find_best_format_for_quality(formats, quality, duration=duration)
+                legacy.select_format_for_direct_download(formats, '720p', duration=duration)
+                legacy.plan_formats(formats, 'audio', 'm4a', duration)
+                legacy.get_best_audio_format(formats)
+                for format_id in ids:
+                    legacy.has_format(formats, format_id)
+
+            def timed(run) -> float:
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    run()
+                return (time.perf_counter() - started) / options['repeat']
+
+            build = timed(lambda: FormatIndex(formats))
+            shared = timed(indexed)  # Includes building the index
+            rescan = timed(scanning)
+
+            index = FormatIndex(formats)
+            lookups = options['repeat'] * 100
+            started = time.perf_counter()
+            for _ in range(lookups):
+                ids[0] in index
+            lookup = (time.perf_counter() - started) / lookups
+            started = time.perf_counter()
+            for _ in range(lookups):
+                legacy.has_format(formats, ids[-1])
+            scan = (time.perf_counter() - started) / lookups
+
+            self.stdout.write(f"{name[-28:]:<28} {len(formats):>8} {build * 1e3:>8.2f}ms {shared * 1e3:>8.2f}ms "
+                              f"{rescan * 1e3:>8.2f}ms {rescan / shared:>7.1f}x {lookup * 1e6:>8.2f}us "
+                              f"{scan * 1e6:>8.2f}us")
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_artifact'),
+        ('downloads', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='artifact',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='downloads', to='core.artifact'),
+        ),
+        migrations.AlterField(
+            model_name='downloadrequest',
+            name='quality_requested',
+            field=models.CharField(choices=[('audio', 'Audio Only (Fastest)'), ('240p', '240p (Fast)'), ('360p', '360p (Fast)'), ('480p', '480p (Balanced)'), ('720p', '720p (Good Quality)'), ('1080p', '1080p (High Quality)'), ('1440p', '1440p'), ('2160p', '2160p (4K)'), ('best', 'Best Available'), ('worst', 'Worst Available')], default='720p', max_length=10),
+        ),
+    ]
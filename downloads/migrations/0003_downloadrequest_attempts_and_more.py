@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloads', '0002_downloadrequest_artifact_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='resume_state',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
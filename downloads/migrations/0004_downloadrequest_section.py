@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloads', '0003_downloadrequest_attempts_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='end_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='start_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
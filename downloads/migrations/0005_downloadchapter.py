@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:44
+
+import django.db.models.deletion
+import downloads.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloads', '0004_downloadrequest_section'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='downloadrequest',
+            name='split_chapters',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='DownloadChapter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('start_time', models.FloatField()),
+                ('end_time', models.FloatField()),
+                ('file_path', models.FileField(blank=True, max_length=500, null=True, upload_to=downloads.models.upload_to_downloads)),
+                ('file_size', models.BigIntegerField(blank=True, null=True)),
+                ('file_format', models.CharField(blank=True, max_length=10)),
+                ('download_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chapters', to='downloads.downloadrequest')),
+            ],
+            options={
+                'ordering': ['download_request', 'position'],
+            },
+        ),
+    ]
@@ -55,16 +55,22 @@ class DownloadRequest(models.Model):
     format_requested = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='mp4')
     quality_requested = models.CharField(max_length=10, choices=QUALITY_CHOICES, default='720p')
     audio_only = models.BooleanField(default=False)
+    start_time = models.FloatField(null=True, blank=True)  # Download only this window, in seconds
+    end_time = models.FloatField(null=True, blank=True)
+    split_chapters = models.BooleanField(default=False)  # Also cut one file per chapter of the video
     
     # Status and tracking
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     progress = models.IntegerField(default=0)  # 0-100
     error_message = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    resume_state = models.JSONField(default=dict, blank=True)  # Partial-download position, survives worker restarts
     
     # File information
     file_path = models.FileField(upload_to=upload_to_downloads, blank=True, null=True)
     file_size = models.BigIntegerField(null=True, blank=True)  # in bytes
     file_format = models.CharField(max_length=10, blank=True)
+    artifact = models.ForeignKey('core.Artifact', on_delete=models.SET_NULL, null=True, blank=True, related_name='downloads')
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -104,8 +110,18 @@ class DownloadRequest(models.Model):
         else:
             return f"{minutes:02d}:{seconds:02d}"
 
+    def section(self):
+        """(start, end) when only part of the video was requested, else None"""
+        if self.start_time is None and self.end_time is None:
+            return None
+        return self.start_time or 0.0, self.end_time
+
     def delete_file(self):
         """Delete the associated file from storage"""
+        for chapter in self.chapters.all():
+            if chapter.file_path and os.path.exists(chapter.file_path.path):
+                os.remove(chapter.file_path.path)
+
         if self.file_path and os.path.exists(self.file_path.path):
             os.remove(self.file_path.path)
             # Update user storage
@@ -113,6 +129,11 @@ class DownloadRequest(models.Model):
                 self.user.storage_used -= self.file_size
                 self.user.save()
 
+        # The shared artifact blob stays until no job references it
+        if self.artifact_id:
+            from core.artifacts import ArtifactStore
+            ArtifactStore().release(self)
+
     def save(self, *args, **kwargs):
         # Set expiration date (7 days from creation)
         if not self.expires_at:
@@ -129,6 +150,24 @@ class DownloadRequest(models.Model):
         super().save(*args, **kwargs)
 
 
+class DownloadChapter(models.Model):
+    """One chapter of a download that was split by chapters"""
+    download_request = models.ForeignKey(DownloadRequest, on_delete=models.CASCADE, related_name='chapters')
+    position = models.PositiveSmallIntegerField(default=0)
+    title = models.CharField(max_length=255, blank=True)
+    start_time = models.FloatField()  # in seconds
+    end_time = models.FloatField()
+    file_path = models.FileField(upload_to=upload_to_downloads, max_length=500, blank=True, null=True)
+    file_size = models.BigIntegerField(null=True, blank=True)  # in bytes
+    file_format = models.CharField(max_length=10, blank=True)
+
+    class Meta:
+        ordering = ['download_request', 'position']
+
+    def __str__(self):
+        return f"{self.download_request_id} #{self.position} {self.title}"
+
+
 class DownloadHistory(models.Model):
     """Track download history for analytics"""
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
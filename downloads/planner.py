@@ -0,0 +1,267 @@
+"""
+Format planning: every way of producing the requested quality in the requested container, scored by what it costs
+"""
+import logging
+from typing import Dict, Any, Optional, List, Tuple, Union
+from django.conf import settings
+from conversions.profiles import CONTAINER_CODECS, FORMAT_CODECS
+from .format_index import FormatIndex, FormatRecord
+
+logger = logging.getLogger(__name__)
+
+QUALITY_HEIGHTS = {
+    '144p': 144, '240p': 240, '360p': 360, '480p': 480,
+    '720p': 720, '1080p': 1080, '1440p': 1440, '2160p': 2160,
+}
+
+VIDEO_CONTAINERS = ('mp4', 'webm', 'mkv', 'mov')
+
+# Cost constants, in seconds of wall time. A merge is a full remux of both streams.
+MERGE_SECONDS = 1.5
+REMUX_BYTES_PER_SECOND = 200 * 1024 * 1024
+VIDEO_ENCODE_PIXELS_PER_SECOND = 120_000_000  # libx264 veryfast, roughly 2x realtime at 1080p30
+AUDIO_ENCODE_SPEED = 100  # x realtime
+
+# A stream the container can hold but players often can't (VP9 or Opus in mp4) tends to be re-encoded by
+# a later conversion anyway; this share of that re-encode is charged so the native codec wins unless it
+# costs a lot more to fetch
+PORTABILITY_SHARE = 0.25
+
+# An audio stream within this share of the best bitrate counts as the same quality
+AUDIO_QUALITY_FLOOR = 0.75
+
+# Bitrates (kbps) assumed when yt-dlp reports neither a size nor a bitrate
+_DEFAULT_KBPS = ((2160, 16000), (1440, 9000), (1080, 4500), (720, 2500), (480, 1200), (360, 700), (240, 400), (0, 200))
+_DEFAULT_AUDIO_KBPS = 128
+
+
+def expected_bytes(fmt: Dict[str, Any], duration: Optional[float]) -> Optional[int]:
+    """filesize, else filesize_approx, else bitrate x duration; None when there is nothing to go on"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    kbps = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if kbps and duration:
+        return int(kbps * 125 * duration)
+    return None
+
+
+def _assumed_bytes(record: FormatRecord, duration: Optional[float]) -> int:
+    """expected_bytes, falling back to a typical bitrate for the format's height"""
+    size = expected_bytes(record.info, duration)
+    if size is not None:
+        return size
+    if record.has_video:
+        kbps = next(rate for height, rate in _DEFAULT_KBPS if record.height >= height)
+    else:
+        kbps = _DEFAULT_AUDIO_KBPS
+    return int(kbps * 125 * (duration or 0))
+
+
+def _stream_step(kind: str, codec: Optional[str], container: str) -> Tuple[str, bool]:
+    """('copy' | 'encode', whether players expect this codec in container) for one stream"""
+    allowed = CONTAINER_CODECS.get(container, {}).get(kind)
+    if allowed is None:
+        return 'copy', True  # Unknown container - nothing to check against
+    if codec is None:
+        return 'copy', False  # Unreported codec; assume it fits, but prefer one we know
+    if codec not in allowed:
+        return 'encode', True
+    native = FORMAT_CODECS.get(container, (None, None))[0 if kind == 'video' else 1]
+    return 'copy', native is None or codec == native
+
+
+def _encode_seconds(kind: str, record: FormatRecord, duration: Optional[float]) -> float:
+    """Rough wall time to re-encode one stream of record"""
+    if kind == 'video':
+        pixels = record.width * record.height * (record.fps or 30)
+        return (duration or 0) * pixels / VIDEO_ENCODE_PIXELS_PER_SECOND
+    return (duration or 0) / AUDIO_ENCODE_SPEED
+
+
+def _score(video: Optional[FormatRecord], audio: Optional[FormatRecord], container: str,
+           duration: Optional[float], bandwidth: float) -> Dict[str, Any]:
+    """One candidate plan with its cost broken down"""
+    parts = [record for record in (video, audio) if record is not None]
+    merge = len(parts) == 2 and parts[0] is not parts[1]
+    if not merge:
+        parts = parts[:1]
+    size = sum(_assumed_bytes(record, duration) for record in parts)
+    known = [expected_bytes(record.info, duration) for record in parts]
+
+    steps = {}
+    codecs = {}
+    portability = 0.0
+    encode_seconds = 0.0
+    for kind, record in (('video', video), ('audio', audio)):
+        if record is None:
+            continue
+        codecs[kind] = record.video_codec if kind == 'video' else record.audio_codec
+        steps[kind], portable = _stream_step(kind, codecs[kind], container)
+        if steps[kind] == 'encode':
+            encode_seconds += _encode_seconds(kind, record, duration)
+        elif not portable:
+            portability += PORTABILITY_SHARE * _encode_seconds(kind, record, duration)
+
+    if 'encode' in steps.values():
+        operation = 'transcode'
+    elif merge:
+        operation = 'merge'
+    elif parts[0].ext != container:
+        operation = 'remux'
+    else:
+        operation = 'download'
+
+    fetch_seconds = size / bandwidth
+    mux_seconds = 0.0
+    if operation != 'download':
+        mux_seconds = (MERGE_SECONDS if merge else 0.0) + size / REMUX_BYTES_PER_SECOND
+
+    return {
+        'format_id': '+'.join(record.format_id for record in parts),
+        'operation': operation,
+        'container': container,
+        'steps': steps,
+        'codecs': codecs,
+        'video': video.info if video is not None else None,
+        'audio': audio.info if audio is not None and (merge or video is None) else None,
+        'height': video.height if video is not None else None,
+        'bytes': size,
+        'expected_bytes': sum(known) if None not in known else None,
+        'size_exact': all(record.info.get('filesize') for record in parts),
+        'cost': round(fetch_seconds + mux_seconds + encode_seconds + portability, 3),
+        'breakdown': {
+            'fetch': round(fetch_seconds, 3),
+            'mux': round(mux_seconds, 3),
+            'encode': round(encode_seconds, 3),
+            'portability': round(portability, 3),
+        },
+    }
+
+
+def _target_height(heights: Tuple[int, ...], quality: str) -> Optional[int]:
+    """The height a quality asks for among those available: the exact tier, else the closest below it,
+    else the closest above"""
+    if not heights:
+        return None
+    if quality == 'best':
+        return heights[-1]
+    if quality == 'worst':
+        return heights[0]
+    wanted = QUALITY_HEIGHTS.get(quality, 720)
+    below = [height for height in heights if height <= wanted]
+    return below[-1] if below else heights[0]
+
+
+def plan_formats(formats: Union[FormatIndex, List[Dict[str, Any]]], quality: str, container: Optional[str] = None,
+                 duration: Optional[float] = None, allow_merge: bool = True, bandwidth: Optional[float] = None,
+                 require_url: bool = False, min_height: Optional[int] = None,
+                 max_height: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Cheapest plan that delivers quality in container, None when formats offer nothing usable
+
+    Quality is a hard constraint (the height tier, or the best audio tier for 'audio'); among the
+    candidates meeting it the cost decides - bytes to fetch, whether two streams have to be merged,
+    and whether either stream must be re-encoded to fit the container. allow_merge=False and
+    require_url keep to single files with a URL, for callers that hand that URL to the client;
+    min_height/max_height limit the heights considered to [min_height, max_height).
+    """
+    index = FormatIndex.of(formats)
+    bandwidth = bandwidth or settings.DOWNLOAD_PLAN_BANDWIDTH
+    usable = (lambda record: record.has_url) if require_url else (lambda record: True)
+    best = index.best_audio
+    # Same track (original language first) and close to its bitrate
+    good_audio = [record for record in index.audio if usable(record)
+                  and record.audio_rank[0] == best.audio_rank[0] and record.abr >= best.abr * AUDIO_QUALITY_FLOOR]
+
+    candidates = []
+    if quality == 'audio':
+        container = container or 'm4a'
+        candidates = [_score(None, record, container, duration, bandwidth) for record in good_audio]
+    else:
+        container = container or 'mp4'
+        target = _target_height(index.heights_between(min_height, max_height), quality)
+        videos = [record for record in index.at_height(target) if usable(record)] if target else []
+        for record in videos:
+            if record.has_audio:
+                candidates.append(_score(record, record, container, duration, bandwidth))
+            elif allow_merge:
+                candidates.extend(_score(record, audio, container, duration, bandwidth) for audio in good_audio)
+        if not candidates and not allow_merge:
+            # No single file at that height carries audio - a silent one still beats nothing
+            candidates = [_score(record, None, container, duration, bandwidth) for record in videos]
+
+    if not candidates:
+        return None
+    candidates.sort(key=lambda plan: plan['cost'])
+    plan = candidates[0]
+    plan['alternatives'] = [describe(other, alternatives=False) for other in candidates[1:6]]
+    logger.debug(f"Format plan for {quality}/{container}: {plan['format_id']} ({plan['operation']}, "
+                 f"cost {plan['cost']}s) out of {len(candidates)} candidates")
+    return plan
+
+
+def plan_format_id(formats: Union[FormatIndex, List[Dict[str, Any]]], format_id: str, container: Optional[str] = None,
+                   duration: Optional[float] = None, bandwidth: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """The plan for an explicit format id ('137' or '137+140'), None when any part isn't in formats"""
+    index = FormatIndex.of(formats)
+    records = [index.get(part) for part in str(format_id).split('+')]
+    if not records or None in records or len(records) > 2:
+        return None
+    video = next((record for record in records if record.has_video), None)
+    audio = next((record for record in records if record.has_audio and record is not video), None)
+    if video is None and audio is None:
+        return None
+    if video is not None and audio is None and video.has_audio:
+        audio = video
+    container = container or ('mp4' if video is not None else 'm4a')
+    plan = _score(video, audio, container, duration, bandwidth or settings.DOWNLOAD_PLAN_BANDWIDTH)
+    plan['alternatives'] = []
+    return plan
+
+
+def format_selector(plan: Optional[Dict[str, Any]], quality: str) -> str:
+    """yt-dlp format string for a plan: its exact format ids, then the quality it stands for
+
+    The ids come from one extraction; a later one (another player client, an expired manifest) may
+    not offer them, so the fallback keeps the download to the same height.
+    """
+    height = plan['height'] if plan else None
+    if quality == 'audio':
+        fallback = 'bestaudio/best'
+    elif height:
+        fallback = f"bestvideo[height<={height}]+bestaudio/best[height<={height}]/best"
+    else:
+        fallback = 'best'
+    return f"{plan['format_id']}/{fallback}" if plan else fallback
+
+
+def describe(plan: Dict[str, Any], alternatives: bool = True) -> Dict[str, Any]:
+    """JSON-safe explanation of a plan - what is fetched, what happens to it, and why it won"""
+    streams = {}
+    for kind in ('video', 'audio'):
+        # A single file with both streams is only stored under 'video'
+        fmt = plan.get(kind) or (plan.get('video') if kind in plan['steps'] else None)
+        if fmt is not None:
+            streams[kind] = {
+                'format_id': fmt.get('format_id'),
+                'ext': fmt.get('ext'),
+                'codec': plan['codecs'].get(kind),
+                'height': fmt.get('height') if kind == 'video' else None,
+                'bitrate': fmt.get('tbr') or fmt.get('abr'),
+                'step': plan['steps'].get(kind),
+            }
+    summary = {
+        'format_id': plan['format_id'],
+        'operation': plan['operation'],
+        'container': plan['container'],
+        'height': plan['height'],
+        'bytes': plan['bytes'],
+        'expected_bytes': plan['expected_bytes'],
+        'size_exact': plan['size_exact'],
+        'cost_seconds': plan['cost'],
+        'breakdown': plan['breakdown'],
+        'streams': streams,
+    }
+    if alternatives:
+        summary['alternatives'] = plan.get('alternatives', [])
+    return summary
@@ -0,0 +1,331 @@
+"""
+Disk-backed range cache for proxied upstream media
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Iterator, List, Tuple, Callable
+from django.conf import settings
+from django.core import signing
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines - fall back to in-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_SIGNING_SALT = 'downloads.range_cache'
+
+# An entry written to this recently may have a filler in another process - eviction leaves it alone
+EVICT_MIN_IDLE = 60  # seconds
+
+
+def sign_cache_key(video_id: str, format_id: str, direct_url: str) -> str:
+    """Bind a cache key to the upstream URL it was issued for, so clients can't poison other entries"""
+    url_digest = hashlib.sha256(direct_url.encode()).hexdigest()[:32]
+    return signing.Signer(salt=_SIGNING_SALT).sign(f"{video_id}|{format_id}|{url_digest}")
+
+
+def verify_cache_key(token: str, direct_url: str) -> Optional[Tuple[str, str]]:
+    """Return (video_id, format_id) if the token was issued by us for this direct URL"""
+    try:
+        value = signing.Signer(salt=_SIGNING_SALT).unsign(token)
+    except signing.BadSignature:
+        return None
+    video_id, format_id, url_digest = value.rsplit('|', 2)
+    if url_digest != hashlib.sha256(direct_url.encode()).hexdigest()[:32]:
+        return None
+    return video_id, format_id
+
+
+def _merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    """Merge half-open [start, end) ranges into a sorted, non-overlapping list"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class CacheEntry:
+    """One cached upstream resource: a sparse data file plus an index of the byte ranges present"""
+
+    def __init__(self, cache: 'RangeCache', key: str):
+        self.cache = cache
+        self.key = key
+        self.dir = os.path.join(cache.root, hashlib.sha256(key.encode()).hexdigest())
+        self.data_path = os.path.join(self.dir, 'data')
+        self.index_path = os.path.join(self.dir, 'index.json')
+        self.lock_path = os.path.join(self.dir, 'lock')
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.dir, exist_ok=True)
+        with self.cache.thread_lock(self.key):
+            with open(self.lock_path, 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_index(self) -> Dict[str, Any]:
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'key': self.key, 'length': None, 'content_type': None, 'ranges': [], 'last_access': 0}
+
+    def _write_index(self, index: Dict[str, Any]):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    @property
+    def index(self) -> Dict[str, Any]:
+        return self._read_index()
+
+    @property
+    def length(self) -> Optional[int]:
+        return self._read_index().get('length')
+
+    @property
+    def content_type(self) -> Optional[str]:
+        return self._read_index().get('content_type')
+
+    def touch(self):
+        """Mark the entry as recently used for LRU eviction"""
+        with self._locked():
+            index = self._read_index()
+            index['last_access'] = time.time()
+            self._write_index(index)
+
+    def set_length(self, length: int, content_type: Optional[str] = None):
+        """Record the upstream length; a different length means the cached bytes are stale"""
+        with self._locked():
+            index = self._read_index()
+            if index.get('length') not in (None, length):
+                logger.warning(f"Upstream length changed for {self.key}, discarding cached ranges")
+                index['ranges'] = []
+                if os.path.exists(self.data_path):
+                    os.remove(self.data_path)
+            if not os.path.exists(self.data_path):
+                index['ranges'] = []  # Whatever the index claims, the bytes are gone
+            index['length'] = length
+            index['content_type'] = content_type or index.get('content_type')
+            index['last_access'] = time.time()
+            if not os.path.exists(self.data_path):
+                with open(self.data_path, 'wb') as f:
+                    f.truncate(length)  # Sparse on filesystems that support it
+            self._write_index(index)
+
+    def cached_bytes(self) -> int:
+        return sum(end - start for start, end in self._read_index()['ranges'])
+
+    def is_complete(self, start: int = 0, end: Optional[int] = None) -> bool:
+        """Whether bytes [start, end) are all present on disk"""
+        index = self._read_index()
+        end = index.get('length') if end is None else end
+        if end is None:
+            return False
+        return any(s <= start and end <= e for s, e in index['ranges'])
+
+    def plan(self, start: int, end: int) -> List[Tuple[int, int, bool]]:
+        """Split [start, end) into consecutive (start, end, cached) spans"""
+        spans = []
+        position = start
+        for s, e in self._read_index()['ranges']:
+            if e <= position or s >= end:
+                continue
+            if s > position:
+                spans.append((position, s, False))
+            spans.append((max(s, position), min(e, end), True))
+            position = min(e, end)
+            if position >= end:
+                break
+        if position < end:
+            spans.append((position, end, False))
+        return spans
+
+    def read(self, start: int, end: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Yield cached bytes [start, end) from disk"""
+        with open(self.data_path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def commit(self, start: int, end: int, inode: Optional[int] = None):
+        """Record that bytes [start, end) have been written to the data file
+
+        inode is the data file the bytes went into; if the entry was evicted (and maybe recreated)
+        since, they are not in the current file and nothing is recorded.
+        """
+        if end <= start:
+            return
+        with self._locked():
+            try:
+                current = os.stat(self.data_path).st_ino
+            except FileNotFoundError:
+                return
+            if inode is not None and inode != current:
+                logger.info(f"Proxy cache entry {self.key} was evicted while filling, dropping {start}-{end}")
+                return
+            index = self._read_index()
+            index['ranges'] = _merge_ranges(index['ranges'] + [[start, end]])
+            index['last_access'] = time.time()
+            self._write_index(index)
+
+    def fill(self, start: int, chunks: Iterator[bytes], commit_every: int = 4 * 1024 * 1024) -> Iterator[bytes]:
+        """Pass upstream chunks through to the caller while writing them into the cache"""
+        committed = start
+        position = start
+        inode = None
+        self.cache.writer_started(self.key)
+        try:
+            try:
+                f = open(self.data_path, 'r+b')
+            except FileNotFoundError:
+                # Evicted by another process since plan() - the headers are out, so the bytes still have to follow
+                logger.info(f"Proxy cache entry {self.key} was evicted before filling, passing {start}- through")
+                yield from chunks
+                return
+            with f:
+                inode = os.fstat(f.fileno()).st_ino
+                f.seek(start)
+                for chunk in chunks:
+                    f.write(chunk)
+                    position += len(chunk)
+                    if position - committed >= commit_every:
+                        f.flush()
+                        self.commit(committed, position, inode)
+                        committed = position
+                    yield chunk
+        finally:
+            self.cache.writer_finished(self.key)
+            # Keep whatever arrived, even if the client went away mid-range
+            if inode is not None:
+                self.commit(committed, position, inode)
+
+    def stream(self, start: int, end: int, fetch: Callable[[int, int], Iterator[bytes]]) -> Iterator[bytes]:
+        """Serve [start, end) from disk where cached, filling the gaps from upstream via fetch(start, end_inclusive)"""
+        self.touch()
+        try:
+            for span_start, span_end, cached in self.plan(start, end):
+                if cached:
+                    try:
+                        reader = self.read(span_start, span_end)
+                        first = next(reader, b'')
+                    except FileNotFoundError:
+                        # Evicted since plan() - fetch the span after all rather than cut the response short
+                        yield from self.fill(span_start, fetch(span_start, span_end - 1))
+                        continue
+                    yield first
+                    yield from reader
+                else:
+                    yield from self.fill(span_start, fetch(span_start, span_end - 1))
+        finally:
+            self.cache.evict(keep=self.key)
+
+    def idle_seconds(self) -> float:
+        """Seconds since the data or the index was last written"""
+        mtimes = [os.path.getmtime(path) for path in (self.data_path, self.index_path) if os.path.exists(path)]
+        return time.time() - max(mtimes) if mtimes else float('inf')
+
+    def delete(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class RangeCache:
+    """LRU cache of upstream media keyed by canonical video ID and format_id rather than signed URLs"""
+
+    _thread_locks: Dict[str, threading.Lock] = {}
+    _writers: Dict[str, int] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = str(root or settings.PROXY_CACHE_DIR)
+        self.max_bytes = settings.PROXY_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    @classmethod
+    def thread_lock(cls, key: str) -> threading.Lock:
+        with cls._registry_lock:
+            return cls._thread_locks.setdefault(key, threading.Lock())
+
+    @classmethod
+    def writer_started(cls, key: str):
+        with cls._registry_lock:
+            cls._writers[key] = cls._writers.get(key, 0) + 1
+
+    @classmethod
+    def writer_finished(cls, key: str):
+        with cls._registry_lock:
+            cls._writers[key] -= 1
+            if not cls._writers[key]:
+                del cls._writers[key]
+
+    def _in_use(self, entry: CacheEntry) -> bool:
+        """Being filled here, or written recently enough that a filler elsewhere may still be at it"""
+        with self._registry_lock:
+            filling = entry.key in self._writers
+        return filling or entry.idle_seconds() < EVICT_MIN_IDLE
+
+    def entry(self, video_id: str, format_id: str) -> CacheEntry:
+        return CacheEntry(self, f"{video_id}:{format_id}")
+
+    def _entries(self) -> List[CacheEntry]:
+        entries = []
+        for name in os.listdir(self.root):
+            index_path = os.path.join(self.root, name, 'index.json')
+            try:
+                with open(index_path, 'r') as f:
+                    key = json.load(f)['key']
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append(CacheEntry(self, key))
+        return entries
+
+    def usage(self) -> Dict[str, Any]:
+        entries = self._entries()
+        return {
+            'entries': len(entries),
+            'bytes': sum(e.cached_bytes() for e in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+    def evict(self, keep: Optional[str] = None):
+        """Drop least recently used entries until the cache fits its byte budget"""
+        entries = [(e.index, e) for e in self._entries()]
+        total = sum(e.cached_bytes() for _, e in entries)
+        if total <= self.max_bytes:
+            return
+
+        for index, entry in sorted(entries, key=lambda item: item[0].get('last_access', 0)):
+            if total <= self.max_bytes:
+                break
+            if entry.key == keep or self._in_use(entry):
+                continue
+            with entry._locked():
+                # A filler may have started between the scan and the lock
+                if self._in_use(entry):
+                    continue
+                size = entry.cached_bytes()
+                entry.delete()
+            total -= size
+            logger.info(f"Evicted proxy cache entry {entry.key} ({size} bytes)")
@@ -0,0 +1,181 @@
+"""
+Persisted resume state for downloads that must survive retries and worker restarts
+"""
+import time
+import uuid
+import random
+import logging
+import threading
+from typing import Dict, Any, Optional, List
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from .models import DownloadRequest
+
+logger = logging.getLogger(__name__)
+
+
+def retry_backoff(attempt: int) -> float:
+    """Exponential backoff with jitter, capped so a flaky fragment can't stall a job for minutes"""
+    base = settings.DOWNLOAD_RETRY_BACKOFF
+    delay = min(base * (2 ** max(attempt - 1, 0)), settings.DOWNLOAD_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def resilient_ydl_opts() -> Dict[str, Any]:
+    """yt-dlp options for bounded per-request/per-fragment retries and resuming from .part files"""
+    return {
+        'continuedl': True,  # Pick up .part/.ytdl files left behind by an interrupted attempt
+        'retries': settings.DOWNLOAD_RETRIES,
+        'fragment_retries': settings.DOWNLOAD_FRAGMENT_RETRIES,
+        'file_access_retries': 3,
+        'retry_sleep_functions': {
+            'http': retry_backoff,
+            'fragment': retry_backoff,
+            'file_access': retry_backoff,
+        },
+        # A missing fragment would silently corrupt the output - retry it, then fail the attempt
+        'skip_unavailable_fragments': False,
+    }
+
+
+class ClaimLost(Exception):
+    """Another attempt took the job over - this one must stop without touching its files or its row"""
+
+
+class ResumeState:
+    """Per-DownloadRequest progress that lets a re-queued job continue where the last attempt stopped
+
+    Each attempt claims the job with a fresh token. Every write of the state is conditional on the
+    token still being ours, so a worker that was written off as stalled but is still running finds
+    out at its next heartbeat and stops (ClaimLost) instead of racing the new attempt on base_path.
+    """
+
+    def __init__(self, download_request: DownloadRequest, flush_interval: float = 2.0):
+        self.download_request = download_request
+        self.state: Dict[str, Any] = dict(download_request.resume_state or {})
+        self.flush_interval = flush_interval
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+        self._lost = threading.Event()
+        self._keepalive: Optional[threading.Event] = None
+        self.claim = uuid.uuid4().hex
+        self.state['claim'] = self.claim
+        self._write({'resume_state': dict(self.state)}, claimed=False)
+
+    @property
+    def is_resuming(self) -> bool:
+        return bool(self.state.get('base_path'))
+
+    def base_path(self, default: str) -> str:
+        """Output path without extension, pinned on the first attempt so .part files are found again"""
+        if not self.state.get('base_path'):
+            self.state['base_path'] = default
+            self.flush(force=True)
+        return self.state['base_path']
+
+    def update(self, **fields):
+        with self._lock:
+            self.state.update(fields)
+        self.flush()
+
+    def _write(self, fields: Dict[str, Any], claimed: bool = True):
+        rows = DownloadRequest.objects.filter(id=self.download_request.id)
+        if claimed:
+            rows = rows.filter(resume_state__claim=self.claim)
+        if not rows.update(**fields):
+            self._lost.set()
+            raise ClaimLost(f"Download {self.download_request.id} was taken over by another attempt")
+        self.download_request.resume_state = fields.get('resume_state', self.download_request.resume_state)
+
+    def check(self):
+        """Raise ClaimLost if a heartbeat found the job taken over; call between steps"""
+        if self._lost.is_set():
+            raise ClaimLost(f"Download {self.download_request.id} was taken over by another attempt")
+
+    def flush(self, force: bool = False, progress: Optional[int] = None):
+        """Persist the state (throttled) - doubles as the heartbeat used to detect stalled jobs"""
+        self.check()
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        with self._lock:
+            self.state['heartbeat'] = timezone.now().isoformat()
+            fields = {'resume_state': dict(self.state)}
+        if progress is not None:
+            fields.update(progress=min(progress, 99), status='processing')
+        self._write(fields)
+
+    def start_keepalive(self, interval: Optional[float] = None):
+        """Heartbeat from a side thread until stop_keepalive(), so steps that report no progress of their
+        own (merges, trims, chapter cuts, artifact hashing) don't look stalled"""
+        if self._keepalive:
+            return
+        interval = interval or max(self.flush_interval, min(30.0, settings.DOWNLOAD_STALL_TIMEOUT / 4))
+        stop = self._keepalive = threading.Event()
+
+        def beat():
+            try:
+                while not stop.wait(interval):
+                    try:
+                        self.flush(force=True)
+                    except ClaimLost:
+                        return
+                    except Exception as e:
+                        logger.warning(f"Heartbeat for download {self.download_request.id} failed: {str(e)}")
+            finally:
+                connection.close()  # The heartbeat opened its own DB connection on this thread
+
+        threading.Thread(target=beat, daemon=True).start()
+
+    def stop_keepalive(self):
+        if self._keepalive:
+            self._keepalive.set()
+            self._keepalive = None
+
+    def clear(self):
+        """Forget the partial state once the download is finished"""
+        with self._lock:
+            self.state = {'claim': self.claim}
+        self._write({'resume_state': dict(self.state)})
+
+    # Segmented (range) downloads
+
+    def segments_for(self, url_key: str, length: int) -> List[List[int]]:
+        """Completed byte ranges from a previous attempt, if it was fetching the same resource"""
+        segmented = self.state.get('segmented') or {}
+        if segmented.get('key') != url_key or segmented.get('length') != length:
+            return []
+        return segmented.get('done', [])
+
+    def start_segments(self, url_key: str, length: int, partial_path: str):
+        previous = self.state.get('segmented') or {}
+        done = previous.get('done', []) if previous.get('key') == url_key and previous.get('length') == length else []
+        with self._lock:
+            self.state['segmented'] = {'key': url_key, 'length': length, 'partial_path': partial_path, 'done': done}
+        self.flush(force=True)
+
+    def segment_done(self, segment):
+        with self._lock:
+            self.state['segmented']['done'].append(list(segment))
+        self.flush()
+
+    # yt-dlp downloads
+
+    def ytdlp_hook(self, d: Dict[str, Any]):
+        """Progress hook recording fragment position and bytes so the job's progress survives restarts"""
+        if d.get('status') != 'downloading':
+            return
+        total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+        downloaded = d.get('downloaded_bytes', 0)
+        with self._lock:
+            self.state.update({
+                'partial_path': d.get('tmpfilename') or d.get('filename'),
+                'fragment_index': d.get('fragment_index'),
+                'fragment_count': d.get('fragment_count'),
+                'downloaded_bytes': downloaded,
+                'total_bytes': total,
+            })
+        progress = int(downloaded / total * 100) if total else None
+        self.flush(progress=progress)
@@ -0,0 +1,100 @@
+"""
+Partial downloads: fetch only the start..end window of a video, then trim it to the exact frame
+"""
+import os
+import logging
+from typing import Dict, Any, Optional, Tuple
+import ffmpeg
+from yt_dlp.utils import download_range_func
+from conversions.clips import EDGE_ENCODERS, KEYFRAME_TOLERANCE, clip_window, clip_input_options, smart_cut
+from conversions.capabilities import get_capabilities
+from conversions.media_info import probe_media
+
+logger = logging.getLogger(__name__)
+
+# Muxers that write an edit list for a stream-copied section, so timeline 0 is the requested start even
+# though the file begins at the keyframe before it. Other containers shift the pre-roll to 0 instead.
+_EDIT_LIST_EXTS = {'mp4', 'm4a', 'mov'}
+
+
+def section_window(start, end) -> Optional[Tuple[float, Optional[float]]]:
+    """(start, end) in seconds from request values, end None meaning the end of the video; None for the whole video"""
+    return clip_window({'start': start, 'end': end})
+
+
+def section_ydl_opts(window: Tuple[float, Optional[float]]) -> Dict[str, Any]:
+    """yt-dlp options that fetch only the window
+
+    yt-dlp hands sections to ffmpeg with an input seek: HLS/DASH playlists only pull the fragments
+    covering the window, progressive files are read with byte ranges located through their index
+    (moov / cues). Cuts land on keyframes - trim_section makes them exact afterwards.
+    """
+    start, end = window
+    return {
+        'download_ranges': download_range_func(None, [(start, end if end is not None else float('inf'))]),
+        'force_keyframes_at_cuts': False,  # That re-encodes the whole section; we only re-encode the edges
+    }
+
+
+def section_key(window: Optional[Tuple[float, Optional[float]]]) -> Dict[str, Any]:
+    """Extra variant-key fields so a section never shares an artifact with the full video"""
+    if not window:
+        return {}
+    return {'start': round(window[0], 3), 'end': round(window[1], 3) if window[1] is not None else None}
+
+
+def trim_section(path: str, window: Tuple[float, Optional[float]]) -> bool:
+    """Cut the keyframe-aligned section yt-dlp fetched down to the exact window, in place
+
+    Returns False when the file is kept as fetched (unknown codec, no edge encoder, or no way to
+    tell where the requested start sits in it).
+    """
+    start, end = window
+    length = end - start if end is not None else None
+    ext = os.path.splitext(path)[1].lstrip('.').lower()
+    media_info = probe_media(path)
+    streams = media_info.get('streams', [])
+    video = next((st for st in streams if st.get('codec_type') == 'video'), None)
+    has_audio = any(st.get('codec_type') == 'audio' for st in streams)
+
+    if ext in _EDIT_LIST_EXTS:
+        offset = 0.0
+    elif length is not None and media_info.get('duration'):
+        # The pre-roll from the keyframe before start is all that makes the file longer than asked
+        offset = max(media_info['duration'] - length, 0.0)
+    else:
+        logger.info(f"Section {start}-{end} of {path}: start offset unknown, keeping keyframe-aligned cut")
+        return False
+    if offset < KEYFRAME_TOLERANCE:
+        offset = 0.0
+    local = (offset, offset + length if length is not None else None)
+
+    root, _ = os.path.splitext(path)
+    trimmed = f"{root}.trim.{ext}"
+    output_options = {'movflags': '+faststart'} if ext in _EDIT_LIST_EXTS else {}
+    try:
+        if video:
+            edge = EDGE_ENCODERS.get(video.get('codec_name'))
+            if not edge or edge[0] not in get_capabilities()['encoders']:
+                logger.info(f"Section {start}-{end} of {path}: no edge encoder for {video.get('codec_name')}, "
+                            f"keeping keyframe-aligned cut")
+                return False
+            smart_cut(path, trimmed, local, video['codec_name'], {'acodec': 'copy'} if has_audio else None,
+                      output_options)
+        elif has_audio:
+            if not offset:
+                return False  # Every audio packet is a keyframe - the fetched cut is already exact
+            # Audio packets all decode on their own, so a plain copy cut is exact
+            ffmpeg.input(path, **clip_input_options(local)).output(
+                trimmed, acodec='copy', vn=None, **output_options
+            ).run(overwrite_output=True, quiet=True)
+        else:
+            return False
+        os.replace(trimmed, path)
+        return True
+    except ffmpeg.Error as e:
+        stderr = (e.stderr or b'').decode('utf-8', 'replace')
+        raise Exception(f"Section trim failed: {stderr[-2000:]}")
+    finally:
+        if os.path.exists(trimmed):
+            os.remove(trimmed)
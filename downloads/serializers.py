@@ -1,24 +1,33 @@
 from rest_framework import serializers
-from .models import DownloadRequest, DownloadHistory
+from .models import DownloadRequest, DownloadChapter, DownloadHistory
+from .sections import section_window
+
+
+class DownloadChapterSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DownloadChapter
+        fields = ('id', 'position', 'title', 'start_time', 'end_time', 'file_size', 'file_format')
+        read_only_fields = fields
 
 
 class DownloadRequestSerializer(serializers.ModelSerializer):
     file_size_mb = serializers.SerializerMethodField()
     duration_formatted = serializers.SerializerMethodField()
     user_email = serializers.SerializerMethodField()
+    chapters = DownloadChapterSerializer(many=True, read_only=True)
 
     class Meta:
         model = DownloadRequest
         fields = (
             'id', 'user_email', 'url', 'title', 'description', 'thumbnail_url',
             'duration', 'duration_formatted', 'format_requested', 'quality_requested',
-            'audio_only', 'status', 'progress', 'error_message', 'file_path',
-            'file_size', 'file_size_mb', 'file_format', 'created_at', 'started_at',
+            'audio_only', 'start_time', 'end_time', 'split_chapters', 'chapters', 'status', 'progress',
+            'error_message', 'file_path', 'file_size', 'file_size_mb', 'file_format', 'created_at', 'started_at',
             'completed_at', 'expires_at', 'video_codec', 'audio_codec', 'bitrate', 'fps'
         )
         read_only_fields = (
-            'id', 'title', 'description', 'thumbnail_url', 'duration', 'status',
-            'progress', 'error_message', 'file_path', 'file_size', 'file_format',
+            'id', 'title', 'description', 'thumbnail_url', 'duration', 'start_time', 'end_time',
+            'split_chapters', 'chapters', 'status', 'progress', 'error_message', 'file_path', 'file_size', 'file_format',
             'created_at', 'started_at', 'completed_at', 'expires_at', 'video_codec',
             'audio_codec', 'bitrate', 'fps'
         )
@@ -34,9 +43,24 @@ class DownloadRequestSerializer(serializers.ModelSerializer):
 
 
 class DownloadCreateSerializer(serializers.ModelSerializer):
+    # Seconds or 'HH:MM:SS.mmm'; either one alone cuts from the beginning / to the end
+    start = serializers.CharField(required=False, allow_blank=True, write_only=True)
+    end = serializers.CharField(required=False, allow_blank=True, write_only=True)
+
     class Meta:
         model = DownloadRequest
-        fields = ('url', 'format_requested', 'quality_requested', 'audio_only')
+        fields = ('url', 'format_requested', 'quality_requested', 'audio_only', 'start', 'end', 'split_chapters')
+
+    def validate(self, attrs):
+        try:
+            window = section_window(attrs.pop('start', None), attrs.pop('end', None))
+        except ValueError as e:
+            raise serializers.ValidationError({'start': str(e)})
+        if window:
+            if attrs.get('split_chapters'):
+                raise serializers.ValidationError("Chapter splitting needs the whole video - drop start/end")
+            attrs['start_time'], attrs['end_time'] = window
+        return attrs
 
     def validate_url(self, value):
         """Validate that the URL is from a supported platform"""
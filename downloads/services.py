@@ -1,17 +1,33 @@
 import os
+import time
 import uuid
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple, Union
 import yt_dlp
 from django.conf import settings
 from django.core.files.storage import default_storage
-from .models import DownloadRequest
+from .models import DownloadRequest, DownloadChapter
 from .youtube_bypass import YouTubeBypassHelper
+from .segmented import SegmentedDownloader
+from .resume import ResumeState, ClaimLost, resilient_ydl_opts
+from .sections import section_ydl_opts, section_key, trim_section
+from .audio import AUDIO_TARGETS, SOURCE_SELECTORS, can_copy, ffmpeg_readable, transcode_to
+from .planner import QUALITY_HEIGHTS, VIDEO_CONTAINERS, plan_formats, format_selector, describe
+from .format_index import FormatIndex
+from .estimates import download_throughput, record_fetch
+from .sizes import SizeResolver
+from conversions.chapters import normalize_chapters, chapter_filename, split_chapters
+from conversions.profiles import resolve_profile
+from conversions.capabilities import get_capabilities
+from core.artifacts import ArtifactStore, canonical_source, settings_key
 import logging
 
 logger = logging.getLogger(__name__)
 
 class DownloadService:
     """Service for handling video downloads using yt-dlp, inspired by the original downloader.py"""
+
+    # Requested formats chapters are encoded to; anything else keeps the downloaded streams as they are
+    CHAPTER_ENCODE_FORMATS = ('mp3', 'wav', 'flac')
     
     def __init__(self):
         self.download_dir = os.path.join(settings.MEDIA_ROOT, 'downloads')
@@ -28,12 +44,12 @@ class DownloadService:
                 raise Exception("No video information could be extracted")
             
             # Get the best format based on quality preference
-            formats = info.get('formats', [])
+            formats = FormatIndex.of(info.get('formats', []))
             if not formats:
                 raise Exception("No downloadable formats found")
             
             # Select format based on quality
-            selected_format = self._select_format_for_direct_download(formats, quality)
+            selected_format = self._select_format_for_direct_download(formats, quality, duration=info.get('duration'))
             
             if not selected_format:
                 raise Exception("No suitable format found for direct download")
@@ -56,77 +72,55 @@ class DownloadService:
             logger.error(f"Error getting direct download URL: {str(e)}")
             raise e
     
-    def _select_format_for_direct_download(self, formats: list, quality: str) -> Optional[Dict]:
+    def _select_format_for_direct_download(self, formats: Union[FormatIndex, list], quality: str, container: Optional[str] = None,
+                                           duration: Optional[float] = None) -> Optional[Dict]:
         """Select the best format for direct download based on quality preference"""
-        if quality == 'audio':
-            # Audio only - find best audio format
-            audio_formats = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') != 'none']
-            if audio_formats:
-                return max(audio_formats, key=lambda x: x.get('abr', 0) or 0)
-        
-        # Video formats
-        video_formats = [f for f in formats if f.get('vcodec') != 'none' and f.get('url')]
-        
-        if not video_formats:
-            # Fallback to any format with URL
-            return next((f for f in formats if f.get('url')), None)
-        
-        # Quality preferences
-        quality_preferences = {
-            '240p': 240,
-            '360p': 360,
-            '480p': 480,
-            '720p': 720,
-            '1080p': 1080,
-            'best': 9999,
-            'worst': 1
+        # The client gets one URL, so only single files qualify - no merge is possible
+        index = FormatIndex.of(formats)
+        plan = plan_formats(index, quality, container, duration, allow_merge=False, require_url=True)
+        if plan:
+            logger.debug(f"Direct download plan: {describe(plan, alternatives=False)}")
+            return plan['video'] or plan['audio']
+
+        # Fallback to any format with URL
+        return next((record.info for record in index.records if record.has_url), None)
+
+    def extract_format_info(self, url: str) -> Dict[str, Any]:
+        """Info dict from the iOS client, which lists the most formats"""
+        ios_opts = {
+            'quiet': True,
+            'skip_download': True,
+            'format': 'all',
+            'extractor_args': {
+                'youtube': {
+                    'player_client': ['ios'],
+                }
+            },
+            'extract_flat': False,
         }
         
-        target_height = quality_preferences.get(quality, 720)
-        
-        # Find format closest to target quality
-        if target_height == 1:  # worst
-            return min(video_formats, key=lambda x: x.get('height', 9999))
-        elif target_height == 9999:  # best
-            return max(video_formats, key=lambda x: x.get('height', 0))
-        else:
-            # Find closest to target
-            return min(video_formats, key=lambda x: abs((x.get('height', 720)) - target_height))
+        with yt_dlp.YoutubeDL(ios_opts) as ydl:
+            return ydl.extract_info(url, download=False)
 
-    def get_available_formats(self, url: str) -> list:
+    def get_available_formats(self, url: str, ios_info: Optional[Dict[str, Any]] = None) -> list:
         """Get all available video formats using iOS client with working smart selectors"""
         try:
             # Use iOS client for maximum format availability
-            ios_opts = {
-                'quiet': True,
-                'skip_download': True,
-                'format': 'all',
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': ['ios'],
-                    }
-                },
-                'extract_flat': False,
-            }
-            
-            with yt_dlp.YoutubeDL(ios_opts) as ydl:
-                ios_info = ydl.extract_info(url, download=False)
-            
-            ios_formats = ios_info.get('formats', [])
-            logger.info(f"iOS extraction: {len(ios_formats)} formats")
-            
-            # Categorize formats
-            video_only = [f for f in ios_formats if f.get('vcodec', 'none') != 'none' and f.get('acodec', 'none') == 'none']
-            audio_only = [f for f in ios_formats if f.get('vcodec', 'none') == 'none' and f.get('acodec', 'none') != 'none']
-            video_with_audio = [f for f in ios_formats if f.get('vcodec', 'none') != 'none' and f.get('acodec', 'none') != 'none']
+            if ios_info is None:
+                ios_info = self.extract_format_info(url)
             
-            logger.info(f"Video-only: {len(video_only)}, Audio-only: {len(audio_only)}, Combined: {len(video_with_audio)}")
+            # Categorize formats - one pass; every lookup below answers from the index
+            index = FormatIndex.of(ios_info.get('formats', []))
+            duration = ios_info.get('duration')
+            logger.info(f"iOS extraction: {len(index)} formats - video-only: {len(index.video)}, "
+                        f"audio-only: {len(index.audio)}, combined: {len(index.combined)}")
             
             available_formats = []
             
             # Add existing video+audio formats if any (these work directly)
-            for f in video_with_audio:
-                height = f.get('height', 0)
+            for record in index.combined:
+                f = record.info
+                height = record.height
                 if height > 0:
                     quality_label = self._get_quality_label(height)
                     available_formats.append({
@@ -153,51 +147,57 @@ class DownloadService:
                     'format_id': 'bestvideo[height>=2160]+bestaudio/best[height>=2160]',
                     'height': 2160,
                     'width': 3840,
-                    'min_height': 2160
+                    'min_height': 2160,
+                    'max_height': None
                 },
                 {
                     'quality': '1440p', 
                     'format_id': 'bestvideo[height>=1440][height<2160]+bestaudio/best[height>=1440][height<2160]',
                     'height': 1440,
                     'width': 2560,
-                    'min_height': 1440
+                    'min_height': 1440,
+                    'max_height': 2160
                 },
                 {
                     'quality': '1080p',
                     'format_id': 'bestvideo[height>=1080][height<1440]+bestaudio/best[height>=1080][height<1440]',
                     'height': 1080,
                     'width': 1920,
-                    'min_height': 1080
+                    'min_height': 1080,
+                    'max_height': 1440
                 },
                 {
                     'quality': '720p',
                     'format_id': 'bestvideo[height>=720][height<1080]+bestaudio/best[height>=720][height<1080]',
                     'height': 720,
                     'width': 1280,
-                    'min_height': 720
+                    'min_height': 720,
+                    'max_height': 1080
                 },
                 {
                     'quality': '480p',
                     'format_id': 'bestvideo[height>=480][height<720]+bestaudio/best[height>=480][height<720]',
                     'height': 480,
                     'width': 854,
-                    'min_height': 480
+                    'min_height': 480,
+                    'max_height': 720
                 },
                 {
                     'quality': '360p',
                     'format_id': 'bestvideo[height>=360][height<480]+bestaudio/best[height>=360][height<480]',
                     'height': 360,
                     'width': 640,
-                    'min_height': 360
+                    'min_height': 360,
+                    'max_height': 480
                 }
             ]
             
             # Only add smart selectors for qualities we actually have video for
             # For vertical videos, we need to check the width (smaller dimension) instead of height
             video_qualities = []
-            for f in video_only:
-                width = f.get('width', 0)
-                height = f.get('height', 0)
+            for record in index.video:
+                width = record.width
+                height = record.height
                 if width > 0 and height > 0:
                     # For vertical videos (height > width), the "quality" is based on width
                     # For horizontal videos, the quality is based on height
@@ -207,8 +207,8 @@ class DownloadService:
             video_qualities = set(video_qualities)
             max_available_quality = max(video_qualities) if video_qualities else 0
             
-            logger.info(f"Available video qualities (effective resolution): {sorted(video_qualities)}")
-            logger.info(f"Max available video quality: {max_available_quality}")
+            logger.debug(f"Available video qualities (effective resolution): {sorted(video_qualities)}, "
+                         f"max {max_available_quality}")
             
             for selector in smart_selectors:
                 # Only add if we have video at or near this resolution
@@ -223,28 +223,33 @@ class DownloadService:
                 )
                 existing_quality = any(fmt['quality'] == selector['quality'] for fmt in available_formats)
                 
-                logger.info(f"Checking {selector['quality']} ({selector_height}p): max_available_quality={max_available_quality}, min_height={min_height}, has_compatible={has_compatible_video}, existing={existing_quality}")
+                logger.debug(f"Checking {selector['quality']} ({selector_height}p): max_available_quality={max_available_quality}, min_height={min_height}, has_compatible={has_compatible_video}, existing={existing_quality}")
                 
                 if has_compatible_video and not existing_quality:
+                    # Cheapest concrete formats for this tier, with the selector kept as yt-dlp's fallback
+                    plan = plan_formats(index, 'best', 'mp4', duration, min_height=min_height,
+                                        max_height=selector['max_height'])
+                    streams = describe(plan)['streams'] if plan else {}
                     available_formats.append({
                         'quality': selector['quality'],
                         'label': f"{selector['quality']} - {selector['width']}x{selector['height']}",
-                        'format_id': selector['format_id'],
+                        'format_id': f"{plan['format_id']}/{selector['format_id']}" if plan else selector['format_id'],
                         'ext': 'mp4',
-                        'filesize': None,  # Will be determined at download time
+                        'filesize': plan['expected_bytes'] if plan else None,
                         'has_audio': True,
-                        'video_codec': 'auto',
-                        'audio_codec': 'auto',
-                        'fps': None,
+                        'video_codec': streams.get('video', {}).get('codec') or 'auto',
+                        'audio_codec': streams.get('audio', {}).get('codec') or 'auto',
+                        'fps': plan['video'].get('fps') if plan else None,
                         'width': selector['width'],
                         'height': selector['height'],
                         'type': 'ios_smart_selector',
                         'source': 'ios',
+                        'operation': plan['operation'] if plan else None,
                         'resolution': f"{selector['width']}x{selector['height']}"
                     })
-                    logger.info(f"Added working iOS smart selector: {selector['quality']} - {selector['format_id']}")
+                    logger.debug(f"Added iOS smart selector: {selector['quality']} - {available_formats[-1]['format_id']}")
                 else:
-                    logger.info(f"Skipped {selector['quality']}: not compatible with available video formats")
+                    logger.debug(f"Skipped {selector['quality']}: not compatible with available video formats")
             
             # Add general fallback if no high quality formats were added
             if not any(fmt.get('height', 0) >= 720 for fmt in available_formats):
@@ -266,8 +271,9 @@ class DownloadService:
                 logger.info("Added general fallback selector")
             
             # Add audio-only option with preference for m4a over webm
-            if audio_only:
-                best_audio = max(audio_only, key=lambda x: x.get('abr', 0))
+            audio_plan = plan_formats(index, 'audio', 'm4a', duration)
+            if audio_plan:
+                best_audio = audio_plan['audio']
                 available_formats.append({
                     'quality': 'audio',
                     'label': f"Audio Only - {best_audio.get('ext', 'm4a').upper()}",
@@ -301,6 +307,9 @@ class DownloadService:
             quality_priority = {'2160p': 8, '1440p': 7, '1080p': 6, '720p': 5, '480p': 4, '360p': 3, '240p': 2, '144p': 1, 'audio': 0}
             available_formats.sort(key=lambda x: quality_priority.get(x['quality'], 0), reverse=True)
             
+            # Exact sizes where already known (earlier probes included), bitrate x duration elsewhere
+            SizeResolver(url, index, duration).estimate(available_formats)
+            
             logger.info(f"Final available formats: {len(available_formats)}")
             return available_formats
             
@@ -419,41 +428,18 @@ class DownloadService:
             logger.error(f"Error getting direct download URL by format: {str(e)}")
             raise
     
-    def _find_best_format_for_quality(self, formats: list, quality: str) -> Optional[Dict]:
-        """Find the best format for a specific quality"""
-        height_map = {
-            '144p': 144, '240p': 240, '360p': 360, '480p': 480,
-            '720p': 720, '1080p': 1080, '1440p': 1440, '2160p': 2160
-        }
-        
-        target_height = height_map.get(quality)
-        if not target_height:
+    def _find_best_format_for_quality(self, formats: Union[FormatIndex, list], quality: str, container: Optional[str] = None,
+                                      duration: Optional[float] = None) -> Optional[Dict]:
+        """Find the best format for a specific quality - the cheapest to deliver in container; for a
+        merge plan this is its video format"""
+        if quality not in QUALITY_HEIGHTS:
             return None
-        
-        # First try to find formats with both video and audio
-        video_audio_formats = [
-            f for f in formats 
-            if f.get('height') == target_height 
-            and f.get('vcodec', 'none') != 'none' 
-            and f.get('acodec', 'none') != 'none'
-        ]
-        
-        if video_audio_formats:
-            # Return the one with best overall quality
-            return max(video_audio_formats, key=lambda x: x.get('tbr', 0))
-        
-        # If no combined format, find video-only format
-        video_only_formats = [
-            f for f in formats 
-            if f.get('height') == target_height 
-            and f.get('vcodec', 'none') != 'none'
-        ]
-        
-        if video_only_formats:
-            return max(video_only_formats, key=lambda x: x.get('vbr', 0))
-        
-        return None
-    
+
+        plan = plan_formats(formats, quality, container, duration)
+        if not plan:
+            return None
+        return plan['video']
+
     def _get_quality_label(self, height: int) -> str:
         """Convert height to quality label"""
         if height >= 2160:
@@ -557,32 +543,109 @@ class DownloadService:
             return "best"
     
     def _get_best_audio_format(self, formats: list) -> Optional[str]:
-        """Get best audio format, inspired by audioQtySelector"""
-        multipletracks = ""
-        
-        # Check for multiple tracks
-        for f in formats:
-            if len(str(f.get('format_id', ''))) == 5:
-                multipletracks = "original"
-                break
-        
-        # Find best audio format
-        for f in formats:
-            if (f.get('resolution') == 'audio only' and
-                f.get('ext') == "m4a" and
-                multipletracks in str(f.get('format_note', '')) and
-                len(str(f.get('format_id', ''))) <= 5):
-                return f.get('format_id')
-        
-        return None
+        """Get best audio format, inspired by audioQtySelector - the original track's best m4a"""
+        record = FormatIndex.of(formats).best_audio_with_ext('m4a')
+        return record.format_id if record else None
     
+    @staticmethod
+    def _progressive_format(plan: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """The plan's single file when it is a plain HTTP download; a merge or a fragmented one is yt-dlp's job"""
+        if not plan or (plan['video'] is not None and plan['audio'] is not None):
+            return None
+        fmt = plan['video'] if plan['video'] is not None else plan['audio']
+        if fmt.get('protocol') not in ('http', 'https') or not fmt.get('url'):
+            return None  # Fragmented (DASH/HLS) - yt-dlp already fetches fragments concurrently
+        return fmt
+
+    def _try_segmented_download(self, download_request: DownloadRequest, fmt: Optional[Dict[str, Any]],
+                                base_path: str, resume: Optional[ResumeState] = None) -> Optional[str]:
+        """Fast path for progressive formats: multi-connection fetch instead of a single yt-dlp stream"""
+        if not fmt:
+            return None
+
+        final_path = f"{base_path}.{fmt.get('ext', 'mp4')}"
+        partial_path = f"{final_path}.segpart"
+
+        def on_progress(downloaded, total):
+            if resume:
+                resume.flush(progress=int(downloaded / total * 100))
+            else:
+                DownloadRequest.objects.filter(id=download_request.id).update(
+                    progress=min(int(downloaded / total * 100), 99),
+                    status='processing'
+                )
+
+        downloader = SegmentedDownloader(fmt['url'], headers=fmt.get('http_headers'))
+        try:
+            if not downloader.supports_segmentation():
+                return self._download_single(downloader, final_path, on_progress)
+
+            # Signed direct URLs expire between attempts - match earlier progress on format and length instead
+            url_key = f"{fmt.get('format_id')}:{fmt.get('ext')}"
+            completed = []
+            if resume and os.path.exists(partial_path):
+                completed = resume.segments_for(url_key, downloader.length)
+                if completed:
+                    logger.info(f"Resuming segmented download {download_request.id}: "
+                                f"{len(completed)} segments already on disk")
+            if resume:
+                resume.start_segments(url_key, downloader.length, partial_path)
+
+            downloader.download_to_file(
+                partial_path,
+                progress_callback=on_progress,
+                completed=completed,
+                segment_callback=resume.segment_done if resume else None,
+            )
+            if resume:
+                resume.check()
+            os.replace(partial_path, final_path)
+            return final_path
+        except ClaimLost:
+            raise
+        except Exception as e:
+            if resume and resume.state.get('segmented', {}).get('done') and os.path.exists(partial_path):
+                # Part of the file is already here - let the task retry and continue from it
+                resume.flush(force=True)
+                raise Exception(f"Segmented download interrupted: {str(e)}")
+            logger.warning(f"Segmented download failed, falling back to yt-dlp: {str(e)}")
+            for path in (partial_path, final_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return None
+        finally:
+            downloader.close()
+
+    def _download_single(self, downloader: SegmentedDownloader, dest_path: str, progress_callback=None) -> str:
+        """Plain single-connection fetch for resources too small or unable to be split"""
+        total = downloader.length or 0
+        downloaded = 0
+        with downloader.session.get(downloader.url, headers=downloader.headers, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            with open(dest_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    if progress_callback and total:
+                        progress_callback(downloaded, total)
+        return dest_path
+
     def download_video(self, download_request: DownloadRequest) -> str:
         """Download video with progress tracking - ULTRA FAST mode"""
+        resume = None
         try:
             # Generate unique filename using the download request ID
             safe_title = "".join(c for c in download_request.title if c.isalnum() or c in (' ', '-', '_')).rstrip()
             filename = f"{download_request.id}_{safe_title}.%(ext)s"
-            filepath = os.path.join(self.download_dir, filename)
+
+            # A retried job keeps its first attempt's path so yt-dlp finds the .part files again
+            resume = ResumeState(download_request)
+            resume.start_keepalive()  # yt-dlp merges and the steps after the fetch report no progress
+            resuming = resume.is_resuming  # base_path() records state, so ask before it does
+            base_path = resume.base_path(os.path.join(self.download_dir, filename).replace('.%(ext)s', ''))
+            filepath = f"{base_path}.%(ext)s"
+            if resuming and download_request.attempts > 1:
+                logger.info(f"Resuming download {download_request.id} (attempt {download_request.attempts})")
             
             # Progress hook for real-time updates
             def progress_hook(d):
@@ -605,28 +668,29 @@ class DownloadService:
                         status='completed'
                     )
             
-            # ULTRA SPEED OPTIMIZATION: Direct format selection without info extraction
-            quality = download_request.quality_requested
-            
-            if quality == 'audio':
-                # Audio only - fastest
-                format_selector = "bestaudio/best[acodec!*=none]"
-            elif quality in ['240p']:
-                # Very fast - prefer small files but be flexible
-                format_selector = "worst[height<=360]/worst[ext=mp4]/worst[ext=webm]/worst"
-            elif quality in ['360p']:
-                # Fast - small files but flexible
-                format_selector = "worst[height<=480]/worst[ext=mp4]/worst[ext=webm]/worst"
-            else:
-                # Default to fastest available
-                format_selector = "worst"
+            # Download exactly what plan_download describes, and key the artifact on it
+            info = self.bypass_helper.extract_video_info_with_retry(download_request.url)
+            plan, selector = self.plan_video(download_request, info)
+            if plan:
+                logger.info(f"Download {download_request.id} plan: {plan['format_id']} ({plan['operation']})")
+
+            # Someone already fetched this video in this format - reuse their bytes
+            artifact_store = ArtifactStore()
+            source_key = canonical_source(download_request.url)
+            window = download_request.section()
+            variant_key = self.artifact_variant_key(download_request, selector)
+            chapters = self.requested_chapters(download_request, info)
+            cached_path = self._complete_from_artifact(download_request, artifact_store, source_key, variant_key,
+                                                       base_path, chapters)
+            if cached_path:
+                return cached_path
             
             # ULTRA FAST yt-dlp options - minimal processing
             ydl_opts = {
                 'outtmpl': filepath,
                 'noplaylist': True,
-                'format': format_selector,
-                'progress_hooks': [progress_hook],
+                'format': selector,
+                'progress_hooks': [progress_hook, resume.ytdlp_hook],
                 'quiet': True,
                 'no_warnings': True,
                 # EXTREME SPEED OPTIMIZATIONS
@@ -638,11 +702,8 @@ class DownloadService:
                 'writedescription': False,
                 'writethumbnail': False,
                 'concurrent_fragment_downloads': 8,  # More parallel downloads
-                'fragment_retries': 0,  # No retries for speed
-                'retries': 0,  # No retries for speed
-                'file_access_retries': 0,
-                'skip_unavailable_fragments': True,
-                'abort_on_unavailable_fragment': False,
+                # Bounded retries with backoff and .part resume - cheaper than restarting from zero
+                **resilient_ydl_opts(),
                 'ignore_no_formats_error': True,
                 # Minimal headers for speed
                 'user_agent': 'Mozilla/5.0',
@@ -659,39 +720,61 @@ class DownloadService:
             custom_opts = {
                 'outtmpl': filepath,
                 'noplaylist': True,
-                'format': format_selector,
-                'progress_hooks': [progress_hook],
+                'format': selector,
+                'progress_hooks': [progress_hook, resume.ytdlp_hook],
                 'concurrent_fragment_downloads': 8,
-                'fragment_retries': 0,
-                'retries': 0,
+                **resilient_ydl_opts(),
                 'ignoreerrors': True,
             }
+            if window:
+                custom_opts.update(section_ydl_opts(window))
             
-            # Use bypass helper for all downloads to avoid bot detection
-            success = self.bypass_helper.download_with_fallback(download_request.url, custom_opts)
-            
-            if not success:
-                raise Exception("All download strategies failed")
-            
-            # Find the actual downloaded file with broader extension search
-            base_path = filepath.replace('.%(ext)s', '')
-            possible_extensions = ['.mp4', '.webm', '.mkv', '.m4a', '.mp3', '.wav', '.ogg', '.flac']
-            
+            # Progressive formats go over several connections; everything else through yt-dlp.
+            # A section skips the multi-connection fetch - it would pull the whole file.
             final_path = None
-            for ext in possible_extensions:
-                if os.path.exists(base_path + ext):
-                    final_path = base_path + ext
-                    break
+            fetch_started = time.monotonic()
+            if not window:
+                final_path = self._try_segmented_download(download_request, self._progressive_format(plan),
+                                                           base_path, resume)
+
+            if not final_path:
+                # Use bypass helper for all downloads to avoid bot detection
+                success = self.bypass_helper.download_with_fallback(download_request.url, custom_opts)
+                resume.check()
+
+                if not success:
+                    raise Exception("All download strategies failed")
+
+                # Find the actual downloaded file with broader extension search
+                possible_extensions = ['.mp4', '.webm', '.mkv', '.m4a', '.mp3', '.wav', '.ogg', '.flac']
+
+                for ext in possible_extensions:
+                    if os.path.exists(base_path + ext):
+                        final_path = base_path + ext
+                        break
             
             if not final_path:
                 # Try finding any file with the base name
                 import glob
                 pattern = base_path + '*'
-                files = glob.glob(pattern)
+                # Leftover partials from an interrupted attempt are not the result
+                files = [f for f in glob.glob(pattern) if not f.endswith(('.part', '.segpart', '.ytdl'))]
                 if files:
                     final_path = files[0]
                 else:
                     raise Exception("Downloaded file not found")
+
+            if not resuming:
+                # A resumed fetch only moved part of the file - its time says nothing about throughput
+                record_fetch(download_request, os.path.getsize(final_path), time.monotonic() - fetch_started)
+
+            if window:
+                resume.update(stage='trimming')
+                trim_section(final_path, window)
+            if chapters:
+                resume.update(stage='splitting_chapters')
+                self._split_chapters(download_request, final_path, chapters)
+            resume.flush(force=True)  # Last claim check before the row is marked completed
             
             # Update file path and mark as completed
             download_request.file_path = os.path.relpath(final_path, settings.MEDIA_ROOT)
@@ -699,100 +782,232 @@ class DownloadService:
             download_request.status = 'completed'
             download_request.progress = 100
             download_request.save()
+            resume.clear()
+
+            self._store_artifact(download_request, artifact_store, final_path, source_key, variant_key)
             
             return final_path
             
+        except ClaimLost:
+            raise  # The row belongs to the attempt that took over
         except Exception as e:
             logger.error(f"Download failed: {str(e)}")
             download_request.status = 'failed'
             download_request.error_message = str(e)
             download_request.save()
             raise e
+        finally:
+            if resume:
+                resume.stop_keepalive()
     
+    def plan_video(self, download_request: DownloadRequest,
+                   info: Optional[Dict[str, Any]] = None) -> Tuple[Optional[Dict[str, Any]], str]:
+        """(plan, yt-dlp format string) a download job fetches - the same plan_download shows for the request"""
+        info = info or self.bypass_helper.extract_video_info_with_retry(download_request.url)
+        quality = download_request.quality_requested
+        container = download_request.format_requested if download_request.format_requested in VIDEO_CONTAINERS else None
+        plan = plan_formats(FormatIndex.of((info or {}).get('formats') or []), quality, container,
+                            (info or {}).get('duration'), bandwidth=download_throughput(download_request.url)[0])
+        return plan, format_selector(plan, quality)
+
+    def artifact_variant_key(self, download_request: DownloadRequest, selector: Optional[str] = None) -> str:
+        """Artifact-store variant a download job produces, so a finished copy can be found before running it
+
+        Video downloads are keyed on the format string they fetch with; without one it is planned here.
+        """
+        window = download_request.section()
+        if download_request.format_requested in AUDIO_TARGETS:
+            return settings_key(kind='download_audio', format=download_request.format_requested, **section_key(window))
+        if selector is None:
+            selector = self.plan_video(download_request)[1]
+        return settings_key(kind='download', format=selector, **section_key(window))
+
+    def _complete_from_artifact(self, download_request: DownloadRequest, artifact_store: ArtifactStore,
+                                source_key: str, variant_key: str, base_path: str,
+                                chapters: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
+        """Complete the job instantly from a stored artifact, if one exists"""
+        artifact = artifact_store.lookup(source_key, variant_key)
+        if not artifact:
+            return None
+
+        final_path = artifact_store.materialize(artifact, f"{base_path}.{artifact.ext}")
+        artifact_store.acquire(download_request, artifact)
+        if chapters:
+            self._split_chapters(download_request, final_path, chapters)
+
+        download_request.file_path = os.path.relpath(final_path, settings.MEDIA_ROOT)
+        download_request.file_size = artifact.file_size
+        download_request.file_format = artifact.ext
+        download_request.status = 'completed'
+        download_request.progress = 100
+        download_request.save()
+
+        logger.info(f"Download {download_request.id} served from artifact store ({source_key})")
+        return final_path
+
+    def requested_chapters(self, download_request: DownloadRequest,
+                           info: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        """The video's chapters when the job asked to be split by them, else None"""
+        if not download_request.split_chapters:
+            return None
+        info = info or self.bypass_helper.extract_video_info_with_retry(download_request.url)
+        chapters = normalize_chapters((info or {}).get('chapters'), (info or {}).get('duration'))
+        if not chapters:
+            raise Exception("This video has no chapters to split by")
+        if len(chapters) > settings.CHAPTER_SPLIT_MAX:
+            raise Exception(f"This video has {len(chapters)} chapters; at most {settings.CHAPTER_SPLIT_MAX} can be split")
+        return chapters
+
+    def _split_chapters(self, download_request: DownloadRequest, source_path: str, chapters: List[Dict[str, Any]]):
+        """Cut the finished download into one file per chapter, all chapters at once"""
+        ext = os.path.splitext(source_path)[1].lstrip('.').lower()
+        requested = download_request.format_requested
+        if requested in self.CHAPTER_ENCODE_FORMATS and requested != ext:
+            options = resolve_profile(requested, capabilities=get_capabilities()).output_options()
+            ext = requested
+        else:
+            options = {'c': 'copy'}  # Same codecs, same container - every chapter is a seek and a copy
+            if ext in ('mp4', 'm4a', 'mov'):
+                options['movflags'] = '+faststart'
+
+        chapter_dir = os.path.join(self.download_dir, f"{download_request.id}_chapters")
+        os.makedirs(chapter_dir, exist_ok=True)
+        paths = [os.path.join(chapter_dir, chapter_filename(position, chapter['title'], ext))
+                 for position, chapter in enumerate(chapters)]
+        split_chapters(source_path, paths, chapters, {**options, 'sn': None})
+
+        DownloadChapter.objects.filter(download_request=download_request).delete()  # A retry cuts them again
+        DownloadChapter.objects.bulk_create([
+            DownloadChapter(
+                download_request=download_request,
+                position=position,
+                title=chapter['title'][:255],
+                start_time=chapter['start'],
+                end_time=chapter['end'],
+                file_path=os.path.relpath(path, settings.MEDIA_ROOT),
+                file_size=os.path.getsize(path),
+                file_format=ext,
+            )
+            for position, (chapter, path) in enumerate(zip(chapters, paths))
+        ])
+        logger.info(f"Download {download_request.id}: split into {len(chapters)} chapters")
+
+    def _store_artifact(self, download_request: DownloadRequest, artifact_store: ArtifactStore,
+                        final_path: str, source_key: str, variant_key: str):
+        """Register a finished download so identical requests can reuse it"""
+        try:
+            artifact = artifact_store.ingest(final_path, source_key, variant_key)
+            artifact_store.acquire(download_request, artifact)
+        except Exception as e:
+            # The job itself succeeded - losing dedupe for it is not worth failing over
+            logger.warning(f"Could not store artifact for {download_request.id}: {str(e)}")
+
     def download_audio(self, download_request: DownloadRequest) -> str:
-        """Download audio only, inspired by audioDownload"""
+        """Download audio straight into format_requested (mp3/m4a/wav/flac) - fetch and encode in one pass"""
+        resume = None
         try:
             # Generate unique filename using the download request ID
             safe_title = "".join(c for c in download_request.title if c.isalnum() or c in (' ', '-', '_')).rstrip()
             filename = f"{download_request.id}_{safe_title}.%(ext)s"
-            filepath = os.path.join(self.download_dir, filename)
-            
-            # Progress hook
-            def progress_hook(d):
-                if d['status'] == 'downloading':
-                    if 'total_bytes' in d:
-                        progress = int((d['downloaded_bytes'] / d['total_bytes']) * 100)
-                    elif 'total_bytes_estimate' in d:
-                        progress = int((d['downloaded_bytes'] / d['total_bytes_estimate']) * 100)
-                    else:
-                        progress = 0
-                    
-                    DownloadRequest.objects.filter(id=download_request.id).update(
-                        progress=min(progress, 99),
-                        status='processing'
-                    )
-                elif d['status'] == 'finished':
-                    DownloadRequest.objects.filter(id=download_request.id).update(
-                        progress=100,
-                        status='completed'
-                    )
-            
-            # Get best audio format
-            info_opts = {
-                'quiet': True, 
-                'skip_download': True,
-                'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'nocheckcertificate': True,
-                'ignoreerrors': True,
-            }
-            info = yt_dlp.YoutubeDL(info_opts).extract_info(
-                download_request.url, download=False
-            )
-            audio_format = self._get_best_audio_format(info.get('formats', []))
-            
-            ydl_opts = {
-                'outtmpl': filepath,
-                'format': audio_format or 'bestaudio',
-                'progress_hooks': [progress_hook],
-                'quiet': True,
-                'no_warnings': True,
-                # Anti-bot detection measures
-                'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'referer': 'https://www.youtube.com/',
-                'headers': {
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-us,en;q=0.5',
-                },
-                'nocheckcertificate': True,
-                'ignoreerrors': True,
-            }
-            
+
+            # Claims the job and keeps its heartbeat going through transcodes, trims and chapter cuts
+            resume = ResumeState(download_request)
+            resume.start_keepalive()
+            base_path = resume.base_path(os.path.join(self.download_dir, filename).replace('.%(ext)s', ''))
+            filepath = f"{base_path}.%(ext)s"
+            target = download_request.format_requested if download_request.format_requested in AUDIO_TARGETS else 'm4a'
+            artifact_store = ArtifactStore()
+            source_key = canonical_source(download_request.url)
+            window = download_request.section()
+            variant_key = self.artifact_variant_key(download_request)
+            chapters = self.requested_chapters(download_request)
+            cached_path = self._complete_from_artifact(download_request, artifact_store, source_key, variant_key,
+                                                       base_path, chapters)
+            if cached_path:
+                return cached_path
+
+            def on_progress(tracker):
+                resume.flush(progress=int(tracker.percent) if tracker.percent is not None else None)
+
+            # One extraction picks the source, preferring one that is already in the target codec
+            ydl_opts = self.bypass_helper.get_base_ydl_opts()
+            ydl_opts['format'] = SOURCE_SELECTORS[target]
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                fmt = ydl.extract_info(download_request.url, download=False)
+            if not fmt:
+                raise Exception("No audio could be extracted")
+
             download_request.status = 'processing'
             download_request.save()
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([download_request.url])
-            
-            # Find the actual downloaded file
-            base_path = filepath.replace('.%(ext)s', '')
-            for ext in ['.m4a', '.mp3', '.webm', '.ogg']:
-                if os.path.exists(base_path + ext):
-                    final_path = base_path + ext
-                    break
+
+            final_path = f"{base_path}.{target}"
+            fetch_started = time.monotonic()
+            if ffmpeg_readable(fmt):
+                transcode_to(fmt, final_path, target, window, callback=on_progress)
             else:
-                raise Exception("Downloaded file not found")
+                # Fragmented sources need yt-dlp's downloader; it converts once the fragments are in
+                final_path = self._download_audio_with_ytdlp(download_request, filepath, base_path, target, window,
+                                                             resume)
+            resume.check()
+            if can_copy(fmt, target):
+                # Only a copied stream is as big as what came over the wire
+                record_fetch(download_request, os.path.getsize(final_path), time.monotonic() - fetch_started)
+
+            if chapters:
+                resume.update(stage='splitting_chapters')
+                self._split_chapters(download_request, final_path, chapters)
+            resume.flush(force=True)  # Last claim check before the row is marked completed
             
             download_request.file_path = os.path.relpath(final_path, settings.MEDIA_ROOT)
             download_request.file_size = os.path.getsize(final_path)
+            download_request.file_format = target
             download_request.status = 'completed'
             download_request.progress = 100
             download_request.save()
+            resume.clear()
+
+            self._store_artifact(download_request, artifact_store, final_path, source_key, variant_key)
             
             return final_path
             
+        except ClaimLost:
+            raise  # The row belongs to the attempt that took over
         except Exception as e:
             logger.error(f"Audio download failed: {str(e)}")
             download_request.status = 'failed'
             download_request.error_message = str(e)
             download_request.save()
             raise e
+        finally:
+            if resume:
+                resume.stop_keepalive()
+
+    def _download_audio_with_ytdlp(self, download_request: DownloadRequest, filepath: str, base_path: str,
+                                   target: str, window=None, resume: Optional[ResumeState] = None) -> str:
+        """Fallback for sources ffmpeg can't open itself: yt-dlp fetches, then extracts to the target format"""
+        def progress_hook(d):
+            if d['status'] == 'downloading':
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                DownloadRequest.objects.filter(id=download_request.id).update(
+                    progress=min(int(d['downloaded_bytes'] / total * 100), 99) if total else 0,
+                    status='processing'
+                )
+
+        ydl_opts = {
+            'outtmpl': filepath,
+            'format': SOURCE_SELECTORS[target],
+            'progress_hooks': [progress_hook] + ([resume.ytdlp_hook] if resume else []),
+            'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': target}],
+            **resilient_ydl_opts(),
+        }
+        if window:
+            ydl_opts.update(section_ydl_opts(window))
+        if not self.bypass_helper.download_with_fallback(download_request.url, ydl_opts):
+            raise Exception("All download strategies failed")
+
+        final_path = f"{base_path}.{target}"
+        if not os.path.exists(final_path):
+            raise Exception("Downloaded file not found")
+        if window:
+            trim_section(final_path, window)
+        return final_path
@@ -0,0 +1,195 @@
+"""
+Format sizes: a bitrate estimate at once, then exact lengths from the CDN, probed concurrently under a time budget
+"""
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from typing import Dict, Any, Optional, List, Iterator, Tuple, Union
+from urllib.parse import urlparse, parse_qs
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.cache import cache
+from core.artifacts import canonical_source
+from .format_index import FormatIndex
+from .planner import expected_bytes
+
+logger = logging.getLogger(__name__)
+
+# Only plain files have one length to ask for; manifests and fragment lists don't
+PROBE_PROTOCOLS = {'http', 'https'}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _shared_session() -> requests.Session:
+    """One keep-alive pool for every probe, so repeat lookups against the same CDN skip the TLS handshake"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.FORMAT_SIZE_PROBE_WORKERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def url_length(fmt: Dict[str, Any]) -> Optional[int]:
+    """Length a googlevideo-style URL already states in its clen parameter - exact, no request needed"""
+    values = parse_qs(urlparse(fmt.get('url') or '').query).get('clen')
+    if values and values[0].isdigit() and int(values[0]) > 0:
+        return int(values[0])
+    return None
+
+
+def probe_length(fmt: Dict[str, Any], timeout: float, session: Optional[requests.Session] = None) -> Optional[int]:
+    """Content length of a format's URL: a HEAD, else a one-byte range request for servers that don't answer HEAD"""
+    session = session or _shared_session()
+    headers = {**(fmt.get('http_headers') or {}), 'Accept-Encoding': 'identity'}
+    response = session.head(fmt['url'], headers=headers, timeout=timeout, allow_redirects=True)
+    length = response.headers.get('Content-Length', '')
+    if response.ok and length.isdigit() and int(length) > 0:
+        return int(length)
+
+    with session.get(fmt['url'], headers={**headers, 'Range': 'bytes=0-0'}, stream=True, timeout=timeout) as response:
+        if response.status_code == 206:
+            total = response.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+            if total.isdigit():
+                return int(total)
+        elif response.ok:
+            length = response.headers.get('Content-Length', '')
+            if length.isdigit():
+                return int(length)
+    return None
+
+
+class SizeResolver:
+    """Sizes for the entries get_available_formats lists, each the sum of the formats its plan fetches
+
+    estimate() answers from what is already known - yt-dlp's filesize, a length cached by an earlier
+    probe, a clen in the URL - and falls back to bitrate x duration. refine() probes the rest over
+    the shared pool and yields each entry as soon as its last part is known; whatever hasn't answered
+    when the budget runs out keeps its estimate.
+    """
+
+    def __init__(self, url: str, formats: Union[FormatIndex, List[Dict[str, Any]]], duration: Optional[float] = None,
+                 budget: Optional[float] = None, max_workers: Optional[int] = None):
+        self.index = FormatIndex.of(formats)
+        self.duration = duration
+        self.budget = settings.FORMAT_SIZE_PROBE_BUDGET if budget is None else budget
+        self.max_workers = max_workers or settings.FORMAT_SIZE_PROBE_WORKERS
+        self._source = hashlib.sha256(canonical_source(url).encode()).hexdigest()[:32]
+        self._exact: Dict[str, Tuple[int, str]] = {}
+
+    def _cache_key(self, format_id: str) -> str:
+        # Format ids are stable per video while their URLs expire, so lengths are cached by id
+        return f"format_size_{self._source}_{format_id}"
+
+    def known(self, format_id: str) -> Optional[Tuple[int, str]]:
+        """(bytes, 'filesize' | 'url' | 'cache' | 'probe') when the exact size of one format is known"""
+        if format_id in self._exact:
+            return self._exact[format_id]
+        record = self.index.get(format_id)
+        if record is None:
+            return None
+        found = None
+        if record.info.get('filesize'):
+            found = (int(record.info['filesize']), 'filesize')
+        elif url_length(record.info):
+            found = (url_length(record.info), 'url')
+        else:
+            cached = cache.get(self._cache_key(format_id))
+            if cached:
+                found = (cached, 'cache')
+        if found:
+            self._exact[format_id] = found
+        return found
+
+    @staticmethod
+    def parts(entry: Dict[str, Any]) -> List[str]:
+        """Concrete format ids an entry fetches - '208+140/bestvideo[...]' is 208 and 140"""
+        ids = str(entry.get('format_id') or '').split('/')[0].split('+')
+        return ids if all(part and not any(char in part for char in '[]<>=') for part in ids) else []
+
+    def estimate(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fill filesize / filesize_exact on every entry from what is known now; no network"""
+        for entry in entries:
+            parts = [self.index.get(part) for part in self.parts(entry)]
+            if not parts or None in parts:
+                entry.setdefault('filesize_exact', False)
+                continue
+            total = 0
+            exact = True
+            for record in parts:
+                known = self.known(record.format_id)
+                if known:
+                    total += known[0]
+                    continue
+                exact = False
+                size = expected_bytes(record.info, self.duration)
+                if size is None:
+                    total = None
+                    break
+                total += size
+            entry['filesize'] = total if total is not None else entry.get('filesize')
+            entry['filesize_exact'] = exact
+        return entries
+
+    def _probeable(self, format_id: str) -> bool:
+        record = self.index.get(format_id)
+        return (record is not None and record.has_url and record.protocol in PROBE_PROTOCOLS
+                and self.known(format_id) is None)
+
+    def refine(self, entries: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Probe the parts still unknown and yield {format_id, quality, filesize, filesize_exact, source}
+        for each entry as it becomes exact"""
+        started = time.monotonic()
+        waiting = [entry for entry in entries if not entry.get('filesize_exact') and self.parts(entry)]
+        pending = sorted({part for entry in waiting for part in self.parts(entry) if self._probeable(part)})
+        if not pending:
+            return
+
+        def resolved(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            found = [self.known(part) for part in self.parts(entry)]
+            if None in found:
+                return None
+            return {
+                'format_id': entry['format_id'],
+                'quality': entry.get('quality'),
+                'filesize': sum(size for size, _ in found),
+                'filesize_exact': True,
+                'source': 'probe' if any(source == 'probe' for _, source in found) else found[0][1],
+            }
+
+        pool = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(pending))))
+        futures = {pool.submit(probe_length, self.index.get(part).info, self.budget): part for part in pending}
+        try:
+            for future in as_completed(futures, timeout=self.budget):
+                part = futures[future]
+                try:
+                    length = future.result()
+                except Exception as e:
+                    logger.debug(f"Size probe for format {part} failed: {str(e)}")
+                    continue
+                if not length:
+                    continue
+                self._exact[part] = (length, 'probe')
+                cache.set(self._cache_key(part), length, timeout=settings.FORMAT_SIZE_CACHE_TIMEOUT)
+                # One audio track is usually shared by several entries; each goes out once its video is in too
+                for entry in list(waiting):
+                    update = resolved(entry)
+                    if update:
+                        waiting.remove(entry)
+                        entry['filesize'] = update['filesize']
+                        entry['filesize_exact'] = True
+                        yield update
+        except FuturesTimeoutError:
+            logger.info(f"Size probes hit the {self.budget}s budget with {len(waiting)} entries still estimated")
+        finally:
+            # Probes still in flight end on their own timeout; nothing waits for them
+            pool.shutdown(wait=False, cancel_futures=True)
+            logger.debug(f"Probed {len(pending)} format sizes in {time.monotonic() - started:.2f}s")
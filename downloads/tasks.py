@@ -1,18 +1,30 @@
 from celery import shared_task
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from .models import DownloadRequest
 from .services import DownloadService
+from .resume import retry_backoff, ClaimLost
 import logging
 
 logger = logging.getLogger(__name__)
 
-@shared_task(bind=True)
+# acks_late + reject_on_worker_lost: a worker killed mid-download puts the message back on the queue
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
 def process_download_task(self, download_id: str):
     """Background task to process video download"""
     try:
         download_request = DownloadRequest.objects.get(id=download_id)
+        if download_request.status in ('completed', 'cancelled'):
+            # Redelivered after the work was already done (or the user gave up on it)
+            return f"Download {download_id} already {download_request.status}"
+
+        DownloadRequest.objects.filter(id=download_id).update(attempts=F('attempts') + 1)
+        download_request.refresh_from_db()
         download_service = DownloadService()
-        
+
         # Extract video info first
         try:
             video_info = download_service.get_video_info(download_request.url)
@@ -20,16 +32,20 @@ def process_download_task(self, download_id: str):
             download_request.save()
         except Exception as e:
             logger.warning(f"Could not extract video info: {str(e)}")
-        
+
         # Download the video/audio
-        if download_request.format in ['mp3', 'm4a', 'wav', 'flac']:
+        if download_request.format_requested in ['mp3', 'm4a', 'wav', 'flac']:
             file_path = download_service.download_audio(download_request)
         else:
             file_path = download_service.download_video(download_request)
-        
+
         logger.info(f"Download completed: {file_path}")
         return f"Download completed: {download_request.title}"
-        
+
+    except ClaimLost as e:
+        # Written off as stalled and re-queued while still running - the new attempt owns the job now
+        logger.warning(str(e))
+        return f"Download {download_id} handed over to another attempt"
     except DownloadRequest.DoesNotExist:
         error_msg = f"Download request {download_id} not found"
         logger.error(error_msg)
@@ -37,7 +53,16 @@ def process_download_task(self, download_id: str):
     except Exception as e:
         error_msg = f"Download failed: {str(e)}"
         logger.error(error_msg)
-        
+
+        attempts = DownloadRequest.objects.filter(id=download_id).values_list('attempts', flat=True).first() or 0
+        if attempts < settings.DOWNLOAD_MAX_ATTEMPTS:
+            # Keep resume_state and the partial files - the next attempt continues from them
+            countdown = retry_backoff(attempts)
+            DownloadRequest.objects.filter(id=download_id).update(status='pending', error_message=str(e))
+            logger.info(f"Retrying download {download_id} in {countdown:.1f}s "
+                        f"(attempt {attempts + 1}/{settings.DOWNLOAD_MAX_ATTEMPTS})")
+            raise self.retry(exc=e, countdown=countdown, max_retries=settings.DOWNLOAD_MAX_ATTEMPTS)
+
         # Update the download request with error
         try:
             download_request = DownloadRequest.objects.get(id=download_id)
@@ -46,5 +71,45 @@ def process_download_task(self, download_id: str):
             download_request.save()
         except:
             pass
-        
+
         return error_msg
+
+
+@shared_task
+def requeue_stalled_downloads():
+    """Periodic task: re-queue downloads whose worker stopped sending heartbeats
+
+    A running job heartbeats from a side thread for its whole lifetime, not only while bytes arrive,
+    so a stale heartbeat means the worker process is gone (or frozen solid). Re-queueing also revokes
+    the job's claim, so a frozen worker that wakes up stops at its next heartbeat instead of writing
+    next to the new attempt.
+    """
+    cutoff = timezone.now() - timezone.timedelta(seconds=settings.DOWNLOAD_STALL_TIMEOUT)
+    requeued = 0
+    for download_request in DownloadRequest.objects.filter(status='processing'):
+        state = dict(download_request.resume_state or {})
+        heartbeat_text = state.get('heartbeat')
+        heartbeat = parse_datetime(heartbeat_text or '')
+        last_seen = heartbeat or download_request.started_at or download_request.created_at
+        if last_seen >= cutoff:
+            continue
+
+        if download_request.attempts >= settings.DOWNLOAD_MAX_ATTEMPTS:
+            state.pop('claim', None)
+            download_request.status = 'failed'
+            download_request.error_message = 'Download stalled and ran out of retry attempts'
+            download_request.resume_state = state
+            download_request.save()
+            continue
+
+        state.pop('claim', None)
+        rows = DownloadRequest.objects.filter(id=download_request.id, status='processing')
+        if heartbeat_text:
+            rows = rows.filter(resume_state__heartbeat=heartbeat_text)
+        if not rows.update(status='pending', resume_state=state):
+            continue  # It beat (or finished) since we looked - alive after all
+        process_download_task.delay(str(download_request.id))
+        requeued += 1
+        logger.info(f"Re-queued stalled download {download_request.id} (last heartbeat {last_seen})")
+
+    return {'requeued': requeued}
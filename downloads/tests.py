@@ -1,3 +1,776 @@
-from django.test import TestCase
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+import requests
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlencode
+from unittest import mock
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from .models import DownloadChapter, DownloadRequest
+from .resume import ResumeState, ClaimLost
+from .tasks import requeue_stalled_downloads
+from .segmented import SegmentedDownloader, SegmentedDownloadError
+from .range_cache import RangeCache, sign_cache_key
+from .planner import plan_formats, plan_format_id, format_selector, _target_height
+from .format_index import FormatIndex
+from .sizes import SizeResolver, url_length
+from .audio import can_copy, ffmpeg_readable, output_options
+from .sections import section_key, section_window, trim_section
 
-# Create your tests here.
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves server.payload, honouring Range; server.fail_once drops the first response for those ranges midway"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        payload = self.server.payload
+        start, end = 0, len(payload) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match and self.server.ranges:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), end) if match.group(2) else end
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+
+        with self.server.lock:
+            self.server.requests.append(self.headers.get('Range'))
+            fail = start in self.server.fail_once
+            self.server.fail_once.discard(start)
+        if fail:
+            # Half the range, then the connection goes away
+            self.wfile.write(payload[start:start + (end - start + 1) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(payload[start:end + 1])
+
+
+class RangeServerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        self.server.payload = os.urandom(100_000)
+        self.server.ranges = True
+        self.server.fail_once = set()
+        self.server.requests = []
+        self.server.lock = threading.Lock()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/media.mp4"
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def downloader(self, **kwargs):
+        downloader = SegmentedDownloader(self.url, max_connections=4, segment_size=16_384, timeout=5, **kwargs)
+        self.addCleanup(downloader.close)
+        return downloader
+
+
+@override_settings(SEGMENTED_DOWNLOAD_INITIAL_CONNECTIONS=2)
+class SegmentedDownloaderTests(RangeServerTestCase):
+    def test_probe_reads_length_and_range_support(self):
+        downloader = self.downloader()
+        self.assertEqual(downloader.probe()['length'], 100_000)
+        self.assertTrue(downloader.accepts_ranges)
+
+    def test_plan_segments_covers_every_byte_once(self):
+        downloader = self.downloader()
+        downloader.probe()
+        segments = downloader.plan_segments()
+        self.assertEqual(segments[0], (0, 16_383))
+        self.assertEqual(segments[-1][1], 99_999)
+        self.assertEqual(sum(end - start + 1 for start, end in segments), 100_000)
+        self.assertTrue(all(b[0] == a[1] + 1 for a, b in zip(segments, segments[1:])))
+
+    def test_plan_segments_skips_completed_ranges(self):
+        downloader = self.downloader()
+        downloader.probe()
+        segments = downloader.plan_segments(completed=[(0, 16_383), [32_768, 49_151]])
+        self.assertNotIn((0, 16_383), segments)
+        self.assertNotIn((32_768, 49_151), segments)
+        self.assertIn((16_384, 32_767), segments)
+
+    def test_plan_segments_between_offsets(self):
+        downloader = self.downloader()
+        downloader.probe()
+        self.assertEqual(downloader.plan_segments(first=10_000, last=40_000), [(10_000, 26_383), (26_384, 40_000)])
+
+    def test_download_reassembles_the_file(self):
+        path = os.path.join(self.tmp, 'out.bin')
+        progress = []
+        length = self.downloader().download_to_file(path, progress_callback=lambda done, total: progress.append(done))
+        self.assertEqual(length, 100_000)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.server.payload)
+        self.assertEqual(progress[-1], 100_000)
+        self.assertGreater(len([r for r in self.server.requests if r != 'bytes=0-0']), 1)
+
+    def test_dropped_segment_resumes_where_it_stopped(self):
+        self.server.fail_once = {16_384, 65_536}
+        path = os.path.join(self.tmp, 'out.bin')
+        self.downloader().download_to_file(path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.server.payload)
+        # Each dropped range was asked for again (from wherever it stopped), nothing else was
+        ends = [r.rsplit('-', 1)[1] for r in self.server.requests if r != 'bytes=0-0']
+        self.assertEqual(sorted(end for end in set(ends) if ends.count(end) > 1), ['32767', '81919'])
+
+    def test_failures_past_the_retry_limit_raise(self):
+        downloader = self.downloader(segment_retries=0)
+        downloader.probe()
+        self.server.fail_once = {0}
+        with self.assertRaises((SegmentedDownloadError, requests.exceptions.RequestException)):
+            downloader.download_to_file(os.path.join(self.tmp, 'out.bin'))
+
+    def test_only_missing_segments_are_fetched_on_resume(self):
+        path = os.path.join(self.tmp, 'out.bin')
+        with open(path, 'wb') as f:
+            f.write(self.server.payload[:32_768])
+        self.downloader().download_to_file(path, completed=[(0, 16_383), (16_384, 32_767)])
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.server.payload)
+        self.assertNotIn('bytes=0-16383', self.server.requests)
+        self.assertNotIn('bytes=16384-32767', self.server.requests)
+
+    def test_iter_content_yields_bytes_in_order(self):
+        data = b''.join(self.downloader().iter_content(chunk_size=10_000, start=5_000, end=70_000))
+        self.assertEqual(data, self.server.payload[5_000:70_001])
+
+    def test_server_without_ranges_is_not_segmented(self):
+        self.server.ranges = False
+        downloader = self.downloader()
+        self.assertFalse(downloader.supports_segmentation(min_size=0))
+        with self.assertRaises(SegmentedDownloadError):
+            downloader.download_to_file(os.path.join(self.tmp, 'out.bin'))
+
+
+class PlannedSegmentedDownloadTests(RangeServerTestCase):
+    """download_video fetches the planned progressive file itself instead of resolving the selector again"""
+    databases = {'default'}
+
+    def plan(self, protocol='https', audio=None):
+        video = {'format_id': '18', 'ext': 'mp4', 'url': self.url, 'protocol': protocol}
+        return {'video': video, 'audio': audio}
+
+    def test_planned_progressive_file_is_fetched(self):
+        from .services import DownloadService
+        service = DownloadService()
+        job = DownloadRequest(url='https://youtu.be/abc')
+        with mock.patch('downloads.services.yt_dlp.YoutubeDL') as ydl:
+            path = service._try_segmented_download(job, service._progressive_format(self.plan()),
+                                                   os.path.join(self.tmp, 'video'))
+        ydl.assert_not_called()
+        self.assertEqual(path, os.path.join(self.tmp, 'video.mp4'))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.server.payload)
+
+    def test_merges_and_fragments_are_left_to_ytdlp(self):
+        from .services import DownloadService
+        self.assertIsNone(DownloadService._progressive_format(self.plan(audio={'format_id': '140'})))
+        self.assertIsNone(DownloadService._progressive_format(self.plan(protocol='m3u8_native')))
+        self.assertIsNone(DownloadService._progressive_format(None))
+
+
+class RangeCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.cache = RangeCache(root=self.root, max_bytes=150)
+
+    def filled(self, format_id, age=0):
+        entry = self.cache.entry('youtube:abc', format_id)
+        entry.set_length(100)
+        list(entry.fill(0, iter([b'x' * 100])))
+        if age:
+            past = time.time() - age
+            for path in (entry.data_path, entry.index_path):
+                os.utime(path, (past, past))
+        return entry
+
+    def keys(self):
+        return sorted(entry.key for entry in self.cache._entries())
+
+    def test_evicts_idle_entries_down_to_budget(self):
+        self.filled('18', age=600)
+        self.filled('22', age=300)
+        self.cache.evict()
+        self.assertEqual(self.keys(), ['youtube:abc:22'])
+
+    def test_recently_written_entries_are_not_evicted(self):
+        self.filled('18')
+        self.filled('22')
+        self.cache.evict()
+        self.assertEqual(self.keys(), ['youtube:abc:18', 'youtube:abc:22'])
+
+    def test_entry_being_filled_is_not_evicted(self):
+        self.filled('18', age=600)
+        entry = self.cache.entry('youtube:abc', '22')
+        entry.set_length(100)
+        filling = entry.fill(0, iter([b'y' * 50, b'y' * 50]))
+        next(filling)
+        os.utime(entry.data_path, (time.time() - 600, time.time() - 600))
+        self.cache.evict()
+        self.assertIn('youtube:abc:22', self.keys())
+        list(filling)
+        self.assertTrue(entry.is_complete())
+
+    def test_commit_after_eviction_records_nothing(self):
+        entry = self.cache.entry('youtube:abc', '18')
+        entry.set_length(100)
+        filling = entry.fill(0, iter([b'z' * 50, b'z' * 50]))
+        next(filling)
+        entry.delete()  # Evicted by another process mid-fill
+        entry.set_length(100)  # ...and recreated by the next request
+        list(filling)
+        self.assertEqual(entry.cached_bytes(), 0)
+        self.assertFalse(entry.is_complete(0, 50))
+
+
+    def test_evicted_entry_passes_upstream_bytes_through(self):
+        entry = self.cache.entry('youtube:abc', '18')
+        entry.set_length(100)
+        entry.delete()  # Evicted by another process between plan() and fill()
+        self.assertEqual(b''.join(entry.fill(0, iter([b'a' * 60, b'b' * 40]))), b'a' * 60 + b'b' * 40)
+
+    def test_evicted_cached_span_is_fetched_again(self):
+        entry = self.filled('18')
+        entry.plan = lambda start, end: [(start, end, True)]  # Planned while the bytes were still there
+        entry.delete()
+        data = b''.join(entry.stream(10, 30, lambda first, last: iter([b'u' * (last - first + 1)])))
+        self.assertEqual(data, b'u' * 20)
+
+class ProxyRangeTests(RangeServerTestCase):
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        override = override_settings(PROXY_CACHE_DIR=cache_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        token = sign_cache_key('youtube:abc', '18', self.url)
+        self.path = '/api/downloads/proxy-download/?' + urlencode({'direct_url': self.url, 'cache_key': token})
+
+    def test_range_is_served_from_cache(self):
+        response = self.client.get(self.path, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/100000')
+        self.assertEqual(b''.join(response.streaming_content), self.server.payload[100:200])
+
+    def test_unsatisfiable_range_is_416(self):
+        for value in ('bytes=200000-', 'bytes=500-100', 'bytes=-0', 'items=0-10', 'bytes=abc'):
+            response = self.client.get(self.path, HTTP_RANGE=value)
+            self.assertEqual(response.status_code, 416, value)
+            self.assertEqual(response['Content-Range'], 'bytes */100000')
+
+
+class ResumeClaimTests(TestCase):
+    def setUp(self):
+        self.job = DownloadRequest.objects.create(url='https://youtu.be/abc', status='processing')
+
+    def test_takeover_stops_the_previous_attempt(self):
+        first = ResumeState(self.job)
+        first.flush(force=True)
+        second = ResumeState(DownloadRequest.objects.get(id=self.job.id))
+        with self.assertRaises(ClaimLost):
+            first.flush(force=True)
+        with self.assertRaises(ClaimLost):
+            first.check()
+        second.flush(force=True, progress=40)
+        self.assertEqual(DownloadRequest.objects.get(id=self.job.id).progress, 40)
+
+    @override_settings(DOWNLOAD_STALL_TIMEOUT=60, DOWNLOAD_MAX_ATTEMPTS=3)
+    def test_requeue_revokes_the_claim_of_a_stalled_job(self):
+        resume = ResumeState(self.job)
+        stale = (timezone.now() - timezone.timedelta(seconds=600)).isoformat()
+        DownloadRequest.objects.filter(id=self.job.id).update(resume_state={**resume.state, 'heartbeat': stale})
+        with mock.patch('downloads.tasks.process_download_task.delay') as delay:
+            self.assertEqual(requeue_stalled_downloads(), {'requeued': 1})
+        delay.assert_called_once_with(str(self.job.id))
+        job = DownloadRequest.objects.get(id=self.job.id)
+        self.assertEqual(job.status, 'pending')
+        self.assertNotIn('claim', job.resume_state)
+        with self.assertRaises(ClaimLost):
+            resume.flush(force=True)
+
+    @override_settings(DOWNLOAD_STALL_TIMEOUT=60)
+    def test_live_job_is_left_alone(self):
+        ResumeState(self.job).flush(force=True)
+        with mock.patch('downloads.tasks.process_download_task.delay') as delay:
+            self.assertEqual(requeue_stalled_downloads(), {'requeued': 0})
+        delay.assert_not_called()
+        self.assertEqual(DownloadRequest.objects.get(id=self.job.id).status, 'processing')
+
+
+class ResumeKeepaliveTests(TransactionTestCase):
+    """The keepalive thread writes on its own connection, so it needs committed rows"""
+
+    def setUp(self):
+        self.job = DownloadRequest.objects.create(url='https://youtu.be/abc', status='processing')
+
+    def test_keepalive_heartbeats_without_progress(self):
+        resume = ResumeState(self.job)
+        resume.flush(force=True)
+        before = DownloadRequest.objects.get(id=self.job.id).resume_state['heartbeat']
+        resume.start_keepalive(interval=0.05)
+        try:
+            time.sleep(0.3)
+        finally:
+            resume.stop_keepalive()
+        self.assertNotEqual(DownloadRequest.objects.get(id=self.job.id).resume_state['heartbeat'], before)
+
+
+class DownloadIdValidationTests(SimpleTestCase):
+    def test_cancel_rejects_ids_that_are_not_uuids(self):
+        for download_id in ('../media/downloads/*', 'abc', '*'):
+            response = self.client.post('/api/downloads/cancel-download/', {'download_id': download_id})
+            self.assertEqual(response.status_code, 400, download_id)
+
+    def test_stream_rejects_ids_that_are_not_uuids(self):
+        response = self.client.get('/api/downloads/stream/', {'url': 'https://youtu.be/abc',
+                                                               'download_id': '../../etc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'download_id must be a UUID')
+
+
+class PlannedDownloadTests(TestCase):
+    """The download job fetches and caches under the same plan the plan endpoint describes"""
+
+    INFO = {
+        'title': 'Clip', 'duration': 60,
+        'formats': [
+            {'format_id': '18', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360, 'width': 640,
+             'tbr': 700, 'url': 'https://cdn.example/18'},
+            {'format_id': '136', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'width': 1280,
+             'tbr': 2500, 'url': 'https://cdn.example/136'},
+            {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a', 'abr': 128,
+             'url': 'https://cdn.example/140'},
+        ],
+    }
+
+    def setUp(self):
+        patcher = mock.patch('downloads.youtube_bypass.YouTubeBypassHelper.extract_video_info_with_retry',
+                             return_value=self.INFO)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_job_plans_the_requested_quality(self):
+        from .services import DownloadService
+        job = DownloadRequest(url='https://youtu.be/abc', format_requested='mp4', quality_requested='720p')
+        plan, selector = DownloadService().plan_video(job)
+        self.assertEqual(plan['format_id'], '136+140')
+        self.assertTrue(selector.startswith('136+140/'))
+
+    def test_cached_check_uses_the_job_key(self):
+        from .services import DownloadService
+        job = DownloadRequest(url='https://youtu.be/abc', format_requested='mp4', quality_requested='720p')
+        with mock.patch('downloads.views.ArtifactStore.lookup', return_value=None) as lookup:
+            response = self.client.get('/api/downloads/plan/', {'url': job.url, 'quality': '720p'})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(lookup.call_args[0][1], DownloadService().artifact_variant_key(job))
+        self.assertEqual(response.data['format_selector'], DownloadService().plan_video(job)[1])
+
+
+def _fmt(format_id, height=0, vcodec='none', acodec='none', ext='mp4', tbr=None, abr=None, **extra):
+    return {'format_id': format_id, 'height': height, 'width': height * 16 // 9, 'vcodec': vcodec,
+            'acodec': acodec, 'ext': ext, 'tbr': tbr, 'abr': abr, 'url': f'https://cdn.example/{format_id}',
+            'protocol': 'https', **extra}
+
+
+AUDIO_140 = _fmt('140', acodec='mp4a.40.2', ext='m4a', abr=128)
+
+
+class FormatPlannerTests(SimpleTestCase):
+    """Which formats a quality/container plan picks, and what it costs"""
+    BANDWIDTH = 10 * 1024 * 1024
+
+    def plan(self, formats, quality='720p', container='mp4', **kwargs):
+        return plan_formats(formats, quality, container, 600, bandwidth=self.BANDWIDTH, **kwargs)
+
+    def test_single_file_beats_a_merge_of_the_same_size(self):
+        formats = [_fmt('22', 720, 'avc1.64001F', 'mp4a.40.2', tbr=2628), _fmt('136', 720, 'avc1.4d401f', tbr=2500),
+                   AUDIO_140]
+        plan = self.plan(formats)
+        self.assertEqual(plan['format_id'], '22')
+        self.assertEqual(plan['operation'], 'download')
+        self.assertIn('136+140', [other['format_id'] for other in plan['alternatives']])
+
+    def test_video_only_formats_are_merged(self):
+        plan = self.plan([_fmt('136', 720, 'avc1.4d401f', tbr=2500), AUDIO_140])
+        self.assertEqual(plan['format_id'], '136+140')
+        self.assertEqual(plan['operation'], 'merge')
+        self.assertGreater(plan['breakdown']['mux'], 0)
+
+    def test_native_codec_beats_a_smaller_non_native_one(self):
+        formats = [_fmt('136', 720, 'avc1.4d401f', tbr=2500), _fmt('247', 720, 'vp09.00.31.08', ext='webm', tbr=1500),
+                   AUDIO_140]
+        plan = self.plan(formats)
+        self.assertEqual(plan['format_id'], '136+140')
+        vp9 = next(other for other in plan['alternatives'] if other['format_id'] == '247+140')
+        self.assertLess(vp9['breakdown']['fetch'], plan['breakdown']['fetch'])
+        self.assertGreater(vp9['breakdown']['portability'], 0)
+
+    def test_codec_the_container_cannot_hold_is_encoded(self):
+        formats = [_fmt('247', 720, 'vp09.00.31.08', ext='webm', tbr=1500), _fmt('251', acodec='opus', ext='webm', abr=130)]
+        plan = self.plan(formats, container='mov')
+        self.assertEqual(plan['operation'], 'transcode')
+        self.assertEqual(plan['steps'], {'video': 'encode', 'audio': 'encode'})
+
+    def test_missing_height_falls_back_below_then_above(self):
+        self.assertEqual(_target_height((360, 720), '1080p'), 720)
+        self.assertEqual(_target_height((360, 720), '480p'), 360)
+        self.assertEqual(_target_height((360, 720), '144p'), 360)
+        self.assertEqual(_target_height((360, 720), 'best'), 720)
+        self.assertIsNone(_target_height((), '720p'))
+        self.assertEqual(self.plan([_fmt('18', 360, 'avc1', 'mp4a', tbr=700)], '1080p')['height'], 360)
+
+    def test_no_merge_returns_a_silent_single_file(self):
+        plan = self.plan([_fmt('136', 720, 'avc1.4d401f', tbr=2500), AUDIO_140], allow_merge=False)
+        self.assertEqual(plan['format_id'], '136')
+        self.assertIsNone(plan['audio'])
+        self.assertEqual(list(plan['steps']), ['video'])
+
+    def test_audio_quality_plans_the_best_audio(self):
+        formats = [AUDIO_140, _fmt('139', acodec='mp4a.40.5', ext='m4a', abr=48)]
+        plan = self.plan(formats, 'audio', 'm4a')
+        self.assertEqual(plan['format_id'], '140')
+        self.assertIsNone(plan['video'])
+
+    def test_explicit_format_ids(self):
+        formats = [_fmt('22', 720, 'avc1', 'mp4a', tbr=2628), _fmt('136', 720, 'avc1', tbr=2500), AUDIO_140]
+        self.assertEqual(plan_format_id(formats, '136+140')['operation'], 'merge')
+        self.assertEqual(plan_format_id(formats, '22')['steps'], {'video': 'copy', 'audio': 'copy'})
+        self.assertIsNone(plan_format_id(formats, '999'))
+
+    def test_format_selector_falls_back_to_the_planned_height(self):
+        plan = self.plan([_fmt('136', 720, 'avc1', tbr=2500), AUDIO_140])
+        self.assertEqual(format_selector(plan, '720p'),
+                         '136+140/bestvideo[height<=720]+bestaudio/best[height<=720]/best')
+        self.assertEqual(format_selector(None, 'audio'), 'bestaudio/best')
+        self.assertEqual(format_selector(None, '720p'), 'best')
+
+
+class FormatIndexTests(SimpleTestCase):
+    """Buckets and audio ranking an extraction is indexed into"""
+
+    FORMATS = [
+        _fmt('18', 360, 'avc1.42001E', 'mp4a.40.2', tbr=600),
+        _fmt('136', 720, 'avc1.4d401f', tbr=2500),
+        _fmt('247', 720, 'vp09.00.31.08', ext='webm', tbr=1500),
+        _fmt('137', 1080, 'avc1.640028', tbr=4500),
+        _fmt('140-drc', acodec='mp4a.40.2', ext='m4a', abr=129, format_note='English original, medium, DRC'),
+        _fmt('140', acodec='mp4a.40.2', ext='m4a', abr=129, format_note='English original, medium'),
+        _fmt('251-1', acodec='opus', ext='webm', abr=160, format_note='Spanish, high'),
+        _fmt('251', acodec='opus', ext='webm', abr=135, format_note='English original, medium'),
+        {'format_id': 'sb0', 'ext': 'mhtml', 'vcodec': 'none', 'acodec': 'none'},
+        {'ext': 'mp4', 'vcodec': 'avc1'},  # No format_id - not selectable
+    ]
+
+    def setUp(self):
+        self.index = FormatIndex(self.FORMATS)
+
+    def test_buckets(self):
+        self.assertEqual(len(self.index), 9)
+        self.assertEqual([record.format_id for record in self.index.combined], ['18'])
+        self.assertEqual([record.format_id for record in self.index.video], ['136', '247', '137'])
+        self.assertEqual(self.index.heights, (360, 720, 1080))
+        self.assertEqual([record.format_id for record in self.index.at_height(720)], ['136', '247'])
+        self.assertEqual(self.index.heights_between(360, 1080), (360, 720))
+        self.assertEqual(self.index.heights_between(min_height=720), (720, 1080))
+        self.assertIsNone(self.index.get('sb0').kind)
+
+    def test_original_full_range_track_ranks_first(self):
+        # Original language beats a higher-bitrate dub; the -drc copy sits behind the full-range one
+        self.assertEqual([record.format_id for record in self.index.audio], ['251', '140', '140-drc', '251-1'])
+        self.assertEqual(self.index.best_audio.format_id, '251')
+        self.assertEqual(self.index.best_audio_with_ext('m4a').format_id, '140')
+        self.assertIsNone(self.index.best_audio_with_ext('mp3'))
+
+    def test_records_normalize_codecs(self):
+        self.assertEqual(self.index.get('247').video_codec, 'vp9')
+        self.assertEqual(self.index.get('18').audio_codec, 'aac')
+        self.assertTrue(self.index.get('18').has_audio and self.index.get('18').has_video)
+        self.assertIn('137', self.index)
+        self.assertNotIn('999', self.index)
+        with self.assertRaises(AttributeError):
+            self.index.get('137').height = 2160
+
+    def test_of_passes_an_index_through_and_reindexes_lists(self):
+        self.assertIs(FormatIndex.of(self.index), self.index)
+        formats = list(self.FORMATS)
+        FormatIndex.of(formats)
+        formats[1] = _fmt('299', 1080, 'avc1.64002a', tbr=6000)  # Changed in place, same length
+        self.assertIn('299', FormatIndex.of(formats))
+        self.assertEqual(len(FormatIndex.of(None)), 0)
+
+
+class SizeResolverTests(SimpleTestCase):
+    """Entry sizes from what an extraction already states, without touching the network"""
+
+    URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+    def resolver(self, formats, duration=100):
+        resolver = SizeResolver(self.URL, formats, duration=duration, budget=1)
+        for fmt in formats:
+            self.addCleanup(cache.delete, resolver._cache_key(fmt['format_id']))
+        return resolver
+
+    def test_parts_takes_the_first_alternative(self):
+        self.assertEqual(SizeResolver.parts({'format_id': '137+140'}), ['137', '140'])
+        self.assertEqual(SizeResolver.parts({'format_id': '208+140/bestvideo[height<=720]+bestaudio/best'}),
+                         ['208', '140'])
+        self.assertEqual(SizeResolver.parts({'format_id': 22}), ['22'])
+        self.assertEqual(SizeResolver.parts({'format_id': 'bestvideo[height<=720]+bestaudio'}), [])
+        self.assertEqual(SizeResolver.parts({'format_id': '137+'}), [])
+        self.assertEqual(SizeResolver.parts({}), [])
+
+    def test_url_length_reads_clen(self):
+        self.assertEqual(url_length({'url': 'https://rr1.googlevideo.com/videoplayback?itag=140&clen=3433514&dur=212'}),
+                         3433514)
+        self.assertIsNone(url_length({'url': 'https://cdn.example/v.mp4?clen=0'}))
+        self.assertIsNone(url_length({'url': 'https://cdn.example/v.mp4?clen=12ab'}))
+        self.assertIsNone(url_length({'url': 'https://cdn.example/v.mp4'}))
+        self.assertIsNone(url_length({}))
+
+    def test_estimate_sums_exact_and_estimated_parts(self):
+        formats = [
+            _fmt('137', 1080, 'avc1.640028', tbr=4000),
+            _fmt('136', 720, 'avc1.4d401f', tbr=2500, filesize=20_000_000),
+            _fmt('140', acodec='mp4a.40.2', ext='m4a', abr=128,
+                 url='https://rr1.googlevideo.com/videoplayback?itag=140&clen=1600000'),
+            _fmt('299', 1080, 'avc1.64002a'),  # No size or bitrate to go on
+        ]
+        resolver = self.resolver(formats)
+        entries = resolver.estimate([
+            {'format_id': '136+140'}, {'format_id': '137+140'}, {'format_id': '299+140', 'filesize': 7},
+            {'format_id': '999+140'}, {'format_id': 'best'},
+        ])
+        self.assertEqual(entries[0], {'format_id': '136+140', 'filesize': 21_600_000, 'filesize_exact': True})
+        self.assertEqual(entries[1], {'format_id': '137+140', 'filesize': 4000 * 125 * 100 + 1_600_000,
+                                      'filesize_exact': False})
+        self.assertEqual(entries[2], {'format_id': '299+140', 'filesize': 7, 'filesize_exact': False})
+        self.assertEqual(entries[3], {'format_id': '999+140', 'filesize_exact': False})
+        self.assertEqual(entries[4], {'format_id': 'best', 'filesize_exact': False})
+        self.assertEqual(resolver.known('140'), (1_600_000, 'url'))
+        self.assertEqual(resolver.known('136'), (20_000_000, 'filesize'))
+
+    def test_cached_probe_makes_an_entry_exact(self):
+        formats = [_fmt('137', 1080, 'avc1.640028', tbr=4000, filesize=50_000_000), _fmt('251', acodec='opus', abr=130)]
+        resolver = self.resolver(formats)
+        cache.set(resolver._cache_key('251'), 2_000_000)
+        self.assertEqual(resolver.estimate([{'format_id': '137+251'}])[0]['filesize'], 52_000_000)
+        self.assertEqual(resolver.known('251'), (2_000_000, 'cache'))
+
+    def test_refine_yields_once_every_part_is_probed(self):
+        formats = [_fmt('137', 1080, 'avc1.640028', tbr=4000), _fmt('136', 720, 'avc1.4d401f', tbr=2500),
+                   _fmt('140', acodec='mp4a.40.2', ext='m4a', abr=128, filesize=1_600_000)]
+        resolver = self.resolver(formats)
+        entries = resolver.estimate([{'format_id': '137+140', 'quality': '1080p'}, {'format_id': '136+140'}])
+        lengths = {'https://cdn.example/137': 40_000_000, 'https://cdn.example/136': None}
+        with mock.patch('downloads.sizes.probe_length', side_effect=lambda fmt, timeout: lengths[fmt['url']]) as probe:
+            updates = list(resolver.refine(entries))
+        self.assertEqual(sorted(call[0][0]['format_id'] for call in probe.call_args_list), ['136', '137'])
+        self.assertEqual(updates, [{'format_id': '137+140', 'quality': '1080p', 'filesize': 41_600_000,
+                                    'filesize_exact': True, 'source': 'probe'}])
+        self.assertFalse(entries[1]['filesize_exact'])  # Its probe came back empty - the estimate stands
+        self.assertEqual(cache.get(resolver._cache_key('137')), 40_000_000)
+
+
+class SectionTrimTests(SimpleTestCase):
+    """Where the requested start sits inside the keyframe-aligned section yt-dlp fetched"""
+
+    H264 = {'codec_type': 'video', 'codec_name': 'h264'}
+    AAC = {'codec_type': 'audio', 'codec_name': 'aac'}
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        patcher = mock.patch('downloads.sections.get_capabilities', return_value={'encoders': ['libx264', 'aac']})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetched(self, ext):
+        path = os.path.join(self.tmp, f'section.{ext}')
+        with open(path, 'wb') as f:
+            f.write(b'fetched')
+        return path
+
+    def trim(self, ext, window, duration=None, streams=(H264, AAC)):
+        path = self.fetched(ext)
+        info = {'streams': list(streams), 'duration': duration}
+
+        def cut(source, output, local, codec, audio, options):
+            with open(output, 'wb') as f:
+                f.write(b'trimmed')
+        with mock.patch('downloads.sections.probe_media', return_value=info), \
+                mock.patch('downloads.sections.smart_cut', side_effect=cut) as smart_cut:
+            trimmed = trim_section(path, window)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'trimmed' if trimmed else b'fetched')
+        return trimmed, smart_cut
+
+    def test_section_window(self):
+        self.assertEqual(section_window('1:30', '2:00'), (90.0, 120.0))
+        self.assertEqual(section_window(45, None), (45.0, None))
+        self.assertIsNone(section_window(None, None))
+        self.assertIsNone(section_window(0, ''))
+        self.assertEqual(section_key((90.0, None)), {'start': 90.0, 'end': None})
+        self.assertEqual(section_key(None), {})
+
+    def test_edit_list_container_starts_at_zero(self):
+        # The mp4 muxer's edit list already hides the pre-roll, however long the file is
+        trimmed, smart_cut = self.trim('mp4', (30.0, 40.0), duration=12.5)
+        self.assertTrue(trimmed)
+        self.assertEqual(smart_cut.call_args[0][2], (0.0, 10.0))
+        self.assertEqual(smart_cut.call_args[0][5], {'movflags': '+faststart'})
+        trimmed, smart_cut = self.trim('mp4', (30.0, None))
+        self.assertEqual(smart_cut.call_args[0][2], (0.0, None))
+
+    def test_pre_roll_is_the_extra_duration(self):
+        trimmed, smart_cut = self.trim('mkv', (30.0, 40.0), duration=12.5)
+        self.assertTrue(trimmed)
+        self.assertEqual(smart_cut.call_args[0][2], (2.5, 12.5))
+        self.assertEqual(smart_cut.call_args[0][3:5], ('h264', {'acodec': 'copy'}))
+        self.assertEqual(smart_cut.call_args[0][5], {})
+
+    def test_pre_roll_within_tolerance_is_ignored(self):
+        trimmed, smart_cut = self.trim('webm', (30.0, 40.0), duration=10.01)
+        self.assertEqual(smart_cut.call_args[0][2], (0.0, 10.0))
+
+    def test_unknown_offset_keeps_the_fetched_cut(self):
+        for window, duration in (((30.0, None), 12.5), ((30.0, 40.0), None)):
+            trimmed, smart_cut = self.trim('mkv', window, duration=duration)
+            self.assertFalse(trimmed)
+            smart_cut.assert_not_called()
+
+    def test_no_edge_encoder_keeps_the_fetched_cut(self):
+        av1 = {'codec_type': 'video', 'codec_name': 'av1'}
+        trimmed, smart_cut = self.trim('mkv', (30.0, 40.0), duration=12.5, streams=(av1, self.AAC))
+        self.assertFalse(trimmed)
+        smart_cut.assert_not_called()
+
+    def test_audio_only_is_copy_cut_at_the_offset(self):
+        trimmed, _ = self.trim('m4a', (30.0, 40.0), streams=(self.AAC,))
+        self.assertFalse(trimmed)  # No pre-roll to drop behind an edit list
+
+        path = self.fetched('mka')
+        with mock.patch('downloads.sections.probe_media', return_value={'streams': [self.AAC], 'duration': 11.0}), \
+                mock.patch('downloads.sections.ffmpeg.input') as ffmpeg_input:
+            output = ffmpeg_input.return_value.output
+            output.return_value.run.side_effect = lambda **kwargs: open(output.call_args[0][0], 'wb').close()
+            self.assertTrue(trim_section(path, (30.0, 40.0)))
+        self.assertEqual(ffmpeg_input.call_args, mock.call(path, ss=1.0, t=10.0))
+        self.assertEqual(output.call_args[1], {'acodec': 'copy', 'vn': None})
+
+
+class ChapterDownloadTests(TestCase):
+    """Which chapters a download is split into, and the files and rows the split leaves"""
+
+    CHAPTERS = [{'start_time': 0, 'end_time': 2, 'title': 'Intro'}, {'start_time': 2, 'end_time': 4, 'title': 'Talk'},
+                {'start_time': 4, 'end_time': None, 'title': 'Q&A'}]
+
+    def setUp(self):
+        from .services import DownloadService
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root, CHAPTER_SPLIT_MAX=3)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.service = DownloadService()
+        self.job = DownloadRequest.objects.create(url='https://youtu.be/abc', title='Talk', split_chapters=True)
+
+    def test_requested_chapters(self):
+        chapters = self.service.requested_chapters(self.job, {'chapters': self.CHAPTERS, 'duration': 6})
+        self.assertEqual([(c['title'], c['start'], c['end']) for c in chapters],
+                         [('Intro', 0.0, 2.0), ('Talk', 2.0, 4.0), ('Q&A', 4.0, 6)])
+
+        with self.assertRaisesMessage(Exception, 'no chapters'):
+            self.service.requested_chapters(self.job, {'chapters': [], 'duration': 6})
+        many = self.CHAPTERS + [{'start_time': 6, 'end_time': 8}]
+        with self.assertRaisesMessage(Exception, 'at most 3'):
+            self.service.requested_chapters(self.job, {'chapters': many, 'duration': 8})
+
+        self.job.split_chapters = False
+        with mock.patch.object(self.service.bypass_helper, 'extract_video_info_with_retry') as extract:
+            self.assertIsNone(self.service.requested_chapters(self.job))
+        extract.assert_not_called()
+
+    @unittest.skipUnless(shutil.which('ffmpeg'), "ffmpeg is not installed")
+    def test_split_writes_a_file_and_row_per_chapter(self):
+        source = os.path.join(self.service.download_dir, f'{self.job.id}_Talk.mp4')
+        subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=160x120:rate=25:duration=6',
+                        '-f', 'lavfi', '-i', 'sine=duration=6', '-c:v', 'libx264', '-g', '25', '-c:a', 'aac',
+                        source], check=True)
+        chapters = self.service.requested_chapters(self.job, {'chapters': self.CHAPTERS, 'duration': 6})
+
+        self.service._split_chapters(self.job, source, chapters)  # Same container: stream copy
+        self.service._split_chapters(self.job, source, chapters)  # A retry replaces the rows
+        rows = list(DownloadChapter.objects.filter(download_request=self.job))
+        self.assertEqual([(row.position, row.title, row.file_format) for row in rows],
+                         [(0, 'Intro', 'mp4'), (1, 'Talk', 'mp4'), (2, 'Q&A', 'mp4')])
+        self.assertEqual(os.path.basename(rows[2].file_path.name), '03 - QA.mp4')
+        for row in rows:
+            self.assertEqual(row.file_size, os.path.getsize(os.path.join(self.media_root, row.file_path.name)))
+
+        self.job.format_requested = 'mp3'  # An audio target is encoded per chapter
+        self.service._split_chapters(self.job, source, chapters)
+        rows = list(DownloadChapter.objects.filter(download_request=self.job))
+        self.assertEqual([row.file_format for row in rows], ['mp3'] * 3)
+        banner = subprocess.run(['ffmpeg', '-hide_banner', '-i', os.path.join(self.media_root, rows[0].file_path.name)],
+                                capture_output=True, text=True).stderr
+        self.assertIn('Audio: mp3', banner)
+        self.assertNotIn('Video:', banner)
+
+
+class DirectAudioTests(SimpleTestCase):
+    """Copy or encode per target, and which formats ffmpeg can fetch by itself"""
+
+    OPUS = _fmt('251', acodec='opus', ext='webm', abr=130)
+    MP3_LINK = {'format_id': '0', 'ext': 'mp3', 'url': 'https://cdn.example/a.mp3', 'protocol': 'https'}
+
+    def setUp(self):
+        patcher = mock.patch('downloads.audio.get_capabilities', return_value={'encoders': [], 'hardware_encoders': []})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_can_copy_per_target(self):
+        self.assertTrue(can_copy(AUDIO_140, 'm4a'))
+        self.assertFalse(can_copy(AUDIO_140, 'mp3'))
+        self.assertFalse(can_copy(self.OPUS, 'm4a'))
+        self.assertTrue(can_copy(_fmt('x', acodec='mp3', ext='mp3'), 'mp3'))
+        self.assertTrue(can_copy(_fmt('x', acodec='flac', ext='flac'), 'flac'))
+        self.assertFalse(can_copy(_fmt('x', acodec='flac', ext='flac'), 'wav'))
+
+    def test_unreported_codec_copies_only_a_bare_file_in_the_target_container(self):
+        self.assertTrue(can_copy(self.MP3_LINK, 'mp3'))
+        self.assertFalse(can_copy(self.MP3_LINK, 'm4a'))
+        self.assertFalse(can_copy({**self.MP3_LINK, 'ext': 'mp4', 'vcodec': 'avc1'}, 'mp4'))
+
+    def test_ffmpeg_readable(self):
+        self.assertTrue(ffmpeg_readable(AUDIO_140))
+        self.assertTrue(ffmpeg_readable({**AUDIO_140, 'protocol': 'm3u8_native'}))
+        self.assertFalse(ffmpeg_readable({**AUDIO_140, 'protocol': 'http_dash_segments'}))
+        self.assertFalse(ffmpeg_readable({**AUDIO_140, 'url': None}))
+        self.assertFalse(ffmpeg_readable({**AUDIO_140, 'requested_formats': [AUDIO_140, self.OPUS]}))
+
+    def test_output_options(self):
+        self.assertEqual(output_options(AUDIO_140, 'm4a'), {'acodec': 'copy', 'vn': None, 'movflags': '+faststart'})
+        self.assertEqual(output_options(self.OPUS, 'm4a'),
+                         {'acodec': 'aac', 'audio_bitrate': mock.ANY, 'vn': None, 'movflags': '+faststart'})
+        self.assertEqual(output_options(AUDIO_140, 'mp3'), {'acodec': 'libmp3lame', 'audio_bitrate': mock.ANY, 'vn': None})
+        self.assertEqual(output_options(self.OPUS, 'flac'), {'acodec': 'flac', 'compression_level': 5, 'vn': None})
+        self.assertEqual(output_options(AUDIO_140, 'wav'), {'acodec': 'pcm_s16le', 'vn': None})
+        self.assertEqual(output_options(self.MP3_LINK, 'mp3'), {'acodec': 'copy', 'vn': None})
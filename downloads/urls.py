@@ -9,6 +9,7 @@ router.register(r'history', views.DownloadHistoryViewSet, basename='downloadhist
 urlpatterns = [
     path('stats/', views.download_stats, name='download_stats'),
     path('video-info/', views.get_video_info, name='get_video_info'),
+    path('format-sizes/', views.stream_format_sizes, name='stream_format_sizes'),
     path('video-info-progress/', views.get_video_info_with_progress, name='get_video_info_with_progress'),
     path('progress/<str:task_id>/', views.get_progress, name='get_progress'),
     path('download-progress/<str:download_id>/', views.get_download_progress, name='get_download_progress'),
@@ -17,6 +18,7 @@ urlpatterns = [
     path('direct-urls/', views.get_direct_urls, name='get_direct_urls'),  # NEW: True direct URLs
     path('proxy-download/', views.proxy_download, name='proxy_download'),  # NEW: Proxy for CORS bypass
     path('stream/', views.stream_download, name='stream_download'),
+    path('plan/', views.plan_download, name='plan_download'),
     path('test/', views.test_download_page, name='test_download_page'),
     path('', include(router.urls)),
 ]
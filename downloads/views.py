@@ -3,19 +3,34 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from rest_framework.decorators import action
-from django.http import HttpResponse, Http404, StreamingHttpResponse
+from django.http import HttpResponse, Http404, StreamingHttpResponse, FileResponse
 from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from urllib.parse import urlparse
 import os
+import re
+import json
+import time
+import uuid
 import logging
 import requests
 from .models import DownloadRequest, DownloadHistory
 from .serializers import DownloadRequestSerializer, DownloadCreateSerializer, DownloadHistorySerializer
 from .tasks import process_download_task  # Import the actual task
 from .services import DownloadService  # Import the download service
+from .segmented import SegmentedDownloader
+from .range_cache import RangeCache, sign_cache_key, verify_cache_key
+from .sections import section_window, section_ydl_opts, trim_section
+from .planner import VIDEO_CONTAINERS, plan_formats, plan_format_id, format_selector, describe
+from .format_index import FormatIndex
+from .audio import AUDIO_TARGETS
+from .estimates import download_throughput, estimate_plan
+from .sizes import SizeResolver
 from core.views import log_activity
+from core.scratch import ScratchSpace, ScratchSpaceError, CleanupIterator
+from core.zipstream import stream_files
+from core.artifacts import ArtifactStore, canonical_source
 
 logger = logging.getLogger(__name__)
 
@@ -129,12 +144,23 @@ class DownloadRequestViewSet(ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def download_file(self, request, pk=None):
-        """Download the completed file"""
+        """Download the completed file; ?chapter=<position> picks one chapter of a split download"""
         download_request = self.get_object()
         
         if download_request.status != 'completed' or not download_request.file_path:
             raise Http404("File not available")
 
+        position = request.query_params.get('chapter')
+        if position not in (None, ''):
+            chapter = download_request.chapters.filter(position=position).first() if position.isdigit() else None
+            if not chapter or not chapter.file_path:
+                raise Http404("Chapter not found")
+            try:
+                return FileResponse(open(chapter.file_path.path, 'rb'), as_attachment=True,
+                                    filename=os.path.basename(chapter.file_path.name))
+            except FileNotFoundError:
+                raise Http404("File not found")
+
         try:
             # Construct full file path
             if hasattr(download_request.file_path, 'path'):
@@ -153,6 +179,21 @@ class DownloadRequestViewSet(ModelViewSet):
         except FileNotFoundError:
             raise Http404("File not found")
 
+    @action(detail=True, methods=['get'])
+    def download_chapters(self, request, pk=None):
+        """All chapters of a split download as one streamed ZIP"""
+        download_request = self.get_object()
+        chapters = [chapter for chapter in download_request.chapters.all()
+                    if chapter.file_path and os.path.exists(chapter.file_path.path)]
+        if download_request.status != 'completed' or not chapters:
+            raise Http404("Chapters not available")
+
+        files = [(os.path.basename(chapter.file_path.name), chapter.file_path.path) for chapter in chapters]
+        safe_title = "".join(c for c in download_request.title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        response = StreamingHttpResponse(stream_files(files), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{safe_title or download_request.id}.zip"'
+        return response
+
     @action(detail=True, methods=['delete'])
     def delete_file(self, request, pk=None):
         """Delete the downloaded file"""
@@ -266,6 +307,11 @@ def get_direct_urls(request):
                 'ext': info.get('ext', 'mp4'),
                 'filesize': info.get('filesize') or info.get('filesize_approx', 0)
             }
+
+            # Let the proxy cache this file under the video's stable identity
+            if info.get('id') and info.get('format_id'):
+                video_id = f"{info.get('extractor_key', 'generic')}:{info['id']}"
+                proxy_params['cache_key'] = sign_cache_key(video_id, info['format_id'], direct_url)
             
             # Create proxy URL that will download via our backend
             proxy_url = f"/api/downloads/proxy-download/?{urllib.parse.urlencode(proxy_params)}"
@@ -338,6 +384,20 @@ def get_direct_urls(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+_DOWNLOAD_ID = re.compile(r'^[0-9a-fA-F-]{32,36}$')
+
+
+def _valid_download_id(value) -> bool:
+    """Client-chosen download ids name scratch directories - only plain UUIDs are accepted"""
+    if not isinstance(value, str) or not _DOWNLOAD_ID.match(value):
+        return False
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
 @api_view(['GET', 'POST'])
 @permission_classes([permissions.AllowAny])
 def stream_download(request):
@@ -349,6 +409,8 @@ def stream_download(request):
         format_id = request.GET.get('format_id')
         test_mode = request.GET.get('test', 'false').lower() == 'true'
         download_id = request.GET.get('download_id')
+        start, end = request.GET.get('start'), request.GET.get('end')
+        format_requested = request.GET.get('format_requested')
         
         # Fix URL encoding issue where + becomes space
         if format_id and ' ' in format_id:
@@ -361,16 +423,26 @@ def stream_download(request):
         format_id = request.data.get('format_id')
         test_mode = request.data.get('test', False)
         download_id = request.data.get('download_id')
+        start, end = request.data.get('start'), request.data.get('end')
+        format_requested = request.data.get('format_requested')
         
         # DEBUG: Print what we received - CLEAN
         logger.info(f"Stream download request - URL: {url}, Format: {format_id}")
     
     if not url:
         return Response({'error': 'URL is required'}, status=400)
+    if download_id and not _valid_download_id(download_id):
+        return Response({'error': 'download_id must be a UUID'}, status=400)
+
+    # Optional start/end: only that window of the video is fetched
+    try:
+        window = section_window(start, end)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
     
     try:
-        import tempfile
         import os
+        import uuid
         from .youtube_bypass import YouTubeBypassHelper
         from django.http import FileResponse
         from django.core.cache import cache
@@ -378,8 +450,8 @@ def stream_download(request):
         # Use our bypass helper
         bypass_helper = YouTubeBypassHelper()
         
-        # Create a temporary directory for this download
-        temp_dir = tempfile.mkdtemp()
+        # Per-job scratch directory - allocated once the format (and so its size) is known
+        scratch = None
         
         # Progress tracking setup - use dedicated download progress key
         progress_key = f"download_progress_{download_id}" if download_id else None
@@ -414,6 +486,10 @@ def stream_download(request):
                     logger.info(f"Download {download_id} cancelled during progress hook")
                     # This will cause yt-dlp to stop - we raise an exception to interrupt
                     raise Exception("Download cancelled by user")
+
+            # Abort before a runaway download fills the disk
+            if scratch:
+                scratch.check_quota()
             
             if d['status'] == 'downloading' and progress_key:
                 downloaded = d.get('downloaded_bytes', 0)
@@ -455,7 +531,6 @@ def stream_download(request):
             
             # Add download-specific options with proper filename template and iOS client force
             ydl_opts.update({
-                'outtmpl': os.path.join(temp_dir, '%(title).100s.%(ext)s'),  # Use actual title
                 'retries': 3,
                 'fragment_retries': 3,
                 'skip_unavailable_fragments': True,
@@ -471,6 +546,9 @@ def stream_download(request):
                 },
             })
             
+            if window:
+                ydl_opts.update(section_ydl_opts(window))
+            
             # If test mode, just return info without downloading
             if test_mode:
                 ydl_opts['skip_download'] = True
@@ -489,12 +567,27 @@ def stream_download(request):
                 title = info.get('title', 'Unknown Title')
                 duration = info.get('duration', 0)
                 
-                # Validate format availability before downloading
-                available_formats = info.get('formats', [])
+                # Validate format availability before downloading - one index, every lookup below uses it
+                available_formats = FormatIndex.of(info.get('formats', []))
                 format_available = False
                 actual_format_to_use = format_id
+                plan = None
                 
-                if is_smart_selector:
+                if not format_id:
+                    # No explicit format - plan the cheapest way to the requested quality and container.
+                    # The download re-extracts with the iOS client, so the quality selector stays as fallback.
+                    if quality == 'audio':
+                        container = format_requested if format_requested in AUDIO_TARGETS else 'm4a'
+                    else:
+                        container = format_requested if format_requested in VIDEO_CONTAINERS else 'mp4'
+                    plan = plan_formats(available_formats, quality, container, duration)
+                    actual_format_to_use = format_selector(plan, quality)
+                    is_smart_selector = True
+                    format_available = True
+                    logger.info(f"Planned format for {quality}/{container}: {actual_format_to_use}"
+                                + (f" ({plan['operation']}, cost {plan['cost']}s)" if plan else ''))
+                    
+                elif is_smart_selector:
                     # Smart selector formats - these always work, let yt-dlp handle them
                     format_available = True
                     actual_format_to_use = format_id
@@ -503,8 +596,8 @@ def stream_download(request):
                 elif is_combined_format:
                     # For combined formats like 137+251, check if both parts exist in RAW formats
                     video_id, audio_id = format_id.split('+')
-                    video_exists = any(f.get('format_id') == video_id for f in available_formats)
-                    audio_exists = any(f.get('format_id') == audio_id for f in available_formats)
+                    video_exists = video_id in available_formats
+                    audio_exists = audio_id in available_formats
                     
                     if video_exists and audio_exists:
                         format_available = True
@@ -518,7 +611,7 @@ def stream_download(request):
                         
                 elif format_id and format_id not in ['best', 'worst']:
                     # Simple format ID - check if it exists in RAW formats
-                    format_available = any(f.get('format_id') == format_id for f in available_formats)
+                    format_available = format_id in available_formats
                     if not format_available:
                         logger.warning(f"Format {format_id} not available in raw formats, using smart fallback")
                         actual_format_to_use = 'best[height<=720]/best'
@@ -533,9 +626,17 @@ def stream_download(request):
                     # Smart selectors - these work without quotes and may need merging
                     ydl_opts.update({
                         'format': actual_format_to_use,  # Smart selectors work without quotes
-                        'merge_output_format': 'mp4',    # Smart selectors may need merging
+                        'merge_output_format': plan['container'] if plan else 'mp4',  # Smart selectors may need merging
                         'prefer_ffmpeg': True,
                     })
+                    if plan and plan['video'] is None and plan['operation'] == 'transcode':
+                        ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': plan['container']}]
+                    elif plan and plan['operation'] == 'transcode':
+                        # A stream doesn't fit the container - merge into mkv, which takes anything, then convert
+                        ydl_opts['merge_output_format'] = 'mkv'
+                        ydl_opts['postprocessors'] = [{'key': 'FFmpegVideoConvertor', 'preferedformat': plan['container']}]
+                    elif plan and plan['operation'] == 'remux':
+                        ydl_opts['postprocessors'] = [{'key': 'FFmpegVideoRemuxer', 'preferedformat': plan['container']}]
                     logger.info(f"Using smart selector: {actual_format_to_use}")
                 elif is_combined_format and '+' in actual_format_to_use:
                     # For combined formats like 137+251, try without quotes first
@@ -557,22 +658,17 @@ def stream_download(request):
                 safe_title = safe_title[:100]  # Limit length
                 
                 # Determine file extension based on format
-                if is_combined_format or actual_format_to_use == 'best':
+                if plan:
+                    ext = plan['container']
+                elif is_combined_format or actual_format_to_use == 'best':
                     ext = 'mp4'  # Combined/merged formats are always mp4
                 else:
                     # Get extension from the specific format
-                    selected_format = None
-                    for fmt in available_formats:
-                        if fmt.get('format_id') == actual_format_to_use:
-                            selected_format = fmt
-                            break
-                    ext = selected_format.get('ext', 'mp4') if selected_format else 'mp4'
+                    selected_format = available_formats.get(actual_format_to_use) if actual_format_to_use else None
+                    ext = (selected_format.ext or 'mp4') if selected_format else 'mp4'
                 
                 filename = f"{safe_title}.{ext}"
                 
-                # Update ydl_opts with the proper filename template using actual title
-                ydl_opts['outtmpl'] = os.path.join(temp_dir, f"{safe_title}.%(ext)s")
-                
                 if test_mode:
                     return Response({
                         'status': 'ready',
@@ -581,9 +677,18 @@ def stream_download(request):
                         'duration': duration,
                         'format': ext,
                         'validated_format': actual_format_to_use,
-                        'original_format': format_id
+                        'original_format': format_id,
+                        'plan': describe(plan) if plan else None,
                     })
                 
+                # Quota-checked, swept if this worker dies mid-download; small jobs land on tmpfs
+                scratch = ScratchSpace().allocate(download_id or uuid.uuid4().hex,
+                                                  expected_size=_expected_download_size(plan, available_formats,
+                                                                                        actual_format_to_use))
+                temp_dir = scratch.path
+                ydl_opts['outtmpl'] = os.path.join(temp_dir, f"{safe_title}.%(ext)s")
+                ydl_opts['max_filesize'] = scratch.quota
+                
                 # Download the file with iOS client directly - no retry logic that might override our client
                 logger.info(f"Starting iOS client download for: {title}")
                 logger.info(f"Using format: {actual_format_to_use}")
@@ -621,9 +726,8 @@ def stream_download(request):
                         logger.error(f"iOS client fallback also failed: {final_error}")
                         
                         # List available formats for debugging
-                        logger.info("Available formats for debugging:")
-                        for fmt in available_formats:
-                            logger.info(f"  - {fmt.get('format_id')}: {fmt.get('ext')} {fmt.get('height', 'audio')}p")
+                        logger.debug("Available formats: " + ', '.join(
+                            f"{record.format_id} ({record.ext} {record.height or 'audio'})" for record in available_formats.records))
                         
                         raise Exception(f"All iOS download attempts failed. Original error: {download_error}")
                 
@@ -634,7 +738,8 @@ def stream_download(request):
                 # Find the downloaded file
                 try:
                     temp_files = os.listdir(temp_dir)
-                    downloaded_files = [f for f in temp_files if os.path.isfile(os.path.join(temp_dir, f))]
+                    downloaded_files = [f for f in temp_files
+                                        if os.path.isfile(os.path.join(temp_dir, f)) and not f.startswith('.')]
                     logger.info(f"Files in temp directory: {temp_files}")
                     logger.info(f"Downloaded files found: {downloaded_files}")
                 except Exception as list_error:
@@ -647,6 +752,11 @@ def stream_download(request):
                 
                 downloaded_file_path = os.path.join(temp_dir, downloaded_files[0])
                 logger.info(f"Download completed: {downloaded_file_path}")
+
+                if window:
+                    if progress_key:
+                        update_download_progress(98, "Trimming section...")
+                    trim_section(downloaded_file_path, window)
                 
                 # Final progress update - file is ready for download
                 if progress_key:
@@ -655,29 +765,11 @@ def stream_download(request):
                 # Note: Don't set progress to 100% here as it conflicts with real yt-dlp progress
                 # The yt-dlp 'finished' hook will handle the final progress update
                 
-                # Create a file response that streams the file and cleans up after
-                def file_iterator(file_path, chunk_size=8192):
-                    try:
-                        with open(file_path, 'rb') as f:
-                            while True:
-                                chunk = f.read(chunk_size)
-                                if not chunk:
-                                    break
-                                yield chunk
-                    finally:
-                        # Clean up the temporary file and directory
-                        try:
-                            if os.path.exists(file_path):
-                                os.remove(file_path)
-                            if os.path.exists(temp_dir):
-                                os.rmdir(temp_dir)
-                        except Exception as cleanup_error:
-                            logger.warning(f"Cleanup error: {cleanup_error}")
-                
                 from django.http import StreamingHttpResponse
                 
+                # Closeable iterator: the scratch dir goes away even if the client disconnects before the first chunk
                 response = StreamingHttpResponse(
-                    file_iterator(downloaded_file_path),
+                    CleanupIterator(downloaded_file_path, scratch),
                     content_type='application/octet-stream'
                 )
                 response['Content-Disposition'] = f'attachment; filename="{filename}"'
@@ -698,12 +790,8 @@ def stream_download(request):
                 
         except Exception as e:
             # Clean up temp directory on error
-            try:
-                import shutil
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
-            except:
-                pass
+            if scratch:
+                scratch.cleanup()
             raise e
         
         # Log the download
@@ -717,11 +805,97 @@ def stream_download(request):
         
         return streaming_response
         
+    except ScratchSpaceError as e:
+        logger.error(f"No scratch space for stream download: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_507_INSUFFICIENT_STORAGE)
     except Exception as e:
         logger.error(f"Error streaming download: {str(e)}")
         return Response({'error': str(e)}, status=400)
 
 
+def _expected_download_size(plan, available_formats: FormatIndex, format_string: str):
+    """Bytes a stream download should need: the plan's expected size, else the chosen ids' filesize or
+    filesize_approx; None when any part is unknown"""
+    if plan:
+        return plan['expected_bytes']
+    sizes = []
+    for part in str(format_string or '').split('/')[0].split('+'):
+        record = available_formats.get(part)
+        if record is None:
+            return None
+        sizes.append(record.info.get('filesize') or record.info.get('filesize_approx'))
+    return sum(sizes) if sizes and None not in sizes else None
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.AllowAny])
+def plan_download(request):
+    """Dry run: the format plan for a URL and output with its expected bytes and time - nothing is downloaded"""
+    params = request.GET if request.method == 'GET' else request.data
+    url = params.get('url')
+    quality = params.get('quality', '720p')
+    format_id = params.get('format_id')
+    format_requested = params.get('format_requested') or ('m4a' if quality == 'audio' else 'mp4')
+
+    if not url:
+        return Response({'error': 'URL is required'}, status=400)
+    if format_requested not in VIDEO_CONTAINERS + AUDIO_TARGETS:
+        return Response({'error': f"Unsupported format_requested: {format_requested}"}, status=400)
+    if format_requested in AUDIO_TARGETS:
+        quality = 'audio'  # Audio formats are fetched as audio whatever quality says, as the download job does
+    if format_id and ' ' in format_id:
+        format_id = format_id.replace(' ', '+')  # + decoded as space in query strings
+    try:
+        window = section_window(params.get('start'), params.get('end'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    try:
+        from .youtube_bypass import YouTubeBypassHelper
+
+        info = YouTubeBypassHelper().extract_video_info_with_retry(url)
+        if not info:
+            raise Exception("Could not extract video information")
+        duration = info.get('duration')
+        index = FormatIndex.of(info.get('formats') or [])
+        throughput = download_throughput(url)
+
+        is_selector = format_id and any(char in format_id for char in ['[', ']', '<', '>', '=', '/'])
+        if format_id and not is_selector and format_id not in ('best', 'worst'):
+            plan = plan_format_id(index, format_id, format_requested, duration, bandwidth=throughput[0])
+            if not plan:
+                return Response({'error': f"Format {format_id} is not available for this video"}, status=400)
+            selector = format_id
+        else:
+            # Selectors are resolved by yt-dlp at download time; plan the quality they stand for
+            plan = plan_formats(index, quality if is_selector or not format_id else format_id, format_requested,
+                                duration, bandwidth=throughput[0])
+            selector = format_id if is_selector else format_selector(plan, quality)
+
+        # The background job for the same request may already have a finished copy
+        artifact = None
+        if format_requested in dict(DownloadRequest.FORMAT_CHOICES):
+            job = DownloadRequest(url=url, format_requested=format_requested, quality_requested=quality,
+                                  start_time=window[0] if window else None, end_time=window[1] if window else None)
+            artifact = ArtifactStore().lookup(canonical_source(url), DownloadService().artifact_variant_key(job, selector))
+
+        return Response({
+            'title': info.get('title', 'Unknown Title'),
+            'duration': duration,
+            'quality': quality,
+            'format_requested': format_requested,
+            'window': {'start': window[0], 'end': window[1]} if window else None,
+            'format_selector': selector,
+            'plan': describe(plan) if plan else None,
+            'estimate': estimate_plan(plan, url, duration, window, throughput) if plan else None,
+            'cached': artifact is not None,
+            'cached_size': artifact.file_size if artifact else None,
+        })
+    except Exception as e:
+        logger.error(f"Error planning download: {str(e)}")
+        return Response({'error': str(e)}, status=400)
+
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def get_download_progress(request, download_id):
@@ -754,6 +928,11 @@ def cancel_download(request):
             {'error': 'download_id is required'}, 
             status=status.HTTP_400_BAD_REQUEST
         )
+    if not _valid_download_id(download_id):
+        return Response(
+            {'error': 'download_id must be a UUID'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     try:
         from django.core.cache import cache
@@ -780,18 +959,9 @@ def cancel_download(request):
         # Note: The actual yt-dlp process cancellation will be handled by the AbortController
         # on the frontend, which will close the HTTP connection
         try:
-            import tempfile
-            import glob
-            
-            # Look for temp directories that might be related to this download
-            temp_base = tempfile.gettempdir()
-            possible_temp_dirs = glob.glob(os.path.join(temp_base, f"*{download_id}*"))
-            
-            for temp_dir in possible_temp_dirs:
-                if os.path.isdir(temp_dir):
-                    import shutil
-                    shutil.rmtree(temp_dir)
-                    logger.info(f"Cleaned up temp directory: {temp_dir}")
+            # Scratch directories are named after the download they belong to
+            for temp_dir in ScratchSpace().release(download_id):
+                logger.info(f"Cleaned up temp directory: {temp_dir}")
                     
         except Exception as cleanup_error:
             logger.warning(f"Could not clean up temp files for {download_id}: {cleanup_error}")
@@ -860,7 +1030,50 @@ def proxy_download(request):
         
         # Make the request to the direct URL
         logger.info(f"Proxying download: {filename}")
-        
+
+        # Large range-capable resources are pulled over several pooled connections
+        # and re-assembled in order, since CDNs cap throughput per connection
+        range_headers = {k: v for k, v in headers.items() if k != 'Range'}
+        segmented = SegmentedDownloader(direct_url, headers=range_headers)
+
+        # Popular videos are served from the local range cache, keyed by video and format
+        # rather than by the expiring signed URL
+        cache_token = request.GET.get('cache_key')
+        cache_identity = verify_cache_key(cache_token, direct_url) if cache_token else None
+        if cache_identity:
+            cached_response = _proxy_from_range_cache(request, cache_identity, segmented, filename)
+            if cached_response is not None:
+                return cached_response
+
+        try:
+            use_segmented = segmented.supports_segmentation()
+        except Exception as probe_error:
+            logger.info(f"Range probe failed, proxying over a single connection: {probe_error}")
+            use_segmented = False
+
+        if use_segmented:
+            def segmented_iterator():
+                try:
+                    yield from segmented.iter_content()
+                except Exception as e:
+                    logger.error(f"Error streaming segmented file: {str(e)}")
+                finally:
+                    segmented.close()
+
+            streaming_response = StreamingHttpResponse(
+                segmented_iterator(),
+                content_type='application/octet-stream'
+            )
+            streaming_response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            streaming_response['Content-Length'] = str(segmented.length)
+            streaming_response['Access-Control-Allow-Origin'] = '*'
+            streaming_response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
+            streaming_response['Access-Control-Allow-Headers'] = 'Content-Type'
+
+            logger.info(f"Started segmented proxy download for: {filename} ({segmented.length} bytes)")
+            return streaming_response
+
+        segmented.close()
         response = requests.get(direct_url, headers=headers, stream=True, timeout=30)
         
         if not response.ok:
@@ -921,6 +1134,87 @@ def proxy_download(request):
         )
 
 
+def _parse_range_header(value: str, length: int):
+    """Parse a single 'bytes=start-end' range into an inclusive (start, end) pair, or None"""
+    if not value or not value.startswith('bytes=') or ',' in value:
+        return None
+    start_text, _, end_text = value[len('bytes='):].partition('-')
+    try:
+        if not start_text:
+            # Suffix range: the last N bytes
+            suffix = int(end_text)
+            return (max(length - suffix, 0), length - 1) if suffix > 0 else None
+        start = int(start_text)
+        end = int(end_text) if end_text else length - 1
+    except ValueError:
+        return None
+    if start >= length or end < start:
+        return None
+    return start, min(end, length - 1)
+
+
+def _proxy_from_range_cache(request, cache_identity, segmented, filename):
+    """Serve a proxied file through the disk range cache; None means fall back to plain proxying"""
+    entry = RangeCache().entry(*cache_identity)
+
+    if entry.length is None:
+        try:
+            segmented.probe()
+        except Exception as probe_error:
+            logger.info(f"Range probe failed, bypassing proxy cache: {probe_error}")
+            return None
+        if not segmented.accepts_ranges or not segmented.length:
+            return None
+        entry.set_length(segmented.length, segmented.content_type)
+    else:
+        # Known entry - trust the cached length so fully cached hits never touch upstream
+        segmented.length = entry.length
+        segmented.accepts_ranges = True
+
+    length = entry.length
+    range_header = request.META.get('HTTP_RANGE', '')
+    requested = _parse_range_header(range_header, length)
+    if range_header and not requested:
+        segmented.close()
+        unsatisfiable = HttpResponse(status=416)
+        unsatisfiable['Content-Range'] = f'bytes */{length}'
+        unsatisfiable['Access-Control-Allow-Origin'] = '*'
+        unsatisfiable['Access-Control-Expose-Headers'] = 'Content-Range'
+        return unsatisfiable
+    start, end = requested or (0, length - 1)
+
+    cache_hit = entry.is_complete(start, end + 1)
+    logger.info(f"Proxy cache {'hit' if cache_hit else 'miss'} for {entry.key} bytes {start}-{end}")
+
+    def cached_iterator():
+        try:
+            yield from entry.stream(
+                start, end + 1,
+                lambda s, e: segmented.iter_content(start=s, end=e)
+            )
+        except Exception as e:
+            logger.error(f"Error streaming cached file: {str(e)}")
+        finally:
+            segmented.close()
+
+    streaming_response = StreamingHttpResponse(
+        cached_iterator(),
+        status=206 if requested else 200,
+        content_type='application/octet-stream'
+    )
+    streaming_response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    streaming_response['Content-Length'] = str(end - start + 1)
+    streaming_response['Accept-Ranges'] = 'bytes'
+    if requested:
+        streaming_response['Content-Range'] = f'bytes {start}-{end}/{length}'
+    streaming_response['X-Proxy-Cache'] = 'HIT' if cache_hit else 'MISS'
+    streaming_response['Access-Control-Allow-Origin'] = '*'
+    streaming_response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
+    streaming_response['Access-Control-Allow-Headers'] = 'Content-Type, Range'
+    streaming_response['Access-Control-Expose-Headers'] = 'Content-Range, X-Proxy-Cache'
+    return streaming_response
+
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def get_direct_download_url(request):
@@ -1018,6 +1312,54 @@ def get_video_info(request):
         )
 
 
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.AllowAny])
+def stream_format_sizes(request):
+    """Available formats with estimated sizes right away, then exact sizes streamed as NDJSON lines as probes answer"""
+    url = request.GET.get('url') if request.method == 'GET' else request.data.get('url')
+    if not url:
+        return Response(
+            {'error': 'URL is required'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        download_service = DownloadService()
+        ios_info = download_service.extract_format_info(url)
+        available_formats = download_service.get_available_formats(url, ios_info)
+        resolver = SizeResolver(url, ios_info.get('formats', []), ios_info.get('duration'))
+    except Exception as e:
+        logger.error(f"Error getting format sizes: {str(e)}")
+        return Response(
+            {'error': str(e)}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    def size_events():
+        started = time.monotonic()
+        yield json.dumps({
+            'event': 'formats',
+            'title': ios_info.get('title', 'Unknown'),
+            'duration': ios_info.get('duration', 0),
+            'available_formats': available_formats,
+        }) + '\n'
+        refined = 0
+        for update in resolver.refine(available_formats):
+            refined += 1
+            yield json.dumps({'event': 'size', **update}) + '\n'
+        yield json.dumps({
+            'event': 'done',
+            'refined': refined,
+            'estimated': [fmt['format_id'] for fmt in available_formats if not fmt.get('filesize_exact')],
+            'elapsed': round(time.monotonic() - started, 3),
+        }) + '\n'
+
+    response = StreamingHttpResponse(size_events(), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Let each line through nginx as it is written
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def get_progress(request, task_id):
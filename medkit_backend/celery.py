@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 from django.conf import settings
 
 # Set the default Django settings module for the 'celery' program.
@@ -14,6 +15,12 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+@worker_process_init.connect
+def warm_ffmpeg_capabilities(**kwargs):
+    """Probe (or load the on-disk probe of) the ffmpeg build before the first conversion arrives"""
+    from conversions.capabilities import get_capabilities
+    get_capabilities()
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
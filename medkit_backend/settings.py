@@ -210,6 +210,80 @@ if 'django-db' in CELERY_BROKER_URL:
 MAX_STORAGE_SIZE = config('MAX_STORAGE_SIZE', default=53687091200, cast=int)  # 50GB
 DOWNLOAD_TIMEOUT = 300  # 5 minutes
 CONVERSION_TIMEOUT = 600  # 10 minutes
+CONVERSION_WORKER_CONCURRENCY = config('CONVERSION_WORKER_CONCURRENCY', default=2, cast=int)  # Parallel conversions, for queue wait estimates
+CONVERSION_SPEED = config('CONVERSION_SPEED', default='balanced')  # fast / balanced / quality encoder presets
+CONVERSION_THREADS = config('CONVERSION_THREADS', default=0, cast=int)  # 0 = let each encoder decide
+CONVERSION_HARDWARE_ENCODING = config('CONVERSION_HARDWARE_ENCODING', default=True, cast=bool)  # Use verified GPU encoders for fast/balanced jobs
+CONVERSION_MAX_RENDITIONS = config('CONVERSION_MAX_RENDITIONS', default=4, cast=int)  # Outputs one decode pass may feed
+CONVERSION_STREAM_RETRY = config('CONVERSION_STREAM_RETRY', default=True, cast=bool)  # Retry a failed streamed encode from the spooled upload
+CONVERSION_LIVE_START_TIMEOUT = config('CONVERSION_LIVE_START_TIMEOUT', default=120, cast=int)  # How long a live follower waits for a queued job to start
+CONVERSION_BATCH_MAX_FILES = config('CONVERSION_BATCH_MAX_FILES', default=100, cast=int)  # Inputs per batch, uploaded or inside an archive
+CONVERSION_BATCH_CONCURRENCY = config('CONVERSION_BATCH_CONCURRENCY', default=2, cast=int)  # Most files of one batch converting at once
+IMAGE_CONVERSION_WORKERS = config('IMAGE_CONVERSION_WORKERS', default=0, cast=int)  # Thread pool for batch image conversion; 0 = one per core
+CHAPTER_SPLIT_WORKERS = config('CHAPTER_SPLIT_WORKERS', default=0, cast=int)  # Chapters cut at once when splitting by chapters; 0 = one per core
+CHAPTER_SPLIT_MAX = config('CHAPTER_SPLIT_MAX', default=200, cast=int)  # Most chapters one job is split into
+FFMPEG_CAPABILITIES_FILE = config('FFMPEG_CAPABILITIES_FILE', default=str(BASE_DIR / 'ffmpeg_capabilities.json'))
+
+# Segment-parallel encoding of long videos
+PARALLEL_ENCODE_ENABLED = config('PARALLEL_ENCODE_ENABLED', default=True, cast=bool)
+PARALLEL_ENCODE_MIN_DURATION = config('PARALLEL_ENCODE_MIN_DURATION', default=600, cast=int)  # seconds of media
+PARALLEL_ENCODE_THREADS_PER_SEGMENT = config('PARALLEL_ENCODE_THREADS_PER_SEGMENT', default=4, cast=int)  # x264 scales well to ~4
+PARALLEL_ENCODE_MAX_WORKERS = config('PARALLEL_ENCODE_MAX_WORKERS', default=8, cast=int)
+PARALLEL_ENCODE_MIN_SEGMENT = config('PARALLEL_ENCODE_MIN_SEGMENT', default=30, cast=int)  # seconds
 
 # Custom user model
 AUTH_USER_MODEL = 'core.User'
+
+# Segmented (multi-connection) fetching of direct media URLs
+SEGMENTED_DOWNLOAD_MAX_CONNECTIONS = config('SEGMENTED_DOWNLOAD_MAX_CONNECTIONS', default=8, cast=int)
+SEGMENTED_DOWNLOAD_INITIAL_CONNECTIONS = config('SEGMENTED_DOWNLOAD_INITIAL_CONNECTIONS', default=2, cast=int)
+SEGMENTED_DOWNLOAD_SEGMENT_SIZE = config('SEGMENTED_DOWNLOAD_SEGMENT_SIZE', default=4 * 1024 * 1024, cast=int)  # 4MB
+SEGMENTED_DOWNLOAD_MIN_SIZE = config('SEGMENTED_DOWNLOAD_MIN_SIZE', default=8 * 1024 * 1024, cast=int)  # Below this a single connection wins
+
+# Format planning: which formats to fetch and whether to merge / re-encode them
+DOWNLOAD_PLAN_BANDWIDTH = config('DOWNLOAD_PLAN_BANDWIDTH', default=8 * 1024 * 1024, cast=int)  # bytes/s assumed when costing a plan
+FORMAT_SIZE_PROBE_BUDGET = config('FORMAT_SIZE_PROBE_BUDGET', default=3.0, cast=float)  # seconds all size probes for one video get
+FORMAT_SIZE_PROBE_WORKERS = config('FORMAT_SIZE_PROBE_WORKERS', default=8, cast=int)  # Probes in flight at once
+FORMAT_SIZE_CACHE_TIMEOUT = config('FORMAT_SIZE_CACHE_TIMEOUT', default=6 * 60 * 60, cast=int)  # Probed lengths kept per format
+
+# Disk-backed range cache for proxied upstream media
+PROXY_CACHE_DIR = config('PROXY_CACHE_DIR', default=str(BASE_DIR / 'proxy_cache'))
+PROXY_CACHE_MAX_BYTES = config('PROXY_CACHE_MAX_BYTES', default=10 * 1024 * 1024 * 1024, cast=int)  # 10GB
+
+# Content-addressed store for finished downloads and conversions (same filesystem as MEDIA_ROOT for hardlinks)
+ARTIFACT_STORE_DIR = config('ARTIFACT_STORE_DIR', default=str(MEDIA_ROOT / 'artifacts'))
+ARTIFACT_IDLE_DAYS = config('ARTIFACT_IDLE_DAYS', default=7, cast=int)
+ARTIFACT_STORE_MAX_BYTES = config('ARTIFACT_STORE_MAX_BYTES', default=MAX_STORAGE_SIZE, cast=int)  # LRU eviction beyond this
+
+# Retry / resume behaviour for downloads interrupted by network errors or worker restarts
+DOWNLOAD_RETRIES = config('DOWNLOAD_RETRIES', default=5, cast=int)  # Per HTTP request inside yt-dlp
+DOWNLOAD_FRAGMENT_RETRIES = config('DOWNLOAD_FRAGMENT_RETRIES', default=10, cast=int)
+DOWNLOAD_MAX_ATTEMPTS = config('DOWNLOAD_MAX_ATTEMPTS', default=3, cast=int)  # Whole-task attempts before giving up
+DOWNLOAD_RETRY_BACKOFF = config('DOWNLOAD_RETRY_BACKOFF', default=2, cast=int)  # seconds, doubled per attempt
+DOWNLOAD_RETRY_BACKOFF_MAX = config('DOWNLOAD_RETRY_BACKOFF_MAX', default=30, cast=int)
+DOWNLOAD_STALL_TIMEOUT = config('DOWNLOAD_STALL_TIMEOUT', default=600, cast=int)  # No heartbeat for this long = dead worker
+
+# Scratch space for in-flight jobs (stream downloads, conversions)
+SCRATCH_DIR = config('SCRATCH_DIR', default=str(BASE_DIR / 'scratch'))
+SCRATCH_TMPFS_DIR = config('SCRATCH_TMPFS_DIR', default='')  # e.g. /dev/shm/medkit - small jobs run in RAM
+SCRATCH_TMPFS_MAX_JOB_BYTES = config('SCRATCH_TMPFS_MAX_JOB_BYTES', default=256 * 1024 * 1024, cast=int)  # 256MB
+SCRATCH_JOB_QUOTA_BYTES = config('SCRATCH_JOB_QUOTA_BYTES', default=8 * 1024 * 1024 * 1024, cast=int)  # 8GB per job
+SCRATCH_MAX_BYTES = config('SCRATCH_MAX_BYTES', default=32 * 1024 * 1024 * 1024, cast=int)  # 32GB across all jobs
+SCRATCH_MIN_FREE_BYTES = config('SCRATCH_MIN_FREE_BYTES', default=2 * 1024 * 1024 * 1024, cast=int)  # Never fill the disk
+SCRATCH_ORPHAN_AGE = config('SCRATCH_ORPHAN_AGE', default=6 * 60 * 60, cast=int)  # seconds without a heartbeat
+CONVERSION_INPUT_RETENTION = config('CONVERSION_INPUT_RETENTION', default=24 * 60 * 60, cast=int)  # Orphaned uploads
+
+CELERY_BEAT_SCHEDULE = {
+    'collect-artifact-garbage': {
+        'task': 'core.tasks.collect_artifact_garbage',
+        'schedule': 6 * 60 * 60,  # every 6 hours
+    },
+    'requeue-stalled-downloads': {
+        'task': 'downloads.tasks.requeue_stalled_downloads',
+        'schedule': 5 * 60,  # every 5 minutes
+    },
+    'sweep-scratch-space': {
+        'task': 'core.tasks.sweep_scratch_space',
+        'schedule': 30 * 60,  # every 30 minutes
+    },
+}